@@ -1,17 +1,54 @@
+import os
+import shutil
+import tempfile
+
 import granian
 from granian.constants import Interfaces, Loops
+from granian.http import HTTP1Settings, HTTP2Settings
 
 from app.settings import settings, DevPhase
 
 
+def available_cpus() -> int:
+    # The CPUs this process may run on, which in a container can be fewer than the host has.
+    if hasattr(os, "sched_getaffinity"): return len(os.sched_getaffinity(0))
+    return os.cpu_count() or 1
+
+
 if __name__ == "__main__":
-    granian.Granian(
+    workers = settings.server_workers or (1 if settings.dev_phase == DevPhase.DEV else available_cpus())
+    # Workers read it to split the database connection budget between them (see `Database.pool_limits`).
+    settings.server_workers = workers
+    os.environ["SERVER_WORKERS"] = str(workers)
+    # A scrape reaches one worker; they share their metrics through this directory so it can report them all.
+    metrics_dir = None
+    if workers > 1 and settings.metrics_enabled and not settings.metrics_dir:
+        metrics_dir = settings.metrics_dir = os.environ["METRICS_DIR"] = tempfile.mkdtemp(prefix="metrics-")
+
+    server = granian.Granian(
         target="app.application:application",
         address="0.0.0.0",  # noqa: S104
         port=settings.app_port,
         interface=Interfaces.ASGI,
+        workers=workers,
+        threads=settings.server_threads,
+        threading_mode=settings.server_threading_mode,
+        backlog=settings.server_backlog,
+        backpressure=settings.server_backpressure,
+        http=settings.server_http,
+        http1_settings=HTTP1Settings(keep_alive=settings.server_http1_keep_alive),
+        http2_settings=HTTP2Settings(
+            keep_alive_interval=settings.server_http2_keep_alive_interval,
+            keep_alive_timeout=settings.server_http2_keep_alive_timeout,
+            max_concurrent_streams=settings.server_http2_max_concurrent_streams,
+        ),
+        respawn_failed_workers=True,
         reload=settings.dev_phase == DevPhase.DEV,
         log_dictconfig={"root": {"level": "INFO"}} if settings.dev_phase != DevPhase.DEV else {},
         log_level=settings.log_level,
         loop=Loops.uvloop,
-    ).serve()
+    )
+    try:
+        server.serve()
+    finally:
+        if metrics_dir is not None: shutil.rmtree(metrics_dir, ignore_errors=True)
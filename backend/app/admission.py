@@ -0,0 +1,154 @@
+"""
+Admission control for endpoints that, hammered, would starve the others of the event loop and the database pool:
+creating maps (large bodies), changing avatars (uploads and outbound fetches), registering and logging in
+(password hashing), and recording plays (which anyone can send, and each of which is buffered).
+
+Each of them belongs to a class with limits of its own (`ADMISSION_LIMITS`). A request is first held to its class's
+rate by a token bucket, kept per user, or per address for endpoints used signed out (the one a trusted proxy
+forwarded it for, see `TRUSTED_PROXIES`), and is turned away with a 429 once its bucket is empty. It then takes one of
+the class's slots, which bound how many requests of the class every client together has running at once; one that
+can't get a slot within `ADMISSION_QUEUE_TIMEOUT_SECONDS` is turned away with a 503. Both answers carry a
+`Retry-After`, and come before the endpoint's own code runs, though not before FastAPI has read the body it declares:
+an avatar upload's multipart form is parsed in full first.
+
+The limits are for all of a server's workers together. Slots are always kept per worker, as it's each worker's own
+event loop and connections they protect, so each worker gets its share of a class's concurrency. Buckets are kept in
+each worker's memory, where each gets its share of the rate and burst too, as a client's requests are spread between
+workers; or with `RATE_LIMIT_BACKEND=database`, exactly, in a table every worker and server shares.
+"""
+import asyncio
+import contextlib
+import math
+import time
+import typing
+
+from fastapi import Depends, Request
+
+from app.auth import get_current_user
+from app.db import AsyncSessionFactory
+from app.exceptions.system import OverloadedException, RateLimitedException
+from app.metrics import admission_rejections_total
+from app.models import UserModel
+from app.repositories import RateLimitBucketService
+from app.settings import AdmissionLimits, RateLimitBackend, settings
+from app.util import client_address
+
+# Seconds a client turned away for overload is told to wait; slots free up as fast as requests finish.
+OVERLOADED_RETRY_AFTER = 1
+# How often idle buckets are dropped
+PRUNE_INTERVAL = 60.0
+
+class MemoryRateLimiter:
+    """ Token buckets in this process's memory, keyed by class and client. """
+    def __init__(self):
+        # key: (tokens, when they were counted, when the bucket will be full again)
+        self._buckets: dict[str, tuple[float, float, float]] = {}
+        self._pruned_at = time.monotonic()
+
+    async def take(self, key: str, rate: float, burst: int) -> float:
+        """
+        Take a token from `key`'s bucket, which refills at `rate` per second up to `burst`, returning 0 if there was
+        one, or else how many seconds until there will be.
+        """
+        now = time.monotonic()
+        if now - self._pruned_at > PRUNE_INTERVAL:
+            # A bucket that's full again is no different from a new one.
+            self._buckets = { key: bucket for key, bucket in self._buckets.items() if bucket[2] > now }
+            self._pruned_at = now
+
+        tokens, counted_at, _ = self._buckets.get(key, (burst, now, now))
+        tokens = min(burst, tokens + (now - counted_at) * rate)
+        wait = 0.0
+        if tokens >= 1:
+            tokens -= 1
+        else:
+            wait = (1 - tokens) / rate
+        self._buckets[key] = (tokens, now, now + (burst - tokens) / rate)
+        return wait
+
+
+class DatabaseRateLimiter:
+    """ Token buckets in the `rate_limit_buckets` table, shared by every server worker that uses the database. """
+    def __init__(self):
+        self._pruned_at = time.monotonic()
+
+    async def take(self, key: str, rate: float, burst: int) -> float:
+        async with AsyncSessionFactory() as session:
+            rate_limit_bucket_service = RateLimitBucketService(session=session)
+            wait = await rate_limit_bucket_service.take_token(key, rate, burst)
+            now = time.monotonic()
+            if now - self._pruned_at > PRUNE_INTERVAL:
+                self._pruned_at = now
+                await rate_limit_bucket_service.delete_idle_buckets(max(
+                    limits.burst / (limits.rate_per_minute / 60) for limits in settings.admission_limits.values()
+                ))
+            await session.commit()
+        return wait
+
+
+class Admission:
+    def __init__(self):
+        self.memory = MemoryRateLimiter()
+        self.database = DatabaseRateLimiter()
+        self._slots: dict[str, asyncio.Semaphore] = {}
+
+    @property
+    def rate_limiter(self) -> MemoryRateLimiter | DatabaseRateLimiter:
+        return self.database if settings.rate_limit_backend == RateLimitBackend.DATABASE else self.memory
+
+    def limits(self, endpoint_class: str) -> AdmissionLimits:
+        """ This worker's share of `endpoint_class`'s limits, which are for every server worker together. """
+        limits = settings.admission_limits[endpoint_class]
+        workers = settings.server_workers or 1
+        if workers == 1: return limits
+        if self.rate_limiter is self.memory:
+            limits = limits.model_copy(update={
+                "rate_per_minute": limits.rate_per_minute / workers, "burst": max(limits.burst // workers, 1)
+            })
+        return limits.model_copy(update={ "concurrency": max(limits.concurrency // workers, 1) })
+
+    @contextlib.asynccontextmanager
+    async def admit(self, endpoint_class: str, client: str) -> typing.AsyncIterator[None]:
+        """ Hold a request of `endpoint_class` from `client` to its limits, keeping one of its slots while it runs. """
+        limits = self.limits(endpoint_class)
+        if settings.rate_limits_enabled:
+            wait = await self.rate_limiter.take(
+                f"{ endpoint_class }:{ client }", limits.rate_per_minute / 60, limits.burst
+            )
+            if wait > 0:
+                admission_rejections_total.inc(endpoint_class, "rate_limited")
+                raise RateLimitedException(math.ceil(wait))
+
+        slots = self._slots.get(endpoint_class)
+        if slots is None: slots = self._slots[endpoint_class] = asyncio.Semaphore(limits.concurrency)
+        try:
+            await asyncio.wait_for(slots.acquire(), timeout=settings.admission_queue_timeout_seconds)
+        except TimeoutError:
+            admission_rejections_total.inc(endpoint_class, "overloaded")
+            raise OverloadedException(OVERLOADED_RETRY_AFTER) from None
+        try:
+            yield
+        finally:
+            slots.release()
+
+    async def stop(self) -> None:
+        # Slots belong to the event loop they were waited on in, so the next start gets new ones.
+        self._slots.clear()
+
+
+admission = Admission()
+
+
+def admit_user(endpoint_class: str) -> typing.Callable[..., typing.AsyncIterator[None]]:
+    """ A dependency admitting a signed-in user's request to an endpoint of `endpoint_class`. """
+    async def dependency(user: UserModel = Depends(get_current_user)) -> typing.AsyncIterator[None]:
+        async with admission.admit(endpoint_class, f"user:{ user.id }"):
+            yield
+    return dependency
+
+def admit_client(endpoint_class: str) -> typing.Callable[..., typing.AsyncIterator[None]]:
+    """ A dependency admitting a request to an endpoint of `endpoint_class` that's used signed out, by its address. """
+    async def dependency(request: Request) -> typing.AsyncIterator[None]:
+        async with admission.admit(endpoint_class, f"address:{ client_address(request) }"):
+            yield
+    return dependency
@@ -1,7 +1,9 @@
 from fastapi import APIRouter
-from . import map_router, user_router, auth_router
+from . import map_router, user_router, auth_router, system_router, metrics_router, job_router
 
 api_router = APIRouter(prefix="/api/v1")
 api_router.include_router(map_router.router, tags=["maps"])
 api_router.include_router(user_router.router, tags=["users"])
-api_router.include_router(auth_router.router, tags=["auth"])
\ No newline at end of file
+api_router.include_router(auth_router.router, tags=["auth"])
+api_router.include_router(system_router.router, tags=["system"])
+api_router.include_router(job_router.router, tags=["jobs"])
\ No newline at end of file
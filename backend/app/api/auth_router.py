@@ -1,4 +1,5 @@
-from pydantic import BaseModel
+from typing import Optional
+from pydantic import BaseModel, EmailStr
 from fastapi import APIRouter, Request, Response, Body, Depends
 from fastapi_users.authentication.strategy.db import DatabaseStrategy
 from fastapi_users import exceptions
@@ -7,20 +8,30 @@ from sqlalchemy.ext.asyncio import AsyncSession
 from app.auth import (
     auth_backend, fastapi_users, cookie_transport,
     UserManager, get_user_manager, get_db_strategy,
-    get_current_user
+    get_current_user_or_none
 )
+from app.admission import admit_client
 from app.db import create_session
+from app.jobs import enqueue_job, job_runner
 from app.util import get_random_pixel_avatar
 from app.repositories import AvatarService
+from app.exceptions import ResetPasswordTokenInvalidException, UnauthorizedException
 from app.models import UserModel
 from app.schemas import UserRead, UserCreate, AvatarCreate
 
 class ResetPasswordBody(BaseModel):
     password: str
+    # From a forgot password email; without one, the signed in user's password is changed
+    token: Optional[str] = None
+
+class ForgotPasswordBody(BaseModel):
+    email: EmailStr
 
 router = APIRouter(prefix="/auth")
 router.include_router(
-    fastapi_users.get_auth_router(auth_backend)
+    fastapi_users.get_auth_router(auth_backend),
+    # Logging out shares login's limits; it's too cheap to need them, but they cost it nothing.
+    dependencies=[Depends(admit_client("auth"))],
 )
 
 @router.post(
@@ -28,6 +39,7 @@ router.include_router(
     response_model=UserRead,
     status_code=201,
     name="register:register",
+    dependencies=[Depends(admit_client("auth"))],
 )
 async def register(
     request: Request,
@@ -60,20 +72,50 @@ async def register(
     "/reset-password",
     name="reset:reset_password",
     status_code=204,
+    # Tokens can be guessed at, so this shares login's limits.
+    dependencies=[Depends(admit_client("auth"))],
 )
 async def reset_password(
     *,
     request: Request,
-    user: UserModel = Depends(get_current_user),
+    user: Optional[UserModel] = Depends(get_current_user_or_none),
     user_manager: UserManager = Depends(get_user_manager),
     reset_password_body: ResetPasswordBody,
 ):
-    if not user.is_active:
-        raise exceptions.UserInactive()
+    if reset_password_body.token is not None:
+        try:
+            await user_manager.reset_password(reset_password_body.token, reset_password_body.password, request)
+        except (exceptions.InvalidResetPasswordToken, exceptions.UserNotExists, exceptions.UserInactive):
+            raise ResetPasswordTokenInvalidException from None
+        return
 
+    if user is None:
+        raise UnauthorizedException
     await user_manager._update(user, {"password": reset_password_body.password})
     await user_manager.on_after_reset_password(user, request)
-    
+
+@router.post(
+    "/forgot-password",
+    name="reset:forgot_password",
+    status_code=202,
+    # Each call can send an email, to any address.
+    dependencies=[Depends(admit_client("auth"))],
+)
+async def forgot_password(
+    *,
+    session: AsyncSession = Depends(create_session),
+    forgot_password_body: ForgotPasswordBody,
+):
+    # Queued for any address, so the request does the same work whether or not it has an account, and can't be used to
+    # probe for emails. The job looks the account up and queues the email, which is sent in the background (see
+    # app.jobs and app.mail).
+    email = forgot_password_body.email
+    await enqueue_job(
+        session, "auth.forgot_password", { "email": email }, dedupe_key=f"forgot_password:{ email.lower() }"
+    )
+    await session.commit()
+    job_runner.wake()
+
 # router.include_router(
 #     fastapi_users.get_reset_password_router(),
 #     tags=["auth"],
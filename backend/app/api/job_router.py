@@ -0,0 +1,30 @@
+from typing import Optional
+from uuid import UUID
+from fastapi import APIRouter, Depends
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.auth import get_current_user_or_none
+from app.db import create_session
+from app.metrics import query_budget
+from app.models import UserModel
+from app.repositories import JobService
+from app.exceptions.job import JobDoesNotExistException
+from app.schemas import JobRead
+
+router = APIRouter(prefix="/jobs")
+
+@router.get("/{job_id}", response_model=JobRead)
+@query_budget(3)
+async def get_job(
+    *,
+    # Read from the primary: a job's status is changed by workers, so the client's own writes don't pin it there.
+    session: AsyncSession = Depends(create_session),
+    user: Optional[UserModel] = Depends(get_current_user_or_none),
+    job_id: UUID
+):
+    """ How a background job is going. Jobs queued for a user are only shown to them, the system's to superusers. """
+    job = await JobService(session=session).get_job(job_id)
+    # Someone else's job is reported missing, rather than revealing that it exists.
+    if job is None or not (user is not None and (user.is_superuser or job.user_id == user.id)):
+        raise JobDoesNotExistException
+    return job
@@ -1,72 +1,325 @@
 import base64
-from typing import Any, Union
-from fastapi import APIRouter, Depends, Header, Response
-from sqlalchemy.ext.asyncio import AsyncSession
+import hashlib
+import json
+from typing import AsyncIterator, Optional, Union
+from fastapi import APIRouter, Depends, Header, Query, Request, Response
+from fastapi.responses import FileResponse, StreamingResponse
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
 from uuid import UUID
 
 from app.auth import get_current_user, get_current_user_or_none
-from app.db import create_session
+from app.db import create_session, create_read_session, read_session_factory
+from app.metrics import query_budget
 from app.models import UserModel, MapModel
-from app.repositories import MapRepository, MapService, MapFavoriteService, ThumbnailService
-from app.schemas import MapFavoritedBody, MapCreateBody, MapCreate, MapRead, MapReadWithData, ThumbnailRead, ThumbnailCreate
+from app.repositories import MapService, MapFavoriteService, MapLayerService
+from app.settings import settings
+from app.play_events import play_event_buffer
+from app.map_data import LAYERS, RENDER_ORDER, LayerSlice, MapDataLayout
+from app.map_upload import read_map_upload
+from app.feed_cache import FeedSnapshot, PUBLIC_FEED, public_feed_cache
+from app.scene import SCENE_MEDIA_TYPE
+from app.scene_cache import scene_cache
+from app.thumbnail_cache import thumbnail_cache
+from app.jobs import enqueue_job, job_runner
+from app.admission import admit_client, admit_user
+from app.export import ExportFormat
+from app.export_cache import EXPORT_MEDIA_TYPE, export_cache, export_filename
+from app.ranges import ByteRange, blob_etag, bytes_reader, ranged_response
+from app.util import accepts_encoding, etag_matches
+from app.exceptions.map import (
+    MapBatchTooLargeException, MapDoesNotExistException, MapLayerInvalidException, MapSearchCursorInvalidException
+)
+from app.schemas import (
+    MapFavoritedBody, MapFavoritedBatchBody, MapCreateBody, MapCreate, MapRead, MapReadWithData, MapSearchPage,
+    ThumbnailRead
+)
 
 router = APIRouter(prefix="/maps")
 
+def encode_search_cursor(rank: float, map_id: UUID) -> str:
+    return base64.urlsafe_b64encode(json.dumps([rank, str(map_id)]).encode()).decode()
+
+def decode_search_cursor(cursor: str) -> tuple[float, UUID]:
+    try:
+        rank, map_id = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        return float(rank), UUID(map_id)
+    except (ValueError, TypeError):
+        raise MapSearchCursorInvalidException from None
+
+def feed_snapshot_response(request: Request, snapshot: FeedSnapshot) -> Response:
+    """ The anonymous feed straight from its snapshot: gzipped when the client takes it, revalidated by ETag. """
+    max_age = max(int(public_feed_cache.ttl - snapshot.age), 0)
+    stale_while_revalidate = int(public_feed_cache.stale_while_revalidate)
+    headers = {
+        "ETag": snapshot.etag,
+        "Cache-Control": f"public, max-age={ max_age }, stale-while-revalidate={ stale_while_revalidate }",
+        # Signed-in callers get their own version of the feed.
+        "Vary": "Accept-Encoding, Cookie",
+    }
+    if etag_matches(request.headers.get("if-none-match", ""), snapshot.etag):
+        return Response(status_code=304, headers=headers)
+    if accepts_encoding(request.headers.get("accept-encoding", ""), "gzip"):
+        return Response(
+            content=snapshot.gzipped_body, media_type="application/json",
+            headers={ **headers, "Content-Encoding": "gzip" }
+        )
+    return Response(content=snapshot.body, media_type="application/json", headers=headers)
+
 @router.get("/", response_model=list[MapRead])
+@query_budget(3)
 async def get_public_maps(
     *,
-    session: AsyncSession = Depends(create_session),
+    request: Request,
+    session: AsyncSession = Depends(create_read_session),
     user: UserModel = Depends(get_current_user_or_none),
     include_self: bool = False
 ):
-    map_repository = MapRepository(session=session)
+    # Every anonymous caller sees the same feed, so it's served from a shared snapshot (see app.feed_cache);
+    # signed-in callers get that snapshot with their favorites overlaid.
+    snapshot = await public_feed_cache.get(PUBLIC_FEED)
+    if user is None:
+        return feed_snapshot_response(request, snapshot)
+
     map_favorite_service = MapFavoriteService(session=session)
+    favorited = await map_favorite_service.get_favorited_map_ids(user.id)
 
-    if user is not None and not include_self:
-        maps = await map_repository.list(
-            MapModel.private == False,
-            MapModel.user_id != user.id,
-            load=MapModel.user
-        )
-    else:
-        maps = await map_repository.list(MapModel.private == False, load=MapModel.user)
-    for map in maps:
-        if user is not None: map.favorited = await map_favorite_service.is_map_favorited(map.id, user.id)
-        else: map.favorited = False
-    return maps
+    return Response(
+        content=snapshot.overlay(favorited, exclude_user_id=None if include_self else user.id),
+        media_type="application/json",
+        headers={ "Cache-Control": "private, no-cache" }
+    )
 
 @router.get("/self", response_model=list[MapRead])
+@query_budget(3)
 async def get_my_maps(
     *,
-    session: AsyncSession = Depends(create_session),
+    session: AsyncSession = Depends(create_read_session),
     user: UserModel = Depends(get_current_user),
 ):
-    map_repository = MapRepository(session=session)
-    map_favorite_service = MapFavoriteService(session=session)
+    map_service = MapService(session=session)
+
+    return await map_service.list_maps(MapModel.user_id == user.id, user=user, load_user=False)
+
+@router.get("/batch", response_model=list[MapRead])
+@query_budget(3)
+async def get_maps_batch(
+    *,
+    session: AsyncSession = Depends(create_read_session),
+    user: UserModel = Depends(get_current_user_or_none),
+    ids: list[UUID] = Query()
+):
+    # Drop duplicate IDs while preserving the order the client asked for them in.
+    map_ids = list(dict.fromkeys(ids))
+    if len(map_ids) > settings.maps_batch_max_size:
+        raise MapBatchTooLargeException
+
+    map_service = MapService(session=session)
+
+    return await map_service.get_maps(map_ids, user)
+
+@router.get("/search", response_model=MapSearchPage)
+@query_budget(3)
+async def search_maps(
+    *,
+    session: AsyncSession = Depends(create_read_session),
+    user: UserModel = Depends(get_current_user_or_none),
+    q: str = Query(min_length=1, max_length=100),
+    limit: int = Query(20, ge=1, le=settings.maps_search_max_limit),
+    cursor: Optional[str] = None
+):
+    map_service = MapService(session=session)
+
+    after = decode_search_cursor(cursor) if cursor is not None else None
+    # Fetch one extra row to learn whether another page exists without a separate count.
+    results = await map_service.search_maps(q, user, limit + 1, after)
+    page, has_more = results[:limit], len(results) > limit
+
+    return MapSearchPage(
+        items=[map for map, _ in page],
+        next_cursor=encode_search_cursor(page[-1][1], page[-1][0].id) if has_more else None
+    )
 
-    maps = await map_repository.list(MapModel.user_id == user.id)
-    for map in maps: map.favorited = await map_favorite_service.is_map_favorited(map.id, user.id)
-    return maps
+def parse_layers(layers: str) -> list[str]:
+    names = list(dict.fromkeys(name.strip() for name in layers.split(",") if name.strip()))
+    if not names or any(name not in LAYERS for name in names):
+        raise MapLayerInvalidException(f"Map layers must be any of { ', '.join(LAYERS) }")
+    return names
+
+def with_layers(map: MapRead, layers_json: dict[str, str]) -> Response:
+    """ `map` with a `data` object holding `layers_json`, whose JSON text goes into the body as stored, undecoded. """
+    data = ",".join(f"{ json.dumps(name) }:{ layer_json }" for name, layer_json in layers_json.items())
+    return Response(content=f'{ map.model_dump_json()[:-1] },"data":{{{ data }}}}}', media_type="application/json")
 
 @router.get("/{map_id}", response_model=Union[MapReadWithData, MapRead])
+@query_budget(5)
 async def get_map_endpoint(
     *,
-    session: AsyncSession = Depends(create_session),
+    session: AsyncSession = Depends(create_read_session),
     user: UserModel = Depends(get_current_user_or_none),
     map_id: UUID,
-    include_data: bool = False
+    include_data: bool = False,
+    layers: Optional[str] = Query(
+        None,
+        description=f"Comma-separated MapData layers to include, implying include_data: { ', '.join(LAYERS) }"
+    )
 ):
     map_service = MapService(session=session)
     map_favorite_service = MapFavoriteService(session=session)
+    map_layer_service = MapLayerService(session=session)
+
+    names = parse_layers(layers) if layers is not None else list(LAYERS) if include_data else None
 
     map = await map_service.get_map(map_id, user, load=MapModel.user)
         
     if user is not None: map.favorited = await map_favorite_service.is_map_favorited(map_id, user.id)
     else: map.favorited = False
-        
-    if include_data:
-        return MapReadWithData.model_validate(map)
-    return MapRead.model_validate(map)
+
+    if names is None:
+        return MapRead.model_validate(map)
+
+    # Only the requested layers' rows are read, and each is sent as stored.
+    layers_json = await map_layer_service.get_layers_json(map_id, names)
+    layers = { name: layers_json[name] for name in names if name in layers_json }
+    return with_layers(MapRead.model_validate(map), layers)
+
+@router.get("/{map_id}/data", responses={
+    200: {"content": {"application/json": {}}},
+    206: {"description": "The requested byte ranges of the map data"},
+}, description="A map's data alone, with Range and If-Range support for resuming or splitting large downloads")
+@query_budget(5)
+async def get_map_data(
+    *,
+    request: Request,
+    session: AsyncSession = Depends(create_read_session),
+    user: UserModel = Depends(get_current_user_or_none),
+    map_id: UUID
+):
+    map_service = MapService(session=session)
+    map_layer_service = MapLayerService(session=session)
+
+    await map_service.get_map(map_id, user)
+    layers = await map_layer_service.get_layer_sizes(map_id)
+    layout = MapDataLayout({ layer.name: layer.size for layer in layers })
+    versions = sorted(f"{ layer.name }:{ layer.size }:{ layer.updated_at.isoformat() }" for layer in layers)
+    etag = f'"{ hashlib.blake2b(" ".join([str(map_id), *versions]).encode(), digest_size=16).hexdigest() }"'
+
+    async def read(ranges: list[ByteRange]) -> list[bytes]:
+        pieces = [layout.pieces(byte_range) for byte_range in ranges]
+        slices = [piece for range_pieces in pieces for piece in range_pieces if isinstance(piece, LayerSlice)]
+        sliced = await map_layer_service.get_layer_slices(map_id, slices)
+        # Layers are only ever removed along with their map.
+        if len(sliced) != len(slices): raise MapDoesNotExistException
+        sliced_iter = iter(sliced)
+        return [
+            b"".join(piece if isinstance(piece, bytes) else next(sliced_iter) for piece in range_pieces)
+            for range_pieces in pieces
+        ]
+
+    return await ranged_response(request, layout.size, etag, "application/json", read)
+
+@router.get("/{map_id}/scene", responses={
+    200: {"content": {SCENE_MEDIA_TYPE: {}}},
+    206: {"description": "The requested byte ranges of the scene"},
+}, description="The map's game scene: its walls and floors as binary buffers, laid out as described in app/scene.py")
+@query_budget(4)
+async def get_map_scene(
+    *,
+    request: Request,
+    session: AsyncSession = Depends(create_read_session),
+    user: UserModel = Depends(get_current_user_or_none),
+    map_id: UUID
+):
+    map_service = MapService(session=session)
+
+    await map_service.get_map(map_id, user)
+    data = await scene_cache.get(session, map_id)
+    return await ranged_response(request, len(data), blob_etag(data), SCENE_MEDIA_TYPE, bytes_reader(data))
+
+def layer_frame(name: str, layer_json: str, chunk: int | None = None) -> str:
+    # Raw newlines in JSON text can only be insignificant whitespace, but would split an NDJSON frame.
+    chunk_field = f'"chunk":{ chunk },' if chunk is not None else ""
+    data = layer_json.replace("\n", " ")
+    return f'{{"type":"layer","name":{ json.dumps(name) },{ chunk_field }"data":{ data }}}\n'
+
+async def map_frames(
+    session_factory: async_sessionmaker, map_id: UUID, map_json: str, names: list[str]
+) -> AsyncIterator[str]:
+    """
+    The NDJSON frames of a map stream: the map itself, a frame per layer in `names` order with the buildings a frame per
+    chunk, then an end frame. Streaming outlives the request's session, so the layers are read in a session of its own.
+    """
+    yield f'{{"type":"map","map":{ map_json }}}\n'
+    async with session_factory() as session:
+        map_layer_service = MapLayerService(session=session)
+        whole_layers = [name for name in names if name != "buildings"]
+        if whole_layers:
+            async for name, layer_json in map_layer_service.stream_layers_json(map_id, whole_layers):
+                yield layer_frame(name, layer_json)
+        if "buildings" in names:
+            chunks = map_layer_service.stream_layer_chunks_json(
+                map_id, "buildings", settings.map_stream_buildings_per_frame
+            )
+            chunk = 0
+            async for chunk_json in chunks:
+                yield layer_frame("buildings", chunk_json, chunk)
+                chunk += 1
+    yield '{"type":"end"}\n'
+
+@router.get("/{map_id}/layers", response_class=StreamingResponse, responses={
+    200: {"content": {"application/x-ndjson": {}}}
+}, description="Stream a map as NDJSON frames in render order, so it can be drawn as it arrives")
+@query_budget(6)
+async def stream_map_layers(
+    *,
+    request: Request,
+    session: AsyncSession = Depends(create_read_session),
+    user: UserModel = Depends(get_current_user_or_none),
+    map_id: UUID,
+    layers: Optional[str] = Query(None, description=f"Comma-separated MapData layers to stream: { ', '.join(LAYERS) }")
+):
+    map_service = MapService(session=session)
+    map_favorite_service = MapFavoriteService(session=session)
+
+    names = parse_layers(layers) if layers is not None else list(LAYERS)
+
+    map = await map_service.get_map(map_id, user, load=MapModel.user)
+
+    if user is not None: map.favorited = await map_favorite_service.is_map_favorited(map_id, user.id)
+    else: map.favorited = False
+
+    return StreamingResponse(
+        map_frames(
+            read_session_factory(request), map_id, MapRead.model_validate(map).model_dump_json(),
+            [name for name in RENDER_ORDER if name in names]
+        ),
+        media_type="application/x-ndjson"
+    )
+
+@router.get("/{map_id}/export", responses={
+    200: {"content": {EXPORT_MEDIA_TYPE: {}}}
+}, description="A zip of 3D models of the map, one per part of the city, streamed as each is built")
+@query_budget(4)
+async def export_map(
+    *,
+    request: Request,
+    session: AsyncSession = Depends(create_read_session),
+    user: UserModel = Depends(get_current_user_or_none),
+    map_id: UUID,
+    format: ExportFormat = ExportFormat.stl
+):
+    map_service = MapService(session=session)
+
+    map = await map_service.get_map(map_id, user)
+    filename = export_filename(map_id, format)
+    path = await export_cache.get(map_id, map.updated_at, format)
+    if path is not None:
+        return FileResponse(path, media_type=EXPORT_MEDIA_TYPE, filename=filename)
+
+    return StreamingResponse(
+        await export_cache.stream(read_session_factory(request), map_id, map.updated_at, format),
+        media_type=EXPORT_MEDIA_TYPE,
+        headers={ "Content-Disposition": f'attachment; filename="{ filename }"' }
+    )
 
 @router.get("/{map_id}/thumbnail", responses={
     200: {
@@ -76,24 +329,27 @@ async def get_map_endpoint(
         }
     }
 }, description="NOTE: The Accept header is overwritten by Swagger UI and will always send application/json")
+@query_budget(4)
 async def get_map_thumbnail(
     *,
-    session: AsyncSession = Depends(create_session),
+    request: Request,
+    session: AsyncSession = Depends(create_read_session),
     user: UserModel = Depends(get_current_user_or_none),
     accept: str = Header("image/jpeg"),
     map_id: UUID
 ):
     map_service = MapService(session=session)
 
-    map = await map_service.get_map(map_id, user, load=MapModel.thumbnail)
+    await map_service.get_map(map_id, user)
+    thumbnail = await thumbnail_cache.get(session, map_id)
     
-    if accept == "application/json": return ThumbnailRead.model_validate(map.thumbnail)
-    return Response(
-        content=map.thumbnail.data,
-        media_type=map.thumbnail.mimetype
+    if accept == "application/json": return ThumbnailRead.model_validate(thumbnail)
+    return await ranged_response(
+        request, len(thumbnail.data), blob_etag(thumbnail.data), thumbnail.mimetype, bytes_reader(thumbnail.data)
     )
 
 @router.post("/{map_id}/favorite", status_code=204)
+@query_budget(4)
 async def set_map_favorited(
     *,
     session: AsyncSession = Depends(create_session),
@@ -108,28 +364,79 @@ async def set_map_favorited(
     map = await map_service.get_map(map_id, user)
     await map_favorite_service.set_map_favorited(map_id, user.id, favorited_body.favorited)
 
-@router.post("/", response_model=MapRead)
+@router.post("/{map_id}/play", status_code=202, dependencies=[Depends(admit_client("map_play"))])
+@query_budget(3)
+async def record_map_play(
+    *,
+    session: AsyncSession = Depends(create_read_session),
+    user: UserModel = Depends(get_current_user_or_none),
+    map_id: UUID
+):
+    # Only plays of maps the player may see are counted; they're buffered and flushed in bulk.
+    await MapService(session=session).get_map(map_id, user)
+    play_event_buffer.record(map_id)
+
+@router.post("/favorites:batch", status_code=204)
+@query_budget(4)
+async def set_maps_favorited(
+    *,
+    session: AsyncSession = Depends(create_session),
+    user: UserModel = Depends(get_current_user),
+    favorited_batch_body: MapFavoritedBatchBody
+):
+    if len(favorited_batch_body.favorites) > settings.maps_batch_max_size:
+        raise MapBatchTooLargeException
+
+    map_service = MapService(session=session)
+    map_favorite_service = MapFavoriteService(session=session)
+
+    # Later toggles of the same map win, mirroring the order the client fired them in.
+    favorites = { item.map_id: item.favorited for item in favorited_batch_body.favorites }
+    if not favorites: return
+
+    await map_service.verify_maps_accessible(list(favorites.keys()), user)
+    await map_favorite_service.set_maps_favorited(user.id, favorites)
+
+@router.post(
+    "/",
+    response_model=MapRead,
+    dependencies=[Depends(admit_user("map_create"))],
+    # The body is read by `read_map_upload` rather than FastAPI, so it's documented by hand.
+    openapi_extra={"requestBody": {
+        "required": True,
+        "content": {"application/json": {"schema": MapCreateBody.model_json_schema()}},
+    }},
+)
+@query_budget(8)
 async def create_map(
     *,
+    request: Request,
     session: AsyncSession = Depends(create_session),
     user: UserModel = Depends(get_current_user),
-    map_create: MapCreateBody
+    response: Response
 ):
     map_service = MapService(session=session)
-    thumbnail_service = ThumbnailService(session=session)
+    map_layer_service = MapLayerService(session=session)
+
+    # Read and validated as it streams in, after the request has been admitted (see app.map_upload).
+    upload = await read_map_upload(request)
     
     map = await map_service.create(MapCreate(
-        **map_create.model_dump(),
+        **upload.fields.model_dump(),
+        **upload.data.stats.model_dump(),
         user_id=user.id
     ))
     map.favorited = False
-
-    thumbnail = await thumbnail_service.create(ThumbnailCreate(
-        map_id=map.id,
-        data=base64.b64decode(map_create.thumbnail_base64),
-        mimetype="image/jpeg"
-    ))
+    await map_layer_service.create_layers(map.id, upload.layers_json)
+    # Drawn from the stored layers once the map is committed, rather than holding up the response.
+    thumbnail_job_id = await enqueue_job(
+        session, "map.thumbnail", { "map_id": str(map.id) }, dedupe_key=f"thumbnail:{ map.id }", user_id=user.id
+    )
 
     await session.commit()
+    if not map.private: public_feed_cache.invalidate(PUBLIC_FEED)
+    job_runner.wake()
+    # Followed at /jobs/{id}
+    response.headers["X-Thumbnail-Job-Id"] = str(thumbnail_job_id)
     
     return map
\ No newline at end of file
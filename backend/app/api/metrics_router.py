@@ -0,0 +1,23 @@
+import asyncio
+import secrets
+
+from fastapi import APIRouter, Depends, Header
+from fastapi.responses import PlainTextResponse
+
+from app.exceptions import MetricsUnauthorizedException
+from app.metrics import read_snapshots, render_metrics
+from app.settings import settings
+
+router = APIRouter()
+
+def authorize_scraper(authorization: str = Header("")) -> None:
+    token = settings.metrics_token
+    if not token or not secrets.compare_digest(authorization.encode(), f"Bearer { token }".encode()):
+        raise MetricsUnauthorizedException()
+
+@router.get(
+    "/metrics", response_class=PlainTextResponse, include_in_schema=False, dependencies=[Depends(authorize_scraper)]
+)
+async def get_metrics():
+    snapshots = await asyncio.to_thread(read_snapshots)
+    return PlainTextResponse(render_metrics(snapshots), media_type="text/plain; version=0.0.4")
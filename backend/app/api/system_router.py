@@ -0,0 +1,48 @@
+from uuid import UUID
+from fastapi import APIRouter, Depends, Query
+from fastapi.responses import FileResponse
+
+from app.auth import get_current_superuser
+from app.db import databases
+from app.models import UserModel
+from app.exceptions.system import ProfileDoesNotExistException
+from app.profiling import profile_path
+from app.schemas import PoolStatsRead, SlowQueryRead
+from app.slow_queries import slow_query_log
+
+router = APIRouter(prefix="/system")
+
+@router.get("/pool", response_model=list[PoolStatsRead])
+async def get_pool_stats(
+    *,
+    user: UserModel = Depends(get_current_superuser)
+):
+    return [PoolStatsRead.model_validate(database.pool_stats()) for database in databases()]
+
+@router.get("/slow-queries", response_model=list[SlowQueryRead])
+async def get_slow_queries(
+    *,
+    user: UserModel = Depends(get_current_superuser),
+    limit: int = Query(20, ge=1, le=100)
+):
+    """ The slowest statements recently logged, grouped by fingerprint and ordered by total time spent in them. """
+    return slow_query_log.top_offenders(limit)
+
+@router.delete("/slow-queries", status_code=204)
+async def clear_slow_queries(
+    *,
+    user: UserModel = Depends(get_current_superuser)
+):
+    slow_query_log.clear()
+
+@router.get("/profiles/{profile_id}", name="get_profile", response_class=FileResponse)
+async def get_profile(
+    *,
+    user: UserModel = Depends(get_current_superuser),
+    profile_id: UUID
+):
+    """ A speedscope profile recorded by sending a request with `X-Profile: 1`. """
+    path = profile_path(profile_id)
+    if not path.is_file():
+        raise ProfileDoesNotExistException
+    return FileResponse(path, media_type="application/json", filename=path.name)
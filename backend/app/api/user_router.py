@@ -1,18 +1,22 @@
 from typing import Any
-from fastapi import APIRouter, Depends, Header, Response, UploadFile
+from fastapi import APIRouter, Depends, Header, Request, UploadFile
 from sqlalchemy.ext.asyncio import AsyncSession
 
-from app.db import create_session
+from app.db import create_session, create_read_session
+from app.metrics import query_budget
 from app.models import UserModel
 from app.auth import get_current_user, get_current_user_or_none
+from app.admission import admit_user
 from app.repositories import UserService, AvatarService
 from app.schemas import UserRead, UserReadPublic, AvatarRead, AvatarCreate
 from app.exceptions import UnauthorizedException, BadRequestException
+from app.ranges import blob_etag, bytes_reader, ranged_response
 from app.util import get_random_pixel_avatar
 
 router = APIRouter(prefix="/users")
 
 @router.get("/self", response_model=UserRead)
+@query_budget(2)
 async def get_my_user(
     *,
     user: UserModel = Depends(get_current_user)
@@ -20,9 +24,10 @@ async def get_my_user(
     return UserRead.model_validate(user)
 
 @router.get("/{username}", response_model=UserReadPublic)
+@query_budget(1)
 async def get_user(
     *,
-    session: AsyncSession = Depends(create_session),
+    session: AsyncSession = Depends(create_read_session),
     username: str
 ):
     user_service = UserService(session=session)
@@ -36,21 +41,24 @@ async def get_user(
         }
     }
 }, description="NOTE: The Accept header is overwritten by Swagger UI and will always send application/json")
+@query_budget(1)
 async def get_user_avatar(
     *,
-    session: AsyncSession = Depends(create_session),
+    request: Request,
+    session: AsyncSession = Depends(create_read_session),
     accept: str = Header("image/jpeg"),
     username: str
 ):
     user_service = UserService(session=session)
     user = await user_service.get_user_by_username(username=username, load=UserModel.avatar)    
     if accept == "application/json": return AvatarRead.model_validate(user.avatar)
-    return Response(
-        content=user.avatar.data,
-        media_type="image/jpeg"
+    avatar = user.avatar
+    return await ranged_response(
+        request, len(avatar.data), blob_etag(avatar.data), avatar.mimetype, bytes_reader(avatar.data)
     )
 
-@router.put("/{username}/avatar", status_code=201)
+@router.put("/{username}/avatar", status_code=201, dependencies=[Depends(admit_user("avatar"))])
+@query_budget(6)
 async def upload_user_avatar(
     *,
     session: AsyncSession = Depends(create_session),
@@ -79,7 +87,8 @@ async def upload_user_avatar(
     )
     await session.commit()
 
-@router.put("/{username}/avatar/random", status_code=201)
+@router.put("/{username}/avatar/random", status_code=201, dependencies=[Depends(admit_user("avatar"))])
+@query_budget(6)
 async def randomize_user_avatar(
     *,
     session: AsyncSession = Depends(create_session),
@@ -1,17 +1,69 @@
+import contextlib
 from fastapi import FastAPI, Request
 from fastapi.responses import JSONResponse
 from fastapi.middleware.cors import CORSMiddleware
 
-from app.api import api_router
+from app.api import api_router, metrics_router
 from app.settings import settings, DevPhase
 from app.exceptions import CustomException
+from app.db import start_databases, stop_databases
+from app.middleware import PrimaryPinMiddleware, QueryBudgetMiddleware
+from app.metrics import MetricsMiddleware, metrics_snapshots
+from app.profiling import ProfilingMiddleware
+from app.play_events import play_event_buffer
+from app.feed_cache import public_feed_cache
+from app.process_pool import process_pool
+from app.scene_cache import scene_cache
+from app.thumbnail_cache import thumbnail_cache
+from app.export_cache import export_cache
+from app.mail import mail_outbox
+from app.jobs import job_runner
+from app.admission import admission
+from app.slow_queries import slow_query_log
+from app.warmup import warm_up
+
+@contextlib.asynccontextmanager
+async def lifespan(app: FastAPI):
+    await start_databases()
+    await warm_up()
+    play_event_buffer.start()
+    process_pool.start()
+    if settings.metrics_enabled:
+        metrics_snapshots.start()
+    if settings.jobs_worker_enabled:
+        job_runner.start()
+    if settings.mail_enabled:
+        mail_outbox.start()
+    try:
+        yield
+    finally:
+        # Stop the background tasks first, they still need the database.
+        await play_event_buffer.stop()
+        await mail_outbox.stop()
+        await job_runner.stop()
+        await public_feed_cache.stop()
+        await scene_cache.stop()
+        await thumbnail_cache.stop()
+        await export_cache.stop()
+        await process_pool.stop()
+        await slow_query_log.stop()
+        await metrics_snapshots.stop()
+        await admission.stop()
+        await stop_databases()
 
 application = FastAPI(
     title=settings.project_name,
     debug=settings.dev_phase == DevPhase.DEV,
+    lifespan=lifespan,
 )
 
 application.include_router(api_router)
+if settings.metrics_enabled:
+    application.include_router(metrics_router.router)
+
+application.add_middleware(PrimaryPinMiddleware)
+if settings.dev_phase == DevPhase.DEV:
+    application.add_middleware(QueryBudgetMiddleware)
 
 application.add_middleware(
     CORSMiddleware,
@@ -21,6 +73,13 @@ application.add_middleware(
     allow_headers=["*"],
 )
 
+if settings.profiling_enabled:
+    application.add_middleware(ProfilingMiddleware)
+
+# Outermost, so latency and sizes cover every other middleware too.
+if settings.metrics_enabled:
+    application.add_middleware(MetricsMiddleware)
+
 @application.exception_handler(CustomException)
 async def custom_exception_handler(request: Request, exc: CustomException):
     content = { "detail": exc.error_code, "message": exc.message }
@@ -29,4 +88,5 @@ async def custom_exception_handler(request: Request, exc: CustomException):
     return JSONResponse(
         status_code=exc.code,
         content=content,
+        headers=exc.headers,
     )
\ No newline at end of file
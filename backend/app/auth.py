@@ -7,8 +7,9 @@ from fastapi_users_db_sqlalchemy import SQLAlchemyUserDatabase
 from fastapi_users_db_sqlalchemy.access_token import SQLAlchemyAccessTokenDatabase
 from fastapi_users.authentication import AuthenticationBackend, CookieTransport
 from fastapi_users.authentication.strategy.db import DatabaseStrategy
+from sqlalchemy.ext.asyncio import AsyncSession
 
-from app.db import AsyncSessionFactory
+from app.db import AsyncSessionFactory, create_session
 from app.repositories import UserService
 from app.models import UserModel, AccessTokenModel
 from app.schemas import UserCreate, UserRead
@@ -76,17 +77,20 @@ class UserManager(IntegerIDMixin, BaseUserManager[UserModel, int]):
 
         return user
     
+    async def validate_password(self, password, user):
+        if len(password) < 4:
+            raise PasswordTooShortException
+
     async def on_after_forgot_password(self, user, token, request = None):
-        await send_reset_password_email(user, token, request)
+        await send_reset_password_email(self.user_db.session, user, token)
 
-async def get_user_db():
-    async with AsyncSessionFactory() as session:
-        yield SQLAlchemyUserDatabase(session, UserModel)
+# Both share the request's session with the route itself (FastAPI caches `create_session` per request), so an
+# authenticated request holds one connection rather than one per dependency.
+async def get_user_db(session: AsyncSession = Depends(create_session)):
+    yield SQLAlchemyUserDatabase(session, UserModel)
 
-async def get_access_token_db(
-):  
-    async with AsyncSessionFactory() as session:
-        yield SQLAlchemyAccessTokenDatabase(session, AccessTokenModel)
+async def get_access_token_db(session: AsyncSession = Depends(create_session)):
+    yield SQLAlchemyAccessTokenDatabase(session, AccessTokenModel)
 
 async def get_user_manager(user_db: SQLAlchemyUserDatabase = Depends(get_user_db)):
     yield UserManager(user_db)
@@ -98,4 +102,18 @@ cookie_transport = CookieTransportWithResponses(cookie_secure=settings.dev_phase
 auth_backend = AuthenticationBackendWithResponses(name="cookie", transport=cookie_transport, get_strategy=get_db_strategy)
 fastapi_users = FastAPIUsers[UserModel, int](get_user_manager, [auth_backend])
 get_current_user = fastapi_users.current_user(active=True)
-get_current_user_or_none = fastapi_users.current_user(active=True, optional=True)
\ No newline at end of file
+get_current_user_or_none = fastapi_users.current_user(active=True, optional=True)
+get_current_superuser = fastapi_users.current_user(active=True, superuser=True)
+
+async def get_superuser_from_token(token: Optional[str]) -> Optional[UserModel]:
+    """ Resolve a login cookie's token to an active superuser outside of dependency injection, e.g. in middleware. """
+    if token is None: return None
+    async with AsyncSessionFactory() as session:
+        strategy = DatabaseStrategy(
+            SQLAlchemyAccessTokenDatabase(session, AccessTokenModel),
+            lifetime_seconds=settings.access_token_lifetime_seconds
+        )
+        user = await strategy.read_token(token, UserManager(SQLAlchemyUserDatabase(session, UserModel)))
+    if user is None or not user.is_active or not user.is_superuser:
+        return None
+    return user
@@ -1,7 +1,15 @@
+import asyncio
+import contextlib
+import functools
+import json
 import logging
+import time
 import typing
 
-from sqlalchemy.pool import AsyncAdaptedQueuePool
+from fastapi import Depends, Request
+from sqlalchemy import text
+from sqlalchemy.engine.url import URL
+from sqlalchemy.pool import AsyncAdaptedQueuePool, NullPool
 from sqlalchemy.ext import asyncio as sa
 
 from app.settings import settings, DevPhase
@@ -9,23 +17,189 @@ from app.settings import settings, DevPhase
 
 logger = logging.getLogger(__name__)
 
-async def create_sa_engine():
-    logger.info("Initializing SQLAlchemy engine")
-    engine = sa.create_async_engine(
-        url=settings.db_dsn,
-        echo=settings.dev_phase == DevPhase.DEV,
-        echo_pool=settings.dev_phase == DevPhase.DEV,
-        pool_size=settings.db_pool_size,
-        pool_pre_ping=settings.db_pool_pre_ping,
-        poolclass=AsyncAdaptedQueuePool,
-        max_overflow=settings.db_max_overflow,
-    )
-    logger.info("SQLAlchemy engine has been initialized")
-    try:
-        yield engine
-    finally:
-        await engine.dispose()
-        logger.info("SQLAlchemy engine has been cleaned up")
+class PoolWaitStats:
+    def __init__(self):
+        self.checkouts = 0
+        self.wait_seconds_total = 0.0
+        self.wait_seconds_max = 0.0
+
+    def record(self, waited: float) -> None:
+        self.checkouts += 1
+        self.wait_seconds_total += waited
+        self.wait_seconds_max = max(self.wait_seconds_max, waited)
+
+
+class InstrumentedAsyncAdaptedQueuePool(AsyncAdaptedQueuePool):
+    """ Queue pool that records how long each checkout spent waiting for (or opening) a connection. """
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.wait_stats = PoolWaitStats()
+
+    def _do_get(self):
+        start = time.perf_counter()
+        try:
+            return super()._do_get()
+        finally:
+            self.wait_stats.record(time.perf_counter() - start)
+
+    def recreate(self):
+        # Disposing an engine swaps in a fresh pool; keep the counters cumulative across it.
+        pool = super().recreate()
+        pool.wait_stats = self.wait_stats
+        return pool
+
+
+class Database:
+    """
+    Owns one SQLAlchemy engine for the lifetime of the application.
+
+    The engine is created in the FastAPI lifespan rather than at import time, warmed up with a handful of
+    connections before traffic arrives, and watched by a periodic background health check instead of
+    `pool_pre_ping`, which would otherwise cost a round trip on every checkout. The session factory passed in
+    is bound to the engine on start, so it can be imported (and used as a dependency) before the app starts.
+    """
+    def __init__(self, name: str, url: URL, session_factory: sa.async_sessionmaker):
+        self.name = name
+        self.url = url
+        self.session_factory = session_factory
+        self.engine: sa.AsyncEngine | None = None
+        self.healthy = False
+        self.last_health_check_at: float | None = None
+        self._health_check_task: asyncio.Task | None = None
+
+    async def connection_budget(self) -> int | None:
+        """ Connections this app may hold on the server across all its workers, or None if it can't be determined. """
+        if settings.db_max_connections is not None: return settings.db_max_connections
+
+        engine = sa.create_async_engine(url=self.url, poolclass=NullPool)
+        try:
+            async with engine.connect() as connection:
+                max_connections = int(await connection.scalar(text("SHOW max_connections")))
+                reserved = int(await connection.scalar(text("SHOW superuser_reserved_connections")))
+        except Exception as e:
+            logger.warning(f"Failed to read max_connections from { self.name } database with error { str(e) }")
+            return None
+        finally:
+            await engine.dispose()
+        return int((max_connections - reserved) * settings.db_max_connections_share)
+
+    async def pool_limits(self) -> tuple[int, int]:
+        """
+        Pool size and overflow for this worker: the configured ones, shrunk if need be so that every worker's pool
+        together fits the connection budget. Background tasks (health checks, flushes, mail) draw from the same pool.
+        """
+        budget = await self.connection_budget()
+        if budget is None: return settings.db_pool_size, settings.db_max_overflow
+
+        workers = settings.server_workers or 1
+        per_worker = max(budget // workers, 1)
+        pool_size = min(settings.db_pool_size, per_worker)
+        max_overflow = min(settings.db_max_overflow, per_worker - pool_size)
+        if (pool_size, max_overflow) != (settings.db_pool_size, settings.db_max_overflow):
+            logger.info(
+                f"Limiting { self.name } database pool to { pool_size } + { max_overflow } overflow connections, "
+                f"{ workers } workers sharing a budget of { budget }"
+            )
+        return pool_size, max_overflow
+
+    def create_engine(self, pool_size: int, max_overflow: int) -> sa.AsyncEngine:
+        return sa.create_async_engine(
+            url=self.url,
+            echo=settings.dev_phase == DevPhase.DEV,
+            echo_pool=settings.dev_phase == DevPhase.DEV,
+            poolclass=InstrumentedAsyncAdaptedQueuePool,
+            pool_size=pool_size,
+            max_overflow=max_overflow,
+            pool_timeout=settings.db_pool_timeout_seconds,
+            pool_recycle=settings.db_pool_recycle_seconds,
+            pool_pre_ping=settings.db_pool_pre_ping,
+            # Compact, since map layers are stored as JSON text and sent back to clients as is.
+            json_serializer=functools.partial(json.dumps, separators=(",", ":")),
+            connect_args={
+                # Size of SQLAlchemy's per-connection cache of asyncpg prepared statements.
+                "prepared_statement_cache_size": settings.db_prepared_statement_cache_size,
+            },
+        )
+
+    async def start(self) -> None:
+        logger.info(f"Initializing SQLAlchemy engine for { self.name } database")
+        self.engine = self.create_engine(*await self.pool_limits())
+        self.session_factory.configure(bind=self.engine)
+
+        await self.warm_up(settings.db_pool_warmup_connections)
+        self._health_check_task = asyncio.create_task(self._run_health_checks())
+        logger.info(f"SQLAlchemy engine for { self.name } database has been initialized")
+
+    async def stop(self) -> None:
+        if self._health_check_task is not None:
+            self._health_check_task.cancel()
+            with contextlib.suppress(asyncio.CancelledError):
+                await self._health_check_task
+            self._health_check_task = None
+
+        if self.engine is not None:
+            await self.engine.dispose()
+            self.engine = None
+        logger.info(f"SQLAlchemy engine for { self.name } database has been cleaned up")
+
+    async def warm_up(self, connections: int) -> None:
+        """
+        Open `connections` connections concurrently and return them to the pool, so the first requests don't pay for
+        connecting.
+        """
+        connections = min(connections, self.engine.pool.size())
+        if connections <= 0: return
+
+        try:
+            async with contextlib.AsyncExitStack() as stack:
+                await asyncio.gather(*(
+                    stack.enter_async_context(self.engine.connect()) for _ in range(connections)
+                ))
+            self.healthy = True
+        except Exception as e:
+            # Don't refuse to boot over a database blip; the health check will keep retrying.
+            logger.warning(f"Failed to warm up { self.name } database pool with error { str(e) }")
+            self.healthy = False
+
+    async def check_health(self) -> bool:
+        try:
+            async with self.engine.connect() as connection:
+                await connection.execute(text("SELECT 1"))
+        except Exception as e:
+            if self.healthy:
+                logger.warning(f"{ self.name.capitalize() } database failed health check with error { str(e) }")
+            self.healthy = False
+            # Without pre-ping, pooled connections may be dead too; drop them so checkouts reconnect.
+            await self.engine.dispose()
+        else:
+            if not self.healthy:
+                logger.info(f"{ self.name.capitalize() } database is healthy")
+            self.healthy = True
+        self.last_health_check_at = time.time()
+        return self.healthy
+
+    async def _run_health_checks(self) -> None:
+        while True:
+            await asyncio.sleep(settings.db_health_check_interval_seconds)
+            await self.check_health()
+
+    def pool_stats(self) -> dict[str, typing.Any]:
+        pool = self.engine.pool if self.engine is not None else None
+        if pool is None:
+            return { "database": self.name, "healthy": False }
+
+        return {
+            "database": self.name,
+            "healthy": self.healthy,
+            "size": pool.size(),
+            "checked_in": pool.checkedin(),
+            "checked_out": pool.checkedout(),
+            "overflow": pool.overflow(),
+            "checkouts": pool.wait_stats.checkouts,
+            "wait_seconds_total": pool.wait_stats.wait_seconds_total,
+            "wait_seconds_max": pool.wait_stats.wait_seconds_max,
+            "last_health_check_at": self.last_health_check_at,
+        }
 
 
 class CustomAsyncSession(sa.AsyncSession):
@@ -35,19 +209,59 @@ class CustomAsyncSession(sa.AsyncSession):
 
         return await super().close()
 
-engine = sa.create_async_engine(
-    url=settings.db_dsn,
-    echo=settings.dev_phase == DevPhase.DEV,
-    echo_pool=settings.dev_phase == DevPhase.DEV,
-    pool_size=settings.db_pool_size,
-    pool_pre_ping=settings.db_pool_pre_ping,
-    poolclass=AsyncAdaptedQueuePool,
-    max_overflow=settings.db_max_overflow,
-)
-AsyncSessionFactory = sa.async_sessionmaker(engine, expire_on_commit=False, autoflush=False)
+AsyncSessionFactory = sa.async_sessionmaker(expire_on_commit=False, autoflush=False)
+ReadAsyncSessionFactory = sa.async_sessionmaker(expire_on_commit=False, autoflush=False)
+
+primary_database = Database("primary", settings.db_dsn, AsyncSessionFactory)
+replica_database = Database(
+    "replica", settings.db_replica_dsn, ReadAsyncSessionFactory
+) if settings.db_replica_dsn is not None else None
+
+# Set on responses to writes; while it hasn't expired, the client's reads go to the primary.
+PRIMARY_PIN_COOKIE = "db_primary_until"
+
+async def start_databases() -> None:
+    await primary_database.start()
+    if replica_database is not None: await replica_database.start()
+
+async def stop_databases() -> None:
+    if replica_database is not None: await replica_database.stop()
+    await primary_database.stop()
+
+def databases() -> list[Database]:
+    return [primary_database] + ([replica_database] if replica_database is not None else [])
+
+def should_read_from_replica(request: Request) -> bool:
+    if replica_database is None or not replica_database.healthy:
+        return False
+    try:
+        pinned_until = float(request.cookies.get(PRIMARY_PIN_COOKIE, 0))
+    except ValueError:
+        pinned_until = 0
+    return pinned_until < time.time()
 
 async def create_session() -> sa.AsyncSession:
     async with AsyncSessionFactory() as session:
         logger.info("session created")
         yield session
-        logger.info("session closed")
\ No newline at end of file
+        logger.info("session closed")
+
+def read_session_factory(request: Request) -> sa.async_sessionmaker:
+    """ The database `create_read_session` would read from, for reads outliving the request's session (streaming). """
+    return ReadAsyncSessionFactory if should_read_from_replica(request) else AsyncSessionFactory
+
+async def create_read_session(
+    request: Request, primary_session: sa.AsyncSession = Depends(create_session)
+) -> sa.AsyncSession:
+    """
+    Session for read-only routes: the replica when one is healthy and the client hasn't just written, else the primary.
+    On the primary it's the request's shared session, which authentication may already have a connection checked out on.
+    """
+    if not should_read_from_replica(request):
+        yield primary_session
+        return
+
+    async with ReadAsyncSessionFactory() as session:
+        logger.info("read session created")
+        yield session
+        logger.info("read session closed")
\ No newline at end of file
@@ -1,3 +1,5 @@
 from .base import *
 from .user import *
-from .map import *
\ No newline at end of file
+from .map import *
+from .system import *
+from .job import *
\ No newline at end of file
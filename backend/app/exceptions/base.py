@@ -5,6 +5,7 @@ class CustomException(Exception):
     code = HTTPStatus.BAD_GATEWAY
     error_code = HTTPStatus.BAD_GATEWAY
     message = HTTPStatus.BAD_GATEWAY.description
+    headers: dict[str, str] | None = None
 
     def __init__(self, message=None):
         if message:
@@ -45,4 +46,28 @@ class UnprocessableEntity(CustomException):
 class DuplicateValueException(CustomException):
     code = HTTPStatus.UNPROCESSABLE_ENTITY
     error_code = HTTPStatus.UNPROCESSABLE_ENTITY
-    message = HTTPStatus.UNPROCESSABLE_ENTITY.description
\ No newline at end of file
+    message = HTTPStatus.UNPROCESSABLE_ENTITY.description
+
+
+class RequestEntityTooLarge(CustomException):
+    code = HTTPStatus.REQUEST_ENTITY_TOO_LARGE
+    error_code = HTTPStatus.REQUEST_ENTITY_TOO_LARGE
+    message = HTTPStatus.REQUEST_ENTITY_TOO_LARGE.description
+
+
+class RangeNotSatisfiable(CustomException):
+    code = HTTPStatus.REQUESTED_RANGE_NOT_SATISFIABLE
+    error_code = HTTPStatus.REQUESTED_RANGE_NOT_SATISFIABLE
+    message = HTTPStatus.REQUESTED_RANGE_NOT_SATISFIABLE.description
+
+
+class TooManyRequests(CustomException):
+    code = HTTPStatus.TOO_MANY_REQUESTS
+    error_code = HTTPStatus.TOO_MANY_REQUESTS
+    message = HTTPStatus.TOO_MANY_REQUESTS.description
+
+
+class ServiceUnavailable(CustomException):
+    code = HTTPStatus.SERVICE_UNAVAILABLE
+    error_code = HTTPStatus.SERVICE_UNAVAILABLE
+    message = HTTPStatus.SERVICE_UNAVAILABLE.description
@@ -0,0 +1,5 @@
+from .base import NotFoundException
+
+class JobDoesNotExistException(NotFoundException):
+    error_code = "JOB__DOES_NOT_EXIST"
+    message = "No job exists with this ID"
@@ -1,4 +1,6 @@
-from .base import BadRequestException, NotFoundException, UnauthorizedException
+from .base import (
+    BadRequestException, NotFoundException, UnauthorizedException, UnprocessableEntity, RequestEntityTooLarge
+)
 
 class MapDoesNotExistException(NotFoundException):
     error_code = "MAP__DOES_NOT_EXIST"
@@ -6,4 +8,32 @@ class MapDoesNotExistException(NotFoundException):
 
 class MapNotPublicException(UnauthorizedException):
     error_code = "MAP__NOT_PUBLIC"
-    message = "You do not have permission to access this map"
\ No newline at end of file
+    message = "You do not have permission to access this map"
+
+class MapBatchTooLargeException(BadRequestException):
+    error_code = "MAP__BATCH_TOO_LARGE"
+    message = "Too many maps were requested in a single batch"
+
+class MapSearchCursorInvalidException(BadRequestException):
+    error_code = "MAP__SEARCH_CURSOR_INVALID"
+    message = "The provided search cursor is malformed"
+
+class MapLayerInvalidException(BadRequestException):
+    error_code = "MAP__LAYER_INVALID"
+    message = "Unknown map layer requested"
+
+class MapDataInvalidException(UnprocessableEntity):
+    error_code = "MAP__DATA_INVALID"
+    message = "The map data is malformed"
+
+class MapDataTooLargeException(RequestEntityTooLarge):
+    error_code = "MAP__DATA_TOO_LARGE"
+    message = "The map data exceeds the allowed size"
+
+class MapBodyInvalidException(UnprocessableEntity):
+    error_code = "MAP__BODY_INVALID"
+    message = "The request body is not a valid map"
+
+class MapBodyTooLargeException(RequestEntityTooLarge):
+    error_code = "MAP__BODY_TOO_LARGE"
+    message = "The request body exceeds the allowed size"
\ No newline at end of file
@@ -0,0 +1,38 @@
+from .base import NotFoundException, RangeNotSatisfiable, ServiceUnavailable, TooManyRequests, UnauthorizedException
+
+class ProfileDoesNotExistException(NotFoundException):
+    error_code = "SYSTEM__PROFILE_DOES_NOT_EXIST"
+    message = "No profile exists with this ID, or it has been pruned"
+
+
+class RangeNotSatisfiableException(RangeNotSatisfiable):
+    error_code = "SYSTEM__RANGE_NOT_SATISFIABLE"
+    message = "None of the requested byte ranges overlap the resource"
+
+    def __init__(self, size: int, message=None):
+        super().__init__(message)
+        self.headers = { "Content-Range": f"bytes */{ size }" }
+
+
+class MetricsUnauthorizedException(UnauthorizedException):
+    error_code = "SYSTEM__METRICS_UNAUTHORIZED"
+    message = "Metrics are only served with the metrics token"
+    headers = { "WWW-Authenticate": "Bearer" }
+
+
+class RateLimitedException(TooManyRequests):
+    error_code = "SYSTEM__RATE_LIMITED"
+    message = "Too many requests, try again later"
+
+    def __init__(self, retry_after: int, message=None):
+        super().__init__(message)
+        self.headers = { "Retry-After": str(retry_after) }
+
+
+class OverloadedException(ServiceUnavailable):
+    error_code = "SYSTEM__OVERLOADED"
+    message = "The server is busy, try again shortly"
+
+    def __init__(self, retry_after: int, message=None):
+        super().__init__(message)
+        self.headers = { "Retry-After": str(retry_after) }
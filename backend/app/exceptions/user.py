@@ -22,4 +22,8 @@ class PasswordTooShortException(BadRequestException):
 
 class InvalidCredentialsException(UnauthorizedException):
     error_code = "USER__INVALID_CREDENTIALS"
-    message = "Invalid credentials provided for user"
\ No newline at end of file
+    message = "Invalid credentials provided for user"
+
+class ResetPasswordTokenInvalidException(BadRequestException):
+    error_code = "USER__RESET_PASSWORD_TOKEN_INVALID"
+    message = "This password reset link is invalid or has expired"
@@ -0,0 +1,238 @@
+"""
+3D models of a map for download, a mesh per part of the city, written as binary STL or binary glTF (GLB).
+
+Meshes are built with NumPy: polygons are extruded by walls of two triangles per edge, in one pass over every edge of
+a layer, and capped top and bottom, convex polygons by fans and the rest by ear clipping. Everything is in map units,
+with heights as stored and z up (y up in glTF, as it requires).
+"""
+import enum
+import json
+import struct
+import typing
+
+import numpy as np
+
+from app.map_data import Layer, features_of, parse_map_data, ring_areas, to_layer
+from app.scene import MAP_SIZE, PARK_COLOR, ROAD_COLOR, ROAD_WIDTHS, WATER_COLOR, road_quads
+
+class ExportFormat(str, enum.Enum):
+    stl = "stl"
+    glb = "glb"
+
+
+class Mesh(typing.NamedTuple):
+    positions: np.ndarray
+    triangles: np.ndarray
+
+
+class ExportPart(typing.NamedTuple):
+    layers: tuple[str, ...]
+    color: tuple[int, int, int, int]
+
+
+# In the order they're written, as the client's exporter wrote them
+EXPORT_PARTS = {
+    "domain": ExportPart((), (252, 246, 217, 255)),
+    "sea": ExportPart(("sea",), WATER_COLOR),
+    "river": ExportPart(("river",), WATER_COLOR),
+    "roads": ExportPart(tuple(ROAD_WIDTHS), ROAD_COLOR),
+    "parks": ExportPart(("bigParks", "smallParks"), PARK_COLOR),
+    "buildings": ExportPart(("buildings",), (200, 200, 200, 255)),
+}
+# Parks stand just above the ground, as the client's exporter raised city blocks.
+PARK_HEIGHT = 1.0
+README = "Each part of the city is its own model, in map units with z up. Stack them to put the city together.\n"
+
+STL_TRIANGLE = np.dtype([("normal", "<f4", 3), ("vertices", "<f4", (3, 3)), ("attributes", "<u2")])
+
+
+def open_rings(layer: Layer) -> tuple[Layer, np.ndarray]:
+    """
+    `layer` without the repeated closing vertex of rings that have one, and without rings of under 3 vertices; and
+    which of its rings were kept.
+    """
+    lengths = layer.ends - layer.starts
+    closed = lengths > 1
+    closed[closed] = (layer.vertices[layer.starts[closed]] == layer.vertices[layer.ends[closed] - 1]).all(axis=1)
+    keep = np.ones(len(layer.vertices), dtype=bool)
+    keep[layer.ends[closed] - 1] = False
+    counts = lengths - closed
+
+    valid = counts >= 3
+    keep &= np.repeat(valid, lengths)
+    offsets = np.zeros(valid.sum() + 1, dtype=np.int64)
+    np.cumsum(counts[valid], out=offsets[1:])
+    return Layer(layer.vertices[keep], offsets), valid
+
+def following(layer: Layer) -> np.ndarray:
+    """ The index of the vertex after each one in its ring. """
+    indices = np.arange(1, len(layer.vertices) + 1)
+    indices[layer.ends - 1] = layer.starts
+    return indices
+
+def signed_areas(layer: Layer) -> np.ndarray:
+    """ Each ring's area, positive if it winds counterclockwise. """
+    if not len(layer.starts): return np.zeros(0)
+    x, y = layer.vertices[:, 0], layer.vertices[:, 1]
+    after = following(layer)
+    return np.add.reduceat(x * y[after] - x[after] * y, layer.starts) / 2
+
+def ear_clip(ring: np.ndarray) -> np.ndarray:
+    """ Triangles of a simple polygon as indices into `ring`, by ear clipping. """
+    remaining = np.arange(len(ring))
+    if ring_areas(Layer(ring, np.array([0, len(ring)])))[0] == 0: return np.zeros((0, 3), dtype=np.int64)
+    if signed_areas(Layer(ring, np.array([0, len(ring)])))[0] < 0: remaining = remaining[::-1]
+
+    triangles = []
+    i = stalled = 0
+    while len(remaining) > 3 and stalled < len(remaining):
+        count = len(remaining)
+        a, b, c = remaining[(i - 1) % count], remaining[i % count], remaining[(i + 1) % count]
+        (ax, ay), (bx, by), (cx, cy) = ring[a], ring[b], ring[c]
+        is_ear = (bx - ax) * (cy - ay) - (by - ay) * (cx - ax) > 0
+        if is_ear:
+            # No other vertex may lie in the ear, by the signs of its position against each of the ear's edges.
+            others = ring[remaining[(remaining != a) & (remaining != b) & (remaining != c)]]
+            px, py = others[:, 0], others[:, 1]
+            inside = (
+                ((bx - ax) * (py - ay) - (by - ay) * (px - ax) >= 0)
+                & ((cx - bx) * (py - by) - (cy - by) * (px - bx) >= 0)
+                & ((ax - cx) * (py - cy) - (ay - cy) * (px - cx) >= 0)
+            )
+            is_ear = not inside.any()
+        if is_ear:
+            triangles.append((a, b, c))
+            remaining = np.delete(remaining, i % count)
+            stalled = 0
+        else:
+            i += 1
+            stalled += 1
+    # A polygon that isn't simple can run out of ears; what's left of it is fanned.
+    triangles += [(remaining[0], remaining[j], remaining[j + 1]) for j in range(1, len(remaining) - 1)]
+    return np.array(triangles, dtype=np.int64).reshape(-1, 3)
+
+def cap_triangles(layer: Layer) -> np.ndarray:
+    """ Triangles covering each ring of an open ring layer, as vertex indices, all winding counterclockwise. """
+    counts = layer.ends - layer.starts
+    if not len(counts): return np.zeros((0, 3), dtype=np.int64)
+    edges = layer.vertices[following(layer)] - layer.vertices
+    previous = np.empty_like(edges)
+    previous[following(layer)] = edges
+    turns = previous[:, 0] * edges[:, 1] - previous[:, 1] * edges[:, 0]
+    convex = (np.minimum.reduceat(turns, layer.starts) >= 0) | (np.maximum.reduceat(turns, layer.starts) <= 0)
+
+    # Convex rings are fanned from their first vertex, all at once.
+    fans = counts[convex] - 2
+    fan_starts = np.repeat(layer.starts[convex], fans)
+    steps = np.arange(fans.sum()) - np.repeat(np.cumsum(fans) - fans, fans) + 1
+    triangles = [np.column_stack([fan_starts, fan_starts + steps, fan_starts + steps + 1])]
+    for start, end in zip(layer.starts[~convex], layer.ends[~convex], strict=True):
+        triangles.append(ear_clip(layer.vertices[start:end]) + start)
+    triangles = np.concatenate(triangles)
+
+    a, b, c = (layer.vertices[triangles[:, i]] for i in range(3))
+    clockwise = (b[:, 0] - a[:, 0]) * (c[:, 1] - a[:, 1]) - (b[:, 1] - a[:, 1]) * (c[:, 0] - a[:, 0]) < 0
+    triangles[clockwise] = triangles[clockwise][:, [0, 2, 1]]
+    return triangles
+
+def extrude(layer: Layer, heights: np.ndarray | float) -> Mesh:
+    """ Each ring of `layer` raised into a closed prism of its height, or left a flat polygon if that's 0. """
+    heights = np.broadcast_to(np.asarray(heights, dtype=np.float64), (len(layer.starts),))
+    layer, kept = open_rings(layer)
+    heights = heights[kept]
+    count = len(layer.vertices)
+    caps = cap_triangles(layer)
+    bottom = np.column_stack([layer.vertices, np.zeros(count)])
+    if not heights.any(): return Mesh(bottom, caps)
+
+    top = np.column_stack([layer.vertices, np.repeat(heights, layer.ends - layer.starts)])
+    after = following(layer)
+    here = np.arange(count)
+    walls = np.concatenate([
+        np.column_stack([here, after, after + count]),
+        np.column_stack([here, after + count, here + count]),
+    ])
+    # Walls face out of counterclockwise rings as built, so those of clockwise rings are turned around.
+    clockwise = np.tile(np.repeat(signed_areas(layer) < 0, layer.ends - layer.starts), 2)
+    walls[clockwise] = walls[clockwise][:, [0, 2, 1]]
+    return Mesh(np.concatenate([bottom, top]), np.concatenate([caps[:, [0, 2, 1]], caps + count, walls]))
+
+def merge(*meshes: Mesh) -> Mesh:
+    offsets = np.cumsum([0, *(len(mesh.positions) for mesh in meshes[:-1])])
+    return Mesh(
+        np.concatenate([mesh.positions for mesh in meshes]),
+        np.concatenate([mesh.triangles + offset for mesh, offset in zip(meshes, offsets, strict=True)]),
+    )
+
+def check_map_data_json(data_json: str) -> None:
+    """ Raise as `parse_map_data` does if a map's stored data, which may predate its checks, can't be exported. """
+    parse_map_data(json.loads(data_json))
+
+def part_mesh(part: str, data: dict[str, typing.Any]) -> Mesh:
+    """ The mesh of one of EXPORT_PARTS, from the layers of map data it's made of. """
+    layers = { name: to_layer(name, features_of(data, name)) for name in EXPORT_PARTS[part].layers }
+    if part == "domain":
+        corners = np.array([(0, 0), (MAP_SIZE, 0), (MAP_SIZE, MAP_SIZE), (0, MAP_SIZE)], dtype=np.float64)
+        return extrude(Layer(corners, np.array([0, 4])), 0)
+    if part == "roads":
+        return merge(*(extrude(road_quads(layers[name], half_width), 0) for name, half_width in ROAD_WIDTHS.items()))
+    if part == "parks":
+        return merge(*(extrude(layer, PARK_HEIGHT) for layer in layers.values()))
+    if part == "buildings":
+        heights = np.array([building["height"] for building in data["buildings"]], dtype=np.float64)
+        return extrude(layers["buildings"], heights)
+    return extrude(layers[part], 0)
+
+def to_stl(mesh: Mesh, name: str) -> bytes:
+    corners = mesh.positions[mesh.triangles]
+    normals = np.cross(corners[:, 1] - corners[:, 0], corners[:, 2] - corners[:, 0])
+    lengths = np.linalg.norm(normals, axis=1, keepdims=True)
+    records = np.zeros(len(corners), dtype=STL_TRIANGLE)
+    records["normal"] = np.divide(normals, lengths, out=np.zeros_like(normals), where=lengths > 0)
+    records["vertices"] = corners
+    return f"citygen { name }".encode()[:80].ljust(80, b"\0") + struct.pack("<I", len(records)) + records.tobytes()
+
+def to_glb(mesh: Mesh, name: str, color: tuple[int, int, int, int]) -> bytes:
+    # Swapping y and z for glTF's y up mirrors the mesh, so the triangles' winding is reversed to keep them facing out.
+    positions = mesh.positions[:, [0, 2, 1]].astype("<f4")
+    indices = mesh.triangles[:, [0, 2, 1]].astype("<u4")
+    binary = positions.tobytes() + indices.tobytes()
+    document = {
+        "asset": { "version": "2.0", "generator": "citygen" },
+        "scene": 0,
+        "scenes": [{ "nodes": [0] }],
+        "nodes": [{ "mesh": 0, "name": name }],
+        "meshes": [{ "name": name, "primitives": [{ "attributes": { "POSITION": 0 }, "indices": 1, "material": 0 }] }],
+        "materials": [{ "pbrMetallicRoughness": { "baseColorFactor": [c / 255 for c in color], "metallicFactor": 0 } }],
+        "buffers": [{ "byteLength": len(binary) }],
+        "bufferViews": [
+            { "buffer": 0, "byteOffset": 0, "byteLength": positions.nbytes, "target": 34962 },
+            { "buffer": 0, "byteOffset": positions.nbytes, "byteLength": indices.nbytes, "target": 34963 },
+        ],
+        "accessors": [
+            {
+                "bufferView": 0, "componentType": 5126, "count": len(positions), "type": "VEC3",
+                "min": positions.min(axis=0).tolist(), "max": positions.max(axis=0).tolist(),
+            },
+            { "bufferView": 1, "componentType": 5125, "count": indices.size, "type": "SCALAR" },
+        ],
+    }
+    # Chunks are padded to 4 bytes, the JSON with spaces.
+    document_json = json.dumps(document, separators=(",", ":")).encode()
+    document_json += b" " * (-len(document_json) % 4)
+    binary += b"\0" * (-len(binary) % 4)
+    return b"".join([
+        struct.pack("<4sII", b"glTF", 2, 12 + 8 + len(document_json) + 8 + len(binary)),
+        struct.pack("<I4s", len(document_json), b"JSON"), document_json,
+        struct.pack("<I4s", len(binary), b"BIN\0"), binary,
+    ])
+
+def export_part(part: str, layers_json: str, format: str) -> bytes | None:
+    """
+    One of EXPORT_PARTS as a file of `format`, from the JSON text of an object of the layers it's made of. None if
+    the part is empty, like a map's missing river.
+    """
+    mesh = part_mesh(part, json.loads(layers_json))
+    if not len(mesh.triangles): return None
+    if format == ExportFormat.glb: return to_glb(mesh, part, EXPORT_PARTS[part].color)
+    return to_stl(mesh, part)
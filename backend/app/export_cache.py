@@ -0,0 +1,263 @@
+import asyncio
+import contextvars
+import logging
+import os
+import tempfile
+import zipfile
+from datetime import datetime
+from pathlib import Path
+from typing import AsyncIterator, BinaryIO
+from uuid import UUID
+
+from sqlalchemy.ext.asyncio import async_sessionmaker
+
+from app.exceptions.map import MapDataInvalidException, MapDataTooLargeException
+from app.export import EXPORT_PARTS, README, ExportFormat, check_map_data_json, export_part
+from app.map_data import LAYERS, join_layers_json
+from app.metrics import cache_requests_total
+from app.process_pool import process_pool
+from app.repositories import MapLayerService
+from app.settings import settings
+
+EXPORT_MEDIA_TYPE = "application/zip"
+
+logger = logging.getLogger(__name__)
+
+class ZipStream:
+    """
+    A write-only file for `zipfile` whose bytes are taken out with `drain` as they're written. It can't seek, so
+    entries are written with data descriptors after them rather than going back to fill in their headers.
+    """
+    def __init__(self):
+        self._buffer = bytearray()
+        self._position = 0
+
+    def write(self, data: bytes) -> int:
+        self._buffer += data
+        self._position += len(data)
+        return len(data)
+
+    def tell(self) -> int:
+        return self._position
+
+    def flush(self) -> None:
+        pass
+
+    def drain(self) -> bytes:
+        data = bytes(self._buffer)
+        self._buffer.clear()
+        return data
+
+
+def export_filename(map_id: UUID, format: ExportFormat) -> str:
+    return f"citygen-{ map_id }-{ format.value }.zip"
+
+def cached_export_path(map_id: UUID, updated_at: datetime, format: ExportFormat) -> Path:
+    """ Where a map's export is kept once built; a map that's changed since has a path of its own. """
+    version = int(updated_at.timestamp() * 1_000_000)
+    return Path(settings.export_cache_dir) / f"{ map_id }-{ version }.{ format.value }.zip"
+
+def create_partial_export(path: Path) -> str:
+    """ A new temporary file next to where the export at `path` will be kept, which it's built in. """
+    path.parent.mkdir(parents=True, exist_ok=True)
+    file, temporary_path = tempfile.mkstemp(dir=path.parent, prefix=".", suffix=".partial")
+    os.close(file)
+    return temporary_path
+
+def store_export(temporary_path: str, path: Path, map_id: UUID, format: ExportFormat) -> None:
+    """ Move a finished export into the cache, dropping what it replaces and whatever no longer fits. """
+    # Only a complete export is cached, and never seen half written.
+    os.replace(temporary_path, path)
+    # Exports of the map from before it last changed won't be asked for again.
+    for stale in path.parent.glob(f"{ map_id }-*.{ format.value }.zip"):
+        if stale != path: stale.unlink(missing_ok=True)
+    evict_exports(path)
+
+def evict_exports(keep: Path) -> None:
+    """ Drop the least recently used exports until the rest fit in the cache's limit, never `keep`, just built. """
+    exports = []
+    for path in Path(settings.export_cache_dir).glob("*.zip"):
+        try:
+            stat = path.stat()
+        except FileNotFoundError:
+            continue
+        exports.append((stat.st_mtime, stat.st_size, path))
+    total = sum(size for _, size, _ in exports)
+    for _, size, path in sorted(exports):
+        if total <= settings.export_cache_max_bytes: break
+        if path == keep: continue
+        path.unlink(missing_ok=True)
+        total -= size
+
+def write_chunk(file: BinaryIO, chunk: bytes) -> None:
+    file.write(chunk)
+    # Flushed, so the requests following the build can read it.
+    file.flush()
+
+
+class ExportBuild:
+    """
+    An export being built into a temporary file, which the requests for it follow as it grows. `checked` is settled
+    once the map's data has been checked, before anything's written, so a map that can't be exported is answered
+    with an error rather than a response cut short.
+    """
+    def __init__(self, path: Path):
+        self.path = path
+        self.temporary_path: str | None = None
+        self.checked: asyncio.Future[None] = asyncio.get_running_loop().create_future()
+        self.written = 0
+        self.task: asyncio.Task | None = None
+        self._grown = asyncio.Event()
+
+    def grew(self, size: int = 0) -> None:
+        self.written += size
+        self._grown.set()
+        self._grown = asyncio.Event()
+
+    async def follow(self) -> AsyncIterator[bytes]:
+        """
+        The export from its first byte, as it's written. The file is opened before this returns, so it's still
+        readable once it's been moved into the cache, or evicted from it.
+        """
+        try:
+            file = await asyncio.to_thread(open, self.temporary_path, "rb")
+        except FileNotFoundError:
+            # Moved into the cache since it was checked, or removed as the build failed, which raises here.
+            await asyncio.shield(self.task)
+            file = await asyncio.to_thread(open, self.path, "rb")
+        return self._read(file)
+
+    async def _read(self, file: BinaryIO) -> AsyncIterator[bytes]:
+        try:
+            position = 0
+            while True:
+                grown = self._grown
+                if position < self.written:
+                    chunk = await asyncio.to_thread(file.read, self.written - position)
+                    position += len(chunk)
+                    yield chunk
+                elif self.task.done():
+                    # Past the check, a failed build can only cut the response short.
+                    self.task.result()
+                    return
+                else:
+                    await grown.wait()
+        finally:
+            await asyncio.to_thread(file.close)
+
+
+class ExportCache:
+    """
+    Map exports (see app.export), each a zip of a model per part, kept as files in EXPORT_CACHE_DIR once built and
+    dropped least recently used first past EXPORT_CACHE_MAX_BYTES. Requests for an export that's still being built
+    stream the same build as it's written. Files are only touched from threads, so a slow disk doesn't hold up the
+    event loop.
+    """
+    def __init__(self):
+        self._builds: dict[Path, ExportBuild] = {}
+
+    async def get(self, map_id: UUID, updated_at: datetime, format: ExportFormat) -> Path | None:
+        path = cached_export_path(map_id, updated_at, format)
+        try:
+            # Touched, so the exports dropped when the cache is full are the ones asked for longest ago.
+            await asyncio.to_thread(os.utime, path)
+        except FileNotFoundError:
+            cache_requests_total.inc("map_export", "miss")
+            return None
+        cache_requests_total.inc("map_export", "hit")
+        return path
+
+    async def _build(
+        self, build: ExportBuild, session_factory: async_sessionmaker, map_id: UUID, format: ExportFormat
+    ) -> None:
+        builds: dict[str, asyncio.Future] = {}
+        try:
+            # A map stored before its data was checked as it is now may not export, which has to be found out before
+            # any of the response is sent.
+            try:
+                build.temporary_path = await asyncio.to_thread(create_partial_export, build.path)
+                async with session_factory() as session:
+                    layers_json = await MapLayerService(session=session).get_layers_json(map_id, list(LAYERS))
+                await process_pool.run(check_map_data_json, join_layers_json(layers_json))
+            except Exception as e:
+                # Removed before the error's answered, so nothing's left of an export that can't be built.
+                if build.temporary_path is not None:
+                    await asyncio.to_thread(Path(build.temporary_path).unlink, missing_ok=True)
+                build.checked.set_exception(e)
+                raise
+            build.checked.set_result(None)
+
+            # Every part is built at once across the pool, and written out in order as each is done.
+            builds = {
+                part: asyncio.ensure_future(process_pool.run(
+                    export_part,
+                    part,
+                    join_layers_json({ name: layers_json[name] for name in spec.layers }),
+                    format.value,
+                ))
+                for part, spec in EXPORT_PARTS.items()
+            }
+            cache_file = await asyncio.to_thread(open, build.temporary_path, "wb")
+            try:
+                stream = ZipStream()
+                with zipfile.ZipFile(stream, "w", compression=zipfile.ZIP_DEFLATED) as archive:
+                    archive.writestr("README.txt", README)
+                    for part, part_build in builds.items():
+                        data = await part_build
+                        if data is None: continue
+                        # Deflating tens of megabytes would hold up the event loop.
+                        await asyncio.to_thread(archive.writestr, f"model/{ part }.{ format.value }", data)
+                        await self._write(build, cache_file, stream.drain())
+                await self._write(build, cache_file, stream.drain())
+            finally:
+                await asyncio.to_thread(cache_file.close)
+            await asyncio.to_thread(store_export, build.temporary_path, build.path, map_id, format)
+        finally:
+            for part_build in builds.values(): part_build.cancel()
+            if not build.checked.done(): build.checked.cancel()
+            if self._builds.get(build.path) is build: del self._builds[build.path]
+            if build.temporary_path is not None:
+                await asyncio.to_thread(Path(build.temporary_path).unlink, missing_ok=True)
+
+    @staticmethod
+    async def _write(build: ExportBuild, cache_file: BinaryIO, chunk: bytes) -> None:
+        await asyncio.to_thread(write_chunk, cache_file, chunk)
+        build.grew(len(chunk))
+
+    @staticmethod
+    def _log_failure(task: asyncio.Task) -> None:
+        # Maps that can't be exported are answered with why.
+        if task.cancelled() or isinstance(task.exception(), (MapDataInvalidException, MapDataTooLargeException)): return
+        if task.exception() is not None:
+            logger.error("Failed to build map export", exc_info=task.exception())
+
+    async def stream(
+        self, session_factory: async_sessionmaker, map_id: UUID, updated_at: datetime, format: ExportFormat
+    ) -> AsyncIterator[bytes]:
+        """
+        A map's export, which the caller must already have checked exists and may be seen, as it's built. The build
+        outlives the request that started it, so the layers are read in a session of its own from `session_factory`.
+        Raises before anything's streamed if the map's data can't be exported.
+        """
+        path = cached_export_path(map_id, updated_at, format)
+        build = self._builds.get(path)
+        if build is None:
+            build = self._builds[path] = ExportBuild(path)
+            # In a context of its own, so the build's queries aren't counted against whichever request started it.
+            build.task = asyncio.create_task(
+                self._build(build, session_factory, map_id, format), context=contextvars.Context()
+            )
+            build.task.add_done_callback(self._log_failure)
+            # The requests following it are woken once it's done, to finish reading or raise its error.
+            build.task.add_done_callback(lambda task: build.grew())
+        # Shielded, so one caller disconnecting doesn't cancel the build everyone else is following.
+        await asyncio.shield(build.checked)
+        return await build.follow()
+
+    async def stop(self) -> None:
+        builds = [build.task for build in self._builds.values()]
+        for task in builds: task.cancel()
+        await asyncio.gather(*builds, return_exceptions=True)
+
+
+export_cache = ExportCache()
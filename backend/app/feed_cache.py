@@ -0,0 +1,163 @@
+import asyncio
+import contextvars
+import gzip
+import hashlib
+import logging
+import time
+import typing
+from uuid import UUID
+
+from pydantic import TypeAdapter
+
+from app.db import AsyncSessionFactory
+from app.metrics import cache_requests_total
+from app.models import MapModel
+from app.repositories import MapService
+from app.schemas import MapRead
+from app.settings import settings
+
+logger = logging.getLogger(__name__)
+
+map_read_adapter = TypeAdapter(MapRead)
+
+class FeedEntry(typing.NamedTuple):
+    map_id: UUID
+    user_id: int
+    # The map serialized as it appears in the feed, and again with `favorited` set, for overlaying a caller's favorites.
+    json: bytes
+    favorited_json: bytes
+
+
+class FeedSnapshot:
+    """ A feed page as the anonymous caller sees it, serialized and gzipped once when it's built. """
+    def __init__(self, entries: list[FeedEntry], generation: int):
+        self.entries = entries
+        self.generation = generation
+        self.built_at = time.monotonic()
+        self.body = b"[" + b",".join(entry.json for entry in entries) + b"]"
+        self.gzipped_body = gzip.compress(self.body, compresslevel=settings.feed_cache_gzip_level, mtime=0)
+        self.etag = f'"{ hashlib.blake2b(self.body, digest_size=16).hexdigest() }"'
+
+    @property
+    def age(self) -> float:
+        return time.monotonic() - self.built_at
+
+    def overlay(self, favorited: set[UUID], exclude_user_id: int | None = None) -> bytes:
+        """ The feed as a signed-in user sees it: their favorites flagged, and optionally their own maps left out. """
+        return b"[" + b",".join(
+            entry.favorited_json if entry.map_id in favorited else entry.json
+            for entry in self.entries if entry.user_id != exclude_user_id
+        ) + b"]"
+
+
+class FeedSnapshotCache:
+    """
+    In-process stale-while-revalidate cache of public feed snapshots, keyed by page.
+
+    A snapshot younger than `ttl` is served as is. Until it's `ttl + stale_while_revalidate` old it's still served,
+    while a single background refresh per key replaces it; past that, or before the first build, callers wait on that
+    same refresh rather than each querying the database.
+
+    `invalidate` is called after writes that change the feed (a map created, or its privacy changed). It refreshes
+    the key right away, and until that refresh lands callers wait on it rather than being served the old snapshot, so a
+    worker reads its own writes. Other workers pick the change up once their snapshot expires.
+    """
+    def __init__(
+        self,
+        build: typing.Callable[[str], typing.Awaitable[list[FeedEntry]]],
+        ttl: float,
+        stale_while_revalidate: float
+    ):
+        self.build = build
+        self.ttl = ttl
+        self.stale_while_revalidate = stale_while_revalidate
+        self._snapshots: dict[str, FeedSnapshot] = {}
+        self._generations: dict[str, int] = {}
+        self._refreshes: dict[str, asyncio.Task] = {}
+
+    async def _refresh(self, key: str) -> FeedSnapshot:
+        try:
+            # An invalidation while building means the build may have missed the write, so go again.
+            while True:
+                generation = self._generations.get(key, 0)
+                entries = await self.build(key)
+                # Compressing a large feed takes a while, so keep it off the event loop.
+                snapshot = await asyncio.to_thread(FeedSnapshot, entries, generation)
+                self._snapshots[key] = snapshot
+                if self._generations.get(key, 0) == generation: return snapshot
+        finally:
+            if self._refreshes.get(key) is asyncio.current_task(): del self._refreshes[key]
+
+    def _ensure_refresh(self, key: str) -> asyncio.Task:
+        task = self._refreshes.get(key)
+        if task is None:
+            # In a context of its own, so the refresh's queries aren't counted against whichever request started it.
+            task = asyncio.create_task(self._refresh(key), context=contextvars.Context())
+            task.add_done_callback(self._log_failure)
+            self._refreshes[key] = task
+        return task
+
+    @staticmethod
+    def _log_failure(task: asyncio.Task) -> None:
+        if not task.cancelled() and task.exception() is not None:
+            logger.error("Failed to refresh feed snapshot", exc_info=task.exception())
+
+    async def get(self, key: str) -> FeedSnapshot:
+        snapshot = self._snapshots.get(key)
+        if snapshot is not None and snapshot.generation == self._generations.get(key, 0):
+            if snapshot.age < self.ttl:
+                cache_requests_total.inc("public_feed", "hit")
+                return snapshot
+            if snapshot.age < self.ttl + self.stale_while_revalidate:
+                cache_requests_total.inc("public_feed", "stale")
+                self._ensure_refresh(key)
+                return snapshot
+
+        cache_requests_total.inc("public_feed", "miss")
+        try:
+            # Shielded, so one caller disconnecting doesn't cancel the refresh everyone else is waiting on.
+            return await asyncio.shield(self._ensure_refresh(key))
+        except Exception:
+            # Serve the last snapshot over failing every request while the database is unavailable.
+            if snapshot is None: raise
+            logger.warning(f"Serving a { snapshot.age:.0f}s old feed snapshot after a failed refresh")
+            return snapshot
+
+    def invalidate(self, key: str) -> None:
+        self._generations[key] = self._generations.get(key, 0) + 1
+        self._ensure_refresh(key)
+
+    async def stop(self) -> None:
+        refreshes = list(self._refreshes.values())
+        for task in refreshes: task.cancel()
+        await asyncio.gather(*refreshes, return_exceptions=True)
+        self._snapshots.clear()
+        self._generations.clear()
+
+
+PUBLIC_FEED = "public"
+
+def feed_entries(maps: list[MapModel]) -> list[FeedEntry]:
+    entries = []
+    for map in maps:
+        read = MapRead.model_validate(map)
+        entries.append(FeedEntry(
+            map.id,
+            map.user_id,
+            map_read_adapter.dump_json(read),
+            map_read_adapter.dump_json(read.model_copy(update={"favorited": True}))
+        ))
+    return entries
+
+async def build_public_feed(key: str) -> list[FeedEntry]:
+    # From the primary rather than a replica, which may not have the write that invalidated the snapshot yet.
+    async with AsyncSessionFactory() as session:
+        maps = await MapService(session=session).list_maps(MapModel.private == False, user=None)
+    return await asyncio.to_thread(feed_entries, maps)
+
+
+public_feed_cache = FeedSnapshotCache(
+    build_public_feed,
+    ttl=settings.feed_cache_ttl_seconds,
+    stale_while_revalidate=settings.feed_cache_stale_while_revalidate_seconds
+)
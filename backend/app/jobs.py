@@ -0,0 +1,258 @@
+"""
+Background jobs, queued in the `jobs` table and run by workers that claim them from it.
+
+Work is queued with `enqueue_job`, in the same transaction as whatever called for it, so a job exists exactly when
+that change was committed. Each kind of job is registered with `@job` to a named queue, and each queue is worked with
+its own concurrency (`JOB_QUEUE_CONCURRENCY`). Workers claim due jobs with `SELECT ... FOR UPDATE SKIP LOCKED`, so
+any number of them can share the table, and push each claimed job's `run_at` out by a lease rather than holding its
+row lock while it runs; a job whose worker died is taken up again once its lease runs out. A job that fails is retried
+with exponential backoff until `JOBS_MAX_ATTEMPTS`, and one queued with a `dedupe_key` is only queued once while it
+may still run.
+
+Every server worker runs jobs alongside requests unless `JOBS_WORKER_ENABLED` is false, in which case they can be run
+by dedicated workers beside Granian instead:
+
+    uv run python -m app.jobs
+"""
+import asyncio
+import contextvars
+import logging
+import signal
+import sys
+import typing
+from datetime import datetime, timedelta, timezone
+from uuid import UUID
+
+from fastapi_users import exceptions
+from fastapi_users_db_sqlalchemy import SQLAlchemyUserDatabase
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.auth import UserManager
+from app.db import AsyncSessionFactory, start_databases, stop_databases
+from app.models import JobModel, UserModel
+from app.process_pool import process_pool
+from app.repositories import JobService, ThumbnailService
+from app.settings import settings
+from app.thumbnail_cache import thumbnail_cache
+
+logger = logging.getLogger(__name__)
+
+JobHandler = typing.Callable[[dict[str, typing.Any]], typing.Awaitable[dict[str, typing.Any] | None]]
+
+class JobKind(typing.NamedTuple):
+    queue: str
+    handler: JobHandler
+
+JOBS: dict[str, JobKind] = {}
+
+def job(kind: str, queue: str) -> typing.Callable[[JobHandler], JobHandler]:
+    """ Register a handler for a kind of job, run on `queue`. It's given the job's payload, and returns its result. """
+    def register(handler: JobHandler) -> JobHandler:
+        JOBS[kind] = JobKind(queue, handler)
+        return handler
+    return register
+
+def retry_delay(attempts: int) -> timedelta:
+    """ Backoff before the next try of a job that has failed `attempts` times. """
+    seconds = settings.jobs_retry_base_seconds * 2 ** (attempts - 1)
+    return timedelta(seconds=min(seconds, settings.jobs_retry_max_seconds))
+
+async def enqueue_job(
+    session: AsyncSession,
+    kind: str,
+    payload: dict[str, typing.Any],
+    dedupe_key: str | None = None,
+    user_id: int | None = None,
+) -> UUID:
+    """
+    Queue a job in `session`'s transaction, returning its id, or the id of the job already queued with `dedupe_key`.
+    It runs once the transaction is committed; call `job_runner.wake()` after committing to have it start at once.
+    """
+    return await JobService(session=session).enqueue(
+        JOBS[kind].queue, kind, payload, settings.jobs_max_attempts, dedupe_key=dedupe_key, user_id=user_id
+    )
+
+
+@job("map.thumbnail", queue="thumbnails")
+async def draw_map_thumbnail(payload: dict[str, typing.Any]) -> dict[str, typing.Any]:
+    map_id = UUID(payload["map_id"])
+    async with AsyncSessionFactory() as session:
+        thumbnail = await ThumbnailService(session=session).get_thumbnail(map_id)
+    # It may have been drawn already, by a request for it before the job came up.
+    if thumbnail is None or thumbnail.size != settings.thumbnail_size:
+        # Shielded, so shutting the worker down doesn't cancel a drawing that requests may be waiting on too.
+        thumbnail = await asyncio.shield(thumbnail_cache.render(map_id))
+    return { "thumbnail_id": str(thumbnail.id), "size": thumbnail.size }
+
+
+@job("auth.forgot_password", queue="mail")
+async def send_forgot_password_email(payload: dict[str, typing.Any]) -> None:
+    async with AsyncSessionFactory() as session:
+        user_manager = UserManager(SQLAlchemyUserDatabase(session, UserModel))
+        try:
+            user = await user_manager.get_by_email(payload["email"])
+            # The email is queued and committed by `on_after_forgot_password` (see app.mail).
+            await user_manager.forgot_password(user)
+        except (exceptions.UserNotExists, exceptions.UserInactive):
+            pass
+
+
+class JobRunner:
+    """
+    Works each of `concurrency`'s queues, running up to its number of jobs at once. A queue's loop wakes on `wake`,
+    whenever one of its jobs finishes, and at least every `poll_interval` seconds, to claim as many due jobs as it has
+    free slots for.
+    """
+    def __init__(
+        self, concurrency: dict[str, int], poll_interval: float, lease: float, shutdown_timeout: float
+    ):
+        self.concurrency = concurrency
+        self.poll_interval = poll_interval
+        self.lease = lease
+        self.shutdown_timeout = shutdown_timeout
+        self._wake: dict[str, asyncio.Event] = {}
+        self._running: dict[str, set[asyncio.Task]] = { queue: set() for queue in concurrency }
+        self._stopping = False
+        self._loops: list[asyncio.Task] = []
+
+    def wake(self) -> None:
+        """ Have every queue look for due jobs now, e.g. after committing new ones. """
+        for event in self._wake.values(): event.set()
+
+    async def _finish(
+        self, job: JobModel, error: str | None, result: dict[str, typing.Any] | None = None, give_up: bool = False
+    ) -> None:
+        async with AsyncSessionFactory() as session:
+            job_service = JobService(session=session)
+            if error is None:
+                await job_service.succeed(job.id, job.attempts, result)
+            elif give_up or job.attempts >= job.max_attempts:
+                logger.error(f"Giving up on job { job.id } ({ job.kind }) after { job.attempts } attempts: { error }")
+                await job_service.fail(job.id, job.attempts, error)
+            else:
+                logger.warning(f"Job { job.id } ({ job.kind }) failed (attempt { job.attempts }), retrying: { error }")
+                run_at = datetime.now(timezone.utc) + retry_delay(job.attempts)
+                await job_service.retry(job.id, job.attempts, run_at, error)
+            await session.commit()
+
+    async def _run(self, job: JobModel) -> None:
+        kind = JOBS.get(job.kind)
+        if kind is None:
+            # Nothing here can run it, so nothing should retry it.
+            return await self._finish(job, f"Unknown kind of job { job.kind }", give_up=True)
+        if job.attempts > job.max_attempts:
+            # Claimed again after its lease ran out on the last attempt, so that attempt never finished.
+            return await self._finish(job, "Ran out of time on its last attempt")
+
+        try:
+            # A job still running after its lease may be taken up by another worker, so it's stopped first.
+            result = await asyncio.wait_for(kind.handler(job.payload), timeout=self.lease)
+        except asyncio.CancelledError:
+            # Shutting down: the job is handed back to be run again straight away, by this worker or another.
+            async with AsyncSessionFactory() as session:
+                await JobService(session=session).release(job.id, job.attempts)
+                await session.commit()
+            raise
+        except Exception as e:
+            await self._finish(job, repr(e))
+        else:
+            await self._finish(job, None, result)
+
+    async def _start_due(self, queue: str) -> list[asyncio.Task]:
+        """ Claim as many of `queue`'s due jobs as it has free slots for, and start running them. """
+        free = self.concurrency[queue] - len(self._running[queue])
+        if free <= 0: return []
+        async with AsyncSessionFactory() as session:
+            jobs = await JobService(session=session).claim(queue, free, self.lease)
+            await session.commit()
+
+        tasks = []
+        for job in jobs:
+            # In a context of its own, so the job's queries aren't counted against whichever request woke the runner.
+            task = asyncio.create_task(self._run(job), context=contextvars.Context())
+            task.add_done_callback(lambda task, queue=queue: self._done(queue, task))
+            self._running[queue].add(task)
+            tasks.append(task)
+        return tasks
+
+    def _done(self, queue: str, task: asyncio.Task) -> None:
+        self._running[queue].discard(task)
+        if not task.cancelled() and task.exception() is not None:
+            logger.error("Failed to run job", exc_info=task.exception())
+        # A slot is free for the next job.
+        if queue in self._wake: self._wake[queue].set()
+
+    async def run_pending(self, queue: str) -> int:
+        """ Claim and run one round of `queue`'s due jobs to the end, returning how many were claimed. """
+        tasks = await self._start_due(queue)
+        await asyncio.gather(*tasks, return_exceptions=True)
+        return len(tasks)
+
+    async def run(self, queue: str) -> None:
+        wake = self._wake[queue]
+        while not self._stopping:
+            wake.clear()
+            try:
+                # Keep claiming while whole rounds come back.
+                while not self._stopping and await self._start_due(queue):
+                    pass
+            except Exception:
+                logger.exception(f"Failed to claim jobs from queue { queue }")
+            try:
+                await asyncio.wait_for(wake.wait(), timeout=self.poll_interval)
+            except asyncio.TimeoutError:
+                pass
+
+    def start(self) -> None:
+        self._stopping = False
+        self._wake = { queue: asyncio.Event() for queue, limit in self.concurrency.items() if limit > 0 }
+        self._loops = [asyncio.create_task(self.run(queue)) for queue in self._wake]
+
+    async def stop(self) -> None:
+        if not self._loops: return
+        self._stopping = True
+        self.wake()
+        await asyncio.gather(*self._loops, return_exceptions=True)
+        self._loops = []
+
+        # Running jobs get a moment to finish; those that don't are handed back to the queue.
+        running = [task for tasks in self._running.values() for task in tasks]
+        if running:
+            _, pending = await asyncio.wait(running, timeout=self.shutdown_timeout)
+            for task in pending: task.cancel()
+            await asyncio.gather(*pending, return_exceptions=True)
+        self._wake = {}
+
+
+job_runner = JobRunner(
+    concurrency=settings.job_queue_concurrency,
+    poll_interval=settings.jobs_poll_interval_seconds,
+    lease=settings.jobs_lease_seconds,
+    shutdown_timeout=settings.jobs_shutdown_timeout_seconds,
+)
+
+
+async def main() -> int:
+    """ Run jobs until interrupted, as a worker of its own beside the server. """
+    stopped = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for signum in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(signum, stopped.set)
+
+    await start_databases()
+    process_pool.start()
+    job_runner.start()
+    logger.info(f"Running jobs from { ', '.join(job_runner.concurrency) }")
+    try:
+        await stopped.wait()
+    finally:
+        await job_runner.stop()
+        await thumbnail_cache.stop()
+        await process_pool.stop()
+        await stop_databases()
+    return 0
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=settings.log_level.value.upper())
+    sys.exit(asyncio.run(main()))
@@ -1,32 +1,226 @@
-from fastapi import Request
-from fastapi_mail import FastMail, ConnectionConfig, MessageSchema
+import asyncio
+import contextlib
+import logging
+import typing
+from datetime import datetime, timedelta, timezone
+from email.utils import formataddr
+from urllib.parse import urlencode
 
-from app.models import UserModel
+from sqlalchemy import select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.db import AsyncSessionFactory
+from app.models import MailOutboxModel, UserModel
 from app.settings import settings
 
-mail_conf = ConnectionConfig(
-    MAIL_USERNAME=settings.mail_username,
-    MAIL_PASSWORD=settings.mail_password,
-    MAIL_FROM=settings.mail_from,
-    MAIL_PORT=settings.mail_port,
-    MAIL_SERVER=settings.mail_server,
-    MAIL_FROM_NAME=settings.mail_from_name,
-    MAIL_STARTTLS=settings.mail_starttls,
-    MAIL_SSL_TLS=settings.mail_ssl_tls
-) if settings.mail_enabled else None
+logger = logging.getLogger(__name__)
 
-fast_mail = FastMail(mail_conf) if settings.mail_enabled else None
+class SMTPConnection:
+    """
+    An open connection to the mail server, to send any number of messages over.
 
-async def send_reset_password_email(user: UserModel, token: str, request: Request):
-    if not settings.mail_enabled: return
+    fastapi_mail has no public API for that, only for a connection per message, so this wraps its `Connection` and
+    `MailMsg._message`. It's the only code that touches them, and fastapi-mail is pinned to the version it was written
+    against in pyproject.toml.
+    """
+    def __init__(self, connection: typing.Any):
+        self._connection = connection
+        self._sender = (
+            formataddr((settings.mail_from_name, settings.mail_from)) if settings.mail_from_name else settings.mail_from
+        )
+
+    @property
+    def is_connected(self) -> bool:
+        return self._connection.session.is_connected
+
+    async def send(self, message: MailOutboxModel) -> None:
+        from fastapi_mail import MessageSchema
+        from fastapi_mail.msg import MailMsg
+
+        email = await MailMsg(MessageSchema(
+            subject=message.subject, recipients=[message.recipient], body=message.body, subtype=message.subtype
+        ))._message(self._sender)
+        await self._connection.session.send_message(email)
+
+
+@contextlib.asynccontextmanager
+async def smtp_connection() -> typing.AsyncIterator[SMTPConnection]:
+    # The mail stack is only imported once there's mail to send.
+    from fastapi_mail import ConnectionConfig
+    from fastapi_mail.connection import Connection
+
+    config = ConnectionConfig(
+        MAIL_USERNAME=settings.mail_username or "",
+        MAIL_PASSWORD=settings.mail_password or "",
+        MAIL_FROM=settings.mail_from,
+        MAIL_PORT=settings.mail_port,
+        MAIL_SERVER=settings.mail_server,
+        MAIL_FROM_NAME=settings.mail_from_name,
+        MAIL_STARTTLS=settings.mail_starttls,
+        MAIL_SSL_TLS=settings.mail_ssl_tls,
+        USE_CREDENTIALS=settings.mail_username is not None,
+        TIMEOUT=settings.mail_timeout_seconds,
+    )
+    async with Connection(config) as connection:
+        yield SMTPConnection(connection)
+
+
+def retry_delay(attempts: int) -> timedelta:
+    """ Backoff before the next try of a message that has failed `attempts` times. """
+    seconds = settings.mail_outbox_retry_base_seconds * 2 ** (attempts - 1)
+    return timedelta(seconds=min(seconds, settings.mail_outbox_retry_max_seconds))
+
+
+class MailOutbox:
+    """
+    Background sender for the `mail_outbox` table.
+
+    Requests only insert a row (see `enqueue`), so mail server latency and outages never reach them. The sender
+    wakes on every enqueue, and at least every `poll_interval` seconds, to claim a batch of due messages and send it
+    over one SMTP connection. A message that fails is retried with exponential backoff until `max_attempts`.
+    Claiming pushes the batch's `next_attempt_at` out by a lease instead of holding row locks while sending, so
+    several workers can share the table, and mail claimed by a worker that dies is picked up again once it expires.
+    """
+    def __init__(self, poll_interval: float, batch_size: int, max_attempts: int, lease: float):
+        self.poll_interval = poll_interval
+        self.batch_size = batch_size
+        self.max_attempts = max_attempts
+        self.lease = lease
+        self._wake: asyncio.Event | None = None
+        self._stopping = False
+        self._task: asyncio.Task | None = None
 
-    origin = f"{ request.url.scheme}://{ request.url.hostname }"
-    if request.url.port: origin += f":{ request.url.port }"
+    async def enqueue(
+        self, session: AsyncSession, recipient: str, subject: str, body: str, subtype: str = "html"
+    ) -> None:
+        """ Queue a message and commit `session`, then nudge the sender. """
+        session.add(MailOutboxModel(recipient=recipient, subject=subject, body=body, subtype=subtype))
+        await session.commit()
+        if self._wake is not None: self._wake.set()
+
+    async def _claim(self) -> list[MailOutboxModel]:
+        now = datetime.now(timezone.utc)
+        due = (
+            select(MailOutboxModel.id)
+            .where(
+                MailOutboxModel.sent_at.is_(None),
+                MailOutboxModel.next_attempt_at <= now,
+                MailOutboxModel.attempts < self.max_attempts,
+            )
+            .order_by(MailOutboxModel.next_attempt_at)
+            .limit(self.batch_size)
+            .with_for_update(skip_locked=True)
+        )
+        async with AsyncSessionFactory() as session:
+            messages = (await session.scalars(
+                update(MailOutboxModel)
+                .where(MailOutboxModel.id.in_(due.scalar_subquery()))
+                .values(attempts=MailOutboxModel.attempts + 1, next_attempt_at=now + timedelta(seconds=self.lease))
+                .returning(MailOutboxModel),
+                execution_options={"synchronize_session": False},
+            )).all()
+            await session.commit()
+        return list(messages)
+
+    async def _deliver(self, messages: list[MailOutboxModel]) -> dict[int, str | None]:
+        """ Send `messages` over one connection, returning each message's error, if it failed. """
+        errors: dict[int, str | None] = {}
+        try:
+            async with smtp_connection() as connection:
+                for message in messages:
+                    try:
+                        await connection.send(message)
+                        errors[message.id] = None
+                    except Exception as e:
+                        errors[message.id] = repr(e)
+                        if not connection.is_connected: break
+        except Exception as e:
+            logger.warning(f"Connection to mail server { settings.mail_server } failed: { e }")
+            for message in messages:
+                errors.setdefault(message.id, repr(e))
+        # Anything left unsent after a dropped connection failed with it.
+        for message in messages:
+            errors.setdefault(message.id, "Connection to the mail server was lost")
+        return errors
+
+    async def send_pending(self) -> int:
+        """ Claim and send one batch of due mail, returning how many messages were claimed. """
+        messages = await self._claim()
+        if not messages: return 0
+
+        errors = await self._deliver(messages)
+        now = datetime.now(timezone.utc)
+        async with AsyncSessionFactory() as session:
+            for message in messages:
+                error = errors[message.id]
+                if error is None:
+                    values = { "sent_at": now, "last_error": None }
+                else:
+                    values = { "next_attempt_at": now + retry_delay(message.attempts), "last_error": error }
+                    if message.attempts >= self.max_attempts:
+                        logger.error(
+                            f"Giving up on mail { message.id } to { message.recipient } "
+                            f"after { message.attempts } attempts: { error }"
+                        )
+                    else:
+                        logger.warning(
+                            f"Failed to send mail { message.id } (attempt { message.attempts }), retrying: { error }"
+                        )
+                await session.execute(update(MailOutboxModel).where(MailOutboxModel.id == message.id).values(**values))
+            await session.commit()
+        return len(messages)
+
+    async def run(self) -> None:
+        wake = self._wake
+        while not self._stopping:
+            try:
+                # Keep draining while whole batches come back.
+                while not self._stopping and await self.send_pending() >= self.batch_size:
+                    pass
+            except Exception:
+                logger.exception("Failed to send pending mail")
+            try:
+                await asyncio.wait_for(wake.wait(), timeout=self.poll_interval)
+            except asyncio.TimeoutError:
+                pass
+            wake.clear()
+
+    def start(self) -> None:
+        self._stopping = False
+        self._wake = asyncio.Event()
+        self._task = asyncio.create_task(self.run())
+
+    async def stop(self) -> None:
+        if self._task is None: return
+        self._stopping = True
+        self._wake.set()
+        # Don't hold up shutdown on a slow mail server; unsent mail stays queued for the next start, and mail claimed
+        # but not sent is sent once its lease runs out.
+        _, pending = await asyncio.wait([self._task], timeout=settings.mail_timeout_seconds)
+        if pending:
+            logger.warning("Mail sender didn't stop in time, queued mail will be sent on the next start")
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+        self._task = None
+        self._wake = None
+
+
+mail_outbox = MailOutbox(
+    poll_interval=settings.mail_outbox_poll_interval_seconds,
+    batch_size=settings.mail_outbox_batch_size,
+    max_attempts=settings.mail_outbox_max_attempts,
+    lease=settings.mail_outbox_lease_seconds,
+)
+
+
+async def send_reset_password_email(session: AsyncSession, user: UserModel, token: str):
+    if not settings.mail_enabled: return
 
-    reset_link = f"{ origin }/api/v1/auth/reset-password/{ token }"
-    await fast_mail.send_message(MessageSchema(
+    # The webapp's page posts the token back to `POST /auth/reset-password` with the new password.
+    reset_link = f"{ settings.public_url.rstrip('/') }/reset-password?{ urlencode({ 'token': token }) }"
+    await mail_outbox.enqueue(
+        session,
+        recipient=user.email,
         subject="Password Reset Request",
-        recipients=[user.email],
         body=f"Click the following link to reset your password: { reset_link }",
-        subtype="html"
-    ))
\ No newline at end of file
+    )
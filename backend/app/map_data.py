@@ -0,0 +1,260 @@
+import json
+import typing
+
+import numpy as np
+
+from app.exceptions.map import MapDataInvalidException, MapDataTooLargeException
+from app.ranges import ByteRange
+from app.schemas import MapStats
+from app.settings import settings
+
+ROAD_LAYERS = ("mainRoads", "majorRoads", "minorRoads", "coastalRoads")
+PARK_LAYERS = ("bigParks", "smallParks")
+# Single polygons rather than lists of features
+WATER_LAYERS = ("sea", "river")
+# In the order MapData declares them (see webapp/src/api/api.ts)
+LAYERS = (*ROAD_LAYERS, *PARK_LAYERS, "buildings", *WATER_LAYERS)
+# Back to front, the order a client draws them in: water (whose coast bounds the city), roads, parks, then buildings
+RENDER_ORDER = (*WATER_LAYERS, "coastalRoads", "mainRoads", "majorRoads", "minorRoads", *PARK_LAYERS, "buildings")
+
+
+class Layer(typing.NamedTuple):
+    """ A layer's features as one (n, 2) array of vertices, feature `i` being `vertices[offsets[i]:offsets[i + 1]]`. """
+    vertices: np.ndarray
+    offsets: np.ndarray
+
+    @property
+    def starts(self) -> np.ndarray:
+        return self.offsets[:-1]
+
+    @property
+    def ends(self) -> np.ndarray:
+        return self.offsets[1:]
+
+
+class ParsedMapData(typing.NamedTuple):
+    layers: dict[str, Layer]
+    heights: np.ndarray
+    stats: MapStats
+
+
+class LayerSlice(typing.NamedTuple):
+    """ Bytes `start` up to `stop` of a layer's stored JSON text. """
+    name: str
+    start: int
+    stop: int
+
+
+class MapDataLayout:
+    """
+    Where each part of a map's data falls when serialized as one JSON object of its stored layers' text, in LAYERS
+    order. Layers are never rewritten, so this is a stable representation, and any byte range of it can be read from
+    the layer rows alone.
+    """
+    def __init__(self, sizes: dict[str, int]):
+        # (offset, literal text or the name of a layer, length)
+        self.segments: list[tuple[int, bytes | str, int]] = []
+        self.size = 0
+        for i, name in enumerate(name for name in LAYERS if name in sizes):
+            self.add(f'{ "," if i else "{" }{ json.dumps(name) }:'.encode())
+            self.add(name, sizes[name])
+        self.add(b"}" if self.segments else b"{}")
+
+    def add(self, content: bytes | str, length: int | None = None) -> None:
+        length = len(content) if length is None else length
+        self.segments.append((self.size, content, length))
+        self.size += length
+
+    def pieces(self, byte_range: ByteRange) -> list[bytes | LayerSlice]:
+        """ The pieces `byte_range` is made of, in order: literal bytes, and slices of layers still to be read. """
+        pieces = []
+        for offset, content, length in self.segments:
+            start, stop = max(byte_range.start - offset, 0), min(byte_range.stop - offset, length)
+            if start >= stop: continue
+            pieces.append(content[start:stop] if isinstance(content, bytes) else LayerSlice(content, start, stop))
+        return pieces
+
+
+def join_layers_json(layers_json: dict[str, str]) -> str:
+    """ Map data as JSON text, from the stored JSON text of its layers, without decoding them. """
+    return "{" + ",".join(f"{ json.dumps(name) }:{ layer_json }" for name, layer_json in layers_json.items()) + "}"
+
+def features_of(data: dict[str, typing.Any], name: str) -> list[list[typing.Any]]:
+    """ A layer's features as lists of raw points, checking the shape but not yet the points themselves. """
+    value = data[name]
+    if name in WATER_LAYERS: value = [value]
+    return layer_features(name, value)
+
+def layer_features(name: str, value: typing.Any) -> list[list[typing.Any]]:
+    """ `features_of` a layer's value, or a run of its items; water layers' as a list of their one polygon. """
+    if name == "buildings":
+        if not isinstance(value, list) or not all(isinstance(building, dict) for building in value):
+            raise MapDataInvalidException("buildings must be a list of { data, height } objects")
+        value = [building.get("data") for building in value]
+    if not isinstance(value, list) or not all(isinstance(feature, list) for feature in value):
+        shape = "a list of points" if name in WATER_LAYERS else "a list of lists of points"
+        raise MapDataInvalidException(f"{ name } must be { shape }")
+    return value
+
+def numbers(values: list[typing.Any], what: str) -> np.ndarray:
+    # Anything but numbers makes NumPy fall back to a string or object array, so one dtype check covers every value.
+    array = np.array(values)
+    if array.dtype.kind not in "iuf" or array.ndim != 1:
+        raise MapDataInvalidException(f"{ what } must be numbers")
+    array = array.astype(np.float64, copy=False)
+    if not np.isfinite(array).all():
+        raise MapDataInvalidException(f"{ what } must be finite")
+    return array
+
+def to_layer(name: str, features: list[list[typing.Any]]) -> Layer:
+    try:
+        coordinates = [c for feature in features for point in feature for c in (point["x"], point["y"])]
+    except (TypeError, KeyError) as e:
+        raise MapDataInvalidException(f"{ name } has points that aren't {{ x, y }} objects") from e
+
+    vertices = numbers(coordinates, f"{ name } coordinates").reshape(-1, 2)
+    if vertices.size and np.abs(vertices).max() > settings.map_data_max_coordinate:
+        raise MapDataInvalidException(f"{ name } has coordinates beyond ±{ settings.map_data_max_coordinate:g}")
+
+    offsets = np.zeros(len(features) + 1, dtype=np.int64)
+    np.cumsum([len(feature) for feature in features], out=offsets[1:])
+    return Layer(vertices, offsets)
+
+def polyline_lengths(layer: Layer) -> np.ndarray:
+    """ Each feature's length, as an open polyline. Features must have at least 2 vertices. """
+    if not len(layer.starts): return np.zeros(0)
+    segments = np.hypot(*np.diff(layer.vertices, axis=0).T)
+    # Drop the segments that join one feature's last vertex to the next one's first.
+    segments[layer.ends[:-1] - 1] = 0
+    return np.add.reduceat(segments, layer.starts)
+
+def ring_areas(layer: Layer) -> np.ndarray:
+    """
+    Each feature's area as a polygon, by the shoelace formula. Features must have at least 3 vertices. Rings may repeat
+    their first vertex at the end or leave the closing edge implied; a repeated vertex only adds a zero length edge.
+    """
+    if not len(layer.starts): return np.zeros(0)
+    x, y = layer.vertices[:, 0], layer.vertices[:, 1]
+    following = np.arange(1, len(x) + 1)
+    following[layer.ends - 1] = layer.starts
+    return np.abs(np.add.reduceat(x * y[following] - x[following] * y, layer.starts)) / 2
+
+def check_vertex_counts(name: str, layer: Layer) -> None:
+    counts = layer.ends - layer.starts
+    if name in ROAD_LAYERS:
+        if (counts < 2).any(): raise MapDataInvalidException(f"{ name } has roads with fewer than 2 points")
+        return
+
+    # Rings are closed by joining their last vertex to their first, so one that already repeats it has one less
+    # distinct vertex.
+    closed = counts > 0
+    closed[closed] = (layer.vertices[layer.starts[closed]] == layer.vertices[layer.ends[closed] - 1]).all(axis=1)
+    distinct = counts - closed
+    # A map may have no sea or river, which is sent as an empty polygon.
+    if name in WATER_LAYERS: distinct = distinct[counts > 0]
+    if (distinct < 3).any():
+        raise MapDataInvalidException(f"{ name } has polygons with fewer than 3 distinct points")
+
+def parse_map_data(data: typing.Any) -> ParsedMapData:
+    """
+    Validate `data` as MapData and convert each layer to arrays, computing the map's summary statistics on the way.
+
+    Limits are checked on feature and vertex counts alone before any coordinate is read, so an oversized map is turned
+    away cheaply; everything after that is a handful of vectorized passes over each layer, whatever its size.
+    Raises `MapDataTooLargeException` over the configured limits and `MapDataInvalidException` for anything malformed.
+    """
+    if not isinstance(data, dict):
+        raise MapDataInvalidException("Map data must be an object")
+    if missing := [name for name in LAYERS if name not in data]:
+        raise MapDataInvalidException(f"Map data is missing { ', '.join(missing) }")
+    if unknown := [name for name in data if name not in LAYERS]:
+        raise MapDataInvalidException(f"Map data has unknown layers { ', '.join(unknown) }")
+
+    features = { name: features_of(data, name) for name in LAYERS }
+    if len(features["buildings"]) > settings.map_data_max_buildings:
+        raise MapDataTooLargeException(f"Maps may have at most { settings.map_data_max_buildings } buildings")
+    if sum(len(feature) for layer in features.values() for feature in layer) > settings.map_data_max_vertices:
+        raise MapDataTooLargeException(f"Maps may have at most { settings.map_data_max_vertices } points")
+
+    layers = { name: to_layer(name, layer_features) for name, layer_features in features.items() }
+    return summarize_map_data(layers, building_heights(data["buildings"]))
+
+def building_heights(buildings: list[dict[str, typing.Any]]) -> np.ndarray:
+    """ The heights of buildings whose shape `layer_features` has checked. """
+    try:
+        heights = numbers([building["height"] for building in buildings], "Building heights")
+    except KeyError as e:
+        raise MapDataInvalidException("buildings must be a list of { data, height } objects") from e
+    if heights.size and (heights.min() < 0 or heights.max() > settings.map_data_max_building_height):
+        raise MapDataInvalidException(
+            f"Building heights must be between 0 and { settings.map_data_max_building_height:g}"
+        )
+    return heights
+
+def summarize_map_data(layers: dict[str, Layer], heights: np.ndarray) -> ParsedMapData:
+    """ Finish checking every layer of a map, converted to arrays, and compute its summary statistics. """
+    for name, layer in layers.items():
+        check_vertex_counts(name, layer)
+
+    areas = { name: ring_areas(layers[name]) for name in (*PARK_LAYERS, "buildings") }
+    for name in areas:
+        if (areas[name] == 0).any():
+            raise MapDataInvalidException(f"{ name } has polygons that enclose no area")
+
+    vertices = np.concatenate([layer.vertices for layer in layers.values()])
+    bbox = [float(v) for v in (*vertices.min(axis=0), *vertices.max(axis=0))] if len(vertices) else [None] * 4
+    stats = MapStats(
+        building_count=len(heights),
+        building_height_min=float(heights.min()) if heights.size else None,
+        building_height_max=float(heights.max()) if heights.size else None,
+        road_length=float(sum(polyline_lengths(layers[name]).sum() for name in ROAD_LAYERS)),
+        park_area=float(sum(areas[name].sum() for name in PARK_LAYERS)),
+        bbox_min_x=bbox[0],
+        bbox_min_y=bbox[1],
+        bbox_max_x=bbox[2],
+        bbox_max_y=bbox[3],
+    )
+    return ParsedMapData(layers, heights, stats)
+
+
+class MapDataBuilder:
+    """
+    Map data converted to arrays a run of features at a time, as it's read (see app.map_upload), rather than from a
+    whole decoded tree like `parse_map_data`, so only the arrays are kept. Checks are the same, and the size limits are
+    enforced as soon as a run goes over them.
+    """
+    def __init__(self):
+        self.vertices: dict[str, list[np.ndarray]] = { name: [] for name in LAYERS }
+        # Vertices per feature, a run at a time
+        self.counts: dict[str, list[np.ndarray]] = { name: [] for name in LAYERS }
+        self.heights: list[np.ndarray] = []
+        self.building_count = 0
+        self.vertex_count = 0
+
+    def add(self, name: str, items: list[typing.Any]) -> None:
+        """ Add a run of a layer's items, in order: its features, or for water layers, points of its one polygon. """
+        features = layer_features(name, [items] if name in WATER_LAYERS else items)
+        if name == "buildings":
+            self.building_count += len(features)
+            if self.building_count > settings.map_data_max_buildings:
+                raise MapDataTooLargeException(f"Maps may have at most { settings.map_data_max_buildings } buildings")
+        self.vertex_count += sum(len(feature) for feature in features)
+        if self.vertex_count > settings.map_data_max_vertices:
+            raise MapDataTooLargeException(f"Maps may have at most { settings.map_data_max_vertices } points")
+
+        layer = to_layer(name, features)
+        self.vertices[name].append(layer.vertices)
+        self.counts[name].append(np.diff(layer.offsets))
+        if name == "buildings": self.heights.append(building_heights(items))
+
+    def finish(self) -> ParsedMapData:
+        layers = {}
+        for name in LAYERS:
+            vertices = np.concatenate([np.zeros((0, 2)), *self.vertices[name]])
+            counts = np.concatenate([np.zeros(0, dtype=np.int64), *self.counts[name]])
+            # A water layer is one polygon, however many runs its points came in.
+            if name in WATER_LAYERS: counts = np.array([len(vertices)])
+            offsets = np.zeros(len(counts) + 1, dtype=np.int64)
+            np.cumsum(counts, out=offsets[1:])
+            layers[name] = Layer(vertices, offsets)
+        return summarize_map_data(layers, np.concatenate([np.zeros(0), *self.heights]))
@@ -0,0 +1,240 @@
+"""
+`POST /maps/` bodies, read as they stream in rather than decoded whole.
+
+A map's body is almost all layers, and decoded whole into Python objects it would take many times its own size, so
+one large upload could take a worker down before its size was even checked. Instead the body is read a chunk at a
+time, and turned away with a 413 as soon as it's over `MAP_CREATE_MAX_BODY_BYTES`, or says it will be. Its layers are
+decoded an item at a time (a feature, a building, or a point of a water polygon) and converted to arrays a run of
+items at a time by `MapDataBuilder`, which enforces the map data limits as it goes. All that's kept is those arrays,
+and each layer's JSON text, to be stored as it was sent.
+"""
+import asyncio
+import codecs
+import contextlib
+import json
+import re
+import typing
+
+from fastapi import Request
+from fastapi.exceptions import RequestValidationError
+from pydantic import ValidationError
+
+from app.exceptions.map import MapBodyInvalidException, MapBodyTooLargeException, MapDataInvalidException
+from app.map_data import LAYERS, WATER_LAYERS, MapDataBuilder, ParsedMapData
+from app.schemas import MapCreateFields
+from app.settings import settings
+
+
+def reject_constant(name: str) -> typing.NoReturn:
+    # Python's json reads NaN and Infinity, which aren't JSON; layers are stored and served back as sent.
+    raise MapBodyInvalidException(f"Invalid JSON: { name } isn't allowed")
+
+
+WHITESPACE = re.compile(r"[ \t\n\r]*")
+DECODER = json.JSONDecoder(parse_constant=reject_constant)
+# Items decoded before they're converted to arrays
+RUN_LENGTH = 1_000
+# How much text that's been read past is kept before it's dropped
+COMPACT_AT = 1 << 16
+# Longer than any number or literal the end of what's been read could cut through
+CUT_OFF_MARGIN = 64
+
+
+class MapUpload(typing.NamedTuple):
+    fields: MapCreateFields
+    # Each layer's JSON text, as it was sent
+    layers_json: dict[str, str]
+    data: ParsedMapData
+
+
+class BodyText:
+    """
+    The text of a JSON request body, read a chunk at a time as parsing needs it. Text that's been read past is dropped,
+    except what's being captured (see `capture`).
+    """
+    def __init__(self, chunks: typing.AsyncIterable[bytes], max_bytes: int):
+        self._chunks = aiter(chunks)
+        self._decoder = codecs.getincrementaldecoder("utf-8")()
+        self.max_bytes = max_bytes
+        self.received = 0
+        self.text = ""
+        self.pos = 0
+        self.done = False
+        # Where the text being captured starts, and what of it has been dropped already
+        self._capture_start: int | None = None
+        self._captured: list[str] = []
+
+    async def read_more(self) -> None:
+        if self.done: raise MapBodyInvalidException("The request body ended too soon")
+        chunk = await anext(self._chunks, None)
+        try:
+            if chunk is None:
+                self.done = True
+                text = self._decoder.decode(b"", final=True)
+            else:
+                self.received += len(chunk)
+                if self.received > self.max_bytes:
+                    raise MapBodyTooLargeException(f"Maps may be at most { self.max_bytes } bytes")
+                text = self._decoder.decode(chunk)
+        except UnicodeDecodeError as e:
+            raise MapBodyInvalidException("The request body isn't UTF-8") from e
+
+        if self.pos >= COMPACT_AT:
+            if self._capture_start is not None:
+                self._captured.append(self.text[self._capture_start:self.pos])
+                self._capture_start = 0
+            self.text = self.text[self.pos:]
+            self.pos = 0
+        self.text += text
+
+    async def peek(self) -> str:
+        """ The next character that isn't whitespace, which is left unread. """
+        while True:
+            self.pos = WHITESPACE.match(self.text, self.pos).end()
+            if self.pos < len(self.text): return self.text[self.pos]
+            await self.read_more()
+
+    async def expect(self, characters: str) -> str:
+        """ Read the next character that isn't whitespace, which must be one of `characters`. """
+        character = await self.peek()
+        if character not in characters:
+            expected = " or ".join(repr(c) for c in characters)
+            raise MapBodyInvalidException(f"Expected { expected } at character { self.received_before() }")
+        self.pos += 1
+        return character
+
+    async def value(self) -> typing.Any:
+        """ Decode the next JSON value. """
+        await self.peek()
+        while True:
+            try:
+                value, end = DECODER.raw_decode(self.text, self.pos)
+            except json.JSONDecodeError as e:
+                # Cut off by the end of what's been read, rather than malformed: a string, or within a number or
+                # literal's length of the end (`12.` fails where the `.` is)
+                cut_off = e.msg.startswith("Unterminated string") or e.pos >= len(self.text) - CUT_OFF_MARGIN
+                if not self.done and cut_off:
+                    await self.read_more()
+                    continue
+                raise MapBodyInvalidException(f"Invalid JSON: { e.msg }") from e
+            except RecursionError:
+                raise MapBodyInvalidException("Invalid JSON: nested too deeply") from None
+            # A number may carry on past what's been read.
+            if end == len(self.text) and not self.done:
+                await self.read_more()
+                continue
+            self.pos = end
+            return value
+
+    async def end(self) -> None:
+        """ Check there's nothing left but whitespace. """
+        while True:
+            self.pos = WHITESPACE.match(self.text, self.pos).end()
+            if self.pos < len(self.text): raise MapBodyInvalidException("Unexpected text after the map")
+            if self.done: return
+            await self.read_more()
+
+    def received_before(self) -> int:
+        """ Roughly how many characters into the body parsing is, for error messages. """
+        return self.received - (len(self.text) - self.pos)
+
+    def capture(self) -> None:
+        """ Start keeping the text from here on, until `captured`. """
+        self._capture_start = self.pos
+        self._captured = []
+
+    def captured(self) -> str:
+        text = "".join([*self._captured, self.text[self._capture_start:self.pos]])
+        self._capture_start = None
+        self._captured = []
+        return text
+
+
+async def read_object(body: BodyText, read_value: typing.Callable[[str], typing.Awaitable[None]]) -> None:
+    """ Read the object next in `body`, calling `read_value` with each key to read its value. """
+    await body.expect("{")
+    if await body.peek() == "}":
+        body.pos += 1
+        return
+    while True:
+        key = await body.value()
+        if not isinstance(key, str): raise MapBodyInvalidException("Object keys must be strings")
+        await body.expect(":")
+        await read_value(key)
+        if await body.expect(",}") == "}": return
+
+async def read_layer(body: BodyText, name: str, builder: MapDataBuilder) -> None:
+    """ Read the layer next in `body` into `builder`, a run of items at a time. """
+    if await body.peek() != "[":
+        shape = "a list of points" if name in WATER_LAYERS else "a list"
+        raise MapDataInvalidException(f"{ name } must be { shape }")
+    body.pos += 1
+    run = []
+    if await body.peek() == "]":
+        body.pos += 1
+    else:
+        while True:
+            run.append(await body.value())
+            if len(run) == RUN_LENGTH:
+                builder.add(name, run)
+                run = []
+            if await body.expect(",]") == "]": break
+    if run: builder.add(name, run)
+
+async def read_map_data(body: BodyText) -> tuple[dict[str, str], ParsedMapData]:
+    builder = MapDataBuilder()
+    layers_json: dict[str, str] = {}
+
+    async def read_layer_json(name: str) -> None:
+        if name not in LAYERS: raise MapDataInvalidException(f"Map data has unknown layers { name }")
+        if name in layers_json: raise MapDataInvalidException(f"Map data has { name } twice")
+        await body.peek()
+        body.capture()
+        await read_layer(body, name, builder)
+        layers_json[name] = body.captured()
+
+    if await body.peek() != "{": raise MapDataInvalidException("Map data must be an object")
+    await read_object(body, read_layer_json)
+    if missing := [name for name in LAYERS if name not in layers_json]:
+        raise MapDataInvalidException(f"Map data is missing { ', '.join(missing) }")
+    # The checks and statistics over whole layers are vectorized, but still scale with the map.
+    return layers_json, await asyncio.to_thread(builder.finish)
+
+async def read_map_upload(request: Request) -> MapUpload:
+    """
+    The name, privacy and data of the map in a `POST /maps/` body, read as it streams in. Raises
+    `MapBodyTooLargeException` past the size limit, `MapBodyInvalidException` for a body that isn't a JSON object, a
+    `RequestValidationError` for invalid fields, and map data exceptions as `parse_map_data` does.
+    """
+    declared = request.headers.get("content-length", "")
+    if declared.isdigit() and int(declared) > settings.map_create_max_body_bytes:
+        raise MapBodyTooLargeException(f"Maps may be at most { settings.map_create_max_body_bytes } bytes")
+
+    fields: dict[str, typing.Any] = {}
+    data: tuple[dict[str, str], ParsedMapData] | None = None
+
+    async def read_field(key: str) -> None:
+        nonlocal data
+        if key in fields or (key == "data" and data is not None):
+            raise MapBodyInvalidException(f"The map has { key } twice")
+        if key == "data":
+            data = await read_map_data(body)
+        elif key in MapCreateFields.model_fields:
+            fields[key] = await body.value()
+        else:
+            # Anything else would have to be decoded whole just to be ignored.
+            raise MapBodyInvalidException(f"Unknown field { key }")
+
+    # Closed whether or not the body is read to the end
+    async with contextlib.aclosing(request.stream()) as chunks:
+        body = BodyText(chunks, settings.map_create_max_body_bytes)
+        await read_object(body, read_field)
+        await body.end()
+
+    try:
+        map_fields = MapCreateFields.model_validate(fields)
+    except ValidationError as e:
+        raise RequestValidationError([{ **error, "loc": ("body", *error["loc"]) } for error in e.errors()]) from e
+    if data is None: raise MapDataInvalidException("The map has no data")
+    layers_json, parsed = data
+    return MapUpload(map_fields, layers_json, parsed)
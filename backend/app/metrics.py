@@ -0,0 +1,413 @@
+import asyncio
+import bisect
+import contextlib
+import contextvars
+import json
+import logging
+import os
+import time
+import typing
+from pathlib import Path
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from sqlalchemy.engine.interfaces import CacheStats
+
+from app.db import databases
+from app.settings import settings
+from app.slow_queries import slow_query_log
+
+logger = logging.getLogger(__name__)
+
+
+class RequestStats:
+    """ Per-request counters filled in by the SQLAlchemy hooks below while a request is in flight. """
+    __slots__ = ("scope", "queries", "db_seconds")
+
+    def __init__(self, scope: dict | None = None):
+        self.scope = scope if scope is not None else {}
+        self.queries = 0
+        self.db_seconds = 0.0
+
+    @property
+    def route(self) -> str:
+        # The router stores the matched route in the scope once routing has happened.
+        route = self.scope.get("route")
+        return route.path if route is not None else "unmatched"
+
+    @property
+    def query_budget(self) -> int | None:
+        route = self.scope.get("route")
+        return getattr(route.endpoint, "query_budget", None) if route is not None else None
+
+
+current_request_stats: contextvars.ContextVar[RequestStats | None] = contextvars.ContextVar(
+    "current_request_stats", default=None
+)
+
+@contextlib.contextmanager
+def bind_request_stats(scope: dict) -> typing.Iterator[RequestStats]:
+    """
+    Bind a `RequestStats` for the request in `scope` to the current context.
+    If the caller already bound one (an outer middleware, or a test measuring a request), it is reused.
+    """
+    stats = current_request_stats.get()
+    if stats is not None:
+        stats.scope = scope
+        yield stats
+        return
+
+    stats = RequestStats(scope)
+    token = current_request_stats.set(stats)
+    try:
+        yield stats
+    finally:
+        current_request_stats.reset(token)
+
+def query_budget(max_queries: int):
+    """
+    Declare the most SQL statements an endpoint may issue per request, authentication included.
+    Exceeding it logs a warning in dev, and tests assert against it.
+    """
+    def decorator(endpoint):
+        endpoint.query_budget = max_queries
+        return endpoint
+    return decorator
+
+
+class Metric:
+    type: str
+
+    def __init__(self, name: str, documentation: str, labelnames: tuple[str, ...] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = labelnames
+        registry.append(self)
+
+    def _format_labels(self, labelvalues: tuple, extra: str = "") -> str:
+        labels = [
+            f'{ name }="{ _escape(str(value)) }"' for name, value in zip(self.labelnames, labelvalues, strict=True)
+        ]
+        if extra: labels.append(extra)
+        return "{" + ",".join(labels) + "}" if labels else ""
+
+    def collect(self) -> dict[tuple, typing.Any]:
+        """ This process's values by label values. """
+        raise NotImplementedError
+
+    @staticmethod
+    def add(a, b):
+        return a + b
+
+    def samples(self, values: dict[tuple, typing.Any], extra: str = "") -> typing.Iterator[str]:
+        raise NotImplementedError
+
+    def render(self, snapshots: dict[int, dict[str, list]]) -> typing.Iterator[str]:
+        yield f"# HELP { self.name } { self.documentation }"
+        yield f"# TYPE { self.name } { self.type }"
+        if self.type == "gauge":
+            # A gauge is a worker's current state, so each live worker's is a sample of its own.
+            for pid, snapshot in snapshots.items():
+                if not _is_alive(pid): continue
+                values = { tuple(labelvalues): value for labelvalues, value in snapshot.get(self.name, ()) }
+                yield from self.samples(values, f'worker="{ pid }"')
+            return
+        # Counters and histograms are summed over every worker, the ones that have since exited too, so totals never
+        # go back when a scrape lands on another worker or one is respawned.
+        totals: dict[tuple, typing.Any] = {}
+        for snapshot in snapshots.values():
+            for labelvalues, value in snapshot.get(self.name, ()):
+                key = tuple(labelvalues)
+                totals[key] = self.add(totals[key], value) if key in totals else value
+        yield from self.samples(totals)
+
+
+class Counter(Metric):
+    type = "counter"
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._values: dict[tuple, float] = {}
+
+    def inc(self, *labelvalues, amount: float = 1) -> None:
+        self._values[labelvalues] = self._values.get(labelvalues, 0) + amount
+
+    def collect(self):
+        return self._values
+
+    def samples(self, values, extra=""):
+        for labelvalues, value in values.items():
+            yield f"{ self.name }{ self._format_labels(labelvalues, extra) } { value }"
+
+
+class Histogram(Metric):
+    type = "histogram"
+
+    def __init__(self, *args, buckets: tuple[float, ...], **kwargs):
+        super().__init__(*args, **kwargs)
+        self.buckets = buckets
+        # labelvalues -> [per-bucket counts (non-cumulative, plus +Inf), sum]
+        self._values: dict[tuple, list] = {}
+
+    def observe(self, value: float, *labelvalues) -> None:
+        entry = self._values.get(labelvalues)
+        if entry is None:
+            entry = self._values[labelvalues] = [[0] * (len(self.buckets) + 1), 0.0]
+        entry[0][bisect.bisect_left(self.buckets, value)] += 1
+        entry[1] += value
+
+    def collect(self):
+        return self._values
+
+    @staticmethod
+    def add(a, b):
+        return [[x + y for x, y in zip(a[0], b[0], strict=True)], a[1] + b[1]]
+
+    def samples(self, values, extra=""):
+        for labelvalues, (counts, total) in values.items():
+            cumulative = 0
+            for bound, count in zip((*self.buckets, "+Inf"), counts, strict=True):
+                cumulative += count
+                le = f'le="{ bound }"'
+                yield f"{ self.name }_bucket{ self._format_labels(labelvalues, le) } { cumulative }"
+            yield f"{ self.name }_sum{ self._format_labels(labelvalues) } { total }"
+            yield f"{ self.name }_count{ self._format_labels(labelvalues) } { cumulative }"
+
+
+class CallbackMetric(Metric):
+    """ Metric whose samples are computed at scrape time, for values owned elsewhere (e.g. pool state). """
+    def __init__(
+        self, name, documentation, labelnames, type: str,
+        callback: typing.Callable[[], typing.Iterable[tuple[tuple, float]]]
+    ):
+        super().__init__(name, documentation, labelnames)
+        self.type = type
+        self.callback = callback
+
+    def collect(self):
+        return dict(self.callback())
+
+    def samples(self, values, extra=""):
+        for labelvalues, value in values.items():
+            yield f"{ self.name }{ self._format_labels(labelvalues, extra) } { value }"
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+def _is_alive(pid: int) -> bool:
+    if pid == os.getpid(): return True
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+registry: list[Metric] = []
+
+def snapshot() -> dict[str, list]:
+    """ This process's metrics, as shared with the other workers through `METRICS_DIR`. """
+    return {
+        metric.name: [[list(labelvalues), value] for labelvalues, value in metric.collect().items()]
+        for metric in registry
+    }
+
+def read_snapshots() -> dict[int, dict[str, list]]:
+    """ The snapshots the other workers last wrote to `METRICS_DIR`, if there is one; this does file I/O. """
+    if not settings.metrics_dir: return {}
+    snapshots = {}
+    for path in Path(settings.metrics_dir).glob("*.json"):
+        try:
+            snapshots[int(path.stem)] = json.loads(path.read_text())
+        except (OSError, ValueError):
+            logger.warning(f"Skipped unreadable metrics snapshot { path }")
+    return snapshots
+
+def render_metrics(snapshots: dict[int, dict[str, list]] | None = None) -> str:
+    """ Every worker's metrics, in the Prometheus text format: this one's as they are, the others' from `snapshots`. """
+    snapshots = { **(snapshots or {}), os.getpid(): snapshot() }
+    return "\n".join(line for metric in registry for line in metric.render(snapshots)) + "\n"
+
+
+class MetricsSnapshots:
+    """
+    Each Granian worker is a process with metrics of its own, and a scrape reaches just one of them. When
+    `METRICS_DIR` is set (`python -m app` sets it for more than one worker), every worker writes its metrics there
+    every `interval` seconds and on shutdown, and a scrape of any worker reports them all from those files.
+    """
+    def __init__(self, interval: float):
+        self.interval = interval
+        self._task: asyncio.Task | None = None
+
+    @property
+    def path(self) -> Path:
+        return Path(settings.metrics_dir) / f"{ os.getpid() }.json"
+
+    def start(self) -> None:
+        if not settings.metrics_dir or self._task is not None: return
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is None: return
+        self._task.cancel()
+        with contextlib.suppress(asyncio.CancelledError):
+            await self._task
+        self._task = None
+        await self.write()
+
+    async def write(self) -> None:
+        # Serialized here, as the event loop goes on changing the values while the thread writes.
+        await asyncio.to_thread(_write_atomically, self.path, json.dumps(snapshot()))
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                await self.write()
+            except OSError:
+                logger.exception("Failed to write a metrics snapshot")
+            await asyncio.sleep(self.interval)
+
+
+def _write_atomically(path: Path, text: str) -> None:
+    temporary_path = path.with_suffix(".tmp")
+    temporary_path.write_text(text)
+    os.replace(temporary_path, path)
+
+metrics_snapshots = MetricsSnapshots(settings.metrics_snapshot_interval_seconds)
+
+
+LATENCY_BUCKETS = (.005, .01, .025, .05, .1, .25, .5, 1, 2.5, 5, 10)
+SIZE_BUCKETS = (100, 1_000, 10_000, 100_000, 1_000_000, 10_000_000, 100_000_000)
+QUERY_COUNT_BUCKETS = (0, 1, 2, 3, 5, 10, 25, 50, 100)
+
+http_requests_total = Counter(
+    "http_requests_total", "HTTP requests by route and status code", ("method", "route", "status")
+)
+http_request_duration_seconds = Histogram(
+    "http_request_duration_seconds", "HTTP request latency", ("method", "route"), buckets=LATENCY_BUCKETS
+)
+http_request_size_bytes = Histogram(
+    "http_request_size_bytes", "HTTP request body size", ("method", "route"), buckets=SIZE_BUCKETS
+)
+http_response_size_bytes = Histogram(
+    "http_response_size_bytes", "HTTP response body size", ("method", "route"), buckets=SIZE_BUCKETS
+)
+db_queries_per_request = Histogram(
+    "db_queries_per_request", "SQL statements executed per HTTP request", ("route",), buckets=QUERY_COUNT_BUCKETS
+)
+db_seconds_per_request = Histogram(
+    "db_seconds_per_request", "Time spent executing SQL per HTTP request", ("route",), buckets=LATENCY_BUCKETS
+)
+cache_requests_total = Counter(
+    "cache_requests_total", "Cache lookups by cache and result (hit, stale or miss)", ("cache", "result")
+)
+admission_rejections_total = Counter(
+    "admission_rejections_total", "Requests turned away by endpoint class and reason (rate_limited or overloaded)",
+    ("endpoint_class", "reason")
+)
+
+def _pool_samples(stat: str):
+    for database in databases():
+        stats = database.pool_stats()
+        if stat in stats: yield (database.name,), stats[stat]
+
+for stat, type, documentation in [
+    ("checked_out", "gauge", "Connections currently checked out of the pool"),
+    ("checked_in", "gauge", "Idle connections currently in the pool"),
+    ("overflow", "gauge", "Current pool overflow (negative while the pool isn't full)"),
+    ("checkouts", "counter", "Pool checkouts since startup"),
+    ("wait_seconds_total", "counter", "Total time checkouts spent waiting for a connection"),
+    ("wait_seconds_max", "gauge", "Longest time a checkout has waited for a connection"),
+]:
+    CallbackMetric(
+        f"db_pool_{ stat }", documentation, ("database",), type,
+        lambda stat=stat: _pool_samples(stat)
+    )
+CallbackMetric(
+    "db_healthy", "Whether the database passed its last health check", ("database",), "gauge",
+    lambda: (((database.name,), int(database.healthy)) for database in databases())
+)
+
+
+@event.listens_for(Engine, "before_cursor_execute")
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault("query_start_time", []).append(time.perf_counter())
+
+@event.listens_for(Engine, "after_cursor_execute")
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    elapsed = time.perf_counter() - conn.info["query_start_time"].pop()
+
+    stats = current_request_stats.get()
+    if stats is not None:
+        stats.queries += 1
+        stats.db_seconds += elapsed
+
+    if elapsed >= slow_query_log.threshold_seconds:
+        slow_query_log.record(
+            conn, statement, parameters, executemany,
+            stats.route if stats is not None else "background", elapsed
+        )
+
+    if context is not None and context.cache_hit in (CacheStats.CACHE_HIT, CacheStats.CACHE_MISS):
+        cache_requests_total.inc(
+            "sqlalchemy_compiled", "hit" if context.cache_hit is CacheStats.CACHE_HIT else "miss"
+        )
+
+@event.listens_for(Engine, "handle_error")
+def _handle_error(exception_context):
+    # A failed statement never reaches after_cursor_execute; don't leave its start time behind.
+    conn = exception_context.connection
+    if conn is not None and conn.info.get("query_start_time"):
+        conn.info["query_start_time"].pop()
+
+
+class MetricsMiddleware:
+    """
+    Records per-route latency, status, body sizes and DB usage for every HTTP request.
+
+    Routes are labelled by their path template (e.g. `/api/v1/maps/{map_id}`), never the raw path, so label
+    cardinality stays bounded. Pure ASGI so the hot path is a few dict lookups and no extra tasks.
+    """
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        start = time.perf_counter()
+        status = 500
+        request_size = 0
+        response_size = 0
+
+        async def receive_with_size():
+            nonlocal request_size
+            message = await receive()
+            if message["type"] == "http.request":
+                request_size += len(message.get("body", b""))
+            return message
+
+        async def send_with_size(message):
+            nonlocal status, response_size
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            elif message["type"] == "http.response.body":
+                response_size += len(message.get("body", b""))
+            await send(message)
+
+        with bind_request_stats(scope) as stats:
+            try:
+                await self.app(scope, receive_with_size, send_with_size)
+            finally:
+                elapsed = time.perf_counter() - start
+                route = stats.route
+                method = scope["method"]
+
+                http_requests_total.inc(method, route, status)
+                http_request_duration_seconds.observe(elapsed, method, route)
+                http_request_size_bytes.observe(request_size, method, route)
+                http_response_size_bytes.observe(response_size, method, route)
+                db_queries_per_request.observe(stats.queries, route)
+                db_seconds_per_request.observe(stats.db_seconds, route)
\ No newline at end of file
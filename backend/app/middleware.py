@@ -0,0 +1,59 @@
+import logging
+import time
+from http.cookies import SimpleCookie
+from starlette.datastructures import MutableHeaders
+
+from app.db import PRIMARY_PIN_COOKIE, replica_database
+from app.metrics import bind_request_stats
+from app.settings import settings, DevPhase
+
+logger = logging.getLogger(__name__)
+
+SAFE_METHODS = ("GET", "HEAD", "OPTIONS")
+
+class PrimaryPinMiddleware:
+    """
+    Pins a client's reads to the primary for `db_replica_pin_seconds` after it successfully writes,
+    so it always reads its own writes even when the replica is lagging.
+    """
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["method"] in SAFE_METHODS or replica_database is None:
+            return await self.app(scope, receive, send)
+
+        async def send_with_pin(message):
+            if message["type"] == "http.response.start" and message["status"] < 400:
+                cookie = SimpleCookie()
+                cookie[PRIMARY_PIN_COOKIE] = str(time.time() + settings.db_replica_pin_seconds)
+                cookie[PRIMARY_PIN_COOKIE]["max-age"] = int(settings.db_replica_pin_seconds) + 1
+                cookie[PRIMARY_PIN_COOKIE]["path"] = "/"
+                cookie[PRIMARY_PIN_COOKIE]["httponly"] = True
+                cookie[PRIMARY_PIN_COOKIE]["samesite"] = "lax"
+                cookie[PRIMARY_PIN_COOKIE]["secure"] = settings.dev_phase == DevPhase.PROD
+                MutableHeaders(scope=message).append("set-cookie", cookie.output(header="").strip())
+            await send(message)
+
+        await self.app(scope, receive, send_with_pin)
+
+
+class QueryBudgetMiddleware:
+    """ Logs a warning whenever a request issues more SQL statements than its endpoint's `query_budget`. """
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        with bind_request_stats(scope) as stats:
+            try:
+                await self.app(scope, receive, send)
+            finally:
+                budget = stats.query_budget
+                if budget is not None and stats.queries > budget:
+                    logger.warning(
+                        f"{ scope['method'] } { stats.route } issued { stats.queries } queries, "
+                        f"over its budget of { budget }"
+                    )
\ No newline at end of file
@@ -2,5 +2,11 @@ from .auth_token import *
 from .user import *
 from .map import *
 from .map_favorite import *
+from .map_layer import *
+from .map_scene import *
 from .thumbnail import *
-from .user_avatar import *
\ No newline at end of file
+from .user_avatar import *
+from .mail_outbox import *
+from .job import *
+
+from .rate_limit_bucket import *
\ No newline at end of file
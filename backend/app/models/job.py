@@ -0,0 +1,39 @@
+import sqlalchemy as sa
+from advanced_alchemy.base import UUIDAuditBase
+from advanced_alchemy.types import DateTimeUTC
+from sqlalchemy import orm
+from datetime import datetime
+from typing import Any
+
+# Jobs in either state may still run; the others are finished.
+ACTIVE_JOB_STATUSES = "status IN ('queued', 'running')"
+
+class JobModel(UUIDAuditBase):
+    """ A unit of background work (see app.jobs), and how it's going. """
+    __tablename__ = "jobs"
+    __table_args__ = (
+        # Workers only ever scan a queue's jobs that may still run, by when they're next due
+        sa.Index("ix_jobs_queue_run_at", "queue", "run_at", postgresql_where=sa.text(ACTIVE_JOB_STATUSES)),
+        # A key is only held while its job may still run, so the same work can be queued again once it's done
+        sa.Index("ix_jobs_dedupe_key", "dedupe_key", unique=True, postgresql_where=sa.text(ACTIVE_JOB_STATUSES)),
+    )
+
+    queue: orm.Mapped[str] = orm.mapped_column(sa.String, nullable=False)
+    kind: orm.Mapped[str] = orm.mapped_column(sa.String, nullable=False)
+    payload: orm.Mapped[dict[str, Any]] = orm.mapped_column(sa.JSON, nullable=False)
+    dedupe_key: orm.Mapped[str] = orm.mapped_column(sa.String, nullable=True)
+    # queued, running, succeeded or failed
+    status: orm.Mapped[str] = orm.mapped_column(sa.String, nullable=False, default="queued", server_default="queued")
+    attempts: orm.Mapped[int] = orm.mapped_column(sa.Integer, nullable=False, default=0, server_default="0")
+    max_attempts: orm.Mapped[int] = orm.mapped_column(sa.Integer, nullable=False)
+    # When a queued job is next due, or when a running job's lease runs out and another worker may take it over
+    run_at: orm.Mapped[datetime] = orm.mapped_column(
+        DateTimeUTC(timezone=True), nullable=False, server_default=sa.func.now()
+    )
+    started_at: orm.Mapped[datetime] = orm.mapped_column(DateTimeUTC(timezone=True), nullable=True)
+    finished_at: orm.Mapped[datetime] = orm.mapped_column(DateTimeUTC(timezone=True), nullable=True)
+    last_error: orm.Mapped[str] = orm.mapped_column(sa.Text, nullable=True)
+    result: orm.Mapped[dict[str, Any]] = orm.mapped_column(sa.JSON, nullable=True)
+
+    # Who the job was queued for, who alone may see it; null for the system's own jobs
+    user_id: orm.Mapped[int] = orm.mapped_column(sa.ForeignKey("users.id", ondelete="cascade"), nullable=True)
@@ -0,0 +1,23 @@
+import sqlalchemy as sa
+from advanced_alchemy.base import BigIntAuditBase
+from advanced_alchemy.types import DateTimeUTC
+from sqlalchemy import orm
+from datetime import datetime
+
+class MailOutboxModel(BigIntAuditBase):
+    __tablename__ = "mail_outbox"
+    __table_args__ = (
+        # The sender only ever scans unsent mail that's due
+        sa.Index("ix_mail_outbox_next_attempt_at", "next_attempt_at", postgresql_where=sa.text("sent_at IS NULL")),
+    )
+
+    recipient: orm.Mapped[str] = orm.mapped_column(sa.String(320), nullable=False)
+    subject: orm.Mapped[str] = orm.mapped_column(sa.String, nullable=False)
+    body: orm.Mapped[str] = orm.mapped_column(sa.Text, nullable=False)
+    subtype: orm.Mapped[str] = orm.mapped_column(sa.String, nullable=False, default="html", server_default="html")
+    attempts: orm.Mapped[int] = orm.mapped_column(sa.Integer, nullable=False, default=0, server_default="0")
+    next_attempt_at: orm.Mapped[datetime] = orm.mapped_column(
+        DateTimeUTC(timezone=True), nullable=False, server_default=sa.func.now()
+    )
+    sent_at: orm.Mapped[datetime] = orm.mapped_column(DateTimeUTC(timezone=True), nullable=True)
+    last_error: orm.Mapped[str] = orm.mapped_column(sa.Text, nullable=True)
@@ -8,13 +8,44 @@ from datetime import datetime
 
 class MapModel(UUIDAuditBase):
     __tablename__ = "maps"
+    __table_args__ = (
+        sa.Index("ix_maps_name_trgm", "name", postgresql_using="gin", postgresql_ops={"name": "gin_trgm_ops"}),
+        # Searching by author finds users by username, then their maps by this
+        sa.Index("ix_maps_user_id", "user_id"),
+    )
 
     name: orm.Mapped[str] = orm.mapped_column(sa.String, nullable=False)
     private: orm.Mapped[bool] = orm.mapped_column(sa.Boolean, nullable=False)
-    data: orm.Mapped[dict] = orm.mapped_column(sa.JSON, nullable=False)
     last_played_at: orm.Mapped[datetime] = orm.mapped_column(sa.DateTime, nullable=True)
+    play_count: orm.Mapped[int] = orm.mapped_column(sa.Integer, nullable=False, default=0, server_default="0")
+
+    # Summary statistics of the map's layers, so listings can show them without loading any (see app.map_data)
+    building_count: orm.Mapped[int] = orm.mapped_column(sa.Integer, nullable=True)
+    building_height_min: orm.Mapped[float] = orm.mapped_column(sa.Float, nullable=True)
+    building_height_max: orm.Mapped[float] = orm.mapped_column(sa.Float, nullable=True)
+    road_length: orm.Mapped[float] = orm.mapped_column(sa.Float, nullable=True)
+    park_area: orm.Mapped[float] = orm.mapped_column(sa.Float, nullable=True)
+    bbox_min_x: orm.Mapped[float] = orm.mapped_column(sa.Float, nullable=True)
+    bbox_min_y: orm.Mapped[float] = orm.mapped_column(sa.Float, nullable=True)
+    bbox_max_x: orm.Mapped[float] = orm.mapped_column(sa.Float, nullable=True)
+    bbox_max_y: orm.Mapped[float] = orm.mapped_column(sa.Float, nullable=True)
 
     user_id: orm.Mapped[int] = orm.mapped_column(sa.ForeignKey("users.id", ondelete="cascade"), nullable=False)
     
     user: orm.Mapped["UserModel"] = orm.relationship("UserModel", back_populates="maps", lazy="noload")
-    thumbnail: orm.Mapped["ThumbnailModel"] = orm.relationship("ThumbnailModel", uselist=False, backref="maps", lazy="noload")
\ No newline at end of file
+    thumbnail: orm.Mapped["ThumbnailModel"] = orm.relationship("ThumbnailModel", uselist=False, backref="maps", lazy="noload")
+
+    @property
+    def stats(self) -> dict | None:
+        if self.building_count is None: return None
+        return {
+            "building_count": self.building_count,
+            "building_height_min": self.building_height_min,
+            "building_height_max": self.building_height_max,
+            "road_length": self.road_length,
+            "park_area": self.park_area,
+            "bbox_min_x": self.bbox_min_x,
+            "bbox_min_y": self.bbox_min_y,
+            "bbox_max_x": self.bbox_max_x,
+            "bbox_max_y": self.bbox_max_y,
+        }
\ No newline at end of file
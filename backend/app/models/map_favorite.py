@@ -5,6 +5,7 @@ from uuid import UUID
 
 class MapFavoriteModel(BigIntAuditBase):
     __tablename__ = "map_favorites"
+    __table_args__ = (sa.UniqueConstraint("user_id", "map_id"),)
 
     user_id: orm.Mapped[int] = orm.mapped_column(sa.ForeignKey("users.id", ondelete="cascade"), nullable=False)
     map_id: orm.Mapped[UUID] = orm.mapped_column(sa.ForeignKey("maps.id", ondelete="cascade"), nullable=False)
\ No newline at end of file
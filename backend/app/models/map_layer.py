@@ -0,0 +1,13 @@
+import sqlalchemy as sa
+from advanced_alchemy.base import BigIntAuditBase
+from sqlalchemy import orm
+from uuid import UUID
+
+class MapLayerModel(BigIntAuditBase):
+    """ One MapData layer of a map (see app.map_data.LAYERS), so each can be read without the others. """
+    __tablename__ = "map_layers"
+    __table_args__ = (sa.UniqueConstraint("map_id", "name"),)
+
+    map_id: orm.Mapped[UUID] = orm.mapped_column(sa.ForeignKey("maps.id", ondelete="cascade"), nullable=False)
+    name: orm.Mapped[str] = orm.mapped_column(sa.String, nullable=False)
+    data: orm.Mapped[list] = orm.mapped_column(sa.JSON, nullable=False)
\ No newline at end of file
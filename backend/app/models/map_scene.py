@@ -0,0 +1,14 @@
+import sqlalchemy as sa
+from advanced_alchemy.base import BigIntAuditBase
+from sqlalchemy import orm
+from uuid import UUID
+
+class MapSceneModel(BigIntAuditBase):
+    """ The game view's scene of a map, built once from its layers (see app.scene), and the format version it's in. """
+    __tablename__ = "map_scenes"
+
+    map_id: orm.Mapped[UUID] = orm.mapped_column(
+        sa.ForeignKey("maps.id", ondelete="cascade"), nullable=False, unique=True
+    )
+    version: orm.Mapped[int] = orm.mapped_column(sa.Integer, nullable=False)
+    data: orm.Mapped[bytes] = orm.mapped_column(sa.LargeBinary, nullable=False)
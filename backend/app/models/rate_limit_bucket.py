@@ -0,0 +1,18 @@
+import sqlalchemy as sa
+from advanced_alchemy.base import DefaultBase
+from advanced_alchemy.types import DateTimeUTC
+from sqlalchemy import orm
+from datetime import datetime
+
+class RateLimitBucketModel(DefaultBase):
+    """ A token bucket shared between server workers (see app.admission), when RATE_LIMIT_BACKEND is database. """
+    __tablename__ = "rate_limit_buckets"
+    # Losing the buckets in a crash only resets everyone's limits, so they're spared the write-ahead log.
+    __table_args__ = { "prefixes": ["UNLOGGED"] }
+
+    # The endpoint class and who's limited, e.g. "map_create:user:42"
+    key: orm.Mapped[str] = orm.mapped_column(sa.String, primary_key=True)
+    tokens: orm.Mapped[float] = orm.mapped_column(sa.Float, nullable=False)
+    updated_at: orm.Mapped[datetime] = orm.mapped_column(
+        DateTimeUTC(timezone=True), nullable=False, server_default=sa.func.now()
+    )
@@ -7,8 +7,11 @@ from datetime import datetime
 
 class ThumbnailModel(UUIDAuditBase):
     __tablename__ = "thumbnails"
+    __table_args__ = (sa.UniqueConstraint("map_id"),)
 
     data: orm.Mapped[bytes] = orm.mapped_column(sa.LargeBinary, nullable=False)
     mimetype: orm.Mapped[str] = orm.mapped_column(sa.String, nullable=False)
+    # Width and height in pixels of thumbnails drawn on the server (see app.thumbnail); null for ones clients uploaded
+    size: orm.Mapped[int] = orm.mapped_column(sa.Integer, nullable=True)
 
     map_id: orm.Mapped[UUID] = orm.mapped_column(sa.ForeignKey("maps.id", ondelete="cascade"), nullable=False)
\ No newline at end of file
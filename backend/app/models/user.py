@@ -9,6 +9,11 @@ from datetime import datetime
 
 class UserModel(SQLAlchemyBaseUserTable[int], BigIntAuditBase):
     __tablename__ = "users"
+    __table_args__ = (
+        sa.Index(
+            "ix_users_username_trgm", "username", postgresql_using="gin", postgresql_ops={"username": "gin_trgm_ops"}
+        ),
+    )
 
     username: orm.Mapped[str] = orm.mapped_column(sa.String, unique=True, nullable=False)
     first_name: orm.Mapped[str] = orm.mapped_column(sa.String, nullable=False)
@@ -0,0 +1,118 @@
+import asyncio
+import logging
+from datetime import datetime, timezone
+from uuid import UUID
+
+import sqlalchemy as sa
+from sqlalchemy import func, update
+
+from app.db import AsyncSessionFactory
+from app.models import MapModel
+from app.settings import settings
+
+logger = logging.getLogger(__name__)
+
+class PlayEventBuffer:
+    """
+    Write-behind buffer for map play events.
+
+    Plays are coalesced in memory per map (a count and the latest timestamp) and periodically
+    flushed as a single `UPDATE maps ... FROM (VALUES ...)` per chunk, so recording a play never
+    costs a transaction of its own. A flush happens every `flush_interval` seconds, as soon as
+    `flush_max_maps` distinct maps are pending, and once more on shutdown. At most `max_pending_maps`
+    maps are kept pending, so a database outage can't grow the buffer without bound; plays of any
+    others are dropped until a flush gets through.
+    """
+    def __init__(self, flush_interval: float, flush_max_maps: int, max_pending_maps: int):
+        self.flush_interval = flush_interval
+        self.flush_max_maps = flush_max_maps
+        self.max_pending_maps = max_pending_maps
+        self.dropped = 0
+        self._pending: dict[UUID, tuple[int, datetime]] = {}
+        self._wake: asyncio.Event | None = None
+        self._stopping = False
+        self._task: asyncio.Task | None = None
+
+    def _add(self, map_id: UUID, plays: int, played_at: datetime) -> None:
+        pending = self._pending.get(map_id)
+        if pending is None:
+            if len(self._pending) >= self.max_pending_maps:
+                self.dropped += plays
+                return
+            pending = (0, played_at)
+        self._pending[map_id] = (pending[0] + plays, max(pending[1], played_at))
+
+    def record(self, map_id: UUID, played_at: datetime | None = None) -> None:
+        # `maps.last_played_at` is a naive timestamp column, stored as UTC.
+        if played_at is None: played_at = datetime.now(timezone.utc).replace(tzinfo=None)
+        self._add(map_id, 1, played_at)
+
+        if len(self._pending) >= self.flush_max_maps and self._wake is not None:
+            self._wake.set()
+
+    def _requeue(self, events: dict[UUID, tuple[int, datetime]]) -> None:
+        for map_id, (plays, played_at) in events.items():
+            self._add(map_id, plays, played_at)
+
+    async def flush(self) -> None:
+        if self.dropped:
+            logger.warning(f"Dropped { self.dropped } play events with { self.max_pending_maps } maps pending")
+            self.dropped = 0
+        if not self._pending: return
+        events, self._pending = self._pending, {}
+
+        rows = [(map_id, plays, played_at) for map_id, (plays, played_at) in events.items()]
+        try:
+            async with AsyncSessionFactory() as session:
+                for i in range(0, len(rows), self.flush_max_maps):
+                    plays = sa.values(
+                        sa.column("id", MapModel.__table__.c.id.type),
+                        sa.column("plays", sa.Integer),
+                        sa.column("played_at", sa.DateTime),
+                        name="plays"
+                    ).data(rows[i : i + self.flush_max_maps])
+                    await session.execute(
+                        update(MapModel)
+                        .where(MapModel.id == plays.c.id)
+                        .values(
+                            play_count=MapModel.play_count + plays.c.plays,
+                            last_played_at=func.greatest(MapModel.last_played_at, plays.c.played_at),
+                            # Playing a map isn't an edit, so don't let the audit column's onupdate bump it.
+                            updated_at=MapModel.updated_at
+                        )
+                        .execution_options(synchronize_session=False)
+                    )
+                await session.commit()
+        except Exception:
+            logger.exception(f"Failed to flush play events for { len(rows) } maps, requeueing...")
+            self._requeue(events)
+
+    async def run(self) -> None:
+        while not self._stopping:
+            try:
+                await asyncio.wait_for(self._wake.wait(), timeout=self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wake.clear()
+            await self.flush()
+
+    def start(self) -> None:
+        self._stopping = False
+        self._wake = asyncio.Event()
+        self._task = asyncio.create_task(self.run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._stopping = True
+            self._wake.set()
+            await self._task
+            self._task = None
+        # Final flush picks up anything recorded while the last periodic flush was in flight.
+        await self.flush()
+
+
+play_event_buffer = PlayEventBuffer(
+    flush_interval=settings.play_events_flush_interval_seconds,
+    flush_max_maps=settings.play_events_flush_max_maps,
+    max_pending_maps=settings.play_events_max_pending_maps,
+)
\ No newline at end of file
@@ -0,0 +1,38 @@
+import asyncio
+import concurrent.futures
+import multiprocessing
+import typing
+
+from app.settings import settings
+
+T = typing.TypeVar("T")
+
+class ProcessPool:
+    """
+    Worker processes for CPU-bound work on map geometry (scenes, exports, thumbnails), which would otherwise hold up the
+    event loop, or every other request through the GIL if run in a thread. Until `start` is called, or with no workers,
+    work runs in the event loop's default thread pool instead.
+
+    Work is sent to a process pickled, so functions run here should take compact arguments such as JSON text.
+    """
+    def __init__(self, workers: int):
+        self.workers = workers
+        self._executor: concurrent.futures.ProcessPoolExecutor | None = None
+
+    async def run(self, fn: typing.Callable[..., T], *args: typing.Any) -> T:
+        return await asyncio.get_running_loop().run_in_executor(self._executor, fn, *args)
+
+    def start(self) -> None:
+        if not self.workers: return
+        # Spawned rather than forked, as forking a process with an event loop and open connections isn't safe.
+        self._executor = concurrent.futures.ProcessPoolExecutor(
+            max_workers=self.workers, mp_context=multiprocessing.get_context("spawn")
+        )
+
+    async def stop(self) -> None:
+        if self._executor is not None:
+            await asyncio.to_thread(self._executor.shutdown, wait=True, cancel_futures=True)
+            self._executor = None
+
+
+process_pool = ProcessPool(workers=settings.process_pool_workers)
@@ -0,0 +1,81 @@
+import asyncio
+import logging
+import uuid
+from pathlib import Path
+from http.cookies import SimpleCookie
+from starlette.datastructures import MutableHeaders
+
+from app.auth import cookie_transport, get_superuser_from_token
+from app.settings import settings
+
+
+logger = logging.getLogger(__name__)
+
+PROFILE_HEADER = b"x-profile"
+
+def profile_path(profile_id: uuid.UUID) -> Path:
+    return Path(settings.profiling_output_dir) / f"{ profile_id }.speedscope.json"
+
+
+class ProfilingMiddleware:
+    """
+    Runs requests sent by a superuser with `X-Profile: 1` under pyinstrument's sampling profiler, saving the result in
+    speedscope format and linking to it from the response's `Link` header (open it at https://www.speedscope.app).
+
+    Only installed when `profiling_enabled` is set. Other requests pay for a single header scan, and pyinstrument
+    isn't imported until a profile is actually taken.
+    """
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or (PROFILE_HEADER, b"1") not in scope["headers"]:
+            return await self.app(scope, receive, send)
+
+        # Anyone else asking for a profile is simply served normally; the header is ignored rather than rejected.
+        if await get_superuser_from_token(self._login_token(scope)) is None:
+            return await self.app(scope, receive, send)
+
+        from pyinstrument import Profiler
+
+        profile_id = uuid.uuid4()
+        profile_url = scope["app"].url_path_for("get_profile", profile_id=profile_id)
+
+        async def send_with_link(message):
+            if message["type"] == "http.response.start":
+                headers = MutableHeaders(scope=message)
+                headers.append("link", f'<{ profile_url }>; rel="profile"; type="application/json"')
+                headers.append("x-profile-id", str(profile_id))
+            await send(message)
+
+        profiler = Profiler(interval=settings.profiling_interval_seconds, async_mode="enabled")
+        profiler.start()
+        try:
+            await self.app(scope, receive, send_with_link)
+        finally:
+            profiler.stop()
+            try:
+                await asyncio.to_thread(self._save, profiler, profile_id)
+            except Exception as e:
+                logger.warning(f"Failed to save profile { profile_id } with error { str(e) }")
+
+    @staticmethod
+    def _login_token(scope) -> str | None:
+        for name, value in scope["headers"]:
+            if name == b"cookie":
+                cookie = SimpleCookie(value.decode("latin-1")).get(cookie_transport.cookie_name)
+                if cookie is not None: return cookie.value
+        return None
+
+    @staticmethod
+    def _save(profiler, profile_id: uuid.UUID) -> None:
+        from pyinstrument.renderers import SpeedscopeRenderer
+
+        path = profile_path(profile_id)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_text(profiler.output(renderer=SpeedscopeRenderer()))
+        logger.info(f"Saved profile { profile_id } ({ profiler.last_session.duration:.3f}s) to { path }")
+
+        profiles = sorted(path.parent.glob("*.speedscope.json"), key=lambda p: p.stat().st_mtime)
+        for stale in profiles[:-settings.profiling_max_profiles]:
+            stale.unlink(missing_ok=True)
@@ -0,0 +1,106 @@
+import hashlib
+import re
+import secrets
+import typing
+
+from fastapi import Request, Response
+
+from app.exceptions.system import RangeNotSatisfiableException
+from app.settings import settings
+
+RANGE_SPEC = re.compile(r"(\d*)-(\d*)", re.ASCII)
+
+
+class ByteRange(typing.NamedTuple):
+    """ Bytes `start` up to but not including `stop`. """
+    start: int
+    stop: int
+
+# Reads the bytes of each range, in order, from wherever the resource is kept.
+Reader = typing.Callable[[list[ByteRange]], typing.Awaitable[list[bytes]]]
+
+
+def parse_range(range_header: str, size: int) -> list[ByteRange] | None:
+    """
+    The byte ranges a Range header asks for of a `size` byte resource, clamped to it and sorted, with overlapping or
+    adjacent ranges merged. None means the header is to be ignored and the whole resource sent, as it isn't a bytes
+    range, is malformed, or asks for more than `http_range_max_parts` ranges.
+    Raises `RangeNotSatisfiableException` if none of the ranges overlap the resource.
+    """
+    unit, _, specs = range_header.partition("=")
+    specs = [spec.strip() for spec in specs.split(",") if spec.strip()]
+    if unit.strip().lower() != "bytes" or not specs or len(specs) > settings.http_range_max_parts: return None
+
+    ranges = []
+    for spec in specs:
+        match = RANGE_SPEC.fullmatch(spec)
+        if not match or not any(match.groups()): return None
+        first, last = match.groups()
+        if not first:
+            # A suffix range, the last `last` bytes
+            start, stop = max(size - int(last), 0), size
+        else:
+            start, stop = int(first), min(int(last) + 1, size) if last else size
+            if last and int(last) < start: return None
+        if start < stop: ranges.append(ByteRange(start, stop))
+    if not ranges: raise RangeNotSatisfiableException(size)
+
+    ranges.sort()
+    merged = [ranges[0]]
+    for byte_range in ranges[1:]:
+        if byte_range.start <= merged[-1].stop:
+            merged[-1] = ByteRange(merged[-1].start, max(merged[-1].stop, byte_range.stop))
+        else:
+            merged.append(byte_range)
+    return merged
+
+def if_range_matches(if_range: str, etag: str) -> bool:
+    """
+    Whether an If-Range header still holds for `etag`, which calls for the strong comparison. Dates never match, as
+    these resources aren't served with a Last-Modified.
+    """
+    return not etag.startswith("W/") and if_range.strip() == etag
+
+def content_range(byte_range: ByteRange, size: int) -> str:
+    return f"bytes { byte_range.start }-{ byte_range.stop - 1 }/{ size }"
+
+def blob_etag(data: bytes) -> str:
+    return f'"{ hashlib.blake2b(data, digest_size=16).hexdigest() }"'
+
+def bytes_reader(data: bytes) -> Reader:
+    """ A `Reader` of a resource already held in memory. """
+    async def read(ranges: list[ByteRange]) -> list[bytes]:
+        return [data[byte_range.start:byte_range.stop] for byte_range in ranges]
+    return read
+
+async def ranged_response(request: Request, size: int, etag: str, media_type: str, read: Reader) -> Response:
+    """
+    A `size` byte resource as a response honouring Range and If-Range: the whole of it, one range, or several as
+    multipart/byteranges. Only the bytes being sent are asked of `read`, so `etag` must identify a representation that
+    reads the same on every request.
+    """
+    headers = { "Accept-Ranges": "bytes", "ETag": etag }
+    range_header, if_range = request.headers.get("range"), request.headers.get("if-range")
+    ranges = None
+    if range_header and (if_range is None or if_range_matches(if_range, etag)):
+        ranges = parse_range(range_header, size)
+
+    if ranges is None:
+        [body] = await read([ByteRange(0, size)])
+        return Response(content=body, media_type=media_type, headers=headers)
+
+    parts = await read(ranges)
+    if len(ranges) == 1:
+        headers["Content-Range"] = content_range(ranges[0], size)
+        return Response(content=parts[0], status_code=206, media_type=media_type, headers=headers)
+
+    boundary = secrets.token_hex(16)
+    body = b"".join(
+        f"--{ boundary }\r\nContent-Type: { media_type }\r\n"
+        f"Content-Range: { content_range(byte_range, size) }\r\n\r\n".encode()
+        + part + b"\r\n"
+        for byte_range, part in zip(ranges, parts, strict=True)
+    ) + f"--{ boundary }--\r\n".encode()
+    return Response(
+        content=body, status_code=206, media_type=f"multipart/byteranges; boundary={ boundary }", headers=headers
+    )
@@ -1,5 +1,9 @@
 from .user_repository import UserRepository, UserService
 from .map_repository import MapRepository, MapService
 from .map_favorite_repository import MapFavoriteRepository, MapFavoriteService
+from .map_layer_repository import MapLayerRepository, MapLayerService
+from .map_scene_repository import MapSceneRepository, MapSceneService
 from .thumbnail_repository import ThumbnailRepository, ThumbnailService
-from .avatar_repository import AvatarRepository, AvatarService
\ No newline at end of file
+from .avatar_repository import AvatarRepository, AvatarService
+from .job_repository import JobRepository, JobService
+from .rate_limit_bucket_repository import RateLimitBucketRepository, RateLimitBucketService
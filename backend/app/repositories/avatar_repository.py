@@ -2,10 +2,12 @@ from advanced_alchemy.repository import SQLAlchemyAsyncRepository
 from advanced_alchemy.service import SQLAlchemyAsyncRepositoryService
 
 from app.models import AvatarModel
+from app.slow_queries import trace_call_sites
 
 class AvatarRepository(SQLAlchemyAsyncRepository[AvatarModel]):
     model_type = AvatarModel
 
 
+@trace_call_sites
 class AvatarService(SQLAlchemyAsyncRepositoryService[AvatarModel]):
     repository_type = AvatarRepository
\ No newline at end of file
@@ -0,0 +1,108 @@
+from datetime import datetime, timedelta, timezone
+from typing import Any, Sequence
+from uuid import UUID
+from advanced_alchemy.repository import SQLAlchemyAsyncRepository
+from advanced_alchemy.service import SQLAlchemyAsyncRepositoryService
+from sqlalchemy import func, select, text, update
+from sqlalchemy.dialects.postgresql import insert
+
+from app.models import JobModel
+from app.models.job import ACTIVE_JOB_STATUSES
+from app.slow_queries import trace_call_sites
+
+class JobRepository(SQLAlchemyAsyncRepository[JobModel]):
+    model_type = JobModel
+
+
+@trace_call_sites
+class JobService(SQLAlchemyAsyncRepositoryService[JobModel]):
+    repository_type = JobRepository
+
+    def __init__(self, **repo_kwargs: Any) -> None:
+        self.repository: JobRepository = self.repository_type(**repo_kwargs)
+        self.model_type = self.repository.model_type
+
+    async def get_job(self, job_id: UUID) -> JobModel | None:
+        return await self.repository.session.scalar(select(JobModel).where(JobModel.id == job_id))
+
+    async def enqueue(
+        self,
+        queue: str,
+        kind: str,
+        payload: dict[str, Any],
+        max_attempts: int,
+        dedupe_key: str | None = None,
+        user_id: int | None = None,
+    ) -> UUID:
+        """
+        Queue a job, unless one with the same `dedupe_key` is still queued or running, and return the id of whichever
+        job will do the work. Nothing is committed.
+
+        The job the insert conflicted with may finish before it's looked up, in which case the insert is tried again:
+        each statement sees what's been committed since the last, so the loop ends once one of them finds a job.
+        """
+        statement = insert(JobModel).values(
+            queue=queue, kind=kind, payload=payload, max_attempts=max_attempts, dedupe_key=dedupe_key, user_id=user_id
+        )
+        if dedupe_key is not None:
+            statement = statement.on_conflict_do_nothing(
+                index_elements=[JobModel.dedupe_key], index_where=text(ACTIVE_JOB_STATUSES)
+            )
+        while True:
+            job_id = await self.repository.session.scalar(statement.returning(JobModel.id))
+            if job_id is not None: return job_id
+            job_id = await self.repository.session.scalar(
+                select(JobModel.id).where(JobModel.dedupe_key == dedupe_key, text(ACTIVE_JOB_STATUSES))
+            )
+            if job_id is not None: return job_id
+
+    async def claim(self, queue: str, limit: int, lease: float) -> Sequence[JobModel]:
+        """
+        Take up to `limit` of a queue's due jobs, oldest first: queued jobs whose time has come, and running jobs whose
+        worker let their lease run out. Rows locked by another worker's claim are skipped rather than waited on, and
+        each job's `run_at` is pushed out by `lease`, so no row lock is held while it runs.
+        """
+        now = datetime.now(timezone.utc)
+        due = (
+            select(JobModel.id)
+            .where(JobModel.queue == queue, text(ACTIVE_JOB_STATUSES), JobModel.run_at <= now)
+            .order_by(JobModel.run_at)
+            .limit(limit)
+            .with_for_update(skip_locked=True)
+        )
+        return (await self.repository.session.scalars(
+            update(JobModel)
+            .where(JobModel.id.in_(due.scalar_subquery()))
+            .values(
+                status="running",
+                attempts=JobModel.attempts + 1,
+                run_at=now + timedelta(seconds=lease),
+                started_at=now,
+                updated_at=func.now(),
+            )
+            .returning(JobModel),
+            execution_options={"synchronize_session": False},
+        )).all()
+
+    async def _finish(self, job_id: UUID, claimed_attempts: int, **values: Any) -> None:
+        # Only the claim that made the job's latest attempt may finish it: once a worker's lease has run out and its job
+        # has been claimed again, `attempts` has moved on, so the worker can't overwrite the new claim.
+        await self.repository.session.execute(
+            update(JobModel)
+            .where(JobModel.id == job_id, JobModel.status == "running", JobModel.attempts == claimed_attempts)
+            .values(**values, updated_at=func.now()),
+            execution_options={"synchronize_session": False},
+        )
+
+    async def succeed(self, job_id: UUID, attempts: int, result: dict[str, Any] | None) -> None:
+        await self._finish(job_id, attempts, status="succeeded", result=result, finished_at=func.now(), last_error=None)
+
+    async def retry(self, job_id: UUID, attempts: int, run_at: datetime, error: str) -> None:
+        await self._finish(job_id, attempts, status="queued", run_at=run_at, last_error=error)
+
+    async def fail(self, job_id: UUID, attempts: int, error: str) -> None:
+        await self._finish(job_id, attempts, status="failed", finished_at=func.now(), last_error=error)
+
+    async def release(self, job_id: UUID, attempts: int) -> None:
+        """ Hand a job back to be run again at once, without counting the attempt, e.g. when its worker shuts down. """
+        await self._finish(job_id, attempts, status="queued", run_at=func.now(), attempts=JobModel.attempts - 1)
@@ -2,13 +2,17 @@ from typing import Any
 from uuid import UUID
 from advanced_alchemy.repository import SQLAlchemyAsyncRepository
 from advanced_alchemy.service import SQLAlchemyAsyncRepositoryService
+from sqlalchemy import delete, select
+from sqlalchemy.dialects.postgresql import insert
 
 from app.models import MapFavoriteModel
+from app.slow_queries import trace_call_sites
 
 class MapFavoriteRepository(SQLAlchemyAsyncRepository[MapFavoriteModel]):
     model_type = MapFavoriteModel
 
 
+@trace_call_sites
 class MapFavoriteService(SQLAlchemyAsyncRepositoryService[MapFavoriteModel]):
     repository_type = MapFavoriteRepository
 
@@ -22,17 +26,38 @@ class MapFavoriteService(SQLAlchemyAsyncRepositoryService[MapFavoriteModel]):
             user_id=user_id
         )
         return map_favorited is not None
+
+    async def get_favorited_map_ids(self, user_id: int) -> set[UUID]:
+        """ Every map `user_id` has favorited, served from the (user_id, map_id) unique index alone. """
+        result = await self.repository.session.scalars(
+            select(MapFavoriteModel.map_id).where(MapFavoriteModel.user_id == user_id)
+        )
+        return set(result)
     
     async def set_map_favorited(self, map_id: UUID, user_id: int, favorited: bool):
-        # Don't bother if state already matches requested state
-        if favorited == await self.is_map_favorited(map_id, user_id): return
-
-        if favorited:
-            await self.repository.add(MapFavoriteModel(user_id=user_id, map_id=map_id))
-        else:
-            await self.repository.delete_where(
-                map_id=map_id,
-                user_id=user_id
+        await self.set_maps_favorited(user_id, {map_id: favorited})
+
+    async def set_maps_favorited(self, user_id: int, favorites: dict[UUID, bool]):
+        """
+        Apply favorite toggles for many maps in a single transaction.
+
+        Each direction is one idempotent statement backed by the (user_id, map_id) unique constraint,
+        so repeated or concurrent toggles can neither duplicate nor race with each other.
+        """
+        favorited_ids = [map_id for map_id, favorited in favorites.items() if favorited]
+        unfavorited_ids = [map_id for map_id, favorited in favorites.items() if not favorited]
+
+        session = self.repository.session
+        if favorited_ids:
+            await session.execute(
+                insert(MapFavoriteModel)
+                .values([{ "user_id": user_id, "map_id": map_id } for map_id in favorited_ids])
+                .on_conflict_do_nothing(index_elements=[MapFavoriteModel.user_id, MapFavoriteModel.map_id])
+            )
+        if unfavorited_ids:
+            await session.execute(
+                delete(MapFavoriteModel)
+                .where(MapFavoriteModel.user_id == user_id, MapFavoriteModel.map_id.in_(unfavorited_ids))
             )
-        
-        await self.repository.session.commit()
\ No newline at end of file
+
+        await session.commit()
\ No newline at end of file
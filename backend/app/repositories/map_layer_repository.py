@@ -0,0 +1,118 @@
+from typing import Any, AsyncIterator, Sequence
+from uuid import UUID
+from advanced_alchemy.repository import SQLAlchemyAsyncRepository
+from advanced_alchemy.service import SQLAlchemyAsyncRepositoryService
+from sqlalchemy import (
+    bindparam, case, cast, column, func, insert, literal, select, true, values, Integer, JSON, LargeBinary, Row, String,
+    Text
+)
+from sqlalchemy.dialects.postgresql import aggregate_order_by
+
+from app.map_data import LayerSlice
+from app.models import MapLayerModel
+from app.slow_queries import trace_call_sites
+
+def encoded_layer_json():
+    # Byte offsets into text need it as bytes; substring and length on text count characters.
+    return func.convert_to(cast(MapLayerModel.data, Text), literal("UTF8"))
+
+class MapLayerRepository(SQLAlchemyAsyncRepository[MapLayerModel]):
+    model_type = MapLayerModel
+
+
+@trace_call_sites
+class MapLayerService(SQLAlchemyAsyncRepositoryService[MapLayerModel]):
+    repository_type = MapLayerRepository
+
+    def __init__(self, **repo_kwargs: Any) -> None:
+        self.repository: MapLayerRepository = self.repository_type(**repo_kwargs)
+        self.model_type = self.repository.model_type
+
+    async def create_layers(self, map_id: UUID, layers_json: dict[str, str]) -> None:
+        """ Store each layer of a map as its own row, in a single statement, from its JSON text as it was sent. """
+        await self.repository.session.execute(
+            # Cast in SQL, since the driver would otherwise encode the text as a JSON string.
+            insert(MapLayerModel.__table__).values(
+                map_id=bindparam("map_id"), name=bindparam("name"), data=cast(bindparam("data_json", type_=Text), JSON)
+            ),
+            [{ "map_id": map_id, "name": name, "data_json": layer_json } for name, layer_json in layers_json.items()]
+        )
+
+    async def get_layers_json(self, map_id: UUID, names: list[str]) -> dict[str, str]:
+        """
+        The JSON text of the named layers of a map, keyed by name. Only those rows are read, and their text is returned
+        as Postgres stored it rather than decoded, so it can be written straight into a response.
+        """
+        result = await self.repository.session.execute(
+            # Cast in SQL, since the driver would otherwise decode json columns itself.
+            select(MapLayerModel.name, cast(MapLayerModel.data, Text))
+            .where(MapLayerModel.map_id == map_id, MapLayerModel.name.in_(names))
+        )
+        return dict(result.tuples().all())
+
+    async def get_layer_sizes(self, map_id: UUID) -> Sequence[Row]:
+        """ Each layer of a map as (name, size, updated_at), its size being that of its stored JSON text in bytes. """
+        result = await self.repository.session.execute(
+            select(MapLayerModel.name, func.octet_length(encoded_layer_json()).label("size"), MapLayerModel.updated_at)
+            .where(MapLayerModel.map_id == map_id)
+        )
+        return result.all()
+
+    async def get_layer_slices(self, map_id: UUID, slices: list[LayerSlice]) -> list[bytes]:
+        """
+        The bytes of each slice of a map's layers' stored JSON text, in order, in one statement. Only the slices are
+        sent back, however large the layers they're cut from.
+        """
+        if not slices: return []
+        wanted = values(
+            column("i", Integer), column("name", String), column("start", Integer), column("length", Integer),
+            name="wanted",
+        ).data([
+            (i, layer_slice.name, layer_slice.start + 1, layer_slice.stop - layer_slice.start)
+            for i, layer_slice in enumerate(slices)
+        ])
+        result = await self.repository.session.execute(
+            select(func.substring(encoded_layer_json(), wanted.c.start, wanted.c.length, type_=LargeBinary))
+            .join_from(wanted, MapLayerModel, MapLayerModel.name == wanted.c.name)
+            .where(MapLayerModel.map_id == map_id)
+            .order_by(wanted.c.i)
+        )
+        return list(result.scalars().all())
+
+    async def stream_layers_json(self, map_id: UUID, names: list[str]) -> AsyncIterator[tuple[str, str]]:
+        """
+        Stream the JSON text of the named layers of a map as (name, text), in the order of `names`, through a
+        server-side cursor so only one layer is held at a time.
+        """
+        position = case({ name: i for i, name in enumerate(names) }, value=MapLayerModel.name)
+        result = await self.repository.session.stream(
+            select(MapLayerModel.name, cast(MapLayerModel.data, Text))
+            .where(MapLayerModel.map_id == map_id, MapLayerModel.name.in_(names))
+            .order_by(position)
+            .execution_options(yield_per=1)
+        )
+        async for name, layer_json in result:
+            yield name, layer_json
+
+    async def stream_layer_chunks_json(self, map_id: UUID, name: str, chunk_size: int) -> AsyncIterator[str]:
+        """
+        Stream a list layer of a map as the JSON text of consecutive slices of `chunk_size` items. The layer is split
+        in the database and read a slice at a time, so however large it is, only one slice is held.
+        """
+        items = func.json_array_elements(MapLayerModel.data).table_valued("value", with_ordinality="ordinality")
+        chunk = ((items.c.ordinality - 1) // chunk_size).label("chunk")
+        # Joined by hand rather than with json_agg, which also adds whitespace between items.
+        chunk_json = (
+            "[" + func.string_agg(cast(items.c.value, Text), aggregate_order_by(literal(","), items.c.ordinality)) + "]"
+        )
+        result = await self.repository.session.stream(
+            select(chunk_json)
+            .select_from(MapLayerModel)
+            .join(items, true())
+            .where(MapLayerModel.map_id == map_id, MapLayerModel.name == name)
+            .group_by(chunk)
+            .order_by(chunk)
+            .execution_options(yield_per=1)
+        )
+        async for chunk_json, in result:
+            yield chunk_json
@@ -2,14 +2,17 @@ from typing import Any
 from uuid import UUID
 from advanced_alchemy.repository import SQLAlchemyAsyncRepository
 from advanced_alchemy.service import SQLAlchemyAsyncRepositoryService
+from sqlalchemy import select, exists, false, or_, orm, func, tuple_, union
 
-from app.models import MapModel, UserModel
+from app.models import MapModel, MapFavoriteModel, UserModel
+from app.slow_queries import trace_call_sites
 from app.exceptions.map import MapDoesNotExistException, MapNotPublicException
 
 class MapRepository(SQLAlchemyAsyncRepository[MapModel]):
     model_type = MapModel
 
 
+@trace_call_sites
 class MapService(SQLAlchemyAsyncRepositoryService[MapModel]):
     repository_type = MapRepository
 
@@ -17,6 +20,39 @@ class MapService(SQLAlchemyAsyncRepositoryService[MapModel]):
         self.repository: MapRepository = self.repository_type(**repo_kwargs)
         self.model_type = self.repository.model_type
 
+    @staticmethod
+    def visible_to(user: UserModel | None):
+        """ SQL form of `get_map`'s privacy rules: public maps, plus the user's own private maps. """
+        if user is None:
+            return MapModel.private == False
+        return or_(MapModel.private == False, MapModel.user_id == user.id)
+
+    @staticmethod
+    def favorited_by(user: UserModel | None):
+        """ Correlated EXISTS selecting whether `user` has favorited each map, using the (user_id, map_id) index. """
+        if user is None:
+            return false()
+        return exists().where(MapFavoriteModel.map_id == MapModel.id, MapFavoriteModel.user_id == user.id)
+
+    async def list_maps(self, *filters, user: UserModel | None, load_user: bool = True) -> list[MapModel]:
+        """
+        List maps matching `filters` with `favorited` set for `user`, in a single query regardless of row count.
+        Geometry lives in its own table, so listings never touch it.
+        """
+        statement = (
+            select(MapModel, self.favorited_by(user).label("favorited"))
+            .where(*filters)
+        )
+        if load_user:
+            statement = statement.options(orm.joinedload(MapModel.user))
+
+        result = await self.repository.session.execute(statement)
+        maps = []
+        for map, favorited in result:
+            map.favorited = favorited
+            maps.append(map)
+        return maps
+
     async def get_map(
         self,
         map_id: UUID,
@@ -31,4 +67,77 @@ class MapService(SQLAlchemyAsyncRepositoryService[MapModel]):
             if user is None or user.id != map.user_id:
                 raise MapNotPublicException
             
-        return map
\ No newline at end of file
+        return map
+
+    async def get_maps(self, map_ids: list[UUID], user: UserModel | None) -> list[MapModel]:
+        """
+        Fetch every map in `map_ids` that `user` may see, in request order, with authors and favorites loaded.
+        Missing and inaccessible maps are omitted rather than raised, since one bad ID shouldn't sink a batch.
+        """
+        maps = await self.list_maps(MapModel.id.in_(map_ids), self.visible_to(user), user=user)
+        maps_by_id = { map.id: map for map in maps }
+        return [maps_by_id[map_id] for map_id in map_ids if map_id in maps_by_id]
+
+    async def search_maps(
+        self,
+        query: str,
+        user: UserModel | None,
+        limit: int,
+        after: tuple[float, UUID] | None = None
+    ) -> list[tuple[MapModel, float]]:
+        """
+        Rank visible maps by trigram similarity of their name or author's username to `query`, with `favorited` set
+        for `user`.
+
+        Candidates are the UNION of maps whose name matches and maps by users whose username matches, each found
+        through its own table's GIN trigram index (and the author's maps through `ix_maps_user_id`); one condition
+        across the join of both tables could use neither, and scan it whole. Substring matches are kept even when they
+        fall under the trigram similarity threshold, since short queries rarely clear it.
+
+        Results are ordered by (rank, id) descending, and `after` is the (rank, id) of the last row of the previous
+        page, so paging is a keyset seek rather than an OFFSET scan.
+        """
+        # ILIKE rather than `icontains`, whose lower() hides the column from its index
+        pattern = "%" + query.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_") + "%"
+        by_name = select(MapModel.id).where(or_(MapModel.name.op("%")(query), MapModel.name.ilike(pattern)))
+        by_author = (
+            select(MapModel.id)
+            .join(UserModel, MapModel.user_id == UserModel.id)
+            .where(or_(UserModel.username.op("%")(query), UserModel.username.ilike(pattern)))
+        )
+        matches = union(by_name, by_author).subquery("matches")
+
+        rank = func.greatest(func.similarity(MapModel.name, query), func.similarity(UserModel.username, query))
+        statement = (
+            select(MapModel, rank.label("rank"), self.favorited_by(user).label("favorited"))
+            .join(matches, matches.c.id == MapModel.id)
+            .join(MapModel.user)
+            .options(orm.contains_eager(MapModel.user))
+            .where(self.visible_to(user))
+            .order_by(rank.desc(), MapModel.id.desc())
+            .limit(limit)
+        )
+        if after is not None:
+            statement = statement.where(tuple_(rank, MapModel.id) < tuple_(*after))
+
+        result = await self.repository.session.execute(statement)
+        results = []
+        for map, rank, favorited in result:
+            map.favorited = favorited
+            results.append((map, rank))
+        return results
+
+    async def verify_maps_accessible(self, map_ids: list[UUID], user: UserModel | None) -> None:
+        """ Bulk equivalent of `get_map`'s existence and privacy checks, without loading map data. """
+        result = await self.repository.session.execute(
+            select(MapModel.id, MapModel.private, MapModel.user_id).where(MapModel.id.in_(map_ids))
+        )
+        maps = { row.id: row for row in result }
+
+        for map_id in map_ids:
+            map = maps.get(map_id)
+            if map is None:
+                raise MapDoesNotExistException
+            if map.private:
+                if user is None or user.id != map.user_id:
+                    raise MapNotPublicException
\ No newline at end of file
@@ -0,0 +1,39 @@
+from typing import Any
+from uuid import UUID
+from advanced_alchemy.repository import SQLAlchemyAsyncRepository
+from advanced_alchemy.service import SQLAlchemyAsyncRepositoryService
+from sqlalchemy import func, select
+from sqlalchemy.dialects.postgresql import insert
+
+from app.models import MapSceneModel
+from app.slow_queries import trace_call_sites
+
+class MapSceneRepository(SQLAlchemyAsyncRepository[MapSceneModel]):
+    model_type = MapSceneModel
+
+
+@trace_call_sites
+class MapSceneService(SQLAlchemyAsyncRepositoryService[MapSceneModel]):
+    repository_type = MapSceneRepository
+
+    def __init__(self, **repo_kwargs: Any) -> None:
+        self.repository: MapSceneRepository = self.repository_type(**repo_kwargs)
+        self.model_type = self.repository.model_type
+
+    async def get_scene_data(self, map_id: UUID, version: int) -> bytes | None:
+        """ A map's stored scene, unless there is none or it's in another format version. """
+        return await self.repository.session.scalar(
+            select(MapSceneModel.data).where(MapSceneModel.map_id == map_id, MapSceneModel.version == version)
+        )
+
+    async def save_scene(self, map_id: UUID, version: int, data: bytes) -> None:
+        """ Store a map's scene, replacing the one in an older format if there is one. """
+        statement = insert(MapSceneModel).values(map_id=map_id, version=version, data=data)
+        await self.repository.session.execute(
+            statement.on_conflict_do_update(
+                index_elements=[MapSceneModel.map_id],
+                set_={
+                    "version": statement.excluded.version, "data": statement.excluded.data, "updated_at": func.now()
+                },
+            )
+        )
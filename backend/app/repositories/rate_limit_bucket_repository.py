@@ -0,0 +1,50 @@
+from typing import Any
+from advanced_alchemy.repository import SQLAlchemyAsyncRepository
+from advanced_alchemy.service import SQLAlchemyAsyncRepositoryService
+from sqlalchemy import delete, func, select
+from sqlalchemy.dialects.postgresql import insert
+
+from app.models import RateLimitBucketModel
+from app.slow_queries import trace_call_sites
+
+class RateLimitBucketRepository(SQLAlchemyAsyncRepository[RateLimitBucketModel]):
+    model_type = RateLimitBucketModel
+
+
+@trace_call_sites
+class RateLimitBucketService(SQLAlchemyAsyncRepositoryService[RateLimitBucketModel]):
+    repository_type = RateLimitBucketRepository
+
+    def __init__(self, **repo_kwargs: Any) -> None:
+        self.repository: RateLimitBucketRepository = self.repository_type(**repo_kwargs)
+        self.model_type = self.repository.model_type
+
+    async def take_token(self, key: str, rate: float, burst: int) -> float:
+        """
+        Take a token from `key`'s bucket, which refills at `rate` per second up to `burst`, returning 0 if there was
+        one, or else how many seconds until there will be. Buckets are refilled by the database's clock, so every
+        server agrees on them, and taken from in one statement, so concurrent requests can't both take the last token.
+        """
+        refilled = func.least(
+            burst,
+            RateLimitBucketModel.tokens + func.extract("epoch", func.now() - RateLimitBucketModel.updated_at) * rate,
+        )
+        statement = insert(RateLimitBucketModel).values(key=key, tokens=burst - 1)
+        taken = await self.repository.session.scalar(
+            statement.on_conflict_do_update(
+                index_elements=[RateLimitBucketModel.key],
+                set_={ "tokens": refilled - 1, "updated_at": func.now() },
+                where=refilled >= 1,
+            ).returning(RateLimitBucketModel.tokens)
+        )
+        if taken is not None: return 0.0
+        tokens = await self.repository.session.scalar(select(refilled).where(RateLimitBucketModel.key == key))
+        return max((1 - tokens) / rate, 0.0)
+
+    async def delete_idle_buckets(self, idle_seconds: float) -> None:
+        """ Drop buckets untouched for `idle_seconds`, by when they'd be full again and no different from new ones. """
+        await self.repository.session.execute(
+            delete(RateLimitBucketModel).where(
+                RateLimitBucketModel.updated_at < func.now() - func.make_interval(0, 0, 0, 0, 0, 0, idle_seconds)
+            )
+        )
@@ -1,11 +1,53 @@
+from typing import Any, Sequence
+from uuid import UUID
 from advanced_alchemy.repository import SQLAlchemyAsyncRepository
 from advanced_alchemy.service import SQLAlchemyAsyncRepositoryService
+from sqlalchemy import func, select
+from sqlalchemy.dialects.postgresql import insert
 
-from app.models import ThumbnailModel
+from app.models import MapModel, ThumbnailModel
+from app.slow_queries import trace_call_sites
 
 class ThumbnailRepository(SQLAlchemyAsyncRepository[ThumbnailModel]):
     model_type = ThumbnailModel
 
 
+@trace_call_sites
 class ThumbnailService(SQLAlchemyAsyncRepositoryService[ThumbnailModel]):
-    repository_type = ThumbnailRepository
\ No newline at end of file
+    repository_type = ThumbnailRepository
+
+    def __init__(self, **repo_kwargs: Any) -> None:
+        self.repository: ThumbnailRepository = self.repository_type(**repo_kwargs)
+        self.model_type = self.repository.model_type
+
+    async def get_thumbnail(self, map_id: UUID) -> ThumbnailModel | None:
+        return await self.repository.session.scalar(select(ThumbnailModel).where(ThumbnailModel.map_id == map_id))
+
+    async def save_thumbnail(self, map_id: UUID, data: bytes, mimetype: str, size: int) -> ThumbnailModel:
+        """ Store a map's thumbnail, replacing the one it has if any. """
+        statement = insert(ThumbnailModel).values(map_id=map_id, data=data, mimetype=mimetype, size=size)
+        return await self.repository.session.scalar(
+            statement.on_conflict_do_update(
+                index_elements=[ThumbnailModel.map_id],
+                set_={
+                    "data": statement.excluded.data,
+                    "mimetype": statement.excluded.mimetype,
+                    "size": statement.excluded.size,
+                    "updated_at": func.now(),
+                }
+            ).returning(ThumbnailModel)
+        )
+
+    async def get_map_ids_without_thumbnail(
+        self, size: int | None, after: UUID | None, limit: int, map_ids: list[UUID] | None = None
+    ) -> Sequence[UUID]:
+        """
+        Up to `limit` maps, by id after `after` and of `map_ids` if given, that have no thumbnail, or when `size` is
+        given none of that size. Ids are walked in order, so each page is read off the primary key however far in it is.
+        """
+        thumbnail = select(ThumbnailModel.id).where(ThumbnailModel.map_id == MapModel.id)
+        if size is not None: thumbnail = thumbnail.where(ThumbnailModel.size == size)
+        statement = select(MapModel.id).where(~thumbnail.exists()).order_by(MapModel.id).limit(limit)
+        if after is not None: statement = statement.where(MapModel.id > after)
+        if map_ids is not None: statement = statement.where(MapModel.id.in_(map_ids))
+        return (await self.repository.session.scalars(statement)).all()
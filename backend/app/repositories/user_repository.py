@@ -3,12 +3,14 @@ from advanced_alchemy.repository import SQLAlchemyAsyncRepository
 from advanced_alchemy.service import SQLAlchemyAsyncRepositoryService
 
 from app.models import UserModel
+from app.slow_queries import trace_call_sites
 from app.exceptions.user import UserDoesNotExistException, UnauthorizedException, BadRequestException
 
 class UserRepository(SQLAlchemyAsyncRepository[UserModel]):
     model_type = UserModel
 
 
+@trace_call_sites
 class UserService(SQLAlchemyAsyncRepositoryService[UserModel]):
     repository_type = UserRepository
 
@@ -17,6 +19,10 @@ class UserService(SQLAlchemyAsyncRepositoryService[UserModel]):
         self.model_type = self.repository.model_type
 
     async def get_user_by_username(self, username: str, **get_kwargs) -> UserModel:
+        if "load" in get_kwargs:
+            # The request's session may already hold this user (authentication loaded it) with its `noload`
+            # relationships set to None, which an eager load alone won't overwrite.
+            get_kwargs.setdefault("execution_options", { "populate_existing": True })
         user = await self.repository.get_one_or_none(username=username, **get_kwargs)
         if user is None:
             raise UserDoesNotExistException
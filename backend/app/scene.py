@@ -0,0 +1,210 @@
+"""
+The game view's scene of a map, built from its data once on the server rather than by every player's client.
+
+The raycaster the game runs on draws walls: each ring of a scene is a closed polygon whose edges become walls of its
+height, its floor filled too if flagged. The scene is packed little-endian, every array aligned to its item size so a
+client can view it in place:
+
+    magic       4 bytes, SCENE_MAGIC
+    version     uint32, SCENE_VERSION
+    rings       uint32, the number of rings R
+    vertices    uint32, the number of vertices V
+    vertices    float32[V, 2], world coordinates
+    offsets     uint32[R + 1], ring i spanning vertices[offsets[i]:offsets[i + 1]]
+    colors      uint8[R, 4], RGBA
+    heights     float32[R]
+    flags       uint8[R], of COLLISION, FILLED and WORLD_BOUND
+"""
+import colorsys
+import json
+import struct
+import typing
+
+import numpy as np
+
+from app.exceptions.map import MapDataInvalidException, MapDataTooLargeException
+from app.map_data import LAYERS, Layer, parse_map_data, ring_areas, to_layer
+
+SCENE_MAGIC = b"CGSC"
+# Bump when the scene built from the same map changes, so cached scenes are rebuilt.
+SCENE_VERSION = 1
+SCENE_MEDIA_TYPE = "application/vnd.citygen.scene"
+HEADER = struct.Struct("<4sIII")
+
+# Mirrors webapp/src/views/game-page/game.ts and MAP_WIDTH / MAP_HEIGHT in map-create-context.tsx
+MAP_SIZE = 512
+WORLD_SIZE = 20_000
+WORLD_SCALE = WORLD_SIZE / MAP_SIZE
+
+COLLISION = 1
+FILLED = 2
+WORLD_BOUND = 4
+
+WATER_COLOR = (0, 0, 255, 255)
+PARK_COLOR = (0, 180, 0, 255)
+ROAD_COLOR = (164, 164, 164, 255)
+WORLD_BOUNDARY_COLOR = (255, 165, 0, 255)
+FLAT_HEIGHT = 0.01
+# Road half widths by layer; coastal roads aren't drawn
+ROAD_WIDTHS = { "mainRoads": 3.0, "majorRoads": 1.5, "minorRoads": 1.5 }
+# The river is cut into pieces of about this area, in map units, so the raycaster can cull what's out of view
+RIVER_PIECE_AREA = 500.0
+# ... but into no more than about this many, however large the river
+RIVER_MAX_PIECES = 1_024
+GOLDEN_ANGLE = 180 * (3 - 5 ** 0.5)
+
+
+class Scene:
+    """ A scene's rings as they're added, packed by `to_bytes`. """
+    def __init__(self):
+        self.layers: list[Layer] = []
+        self.colors: list[np.ndarray] = []
+        self.heights: list[np.ndarray] = []
+        self.flags: list[np.ndarray] = []
+
+    def add(self, layer: Layer, color: typing.Any, height: typing.Any, flags: int) -> None:
+        """ Add each feature of `layer` as a ring; `color` and `height` are either one for all of them or one each. """
+        count = len(layer.offsets) - 1
+        if not count: return
+        self.layers.append(layer)
+        self.colors.append(np.broadcast_to(np.asarray(color, dtype=np.uint8), (count, 4)))
+        self.heights.append(np.broadcast_to(np.asarray(height, dtype=np.float32), (count,)))
+        self.flags.append(np.full(count, flags, dtype=np.uint8))
+
+    def to_bytes(self) -> bytes:
+        vertices = np.concatenate([layer.vertices for layer in self.layers]) * WORLD_SCALE
+        # Each layer's offsets continue from where the previous layer's vertices end.
+        offsets = np.concatenate([[0], *(
+            layer.offsets[1:] + start
+            for layer, start in zip(
+                self.layers, np.cumsum([0, *(len(layer.vertices) for layer in self.layers[:-1])]), strict=True
+            )
+        )])
+        return b"".join([
+            HEADER.pack(SCENE_MAGIC, SCENE_VERSION, len(offsets) - 1, len(vertices)),
+            vertices.astype("<f4").tobytes(),
+            offsets.astype("<u4").tobytes(),
+            np.concatenate(self.colors).tobytes(),
+            np.concatenate(self.heights).astype("<f4").tobytes(),
+            np.concatenate(self.flags).tobytes(),
+        ])
+
+
+def rings(*features: np.ndarray) -> Layer:
+    """ A layer of the given rings. """
+    offsets = np.zeros(len(features) + 1, dtype=np.int64)
+    np.cumsum([len(feature) for feature in features], out=offsets[1:])
+    return Layer(np.concatenate(features) if features else np.zeros((0, 2)), offsets)
+
+def clip_ring(ring: np.ndarray, origin: np.ndarray, normal: np.ndarray) -> np.ndarray:
+    """
+    The part of a ring on the side of the line through `origin` that `normal` points to, by Sutherland-Hodgman. A
+    concave ring the line cuts more than once stays one ring, joined along the line by edges of no area.
+    """
+    distances = (ring - origin) @ normal
+    following = np.roll(ring, -1, axis=0)
+    inside = distances >= 0
+    crosses = inside != np.roll(inside, -1)
+    t = distances[crosses] / (distances[crosses] - np.roll(distances, -1)[crosses])
+    # Each vertex is followed by where its edge crosses the line, if it does.
+    points = np.repeat(ring, 2, axis=0)
+    points[1::2][crosses] = ring[crosses] + t[:, None] * (following[crosses] - ring[crosses])
+    return points[np.column_stack([inside, crosses]).ravel()]
+
+def subdivide_ring(ring: np.ndarray, piece_area: float) -> list[np.ndarray]:
+    """
+    Cut a ring in two across the middle of its longest edge until the pieces are under twice `piece_area`, as the
+    client's `PolygonUtil.subdividePolygon` does with `cleanDivide`. Slivers are dropped, like it drops them.
+    """
+    if len(ring) < 3: return []
+    area = ring_areas(rings(ring))[0]
+    if area < 0.5 * piece_area: return []
+    edges = np.roll(ring, -1, axis=0) - ring
+    lengths = np.hypot(*edges.T)
+    if area / lengths.sum() ** 2 < 0.001: return []
+    if area < 2 * piece_area: return [ring]
+
+    longest = lengths.argmax()
+    midpoint, direction = ring[longest] + edges[longest] / 2, edges[longest] / lengths[longest]
+    pieces = []
+    for normal in (direction, -direction):
+        piece = clip_ring(ring, midpoint, normal)
+        if len(piece) < 3: continue
+        # Only pieces actually smaller than the ring are cut again, so a degenerate cut can't recurse forever.
+        if piece_area <= ring_areas(rings(piece))[0] < area: pieces += subdivide_ring(piece, piece_area)
+        else: pieces.append(piece)
+    return pieces
+
+def road_quads(layer: Layer, half_width: float) -> Layer:
+    """ Each segment of each road as its own rectangle, `half_width` either side of it. """
+    if len(layer.vertices) < 2: return rings()
+    starts, ends = layer.vertices[:-1], layer.vertices[1:]
+    # Segments are between consecutive vertices of the same road, and of some length.
+    segments = np.ones(len(starts), dtype=bool)
+    segments[layer.ends[:-1] - 1] = False
+    directions = ends - starts
+    lengths = np.hypot(*directions.T)
+    segments &= lengths > 0
+
+    starts, ends, directions, lengths = starts[segments], ends[segments], directions[segments], lengths[segments]
+    normals = np.column_stack([-directions[:, 1], directions[:, 0]]) / lengths[:, None] * half_width
+    quads = np.stack([starts + normals, ends + normals, ends - normals, starts - normals], axis=1)
+    return Layer(quads.reshape(-1, 2), np.arange(0, 4 * len(quads) + 1, 4))
+
+def building_colors(count: int, seed: int) -> np.ndarray:
+    """
+    The client's pastel palette: a random light seed colour, each building's hue turned from the last by the golden
+    angle. Seeded per map, so every player sees the same colours.
+    """
+    red, green, blue = np.random.default_rng(seed).integers(127, 255, size=3, endpoint=True) / 255
+    hue, lightness, saturation = colorsys.rgb_to_hls(red, green, blue)
+    lightness, saturation = min(max(lightness, 0.2), 0.8), max(saturation, 0.2)
+
+    hues = (hue * 360 + GOLDEN_ANGLE * np.arange(count)) % 360 / 60
+    chroma = (1 - abs(2 * lightness - 1)) * saturation
+    second = chroma * (1 - np.abs(hues % 2 - 1))
+    sector = hues.astype(int) % 6
+    zeros, chroma = np.zeros(count), np.full(count, chroma)
+    # (r, g, b) before lightness is added, by which sixth of the hue circle each hue is in
+    rgb = np.select(
+        [sector[:, None] == i for i in range(6)],
+        [np.column_stack(channels) for channels in (
+            (chroma, second, zeros), (second, chroma, zeros), (zeros, chroma, second),
+            (zeros, second, chroma), (second, zeros, chroma), (chroma, zeros, second),
+        )]
+    ) + (lightness - chroma[:, None] / 2)
+    return np.column_stack([np.round(rgb * 255), np.full(count, 255)]).astype(np.uint8)
+
+def build_scene(layers: dict[str, Layer], heights: np.ndarray, seed: int) -> bytes:
+    """ The scene of a map, from its layers and building heights, in the order the client used to build it. """
+    scene = Scene()
+    scene.add(
+        rings(np.array([(0, 0), (MAP_SIZE, 0), (MAP_SIZE, MAP_SIZE), (0, MAP_SIZE)], dtype=np.float64)),
+        WORLD_BOUNDARY_COLOR, 25, COLLISION | WORLD_BOUND
+    )
+    river = layers["river"]
+    piece_area = RIVER_PIECE_AREA
+    if len(river.vertices): piece_area = max(RIVER_PIECE_AREA, ring_areas(river)[0] / RIVER_MAX_PIECES)
+    scene.add(rings(*subdivide_ring(river.vertices, piece_area)), WATER_COLOR, FLAT_HEIGHT, COLLISION | FILLED)
+    # A map without a sea has an empty one.
+    if len(layers["sea"].vertices): scene.add(layers["sea"], WATER_COLOR, FLAT_HEIGHT, COLLISION | FILLED)
+    scene.add(layers["bigParks"], PARK_COLOR, FLAT_HEIGHT, FILLED)
+
+    spread = heights.max() - heights.min() if heights.size else 0
+    scaled = 1 + 7.5 * (heights - heights.min()) / spread if spread else np.ones_like(heights)
+    scene.add(layers["buildings"], building_colors(len(heights), seed), scaled, COLLISION)
+
+    for name, half_width in ROAD_WIDTHS.items():
+        scene.add(road_quads(layers[name], half_width), ROAD_COLOR, FLAT_HEIGHT, FILLED)
+    return scene.to_bytes()
+
+def build_scene_from_json(data_json: str, seed: int) -> bytes:
+    """
+    `build_scene` from a map's data as JSON text, which is far cheaper to send to a worker process than objects.
+    Maps stored before their data was validated may not pass now; they can still be played, on bare land.
+    """
+    try:
+        parsed = parse_map_data(json.loads(data_json))
+    except (MapDataInvalidException, MapDataTooLargeException):
+        return build_scene({ name: to_layer(name, []) for name in LAYERS }, np.empty(0), seed)
+    return build_scene(parsed.layers, parsed.heights, seed)
@@ -0,0 +1,68 @@
+import asyncio
+import contextvars
+import logging
+from uuid import UUID
+
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.db import AsyncSessionFactory
+from app.map_data import LAYERS, join_layers_json
+from app.metrics import cache_requests_total
+from app.process_pool import process_pool
+from app.repositories import MapLayerService, MapSceneService
+from app.scene import SCENE_VERSION, build_scene_from_json
+
+logger = logging.getLogger(__name__)
+
+class SceneCache:
+    """
+    Map scenes (see app.scene), built once per map in the process pool and kept in the database. Requests for a scene
+    that's still being built wait on the same build.
+    """
+    def __init__(self):
+        self._builds: dict[UUID, asyncio.Task] = {}
+
+    async def _build(self, map_id: UUID) -> bytes:
+        try:
+            async with AsyncSessionFactory() as session:
+                layers_json = await MapLayerService(session=session).get_layers_json(map_id, list(LAYERS))
+                # Seeded by the map, so the scene comes out the same whichever worker builds it.
+                data = await process_pool.run(build_scene_from_json, join_layers_json(layers_json), map_id.int)
+                await MapSceneService(session=session).save_scene(map_id, SCENE_VERSION, data)
+                await session.commit()
+            return data
+        finally:
+            if self._builds.get(map_id) is asyncio.current_task(): del self._builds[map_id]
+
+    def _ensure_build(self, map_id: UUID) -> asyncio.Task:
+        task = self._builds.get(map_id)
+        if task is None:
+            # In a context of its own, so the build's queries aren't counted against whichever request started it.
+            task = asyncio.create_task(self._build(map_id), context=contextvars.Context())
+            task.add_done_callback(self._log_failure)
+            self._builds[map_id] = task
+        return task
+
+    @staticmethod
+    def _log_failure(task: asyncio.Task) -> None:
+        if not task.cancelled() and task.exception() is not None:
+            logger.error("Failed to build map scene", exc_info=task.exception())
+
+    async def get(self, session: AsyncSession, map_id: UUID) -> bytes:
+        """ The scene of a map, which the caller must already have checked exists and may be seen. """
+        data = await MapSceneService(session=session).get_scene_data(map_id, SCENE_VERSION)
+        if data is not None:
+            cache_requests_total.inc("map_scene", "hit")
+            return data
+
+        cache_requests_total.inc("map_scene", "miss")
+        # Shielded, so one caller disconnecting doesn't cancel the build everyone else is waiting on.
+        return await asyncio.shield(self._ensure_build(map_id))
+
+    async def stop(self) -> None:
+        builds = list(self._builds.values())
+        for task in builds: task.cancel()
+        await asyncio.gather(*builds, return_exceptions=True)
+
+
+scene_cache = SceneCache()
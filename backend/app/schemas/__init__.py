@@ -1,4 +1,6 @@
 from .user import *
 from .map import *
 from .thumbnail import *
-from .user_avatar import *
\ No newline at end of file
+from .user_avatar import *
+from .system import *
+from .job import *
\ No newline at end of file
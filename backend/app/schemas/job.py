@@ -0,0 +1,20 @@
+from datetime import datetime
+from typing import Any, Optional
+from uuid import UUID
+
+from .base import Base
+
+class JobRead(Base):
+    id: UUID
+    queue: str
+    kind: str
+    status: str
+    attempts: int
+    max_attempts: int
+    run_at: datetime
+    started_at: Optional[datetime] = None
+    finished_at: Optional[datetime] = None
+    last_error: Optional[str] = None
+    result: Optional[dict[str, Any]] = None
+    created_at: datetime
+    updated_at: datetime
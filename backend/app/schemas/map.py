@@ -8,13 +8,33 @@ from .user import UserReadPublic
 class MapFavoritedBody(Base):
     favorited: bool
 
-class MapCreateBody(Base):
+class MapFavoritedBatchItem(MapFavoritedBody):
+    map_id: UUID
+
+class MapFavoritedBatchBody(Base):
+    favorites: list[MapFavoritedBatchItem]
+
+class MapCreateFields(Base):
     name: str
     private: bool
-    thumbnail_base64: str
+
+class MapCreateBody(MapCreateFields):
+    """ The body of `POST /maps/`, which is read as it streams in (see app.map_upload) rather than by this model. """
     data: dict
 
-class MapCreate(MapCreateBody):
+class MapStats(Base):
+    """ Summary statistics of a map's geometry, computed when it's created (see app.map_data). """
+    building_count: int
+    building_height_min: Optional[float]
+    building_height_max: Optional[float]
+    road_length: float
+    park_area: float
+    bbox_min_x: Optional[float]
+    bbox_min_y: Optional[float]
+    bbox_max_x: Optional[float]
+    bbox_max_y: Optional[float]
+
+class MapCreate(MapCreateFields, MapStats):
     user_id: int
 
 class MapRead(Base):
@@ -23,9 +43,16 @@ class MapRead(Base):
     private: bool
     favorited: bool
     last_played_at: Optional[datetime]
+    play_count: int
     created_at: datetime
     updated_at: datetime
+    # Only missing for maps whose data predates validation and couldn't be read
+    stats: Optional[MapStats]
     user: Optional[UserReadPublic] = None
 
 class MapReadWithData(MapRead):
-    data: dict
\ No newline at end of file
+    data: dict
+
+class MapSearchPage(Base):
+    items: list[MapRead]
+    next_cursor: Optional[str]
\ No newline at end of file
@@ -0,0 +1,29 @@
+from typing import Any, Optional
+
+from .base import Base
+
+class PoolStatsRead(Base):
+    database: str
+    healthy: bool
+    size: Optional[int] = None
+    checked_in: Optional[int] = None
+    checked_out: Optional[int] = None
+    overflow: Optional[int] = None
+    checkouts: Optional[int] = None
+    wait_seconds_total: Optional[float] = None
+    wait_seconds_max: Optional[float] = None
+    last_health_check_at: Optional[float] = None
+
+class SlowQueryRead(Base):
+    fingerprint: str
+    statement: str
+    parameter_shape: Any
+    count: int
+    total_seconds: float
+    mean_seconds: float
+    max_seconds: float
+    last_seen_at: float
+    routes: list[str]
+    call_sites: list[str]
+    plan: Optional[Any] = None
+    plan_analyzed: bool
@@ -1,14 +1,19 @@
+import base64
+from typing import Any
 from uuid import UUID
 
+from pydantic import field_validator
+
 from .base import Base
 
-class ThumbnailCreate(Base):
-    map_id: UUID
-    data: bytes
-    mimetype: str
-    
 class ThumbnailRead(Base):
     id: UUID
     map_id: UUID
     data: str # base64-encoded
-    mimetype: str
\ No newline at end of file
+    mimetype: str
+    size: int | None
+
+    @field_validator("data", mode="before")
+    @classmethod
+    def encode_data(cls, value: Any) -> Any:
+        return base64.b64encode(value).decode() if isinstance(value, bytes) else value
@@ -0,0 +1,327 @@
+"""
+Bulk-seed a database with synthetic users, maps, thumbnails, avatars and favorites.
+
+    uv run python -m app.seed --users 1000 --maps 5000 --truncate
+    DB_DATABASE=citygen_bench uv run python -m app.seed --large-maps 3 --large-map-buildings 150000
+
+Rows are written with COPY in batches rather than through the ORM, and every value (ids, geometry, timestamps,
+password hashes) is derived from `--seed`, so the same arguments against an empty database produce identical data.
+Seeded users are `<username-prefix><n>` with the email `<username-prefix><n>@example.com` and password `--password`.
+"""
+import argparse
+import asyncio
+import json
+import math
+import random
+import sys
+import time
+import typing
+import uuid
+from datetime import datetime, timedelta, timezone
+
+from pydantic import BaseModel, Field
+
+
+FIRST_NAMES = ["Ada", "Alan", "Grace", "Edsger", "Barbara", "Donald", "Frances", "Ken", "Margaret", "Dennis"]
+LAST_NAMES = ["Lovelace", "Turing", "Hopper", "Dijkstra", "Liskov", "Knuth", "Allen", "Thompson", "Hamilton", "Ritchie"]
+# Everything seeded is dated within a year of this, so reruns don't drift with the wall clock.
+EPOCH = datetime(2024, 1, 1, tzinfo=timezone.utc)
+
+
+class SeedConfig(BaseModel):
+    users: int = Field(100, ge=1)
+    maps: int = 500
+    # Mean favorites per user, exponentially distributed and skewed toward popular maps
+    favorites_per_user: float = 10.0
+    private_share: float = 0.1
+    # Buildings per map follow a Pareto distribution: most maps are near `buildings_min`, a few are far larger
+    buildings_min: int = 200
+    buildings_alpha: float = 1.2
+    buildings_max: int = 150_000
+    # The first `large_maps` maps have exactly `large_map_buildings`, so the tail is always exercised
+    large_maps: int = 1
+    large_map_buildings: int = 100_000
+    thumbnail_size: int = 128
+    batch_size: int = 100
+    seed: int = 0
+    username_prefix: str = "seed"
+    password: str = "password"
+
+
+class SeedSummary(BaseModel):
+    users: int = 0
+    maps: int = 0
+    buildings: int = 0
+    favorites: int = 0
+    seconds: float = 0.0
+
+
+def generate_map_data(rng: random.Random, buildings: int) -> dict[str, typing.Any]:
+    """
+    Plausibly shaped MapData for a city of `buildings` buildings, deterministic for a given `rng`.
+
+    The city grows with its building count at a constant density: a few main roads cross it, major and minor roads
+    fill it in, and buildings line the minor roads, facing them, taller toward the center.
+    """
+    extent = 40 * math.sqrt(max(buildings, 100))
+    center = extent / 2
+
+    def point(x: float, y: float) -> dict[str, float]:
+        return { "x": round(x, 2), "y": round(y, 2) }
+
+    def road(points: int, length: float, x: float | None = None, y: float | None = None, heading: float | None = None):
+        x = rng.uniform(0, extent) if x is None else x
+        y = rng.uniform(0, extent) if y is None else y
+        heading = rng.uniform(0, 2 * math.pi) if heading is None else heading
+        step = length / max(points - 1, 1)
+        vertices = []
+        for _ in range(points):
+            vertices.append(point(x, y))
+            heading += rng.gauss(0, 0.15)
+            x, y = x + step * math.cos(heading), y + step * math.sin(heading)
+        return vertices
+
+    def ring(points: int, radius: float):
+        x, y = rng.uniform(0, extent), rng.uniform(0, extent)
+        vertices = [
+            point(x + radius * rng.uniform(0.7, 1.0) * math.cos(a), y + radius * rng.uniform(0.7, 1.0) * math.sin(a))
+            for a in (2 * math.pi * i / points for i in range(points))
+        ]
+        return [*vertices, vertices[0]]
+
+    main_roads = [
+        road(20, extent, x=0, y=rng.uniform(0.2, 0.8) * extent, heading=0) for _ in range(2)
+    ] + [
+        road(20, extent, x=rng.uniform(0.2, 0.8) * extent, y=0, heading=math.pi / 2) for _ in range(2)
+    ]
+    major_roads = [road(12, extent / 3) for _ in range(buildings // 100 + 1)]
+    minor_roads = [road(6, extent / 12) for _ in range(buildings // 20 + 1)]
+
+    footprints = []
+    for _ in range(buildings):
+        street = rng.choice(minor_roads)
+        i = rng.randrange(len(street) - 1)
+        (ax, ay), (bx, by) = (street[i]["x"], street[i]["y"]), (street[i + 1]["x"], street[i + 1]["y"])
+        t = rng.random()
+        angle = math.atan2(by - ay, bx - ax)
+        # Set back from the road on either side, facing it
+        side = rng.choice((-1, 1)) * rng.uniform(8, 20)
+        x = ax + t * (bx - ax) - side * math.sin(angle)
+        y = ay + t * (by - ay) + side * math.cos(angle)
+        w, d = rng.uniform(5, 30) / 2, rng.uniform(5, 30) / 2
+        cos, sin = math.cos(angle), math.sin(angle)
+        corners = [
+            point(x + cx * cos - cy * sin, y + cx * sin + cy * cos)
+            for cx, cy in ((-w, -d), (w, -d), (w, d), (-w, d), (-w, -d))
+        ]
+        downtown = 1 - min(math.hypot(x - center, y - center) / center, 1)
+        height = min(rng.lognormvariate(2.3, 0.5) * (1 + 4 * downtown ** 2), 400)
+        footprints.append({ "data": corners, "height": round(height, 1) })
+
+    coast = [point(extent * i / 19, rng.uniform(0, 0.05) * extent) for i in range(20)]
+    return {
+        "mainRoads": main_roads,
+        "majorRoads": major_roads,
+        "minorRoads": minor_roads,
+        "coastalRoads": [coast],
+        "bigParks": [ring(8, extent / 15) for _ in range(3)],
+        "smallParks": [ring(6, extent / 60) for _ in range(buildings // 200 + 1)],
+        "buildings": footprints,
+        "sea": [point(extent, 0), point(0, 0), *coast],
+        "river": road(30, extent * 1.2, x=0, y=rng.uniform(0.3, 0.7) * extent, heading=rng.uniform(-0.3, 0.3)),
+    }
+
+
+def hash_password(password: str, salt: bytes) -> str:
+    """ Hash `password` the way the app does, but with a fixed salt so the hash is reproducible. """
+    from fastapi_users.password import PasswordHelper
+    return PasswordHelper().password_hash.current_hasher.hash(password, salt=salt)
+
+def building_count(rng: random.Random, config: SeedConfig, index: int) -> int:
+    if index < config.large_maps: return config.large_map_buildings
+    return min(int(config.buildings_min * rng.paretovariate(config.buildings_alpha)), config.buildings_max)
+
+def timestamp(rng: random.Random) -> datetime:
+    return EPOCH + timedelta(seconds=rng.uniform(0, 365 * 24 * 60 * 60))
+
+def batched(items: typing.Iterable, size: int) -> typing.Iterator[list]:
+    batch = []
+    for item in items:
+        batch.append(item)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch: yield batch
+
+
+async def seed(connection, config: SeedConfig, log: typing.Callable[[str], None] = lambda message: None) -> SeedSummary:
+    """
+    Insert `config`'s users, maps and favorites through `connection`, an asyncpg connection, in one transaction.
+    Each kind of row draws from its own seeded stream, so e.g. changing `users` doesn't reshuffle map geometry.
+    """
+    from app.map_data import parse_map_data
+    from app.thumbnail import THUMBNAIL_MEDIA_TYPE, render_thumbnail
+    from app.schemas import MapStats
+    from app.util import get_default_avatar
+
+    start = time.perf_counter()
+    summary = SeedSummary()
+    user_rng = random.Random(f"{ config.seed }:users")
+    favorite_rng = random.Random(f"{ config.seed }:favorites")
+    avatar = get_default_avatar()
+    hashed_password = hash_password(config.password, user_rng.randbytes(16))
+
+    async with connection.transaction():
+        user_ids = [row[0] for row in await connection.fetch(
+            "SELECT nextval('users_id_seq') FROM generate_series(1, $1)", config.users
+        )]
+        for batch in batched(enumerate(user_ids), config.batch_size):
+            users, avatars = [], []
+            for i, user_id in batch:
+                username = f"{ config.username_prefix }{ i }"
+                created_at = timestamp(user_rng)
+                users.append((
+                    user_id, username, f"{ username }@example.com", user_rng.choice(FIRST_NAMES),
+                    user_rng.choice(LAST_NAMES), hashed_password, True, False, True, created_at, created_at,
+                ))
+                avatar_id = uuid.UUID(int=user_rng.getrandbits(128), version=4)
+                avatars.append((avatar_id, user_id, avatar, "image/jpeg", created_at, created_at))
+            await connection.copy_records_to_table("users", records=users, columns=(
+                "id", "username", "email", "first_name", "last_name", "hashed_password",
+                "is_active", "is_superuser", "is_verified", "created_at", "updated_at",
+            ))
+            await connection.copy_records_to_table("user_avatars", records=avatars, columns=(
+                "id", "user_id", "data", "mimetype", "created_at", "updated_at",
+            ))
+            summary.users += len(batch)
+        log(f"Seeded { summary.users } users")
+
+        map_ids = []
+        for batch in batched(range(config.maps), config.batch_size):
+            maps, layers, thumbnails = [], [], []
+            for i in batch:
+                map_rng = random.Random(f"{ config.seed }:maps:{ i }")
+                map_id = uuid.UUID(int=map_rng.getrandbits(128), version=4)
+                buildings = building_count(map_rng, config, i)
+                data = generate_map_data(map_rng, buildings)
+                parsed = parse_map_data(data)
+                stats = parsed.stats
+                created_at = timestamp(map_rng)
+                played = map_rng.random() < 0.7
+                maps.append((
+                    map_id, f"{ map_rng.choice(LAST_NAMES) } City { i }", map_rng.random() < config.private_share,
+                    map_rng.choice(user_ids),
+                    (created_at + timedelta(days=map_rng.uniform(0, 30))).replace(tzinfo=None) if played else None,
+                    int(map_rng.paretovariate(1.5)) if played else 0, created_at, created_at,
+                    *stats.model_dump().values(),
+                ))
+                layers.extend(
+                    (map_id, name, json.dumps(layer, separators=(",", ":")), created_at, created_at)
+                    for name, layer in data.items()
+                )
+                # Seeded maps aren't drawn to the client's scale, so their thumbnails fit the whole of each in.
+                extent = max(stats.bbox_max_x or 0, stats.bbox_max_y or 0, 1.0)
+                thumbnails.append((
+                    uuid.UUID(int=map_rng.getrandbits(128), version=4), map_id,
+                    render_thumbnail(parsed.layers, config.thumbnail_size, extent),
+                    THUMBNAIL_MEDIA_TYPE, config.thumbnail_size, created_at, created_at,
+                ))
+                map_ids.append(map_id)
+                summary.buildings += buildings
+            await connection.copy_records_to_table("maps", records=maps, columns=(
+                "id", "name", "private", "user_id", "last_played_at", "play_count", "created_at", "updated_at",
+                *MapStats.model_fields,
+            ))
+            await connection.copy_records_to_table("map_layers", records=layers, columns=(
+                "map_id", "name", "data", "created_at", "updated_at",
+            ))
+            await connection.copy_records_to_table("thumbnails", records=thumbnails, columns=(
+                "id", "map_id", "data", "mimetype", "size", "created_at", "updated_at",
+            ))
+            summary.maps += len(batch)
+            log(f"Seeded { summary.maps }/{ config.maps } maps ({ summary.buildings } buildings)")
+
+        favorites = []
+        for user_id in user_ids:
+            if not map_ids or config.favorites_per_user <= 0: break
+            wanted = min(int(favorite_rng.expovariate(1 / config.favorites_per_user)), len(map_ids))
+            # Squaring skews picks toward the first maps, so a few maps are far more popular than the rest
+            favorited = set()
+            while len(favorited) < wanted:
+                favorited.add(map_ids[int(len(map_ids) * favorite_rng.random() ** 2)])
+            for map_id in sorted(favorited):
+                created_at = timestamp(favorite_rng)
+                favorites.append((user_id, map_id, created_at, created_at))
+        for batch in batched(favorites, config.batch_size * 100):
+            await connection.copy_records_to_table("map_favorites", records=batch, columns=(
+                "user_id", "map_id", "created_at", "updated_at",
+            ))
+        summary.favorites = len(favorites)
+        log(f"Seeded { summary.favorites } favorites")
+
+    summary.seconds = time.perf_counter() - start
+    return summary
+
+
+def parse_args() -> argparse.Namespace:
+    defaults = SeedConfig()
+    parser = argparse.ArgumentParser(prog="python -m app.seed", description=__doc__.split("\n\n")[0])
+    parser.add_argument("--users", type=int, default=defaults.users)
+    parser.add_argument("--maps", type=int, default=defaults.maps)
+    parser.add_argument(
+        "--favorites-per-user", type=float, default=defaults.favorites_per_user, help="mean favorites per user"
+    )
+    parser.add_argument(
+        "--private-share", type=float, default=defaults.private_share, help="fraction of maps that are private"
+    )
+    parser.add_argument("--buildings-min", type=int, default=defaults.buildings_min, help="smallest map, in buildings")
+    parser.add_argument(
+        "--buildings-alpha", type=float, default=defaults.buildings_alpha,
+        help="Pareto shape; lower means a longer tail",
+    )
+    parser.add_argument("--buildings-max", type=int, default=defaults.buildings_max, help="cap on randomly sized maps")
+    parser.add_argument(
+        "--large-maps", type=int, default=defaults.large_maps, help="maps guaranteed --large-map-buildings"
+    )
+    parser.add_argument("--large-map-buildings", type=int, default=defaults.large_map_buildings)
+    parser.add_argument(
+        "--thumbnail-size", type=int, default=defaults.thumbnail_size, help="thumbnail width and height in pixels"
+    )
+    parser.add_argument("--batch-size", type=int, default=defaults.batch_size, help="rows per COPY")
+    parser.add_argument("--seed", type=int, default=defaults.seed)
+    parser.add_argument("--username-prefix", default=defaults.username_prefix)
+    parser.add_argument("--password", default=defaults.password, help="password of every seeded user")
+    parser.add_argument("--truncate", action="store_true", help="empty every table first; the database is wiped!")
+    return parser.parse_args()
+
+
+async def main() -> int:
+    from advanced_alchemy.base import DefaultBase
+    from sqlalchemy import text
+    from sqlalchemy.ext.asyncio import create_async_engine
+    import app.models  # noqa: F401 registers the tables on DefaultBase
+    from app.settings import settings
+
+    args = parse_args()
+    config = SeedConfig(**{ key: value for key, value in vars(args).items() if key in SeedConfig.model_fields })
+
+    engine = create_async_engine(settings.db_dsn)
+    try:
+        async with engine.begin() as connection:
+            if args.truncate:
+                tables = ", ".join(f'"{ table.name }"' for table in DefaultBase.metadata.sorted_tables)
+                await connection.execute(text(f"TRUNCATE { tables } RESTART IDENTITY CASCADE"))
+            raw_connection = await connection.get_raw_connection()
+            summary = await seed(raw_connection.driver_connection, config, log=print)
+    finally:
+        await engine.dispose()
+
+    print(
+        f"Seeded { summary.users } users, { summary.maps } maps ({ summary.buildings } buildings) and "
+        f"{ summary.favorites } favorites into { settings.db_database } in { summary.seconds:.1f}s"
+    )
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(main()))
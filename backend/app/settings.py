@@ -1,6 +1,8 @@
+import pydantic
 import pydantic_settings
 from typing import Optional
 from enum import Enum
+from granian.constants import HTTPModes, ThreadModes
 from granian.log import LogLevels
 from sqlalchemy.engine.url import URL
 
@@ -8,6 +10,17 @@ class DevPhase(str, Enum):
     DEV = "dev"
     PROD = "prod"
 
+class RateLimitBackend(str, Enum):
+    MEMORY = "memory"
+    DATABASE = "database"
+
+class AdmissionLimits(pydantic.BaseModel):
+    # Requests each user (or address, for signed out endpoints) may make per minute, and at once in a burst
+    rate_per_minute: float
+    burst: int
+    # Requests every client together may have running at once, split between the server workers
+    concurrency: int
+
 class Settings(pydantic_settings.BaseSettings):
     project_name: str = "Citygen"
     dev_phase: DevPhase = DevPhase.PROD
@@ -16,14 +29,117 @@ class Settings(pydantic_settings.BaseSettings):
     access_token_lifetime_seconds: int = 60 * 60 * 24 * 30
     log_level: LogLevels = LogLevels.info
 
-    # mail_username: Optional[str] = None
-    # mail_password: Optional[str] = None
-    # mail_from: Optional[str] = None
-    # mail_port: Optional[int] = None
-    # mail_server: Optional[str] = None
-    # mail_from_name: Optional[str] = None
-    # mail_starttls: bool = True
-    # mail_ssl_tls: bool = False
+    # Granian worker processes for `python -m app`, one per available CPU by default. Each has its own event loop and
+    # database pool; when unset otherwise (tests, in-process benchmarks) the app assumes it's the only process.
+    server_workers: Optional[int] = None
+    # Rust runtime threads per worker, and whether they share the worker's event loop (workers) or not (runtime)
+    server_threads: int = 1
+    server_threading_mode: ThreadModes = ThreadModes.workers
+    server_backlog: int = 1024
+    # Requests a worker handles concurrently before it stops accepting connections; Granian's default is
+    # backlog / workers
+    server_backpressure: Optional[int] = None
+    server_http: HTTPModes = HTTPModes.auto
+    server_http1_keep_alive: bool = True
+    server_http2_max_concurrent_streams: int = 200
+    server_http2_keep_alive_interval: Optional[int] = None
+    server_http2_keep_alive_timeout: int = 20
+    # Collect Prometheus metrics, served at /metrics to scrapers sending `Authorization: Bearer <metrics_token>`; with
+    # no token set, to nobody
+    metrics_enabled: bool = True
+    metrics_token: Optional[str] = None
+    # Where workers share their metrics so a scrape of any one reports them all, and how often they write them there;
+    # `python -m app` makes a directory of its own when it runs more than one worker
+    metrics_dir: Optional[str] = None
+    metrics_snapshot_interval_seconds: float = 5
+
+    # Fetch a random avatar from DiceBear for new users; off, everyone starts with the default (tests, load tests,
+    # offline)
+    random_avatars_enabled: bool = True
+
+    maps_batch_max_size: int = 100
+    maps_search_max_limit: int = 50
+    # Map data over these limits is rejected before it's parsed any further; coordinates are bounded to ±max_coordinate
+    map_data_max_buildings: int = 250_000
+    map_data_max_vertices: int = 2_000_000
+    map_data_max_coordinate: float = 1_000_000.0
+    map_data_max_building_height: float = 1_000.0
+    # Largest body `POST /maps/` accepts; it's turned away with a 413 as soon as it's seen to be larger
+    map_create_max_body_bytes: int = 128 * 1024 * 1024
+    # Buildings per frame when streaming a map's layers
+    map_stream_buildings_per_frame: int = 1_000
+    # Processes per server worker for CPU-bound work on map geometry: game scenes, exports and thumbnails; 0 runs it in
+    # threads instead
+    process_pool_workers: int = 2
+    # Width and height in pixels of the thumbnails drawn for maps that have none yet
+    thumbnail_size: int = 512
+    # Finished map exports are kept here, one per map and format, until the map changes or they're evicted
+    export_cache_dir: str = "exports"
+    # Past this many bytes of exports in all, the least recently asked for are dropped
+    export_cache_max_bytes: int = 2 * 1024 * 1024 * 1024
+    # Ranges past this many in one Range header are ignored and the whole resource is sent instead
+    http_range_max_parts: int = 16
+    # The anonymous public feed is served from a snapshot, fresh for the TTL, then served stale while one refresh runs
+    feed_cache_ttl_seconds: float = 5.0
+    feed_cache_stale_while_revalidate_seconds: float = 60.0
+    feed_cache_gzip_level: int = 6
+
+    play_events_flush_interval_seconds: float = 5.0
+    play_events_flush_max_maps: int = 500
+    # Plays of maps past this many pending (e.g. while the database is down) are dropped rather than buffered
+    play_events_max_pending_maps: int = 100_000
+
+    # Where the webapp is served; links in emails point here, never to the Host a request happened to be sent with
+    public_url: str = "http://localhost:3000"
+    # Mail is sent when a server and sender are configured; credentials are optional (e.g. for a local relay)
+    mail_username: Optional[str] = None
+    mail_password: Optional[str] = None
+    mail_from: Optional[str] = None
+    mail_port: int = 587
+    mail_server: Optional[str] = None
+    mail_from_name: Optional[str] = None
+    mail_starttls: bool = True
+    mail_ssl_tls: bool = False
+    mail_timeout_seconds: int = 30
+    # Mail is queued in the outbox table and sent by a background task, a batch per SMTP connection
+    mail_outbox_poll_interval_seconds: float = 5.0
+    mail_outbox_batch_size: int = 20
+    # Failed sends are retried with exponential backoff, doubling from the base up to the max, then given up on
+    mail_outbox_max_attempts: int = 8
+    mail_outbox_retry_base_seconds: float = 30.0
+    mail_outbox_retry_max_seconds: float = 60 * 60
+    # A claimed batch whose sender died is retried once this has passed
+    mail_outbox_lease_seconds: float = 300.0
+
+    # Background jobs (see app.jobs) are run by every server worker unless this is off, e.g. to run them separately
+    jobs_worker_enabled: bool = True
+    # Jobs each worker process runs at once, per queue; queues left out aren't run by it
+    job_queue_concurrency: dict[str, int] = { "thumbnails": 2, "mail": 1 }
+    jobs_poll_interval_seconds: float = 2.0
+    # Failed jobs are retried with exponential backoff, doubling from the base up to the max, then given up on
+    jobs_max_attempts: int = 5
+    jobs_retry_base_seconds: float = 10.0
+    jobs_retry_max_seconds: float = 60 * 60
+    # How long a job may run; once this has passed, it's stopped, or retried by another worker if its own died
+    jobs_lease_seconds: float = 300.0
+    # How long running jobs get to finish on shutdown before they're handed back to the queue
+    jobs_shutdown_timeout_seconds: float = 10.0
+
+    # Admission control for expensive endpoints (see app.admission), by class: map_create, avatar, auth and map_play
+    admission_limits: dict[str, AdmissionLimits] = {
+        "map_create": AdmissionLimits(rate_per_minute=10, burst=5, concurrency=4),
+        "avatar": AdmissionLimits(rate_per_minute=10, burst=5, concurrency=8),
+        "auth": AdmissionLimits(rate_per_minute=20, burst=10, concurrency=8),
+        "map_play": AdmissionLimits(rate_per_minute=30, burst=10, concurrency=32),
+    }
+    rate_limits_enabled: bool = True
+    # memory keeps each server worker's rate limits to itself; database shares them between all workers and servers
+    rate_limit_backend: RateLimitBackend = RateLimitBackend.MEMORY
+    # How long a request waits for one of its class's slots before it's turned away with a 503
+    admission_queue_timeout_seconds: float = 0.5
+    # Addresses or networks of the reverse proxies in front of the app; requests through them are limited by the
+    # client address they give in X-Forwarded-For
+    trusted_proxies: list[str] = []
 
     db_driver: str = "postgresql+asyncpg"
     db_host: str
@@ -32,10 +148,42 @@ class Settings(pydantic_settings.BaseSettings):
     db_password: str = "password"
     db_database: str = "postgres"
 
-    db_pool_size: int = 0
-    db_max_overflow: int = 0
+    # Optional read replica, GET endpoints read from it when configured and healthy
+    db_replica_host: Optional[str] = None
+    db_replica_port: Optional[int] = None
+    db_replica_database: Optional[str] = None
+    # How long a client's reads stick to the primary after it writes, to read its own writes
+    db_replica_pin_seconds: float = 5.0
+
+    db_pool_size: int = 10
+    db_max_overflow: int = 10
+    # Connections all workers may hold in total (pool + overflow, per database), so they fit under Postgres'
+    # `max_connections`. Unset, it's that share of the server's `max_connections`, less superuser-reserved slots.
+    db_max_connections: Optional[int] = None
+    db_max_connections_share: float = 0.8
+    db_pool_timeout_seconds: float = 10.0
+    db_pool_recycle_seconds: int = 60 * 30
+    db_pool_warmup_connections: int = 4
     db_echo: bool = False
-    db_pool_pre_ping: bool = True
+    # Connections are validated by a periodic health check instead of a ping on every checkout
+    db_pool_pre_ping: bool = False
+    db_health_check_interval_seconds: float = 15.0
+    db_prepared_statement_cache_size: int = 500
+
+    # Statements slower than this are logged with their plan and listed at /system/slow-queries
+    slow_query_threshold_ms: float = 250.0
+    slow_query_log_size: int = 500
+    # EXPLAIN ANALYZE re-runs the statement (SELECTs only, read-only and rolled back); disable to capture estimates only
+    slow_query_explain_analyze: bool = True
+    slow_query_explain_interval_seconds: float = 60.0
+    slow_query_explain_timeout_seconds: float = 5.0
+
+    # Lets superusers profile a request by sending `X-Profile: 1`; when off the middleware isn't even installed
+    profiling_enabled: bool = False
+    profiling_output_dir: str = "profiles"
+    profiling_interval_seconds: float = 0.001
+    # Oldest profiles are deleted beyond this many
+    profiling_max_profiles: int = 100
 
     @property
     def db_dsn(self) -> URL:
@@ -48,10 +196,22 @@ class Settings(pydantic_settings.BaseSettings):
             self.db_database,
         )
     
+    @property
+    def db_replica_dsn(self) -> Optional[URL]:
+        if self.db_replica_host is None:
+            return None
+        return URL.create(
+            self.db_driver,
+            self.db_user,
+            self.db_password,
+            self.db_replica_host,
+            self.db_replica_port or self.db_port,
+            self.db_replica_database or self.db_database,
+        )
+
     @property
     def mail_enabled(self) -> bool:
-        return False
-        # return self.mail_username is not None and self.mail_password is not None
+        return self.mail_server is not None and self.mail_from is not None
 
 
 settings = Settings()
@@ -0,0 +1,233 @@
+import asyncio
+import collections
+import contextvars
+import functools
+import inspect
+import json
+import logging
+import re
+import time
+import types
+import typing
+
+from app.db import Database, databases
+from app.settings import settings
+
+
+logger = logging.getLogger(__name__)
+
+# The service method (e.g. `MapService.search_maps`) whose statements are currently executing.
+current_call_site: contextvars.ContextVar[str | None] = contextvars.ContextVar("current_call_site", default=None)
+
+def trace_call_sites(cls):
+    """
+    Class decorator tagging every statement issued from the service's public coroutine methods with
+    `Service.method`, so slow queries can be traced back to the repository call that issued them.
+    The outermost traced call wins, e.g. `MapService.get_maps` rather than the `list_maps` it delegates to.
+    """
+    for name in dir(cls):
+        if name.startswith("_"): continue
+        method = inspect.getattr_static(cls, name)
+        if isinstance(method, types.FunctionType) and inspect.iscoroutinefunction(method):
+            setattr(cls, name, _traced(method, f"{ cls.__name__ }.{ name }"))
+    return cls
+
+def _traced(method, call_site: str):
+    @functools.wraps(method)
+    async def wrapper(*args, **kwargs):
+        if current_call_site.get() is not None:
+            return await method(*args, **kwargs)
+        token = current_call_site.set(call_site)
+        try:
+            return await method(*args, **kwargs)
+        finally:
+            current_call_site.reset(token)
+    return wrapper
+
+
+# Statements EXPLAIN accepts, and those it's safe to EXPLAIN ANALYZE (which executes them) inside a read-only
+# transaction.
+EXPLAINABLE_STATEMENT = re.compile(r"\s*(SELECT|WITH|INSERT|UPDATE|DELETE)\b", re.IGNORECASE)
+ANALYZABLE_STATEMENT = re.compile(r"\s*(SELECT|WITH)\b", re.IGNORECASE)
+
+# Set while capturing a plan, whose own statements (the EXPLAIN re-runs the slow one) mustn't be logged in turn.
+capturing_plan: contextvars.ContextVar[bool] = contextvars.ContextVar("capturing_plan", default=False)
+
+def fingerprint(statement: str) -> str:
+    """ Normalize a statement so IN lists and multi-row VALUES of different lengths group together. """
+    statement = " ".join(statement.split())
+    statement = re.sub(r"\$\d+", "?", statement)
+    statement = re.sub(r"\?(?:, \?)+", "?", statement)
+    return re.sub(r"(\([^()]*\))(?:, \1)+", r"\1", statement)
+
+def parameter_shape(parameters: typing.Any) -> typing.Any:
+    """ Types of the bound parameters, never their values, which may hold user data. """
+    if isinstance(parameters, dict):
+        return { key: parameter_shape(value) for key, value in parameters.items() }
+    if isinstance(parameters, (list, tuple)):
+        return [parameter_shape(value) for value in parameters]
+    return type(parameters).__name__
+
+
+class SlowQuery:
+    __slots__ = (
+        "fingerprint", "statement", "parameter_shape", "route", "call_site", "database",
+        "duration_seconds", "recorded_at", "plan", "plan_analyzed"
+    )
+
+    def __init__(
+        self, statement: str, parameter_shape, route: str, call_site: str | None, database: str | None,
+        duration_seconds: float
+    ):
+        self.fingerprint = fingerprint(statement)
+        self.statement = statement
+        self.parameter_shape = parameter_shape
+        self.route = route
+        self.call_site = call_site
+        self.database = database
+        self.duration_seconds = duration_seconds
+        self.recorded_at = time.time()
+        self.plan: typing.Any = None
+        self.plan_analyzed = False
+
+    def to_dict(self) -> dict[str, typing.Any]:
+        return { name: getattr(self, name) for name in self.__slots__ }
+
+
+class SlowQueryLog:
+    """
+    Ring buffer of statements slower than `slow_query_threshold_ms`.
+
+    Each one is logged with its route, call site and parameter shape. Its plan is captured in the background on a
+    separate connection: `EXPLAIN ANALYZE` for SELECTs, in a read-only transaction that is rolled back, and a plain
+    `EXPLAIN` for anything else, at most once per statement fingerprint per `slow_query_explain_interval_seconds`.
+    """
+    def __init__(self, size: int):
+        self.entries: collections.deque[SlowQuery] = collections.deque(maxlen=size)
+        self._last_explained_at: dict[str, float] = {}
+        self._explain_tasks: set[asyncio.Task] = set()
+
+    @property
+    def threshold_seconds(self) -> float:
+        return settings.slow_query_threshold_ms / 1000
+
+    def record(
+        self, conn, statement: str, parameters, executemany: bool, route: str, duration_seconds: float
+    ) -> SlowQuery | None:
+        if capturing_plan.get(): return None
+
+        database = self._database_for(conn)
+        entry = SlowQuery(
+            statement,
+            parameter_shape(parameters),
+            route,
+            current_call_site.get(),
+            database.name if database is not None else None,
+            duration_seconds
+        )
+        self.entries.append(entry)
+        logger.warning(
+            f"Slow query ({ duration_seconds * 1000:.1f} ms) from { entry.call_site or 'unknown call site' } "
+            f"on { route }: { entry.fingerprint }",
+            extra={ "slow_query": entry.to_dict() }
+        )
+
+        if database is not None and not executemany and self._should_explain(entry):
+            self._schedule_explain(entry, database, statement, parameters)
+        return entry
+
+    def top_offenders(self, limit: int) -> list[dict[str, typing.Any]]:
+        """ Slow statements grouped by fingerprint, by total time spent in them, with their latest captured plan. """
+        groups: dict[str, dict[str, typing.Any]] = {}
+        for entry in self.entries:
+            group = groups.get(entry.fingerprint)
+            if group is None:
+                group = groups[entry.fingerprint] = {
+                    "fingerprint": entry.fingerprint,
+                    "count": 0,
+                    "total_seconds": 0.0,
+                    "max_seconds": 0.0,
+                    "routes": [],
+                    "call_sites": [],
+                    "plan": None,
+                    "plan_analyzed": False,
+                }
+            group["count"] += 1
+            group["total_seconds"] += entry.duration_seconds
+            group["max_seconds"] = max(group["max_seconds"], entry.duration_seconds)
+            group["statement"] = entry.statement
+            group["parameter_shape"] = entry.parameter_shape
+            group["last_seen_at"] = entry.recorded_at
+            if entry.route not in group["routes"]: group["routes"].append(entry.route)
+            if entry.call_site is not None and entry.call_site not in group["call_sites"]:
+                group["call_sites"].append(entry.call_site)
+            if entry.plan is not None:
+                group["plan"] = entry.plan
+                group["plan_analyzed"] = entry.plan_analyzed
+
+        for group in groups.values():
+            group["mean_seconds"] = group["total_seconds"] / group["count"]
+        return sorted(groups.values(), key=lambda group: group["total_seconds"], reverse=True)[:limit]
+
+    def clear(self) -> None:
+        self.entries.clear()
+        self._last_explained_at.clear()
+
+    async def stop(self) -> None:
+        """ Cancel in-flight plan captures; call before the engines they use are disposed. """
+        for task in list(self._explain_tasks):
+            task.cancel()
+        await asyncio.gather(*self._explain_tasks, return_exceptions=True)
+
+    @staticmethod
+    def _database_for(conn) -> Database | None:
+        for database in databases():
+            if database.engine is not None and database.engine.sync_engine is conn.engine:
+                return database
+        return None
+
+    def _should_explain(self, entry: SlowQuery) -> bool:
+        if not EXPLAINABLE_STATEMENT.match(entry.statement): return False
+        now = time.monotonic()
+        last_explained_at = self._last_explained_at.get(entry.fingerprint)
+        if last_explained_at is not None and now - last_explained_at < settings.slow_query_explain_interval_seconds:
+            return False
+        self._last_explained_at[entry.fingerprint] = now
+        return True
+
+    def _schedule_explain(self, entry: SlowQuery, database: Database, statement: str, parameters) -> None:
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            return
+        # A fresh context, so the EXPLAIN isn't counted against (or logged as coming from) the request behind it.
+        task = loop.create_task(self._explain(entry, database, statement, parameters), context=contextvars.Context())
+        self._explain_tasks.add(task)
+        task.add_done_callback(self._explain_tasks.discard)
+
+    async def _explain(self, entry: SlowQuery, database: Database, statement: str, parameters) -> None:
+        analyze = settings.slow_query_explain_analyze and ANALYZABLE_STATEMENT.match(statement) is not None
+        options = "ANALYZE, BUFFERS, FORMAT JSON" if analyze else "FORMAT JSON"
+        timeout_ms = int(settings.slow_query_explain_timeout_seconds * 1000)
+        capturing_plan.set(True)
+        try:
+            async with database.engine.connect() as connection:
+                # ANALYZE executes the statement; the transaction is read-only and never committed.
+                await connection.exec_driver_sql("SET TRANSACTION READ ONLY")
+                await connection.exec_driver_sql(f"SET LOCAL statement_timeout = { timeout_ms }")
+                result = await connection.exec_driver_sql(f"EXPLAIN ({ options }) { statement }", parameters)
+                plan = result.scalar_one()
+                await connection.rollback()
+        except Exception as e:
+            logger.warning(f"Failed to capture plan for slow query { entry.fingerprint } with error { str(e) }")
+            return
+
+        entry.plan = json.loads(plan) if isinstance(plan, str) else plan
+        entry.plan_analyzed = analyze
+        logger.info(
+            f"Captured plan for slow query from { entry.call_site or 'unknown call site' }: { entry.fingerprint }",
+            extra={ "slow_query": entry.to_dict() }
+        )
+
+
+slow_query_log = SlowQueryLog(settings.slow_query_log_size)
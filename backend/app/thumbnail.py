@@ -0,0 +1,129 @@
+"""
+Map thumbnails, drawn on the server from a map's data rather than uploaded by the client, so every map has one in the
+same style and at whatever size is asked for.
+
+Drawing is vectorized with NumPy: every polygon of a layer is filled at once by scanline, from where each of its edges
+crosses the centre of each row of pixels, and roads are drawn as a rectangle per segment, filled the same way. The
+image is drawn at SUPERSAMPLING times its size and scaled down, which smooths its edges.
+"""
+import json
+import struct
+import zlib
+
+import numpy as np
+
+from app.exceptions.map import MapDataInvalidException, MapDataTooLargeException
+from app.map_data import LAYERS, Layer, parse_map_data
+from app.scene import MAP_SIZE, road_quads
+
+THUMBNAIL_MEDIA_TYPE = "image/png"
+SUPERSAMPLING = 2
+
+# Mirrors drawRoadParks and drawBuildings in webapp/src/views/map-create/map-create-context.tsx
+LAND_COLOR = (252, 246, 217)
+WATER_COLOR = (22, 119, 255)
+PARK_COLOR = (82, 196, 26)
+MAJOR_ROAD_COLOR = (64, 64, 64)
+MAIN_ROAD_COLOR = (250, 219, 20)
+MINOR_ROAD_COLOR = (255, 255, 255)
+MINOR_ROAD_OUTLINE_COLOR = (0, 0, 0)
+BUILDING_COLOR = (249, 236, 172)
+BUILDING_OUTLINE_COLOR = (128, 128, 128)
+
+
+def closed_rings(layer: Layer) -> Layer:
+    """ `layer` with each ring's first vertex repeated at its end, so its closing edge is a segment like the others. """
+    vertices = np.insert(layer.vertices, layer.ends, layer.vertices[layer.starts], axis=0)
+    return Layer(vertices, layer.offsets + np.arange(len(layer.offsets)))
+
+def coverage(layer: Layer, size: int, scale: float) -> np.ndarray:
+    """ Which pixels of a `size` square image have centres inside a ring of `layer`, its vertices scaled by `scale`. """
+    mask = np.zeros((size, size), dtype=bool)
+    if not len(layer.starts): return mask
+    x0, y0 = (layer.vertices * scale).T
+    following = np.arange(1, len(x0) + 1)
+    following[layer.ends - 1] = layer.starts
+    x1, y1 = x0[following], y0[following]
+
+    # Each edge crosses the centres of rows low up to high, counting its lower end but not its upper one, so a ring
+    # crosses every row an even number of times.
+    low = np.clip(np.ceil(np.minimum(y0, y1) - 0.5), 0, size).astype(np.int64)
+    high = np.clip(np.ceil(np.maximum(y0, y1) - 0.5), 0, size).astype(np.int64)
+    counts = np.maximum(high - low, 0)
+    edges = np.repeat(np.arange(len(x0)), counts)
+    rows = low[edges] + np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+    xs = x0[edges] + (rows + 0.5 - y0[edges]) * (x1 - x0)[edges] / (y1 - y0)[edges]
+
+    # Along each row of each ring, pixels from one crossing up to the next are inside, then outside to the next.
+    order = np.lexsort((xs, rows, np.repeat(np.arange(len(layer.starts)), layer.ends - layer.starts)[edges]))
+    rows, xs = rows[order], xs[order]
+    span_rows = rows[0::2]
+    starts = np.clip(np.ceil(xs[0::2] - 0.5), 0, size).astype(np.int64)
+    stops = np.clip(np.ceil(xs[1::2] - 0.5), 0, size).astype(np.int64)
+    # Spans are summed as +1 where they start and -1 where they stop, so overlapping rings add up rather than cancel.
+    changes = (
+        np.bincount(span_rows * (size + 1) + starts, minlength=size * (size + 1))
+        - np.bincount(span_rows * (size + 1) + stops, minlength=size * (size + 1))
+    )
+    mask[:] = np.cumsum(changes.reshape(size, size + 1), axis=1)[:, :size] > 0
+    return mask
+
+def encode_png(pixels: np.ndarray) -> bytes:
+    """ Encode an (height, width, 3) array of 8-bit RGB as a PNG. """
+    def chunk(kind: bytes, data: bytes) -> bytes:
+        return struct.pack(">I", len(data)) + kind + data + struct.pack(">I", zlib.crc32(kind + data))
+
+    height, width, _ = pixels.shape
+    # Each scanline is prefixed with its filter type, 0 (none)
+    raw = np.concatenate([np.zeros((height, 1), dtype=np.uint8), pixels.reshape(height, width * 3)], axis=1)
+    return b"".join([
+        b"\x89PNG\r\n\x1a\n",
+        chunk(b"IHDR", struct.pack(">IIBBBBB", width, height, 8, 2, 0, 0, 0)),
+        chunk(b"IDAT", zlib.compress(raw.tobytes(), 6)),
+        chunk(b"IEND", b""),
+    ])
+
+def render_thumbnail(layers: dict[str, Layer], size: int, extent: float = MAP_SIZE) -> bytes:
+    """
+    A `size` pixel square PNG of a map's parsed layers from the top, as the client draws them while the map is being
+    made: its (0, 0) to (`extent`, `extent`) square, which is the whole map when `extent` is MAP_SIZE. Missing layers
+    are left out.
+    """
+    empty = Layer(np.zeros((0, 2)), np.zeros(1, dtype=np.int64))
+    layers = { name: layers.get(name, empty) for name in LAYERS }
+    samples = size * SUPERSAMPLING
+    scale = samples / extent
+    image = np.empty((samples, samples, 3), dtype=np.uint8)
+    image[:] = LAND_COLOR
+
+    def fill(layer: Layer, color: tuple[int, int, int]) -> None:
+        image[coverage(layer, samples, scale)] = color
+
+    def roads(names: tuple[str, ...], half_width: float, color: tuple[int, int, int]) -> None:
+        for name in names: fill(road_quads(layers[name], half_width), color)
+
+    for name in ("sea", "river"):
+        # A map without a sea or river has an empty one.
+        if len(layers[name].vertices) >= 3: fill(layers[name], WATER_COLOR)
+    roads(("majorRoads",), 1.0, MAJOR_ROAD_COLOR)
+    roads(("mainRoads", "coastalRoads"), 1.5, MAIN_ROAD_COLOR)
+    fill(layers["bigParks"], PARK_COLOR)
+    fill(layers["smallParks"], PARK_COLOR)
+    roads(("minorRoads",), 1.0, MINOR_ROAD_OUTLINE_COLOR)
+    roads(("minorRoads",), 0.5, MINOR_ROAD_COLOR)
+    fill(layers["buildings"], BUILDING_COLOR)
+    fill(road_quads(closed_rings(layers["buildings"]), 0.5), BUILDING_OUTLINE_COLOR)
+
+    pixels = image.reshape(size, SUPERSAMPLING, size, SUPERSAMPLING, 3).mean(axis=(1, 3))
+    return encode_png(np.round(pixels).astype(np.uint8))
+
+def render_thumbnail_from_json(data_json: str, size: int) -> bytes:
+    """
+    `render_thumbnail` from a map's data as JSON text, which is far cheaper to send to a worker process than objects.
+    Maps stored before their data was validated may not pass now; they still get a thumbnail, of bare land.
+    """
+    try:
+        layers = parse_map_data(json.loads(data_json)).layers
+    except (MapDataInvalidException, MapDataTooLargeException):
+        layers = {}
+    return render_thumbnail(layers, size)
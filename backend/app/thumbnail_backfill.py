@@ -0,0 +1,101 @@
+"""
+Draw thumbnails for existing maps (see app.thumbnail): maps whose thumbnail was uploaded by the client, or drawn at
+another size, or that have none at all.
+
+    uv run python -m app.thumbnail_backfill --size 256
+    uv run python -m app.thumbnail_backfill --missing-only --workers 8
+
+Maps are walked by id a batch at a time. Each batch's thumbnails are drawn in parallel across a process pool and
+stored in one transaction, so the job can be stopped and run again, and carries on with the maps it hadn't reached.
+"""
+import argparse
+import asyncio
+import sys
+import time
+import typing
+from uuid import UUID
+
+from sqlalchemy.ext.asyncio import async_sessionmaker
+
+from app.db import AsyncSessionFactory, start_databases, stop_databases
+from app.map_data import LAYERS, join_layers_json
+from app.process_pool import ProcessPool
+from app.repositories import MapLayerService, ThumbnailService
+from app.settings import settings
+from app.thumbnail import THUMBNAIL_MEDIA_TYPE, render_thumbnail_from_json
+
+
+async def backfill_thumbnails(
+    session_factory: async_sessionmaker,
+    pool: ProcessPool,
+    size: int,
+    missing_only: bool = False,
+    batch_size: int = 50,
+    map_ids: list[UUID] | None = None,
+    log: typing.Callable[[str], None] = lambda message: None,
+) -> int:
+    """
+    Draw a `size` thumbnail for each map (of `map_ids` if given) without one of that size, or only for those without
+    any if `missing_only`. Returns how many were drawn.
+    """
+    drawn = 0
+    after = None
+    while True:
+        async with session_factory() as session:
+            map_layer_service = MapLayerService(session=session)
+            thumbnail_service = ThumbnailService(session=session)
+
+            batch = await thumbnail_service.get_map_ids_without_thumbnail(
+                None if missing_only else size, after, batch_size, map_ids
+            )
+            if not batch: return drawn
+            # Each map is sent to the pool as soon as its layers are read, so drawing overlaps reading the next.
+            renders = []
+            for map_id in batch:
+                layers_json = await map_layer_service.get_layers_json(map_id, list(LAYERS))
+                renders.append(asyncio.ensure_future(
+                    pool.run(render_thumbnail_from_json, join_layers_json(layers_json), size)
+                ))
+            for map_id, data in zip(batch, await asyncio.gather(*renders), strict=True):
+                await thumbnail_service.save_thumbnail(map_id, data, THUMBNAIL_MEDIA_TYPE, size)
+            await session.commit()
+
+        drawn += len(batch)
+        after = batch[-1]
+        log(f"Drew { drawn } thumbnails, up to map { after }")
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(prog="python -m app.thumbnail_backfill", description=__doc__.split("\n\n")[0])
+    parser.add_argument(
+        "--size", type=int, default=settings.thumbnail_size, help="thumbnail width and height in pixels"
+    )
+    parser.add_argument("--missing-only", action="store_true", help="only draw thumbnails for maps that have none")
+    parser.add_argument("--map-id", type=UUID, action="append", dest="map_ids", help="only this map; may be repeated")
+    parser.add_argument("--batch-size", type=int, default=50, help="maps per transaction")
+    parser.add_argument(
+        "--workers", type=int, default=settings.process_pool_workers, help="processes drawing thumbnails"
+    )
+    return parser.parse_args()
+
+
+async def main() -> int:
+    args = parse_args()
+    start = time.perf_counter()
+    pool = ProcessPool(workers=args.workers)
+    await start_databases()
+    pool.start()
+    try:
+        drawn = await backfill_thumbnails(
+            AsyncSessionFactory, pool, args.size, args.missing_only, args.batch_size, args.map_ids, log=print
+        )
+    finally:
+        await pool.stop()
+        await stop_databases()
+
+    print(f"Drew { drawn } thumbnails of { args.size }px in { time.perf_counter() - start:.1f}s")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(main()))
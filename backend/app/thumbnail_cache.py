@@ -0,0 +1,76 @@
+import asyncio
+import contextvars
+import logging
+from uuid import UUID
+
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.db import AsyncSessionFactory
+from app.map_data import LAYERS, join_layers_json
+from app.metrics import cache_requests_total
+from app.models import ThumbnailModel
+from app.process_pool import process_pool
+from app.repositories import MapLayerService, ThumbnailService
+from app.settings import settings
+from app.thumbnail import THUMBNAIL_MEDIA_TYPE, render_thumbnail_from_json
+
+logger = logging.getLogger(__name__)
+
+class ThumbnailCache:
+    """
+    Map thumbnails (see app.thumbnail), drawn in the process pool when a map is created, or when one without a
+    thumbnail is first asked for, and kept in the database. Requests for a thumbnail that's still being drawn wait on
+    the same drawing.
+    """
+    def __init__(self):
+        self._renders: dict[UUID, asyncio.Task] = {}
+
+    async def _render(self, map_id: UUID) -> ThumbnailModel:
+        try:
+            async with AsyncSessionFactory() as session:
+                layers_json = await MapLayerService(session=session).get_layers_json(map_id, list(LAYERS))
+                data = await process_pool.run(
+                    render_thumbnail_from_json, join_layers_json(layers_json), settings.thumbnail_size
+                )
+                thumbnail = await ThumbnailService(session=session).save_thumbnail(
+                    map_id, data, THUMBNAIL_MEDIA_TYPE, settings.thumbnail_size
+                )
+                await session.commit()
+            return thumbnail
+        finally:
+            if self._renders.get(map_id) is asyncio.current_task(): del self._renders[map_id]
+
+    def render(self, map_id: UUID) -> asyncio.Task:
+        """ Start drawing a map's thumbnail, unless it's already being drawn. """
+        task = self._renders.get(map_id)
+        if task is None:
+            # In a context of its own, so the drawing's queries aren't counted against whichever request started it.
+            task = asyncio.create_task(self._render(map_id), context=contextvars.Context())
+            task.add_done_callback(self._log_failure)
+            self._renders[map_id] = task
+        return task
+
+    @staticmethod
+    def _log_failure(task: asyncio.Task) -> None:
+        if not task.cancelled() and task.exception() is not None:
+            logger.error("Failed to render map thumbnail", exc_info=task.exception())
+
+    async def get(self, session: AsyncSession, map_id: UUID) -> ThumbnailModel:
+        """ The thumbnail of a map, which the caller must already have checked exists and may be seen. """
+        thumbnail_service = ThumbnailService(session=session)
+        thumbnail = await thumbnail_service.get_thumbnail(map_id)
+        if thumbnail is not None:
+            cache_requests_total.inc("map_thumbnail", "hit")
+            return thumbnail
+
+        cache_requests_total.inc("map_thumbnail", "miss")
+        # Shielded, so one caller disconnecting doesn't cancel the drawing everyone else is waiting on.
+        return await asyncio.shield(self.render(map_id))
+
+    async def stop(self) -> None:
+        renders = list(self._renders.values())
+        for task in renders: task.cancel()
+        await asyncio.gather(*renders, return_exceptions=True)
+
+
+thumbnail_cache = ThumbnailCache()
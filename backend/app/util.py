@@ -1,12 +1,27 @@
+import functools
 import httpx
+import ipaddress
 import random
 import string
 import logging
+from pathlib import Path
 from typing import Annotated
 
+from fastapi import Request
+
+from app.settings import settings
+
 logger = logging.getLogger(__name__)
 
+DEFAULT_AVATAR_PATH = Path(__file__).parent.parent / "static" / "images" / "default-avatar.jpg"
+
+def get_default_avatar() -> Annotated[bytes, "JPEG"]:
+    return DEFAULT_AVATAR_PATH.read_bytes()
+
 async def get_random_pixel_avatar(timeout=10.0) -> Annotated[bytes, "JPEG"]:
+    if not settings.random_avatars_enabled:
+        return get_default_avatar()
+
     avatar_seed = "".join(random.choices(string.ascii_letters + string.digits, k=16))
     background_color = random.choice(["b6e3f4", "c0aede", "d1d4f9", "ffd5dc", "ffdfbf"])
     
@@ -22,7 +37,49 @@ async def get_random_pixel_avatar(timeout=10.0) -> Annotated[bytes, "JPEG"]:
             logger.warning(
                 f"Failed to retrieve avatar from DiceBear with error { str(e) }, falling back to default..."
                 )
-            with open("static/images/default-avatar.jpg", "wb") as f:
-                avatar_bytes = f.read()
+            avatar_bytes = get_default_avatar()
+
+    return avatar_bytes
+
+def accepts_encoding(accept_encoding: str, encoding: str) -> bool:
+    """ Whether an Accept-Encoding header allows `encoding`, honouring `q=0` refusals. """
+    for value in accept_encoding.lower().split(","):
+        coding, _, params = value.partition(";")
+        if coding.strip() not in (encoding, "*"): continue
+        quality = params.strip().removeprefix("q=")
+        try:
+            return not params.strip() or float(quality) > 0
+        except ValueError:
+            return False
+    return False
+
+def etag_matches(if_none_match: str, etag: str) -> bool:
+    """ Whether an If-None-Match header matches `etag`, using the weak comparison it calls for. """
+    if if_none_match.strip() == "*": return True
+    return etag.removeprefix("W/") in (tag.strip().removeprefix("W/") for tag in if_none_match.split(","))
+
+@functools.cache
+def trusted_networks(proxies: tuple[str, ...]) -> tuple[ipaddress.IPv4Network | ipaddress.IPv6Network, ...]:
+    return tuple(ipaddress.ip_network(proxy, strict=False) for proxy in proxies)
+
+def is_trusted_proxy(address: str) -> bool:
+    try:
+        ip = ipaddress.ip_address(address)
+    except ValueError:
+        return False
+    return any(ip in network for network in trusted_networks(tuple(settings.trusted_proxies)))
 
-    return avatar_bytes
\ No newline at end of file
+def client_address(request: Request) -> str:
+    """
+    The address a request came from. Through the reverse proxies in TRUSTED_PROXIES, that's the last address in
+    X-Forwarded-For that isn't one of theirs, as each proxy appends the address it was connected from; what comes
+    before that is up to the client, and not believed.
+    """
+    address = request.client.host if request.client else "unknown"
+    if not is_trusted_proxy(address): return address
+    forwarded = [part.strip() for header in request.headers.getlist("x-forwarded-for") for part in header.split(",")]
+    for hop in reversed(forwarded):
+        if not hop: continue
+        address = hop
+        if not is_trusted_proxy(hop): break
+    return address
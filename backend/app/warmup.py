@@ -0,0 +1,74 @@
+import asyncio
+import contextlib
+import importlib
+import logging
+import time
+from uuid import UUID
+
+from fastapi_users.authentication.strategy.db import DatabaseStrategy
+from fastapi_users_db_sqlalchemy.access_token import SQLAlchemyAccessTokenDatabase
+
+from app.db import AsyncSessionFactory, primary_database
+from app.exceptions import CustomException
+from app.models import AccessTokenModel, MapModel, UserModel
+from app.repositories import MapService, ThumbnailService, UserService
+from app.settings import settings
+
+logger = logging.getLogger(__name__)
+
+NIL_ID = UUID(int=0)
+
+def lazy_modules() -> list[str]:
+    """ Modules the app imports on first use rather than at startup, that this configuration will use. """
+    modules = []
+    if settings.mail_enabled:
+        modules += ["fastapi_mail", "fastapi_mail.connection", "fastapi_mail.msg"]
+    if settings.profiling_enabled:
+        modules += ["pyinstrument", "pyinstrument.renderers"]
+    return modules
+
+async def prime_connection() -> None:
+    """
+    Issue the hot-path lookups (session token, map, thumbnail, avatar) with keys that match nothing, so SQLAlchemy's
+    compiled cache and the connection's prepared statement cache already hold them when real requests arrive.
+    """
+    async with AsyncSessionFactory() as session:
+        strategy = DatabaseStrategy(
+            SQLAlchemyAccessTokenDatabase(session, AccessTokenModel),
+            lifetime_seconds=settings.access_token_lifetime_seconds
+        )
+        # An unknown token returns before the user manager is needed.
+        await strategy.read_token("warm-up", user_manager=None)
+
+        map_service = MapService(session=session)
+        thumbnail_service = ThumbnailService(session=session)
+        user_service = UserService(session=session)
+        lookups = [
+            lambda: map_service.get_map(NIL_ID, None, load=MapModel.user),
+            lambda: map_service.get_map(NIL_ID, None),
+            lambda: thumbnail_service.get_thumbnail(NIL_ID),
+            lambda: user_service.get_user_by_username("", load=UserModel.avatar),
+        ]
+        for lookup in lookups:
+            with contextlib.suppress(CustomException):
+                await lookup()
+
+async def warm_up() -> None:
+    """
+    Get a worker ready for traffic. Granian runs the lifespan before a worker accepts connections, so this cost is
+    paid at startup rather than by the first requests: lazily imported modules are imported, and each connection
+    the pool was warmed with is primed (see `prime_connection`).
+    """
+    start = time.perf_counter()
+    for module in lazy_modules():
+        importlib.import_module(module)
+
+    if primary_database.healthy:
+        connections = min(settings.db_pool_warmup_connections, primary_database.engine.pool.size())
+        try:
+            # Concurrently, so each primes a different pooled connection.
+            await asyncio.gather(*(prime_connection() for _ in range(max(connections, 1))))
+        except Exception as e:
+            logger.warning(f"Failed to prime database connections with error { str(e) }")
+
+    logger.info(f"Worker warmed up in { (time.perf_counter() - start) * 1000:.0f} ms")
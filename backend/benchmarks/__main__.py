@@ -0,0 +1,233 @@
+"""
+Load-test the API in-process and through a real Granian server, against a dedicated local Postgres database.
+
+    uv run python -m benchmarks                       # run every scenario on both targets, compare with baselines
+    uv run python -m benchmarks --target inprocess --scenario browse --scenario map-load
+    uv run python -m benchmarks --update-baselines    # record new baselines after an intentional change
+    uv run python -m benchmarks --target granian --workers 1 --workers 4 --concurrency 64   # scaling with cores
+
+The database named by `--database` is created if missing, migrated, and emptied before each target is seeded, so runs
+are reproducible. Exits non-zero when a scenario errors or regresses past `--tolerance` against its baseline.
+"""
+import argparse
+import asyncio
+import contextlib
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+import typing
+from pathlib import Path
+
+if typing.TYPE_CHECKING:
+    from benchmarks.harness import ScenarioResult
+
+
+BACKEND_DIR = Path(__file__).parent.parent
+TARGETS = ("inprocess", "granian")
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(prog="python -m benchmarks", description=__doc__.split("\n\n")[0])
+    parser.add_argument("--target", action="append", choices=TARGETS, help="target to run (repeatable, default: all)")
+    parser.add_argument("--scenario", action="append", help="scenario to run (repeatable, default: all)")
+    parser.add_argument(
+        "--workers", type=int, action="append", help="Granian worker counts to run (repeatable, default: 1)"
+    )
+    parser.add_argument("--requests", type=int, default=300, help="timed requests per scenario")
+    parser.add_argument("--concurrency", type=int, default=16, help="concurrent virtual clients")
+    parser.add_argument("--warmup", type=int, default=10, help="untimed requests per scenario before measuring")
+    parser.add_argument("--users", type=int, default=8)
+    parser.add_argument("--maps-per-user", type=int, default=4)
+    parser.add_argument("--buildings", type=int, default=1500, help="buildings per seeded map")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--database", default="citygen_bench", help="database to (re)create and seed; it is emptied!")
+    parser.add_argument(
+        "--maintenance-database", default="postgres", help="database to connect to to create --database"
+    )
+    parser.add_argument(
+        "--tolerance", type=float, default=0.3, help="allowed fractional regression in p50/p95/throughput"
+    )
+    parser.add_argument("--baselines-dir", type=Path, default=Path(__file__).parent / "baselines")
+    parser.add_argument("--update-baselines", action="store_true", help="record these results as the new baselines")
+    return parser.parse_args()
+
+
+def bench_environment(args: argparse.Namespace) -> dict[str, str]:
+    return {
+        **os.environ,
+        "DB_DATABASE": args.database,
+        "SECRET_KEY": os.environ.get("SECRET_KEY", "benchmark-secret"),
+        "DEV_PHASE": "prod",
+        "RANDOM_AVATARS_ENABLED": "false",
+        "PROFILING_ENABLED": "false",
+        # Every simulated client shares one address, and bursts are the point; requests queue for slots instead.
+        "RATE_LIMITS_ENABLED": "false",
+        "ADMISSION_QUEUE_TIMEOUT_SECONDS": "60",
+    }
+
+async def reset_database(args: argparse.Namespace, env: dict[str, str]) -> None:
+    from advanced_alchemy.base import DefaultBase
+    from sqlalchemy import text
+    from sqlalchemy.ext.asyncio import create_async_engine
+    import app.models  # noqa: F401 registers the tables on DefaultBase
+    from app.settings import settings
+
+    maintenance = create_async_engine(
+        settings.db_dsn.set(database=args.maintenance_database), isolation_level="AUTOCOMMIT"
+    )
+    async with maintenance.connect() as connection:
+        exists = await connection.scalar(
+            text("SELECT 1 FROM pg_database WHERE datname = :name"), { "name": args.database }
+        )
+        if not exists:
+            await connection.execute(text(f'CREATE DATABASE "{ args.database }"'))
+    await maintenance.dispose()
+
+    subprocess.run(
+        [sys.executable, "-m", "alembic", "upgrade", "head"], env=env, cwd=BACKEND_DIR, check=True, capture_output=True
+    )
+
+    engine = create_async_engine(settings.db_dsn)
+    async with engine.begin() as connection:
+        tables = ", ".join(f'"{ table.name }"' for table in DefaultBase.metadata.sorted_tables)
+        await connection.execute(text(f"TRUNCATE { tables } RESTART IDENTITY CASCADE"))
+    await engine.dispose()
+
+
+@contextlib.asynccontextmanager
+async def inprocess_client():
+    import httpx
+    from app.application import application
+
+    async with (
+        application.router.lifespan_context(application),
+        httpx.AsyncClient(
+            transport=httpx.ASGITransport(app=application), base_url="http://bench", timeout=60
+        ) as client,
+    ):
+        yield client
+
+@contextlib.asynccontextmanager
+async def granian_client(env: dict[str, str]):
+    """ Serve the app with its production entrypoint (`python -m app`) on a free port and connect to it over TCP. """
+    import httpx
+
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        port = sock.getsockname()[1]
+
+    with tempfile.TemporaryFile() as log:
+        process = subprocess.Popen(
+            [sys.executable, "-m", "app"], env={ **env, "APP_PORT": str(port) }, cwd=BACKEND_DIR, stdout=log, stderr=log
+        )
+        try:
+            async with httpx.AsyncClient(base_url=f"http://127.0.0.1:{ port }", timeout=60) as client:
+                deadline = time.monotonic() + 30
+                while True:
+                    try:
+                        if (await client.get("/api/v1/maps/")).status_code == 200: break
+                    except httpx.TransportError:
+                        pass
+                    if process.poll() is not None or time.monotonic() > deadline:
+                        log.seek(0)
+                        raise RuntimeError(f"Granian failed to start:\n{ log.read().decode(errors='replace')[-4000:] }")
+                    await asyncio.sleep(0.2)
+                yield client
+        finally:
+            process.terminate()
+            try:
+                process.wait(timeout=15)
+            except subprocess.TimeoutExpired:
+                process.kill()
+
+
+async def run_target(
+    target: str, args: argparse.Namespace, env: dict[str, str], workers: int = 1
+) -> tuple[bool, list["ScenarioResult"]]:
+    from benchmarks.harness import Baseline, compare, format_results, load_baseline, run_scenario, save_baseline
+    from benchmarks.scenarios import SCENARIOS, World
+
+    await reset_database(args, env)
+    client_context = (
+        inprocess_client() if target == "inprocess" else granian_client({ **env, "SERVER_WORKERS": str(workers) })
+    )
+    scenarios = [SCENARIOS[name] for name in (args.scenario or SCENARIOS)]
+
+    async with client_context as client:
+        world = World(client, seed=args.seed)
+        await world.populate(args.users, args.maps_per_user, args.buildings)
+
+        results = []
+        for scenario in scenarios:
+            requests = max(int(args.requests * scenario.request_share), 1)
+            results.append(await run_scenario(
+                scenario.name, lambda scenario=scenario: scenario.run(world),
+                requests=requests,
+                concurrency=min(args.concurrency, requests),
+                warmup=min(args.warmup, requests),
+            ))
+
+    config = {
+        "requests": args.requests, "concurrency": args.concurrency, "warmup": args.warmup, "users": args.users,
+        "maps_per_user": args.maps_per_user, "buildings": args.buildings, "seed": args.seed,
+    }
+    if target == "granian":
+        config["workers"] = workers
+        # Each worker count has its own baseline.
+        if workers != 1: target = f"{ target }-{ workers }w"
+    path = args.baselines_dir / f"{ target }.json"
+    baseline = load_baseline(path)
+    print(format_results(target, results, baseline if baseline is not None and baseline.config == config else None))
+
+    ok = True
+    if any(result.errors for result in results):
+        print(f"FAIL: { target } had failed requests")
+        ok = False
+
+    if args.update_baselines:
+        # Keep the baseline's results for scenarios this run skipped, if they're comparable.
+        recorded = dict(baseline.results) if baseline is not None and baseline.config == config else {}
+        recorded.update({ result.scenario: result for result in results })
+        save_baseline(path, Baseline(target=target, config=config, results=recorded))
+        print(f"Updated baseline { path }")
+    elif baseline is None:
+        print(f"No baseline at { path }; record one with --update-baselines")
+    elif baseline.config != config:
+        print(f"Not comparing with { path }, it was recorded with a different configuration: { baseline.config }")
+    else:
+        regressions = compare(baseline, results, args.tolerance)
+        for regression in regressions:
+            print(f"REGRESSION: { target } { regression }")
+        ok = ok and not regressions
+    print()
+    return ok, results
+
+
+async def main() -> int:
+    args = parse_args()
+    env = bench_environment(args)
+    # The app reads its settings at import time, so point it at the benchmark database before importing anything.
+    os.environ.update(env)
+    sys.path.insert(0, str(BACKEND_DIR))
+
+    from benchmarks.harness import format_scaling
+
+    ok = True
+    for target in args.target or TARGETS:
+        if target != "granian":
+            ok = (await run_target(target, args, env))[0] and ok
+            continue
+
+        results_by_workers = {}
+        for workers in args.workers or [1]:
+            target_ok, results_by_workers[workers] = await run_target(target, args, env, workers)
+            ok = target_ok and ok
+        if len(results_by_workers) > 1:
+            print(format_scaling(results_by_workers))
+    return 0 if ok else 1
+
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(main()))
@@ -0,0 +1,171 @@
+import asyncio
+import json
+import math
+import time
+import typing
+from pathlib import Path
+
+import httpx
+from pydantic import BaseModel
+
+
+class ScenarioResult(BaseModel):
+    scenario: str
+    requests: int
+    errors: int
+    seconds: float
+    throughput: float
+    mean_ms: float
+    p50_ms: float
+    p95_ms: float
+    p99_ms: float
+    max_ms: float
+
+
+class Baseline(BaseModel):
+    target: str
+    config: dict[str, typing.Any]
+    results: dict[str, ScenarioResult]
+
+
+class Regression(BaseModel):
+    scenario: str
+    metric: str
+    baseline: float
+    current: float
+
+    def __str__(self) -> str:
+        return f"{ self.scenario }: { self.metric } regressed from { self.baseline:.2f} to { self.current:.2f}"
+
+
+def percentile(sorted_values: list[float], q: float) -> float:
+    """ Nearest-rank percentile of an already sorted list. """
+    if not sorted_values: return 0.0
+    rank = max(math.ceil(q / 100 * len(sorted_values)), 1)
+    return sorted_values[rank - 1]
+
+async def run_scenario(
+    name: str,
+    scenario: typing.Callable[[], typing.Awaitable[httpx.Response]],
+    *,
+    requests: int,
+    concurrency: int,
+    warmup: int = 0
+) -> ScenarioResult:
+    """
+    Issue `requests` calls of `scenario` from `concurrency` concurrent workers (a closed loop: each worker sends its
+    next request as soon as the last one completes), after `warmup` untimed calls.
+    """
+    for _ in range(warmup):
+        await scenario()
+
+    remaining = iter(range(requests))
+    latencies: list[float] = []
+    errors = 0
+
+    async def worker():
+        nonlocal errors
+        for _ in remaining:
+            start = time.perf_counter()
+            try:
+                response = await scenario()
+                failed = response.status_code >= 400
+            except httpx.HTTPError:
+                failed = True
+            latencies.append(time.perf_counter() - start)
+            if failed: errors += 1
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    seconds = time.perf_counter() - start
+
+    latencies.sort()
+    return ScenarioResult(
+        scenario=name,
+        requests=requests,
+        errors=errors,
+        seconds=seconds,
+        throughput=requests / seconds if seconds > 0 else 0.0,
+        mean_ms=sum(latencies) / len(latencies) * 1000 if latencies else 0.0,
+        p50_ms=percentile(latencies, 50) * 1000,
+        p95_ms=percentile(latencies, 95) * 1000,
+        p99_ms=percentile(latencies, 99) * 1000,
+        max_ms=latencies[-1] * 1000 if latencies else 0.0,
+    )
+
+
+def compare(
+    baseline: Baseline,
+    results: list[ScenarioResult],
+    tolerance: float,
+    min_latency_delta_ms: float = 2.0
+) -> list[Regression]:
+    """
+    Regressions of `results` against `baseline`: a p50 or p95 more than `tolerance` (a fraction) slower, or throughput
+    more than `tolerance` lower. p99 is reported but not gated on, since a few hundred samples put it at the mercy of
+    one or two stalls. Latency changes under `min_latency_delta_ms` are ignored as noise too.
+    """
+    regressions = []
+    for result in results:
+        base = baseline.results.get(result.scenario)
+        if base is None: continue
+
+        for metric in ("p50_ms", "p95_ms"):
+            current, previous = getattr(result, metric), getattr(base, metric)
+            if current > previous * (1 + tolerance) and current - previous > min_latency_delta_ms:
+                regressions.append(Regression(
+                    scenario=result.scenario, metric=metric, baseline=previous, current=current
+                ))
+        if result.throughput < base.throughput * (1 - tolerance):
+            regressions.append(Regression(
+                scenario=result.scenario, metric="throughput", baseline=base.throughput, current=result.throughput
+            ))
+    return regressions
+
+def load_baseline(path: Path) -> Baseline | None:
+    if not path.is_file(): return None
+    return Baseline.model_validate(json.loads(path.read_text()))
+
+def save_baseline(path: Path, baseline: Baseline) -> None:
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_text(baseline.model_dump_json(indent=2) + "\n")
+
+
+def format_results(target: str, results: list[ScenarioResult], baseline: Baseline | None = None) -> str:
+    lines = [
+        f"{ target }",
+        f"{ 'scenario':<12} { 'reqs':>6} { 'errors':>6} { 'req/s':>9} "
+        f"{ 'mean':>8} { 'p50':>8} { 'p95':>8} { 'p99':>8} { 'max':>8}"
+        + ("   p95 vs baseline" if baseline is not None else ""),
+    ]
+    for result in results:
+        line = (
+            f"{ result.scenario:<12} { result.requests:>6} { result.errors:>6} { result.throughput:>9.1f} "
+            f"{ result.mean_ms:>8.2f} { result.p50_ms:>8.2f} { result.p95_ms:>8.2f} { result.p99_ms:>8.2f} "
+            f"{ result.max_ms:>8.2f}"
+        )
+        base = baseline.results.get(result.scenario) if baseline is not None else None
+        if base is not None and base.p95_ms > 0:
+            line += f"   { (result.p95_ms / base.p95_ms - 1) * 100:+.1f}%"
+        lines.append(line)
+    return "\n".join(lines)
+
+
+def format_scaling(results_by_workers: dict[int, list[ScenarioResult]]) -> str:
+    """ Throughput of each scenario per Granian worker count, and its speedup over the fewest workers. """
+    counts = sorted(results_by_workers)
+    throughput = {
+        workers: { result.scenario: result.throughput for result in results_by_workers[workers] } for workers in counts
+    }
+    lines = [
+        "throughput by workers (speedup)",
+        f"{ 'scenario':<12}" + "".join(f" { f'{ workers } workers':>20}" for workers in counts),
+    ]
+    for scenario in throughput[counts[0]]:
+        base = throughput[counts[0]][scenario]
+        cells = []
+        for workers in counts:
+            current = throughput[workers].get(scenario, 0.0)
+            cells.append(f" { f'{ current:.1f} ({ current / base if base else 0.0:.2f}x)':>20}")
+        lines.append(f"{ scenario:<12}" + "".join(cells))
+    return "\n".join(lines)
@@ -0,0 +1,119 @@
+import random
+import typing
+
+import httpx
+
+from app.auth import cookie_transport
+from app.seed import generate_map_data
+
+
+API_PREFIX = "/api/v1"
+PASSWORD = "benchmark-password"
+
+
+class VirtualUser:
+    def __init__(self, username: str, email: str, token: str):
+        self.username = username
+        self.email = email
+        # Sent explicitly rather than through the client's cookie jar, which is shared between virtual users.
+        self.headers = { "cookie": f"{ cookie_transport.cookie_name }={ token }" }
+
+
+class World:
+    """
+    The users and maps scenarios run against, created through the API so every target is seeded identically.
+    All randomness comes from `seed`, so two runs against an empty database issue the same requests.
+    """
+    def __init__(self, client: httpx.AsyncClient, seed: int = 0, username_prefix: str = "bench"):
+        self.client = client
+        self.username_prefix = username_prefix
+        self.rng = random.Random(seed)
+        self.users: list[VirtualUser] = []
+        self.map_ids: list[str] = []
+        self.buildings_per_map = 0
+
+    async def populate(self, users: int, maps_per_user: int, buildings_per_map: int) -> None:
+        self.buildings_per_map = buildings_per_map
+        for i in range(users):
+            user = await self.register(f"{ self.username_prefix }{ i }")
+            for j in range(maps_per_user):
+                response = await self.create_map(user, f"bench map { i }-{ j }")
+                response.raise_for_status()
+                self.map_ids.append(response.json()["id"])
+
+    async def register(self, username: str) -> VirtualUser:
+        response = await self.client.post(f"{ API_PREFIX }/auth/register", json={
+            "username": username,
+            "email": f"{ username }@example.com",
+            "first_name": "Bench",
+            "last_name": "User",
+            "password": PASSWORD,
+        })
+        response.raise_for_status()
+        user = VirtualUser(username, f"{ username }@example.com", response.cookies[cookie_transport.cookie_name])
+        self.users.append(user)
+        return user
+
+    async def create_map(self, user: VirtualUser, name: str) -> httpx.Response:
+        return await self.client.post(f"{ API_PREFIX }/maps/", headers=user.headers, json={
+            "name": name,
+            "private": False,
+            "data": generate_map_data(self.rng, self.buildings_per_map),
+        })
+
+    def user(self) -> VirtualUser:
+        return self.rng.choice(self.users)
+
+    def map_id(self) -> str:
+        return self.rng.choice(self.map_ids)
+
+
+async def browse(world: World) -> httpx.Response:
+    return await world.client.get(f"{ API_PREFIX }/maps/", headers=world.user().headers)
+
+async def map_load(world: World) -> httpx.Response:
+    return await world.client.get(
+        f"{ API_PREFIX }/maps/{ world.map_id() }", params={ "include_data": True }, headers=world.user().headers
+    )
+
+async def thumbnail(world: World) -> httpx.Response:
+    return await world.client.get(f"{ API_PREFIX }/maps/{ world.map_id() }/thumbnail")
+
+async def avatar(world: World) -> httpx.Response:
+    return await world.client.get(f"{ API_PREFIX }/users/{ world.user().username }/avatar")
+
+async def favorite(world: World) -> httpx.Response:
+    return await world.client.post(
+        f"{ API_PREFIX }/maps/{ world.map_id() }/favorite",
+        json={ "favorited": world.rng.random() < 0.5 },
+        headers=world.user().headers
+    )
+
+async def login(world: World) -> httpx.Response:
+    return await world.client.post(
+        f"{ API_PREFIX }/auth/login", data={ "username": world.user().email, "password": PASSWORD }
+    )
+
+async def create_map(world: World) -> httpx.Response:
+    return await world.create_map(world.user(), "bench map")
+
+
+class Scenario:
+    def __init__(
+        self, name: str, run: typing.Callable[[World], typing.Awaitable[httpx.Response]], request_share: float = 1.0
+    ):
+        self.name = name
+        self.run = run
+        # Fraction of `--requests` to issue, for scenarios that are slow by design (password hashing, large writes).
+        self.request_share = request_share
+
+
+SCENARIOS = { scenario.name: scenario for scenario in [
+    Scenario("browse", browse),
+    Scenario("map-load", map_load),
+    Scenario("thumbnail", thumbnail),
+    Scenario("avatar", avatar),
+    Scenario("favorite", favorite),
+    Scenario("login", login, request_share=0.1),
+    Scenario("create-map", create_map, request_share=0.25),
+] }
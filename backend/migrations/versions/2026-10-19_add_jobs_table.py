@@ -0,0 +1,62 @@
+"""add jobs table
+
+Revision ID: 445796c901e3
+Revises: 3a9e6d2b8c14
+Create Date: 2026-10-19 14:08:12.795349
+
+"""
+from alembic import op
+import sqlalchemy as sa
+import advanced_alchemy
+
+
+# revision identifiers, used by Alembic.
+revision = '445796c901e3'
+down_revision = '3a9e6d2b8c14'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('jobs',
+    sa.Column('queue', sa.String(), nullable=False),
+    sa.Column('kind', sa.String(), nullable=False),
+    sa.Column('payload', sa.JSON(), nullable=False),
+    sa.Column('dedupe_key', sa.String(), nullable=True),
+    sa.Column('status', sa.String(), server_default='queued', nullable=False),
+    sa.Column('attempts', sa.Integer(), server_default='0', nullable=False),
+    sa.Column('max_attempts', sa.Integer(), nullable=False),
+    sa.Column(
+        'run_at', advanced_alchemy.types.datetime.DateTimeUTC(timezone=True),
+        server_default=sa.text('now()'), nullable=False
+    ),
+    sa.Column('started_at', advanced_alchemy.types.datetime.DateTimeUTC(timezone=True), nullable=True),
+    sa.Column('finished_at', advanced_alchemy.types.datetime.DateTimeUTC(timezone=True), nullable=True),
+    sa.Column('last_error', sa.Text(), nullable=True),
+    sa.Column('result', sa.JSON(), nullable=True),
+    sa.Column('user_id', sa.BigInteger().with_variant(sa.Integer(), 'sqlite'), nullable=True),
+    sa.Column('id', advanced_alchemy.types.guid.GUID(length=16), nullable=False),
+    sa.Column('sa_orm_sentinel', sa.Integer(), nullable=True),
+    sa.Column('created_at', advanced_alchemy.types.datetime.DateTimeUTC(timezone=True), nullable=False),
+    sa.Column('updated_at', advanced_alchemy.types.datetime.DateTimeUTC(timezone=True), nullable=False),
+    sa.ForeignKeyConstraint(['user_id'], ['users.id'], name=op.f('fk_jobs_user_id_users'), ondelete='cascade'),
+    sa.PrimaryKeyConstraint('id', name=op.f('pk_jobs'))
+    )
+    op.create_index(
+        'ix_jobs_dedupe_key', 'jobs', ['dedupe_key'], unique=True,
+        postgresql_where=sa.text("status IN ('queued', 'running')")
+    )
+    op.create_index(
+        'ix_jobs_queue_run_at', 'jobs', ['queue', 'run_at'], unique=False,
+        postgresql_where=sa.text("status IN ('queued', 'running')")
+    )
+
+
+def downgrade():
+    op.drop_index(
+        'ix_jobs_queue_run_at', table_name='jobs', postgresql_where=sa.text("status IN ('queued', 'running')")
+    )
+    op.drop_index(
+        'ix_jobs_dedupe_key', table_name='jobs', postgresql_where=sa.text("status IN ('queued', 'running')")
+    )
+    op.drop_table('jobs')
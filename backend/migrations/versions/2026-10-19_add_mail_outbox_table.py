@@ -0,0 +1,48 @@
+"""add mail outbox table
+
+Revision ID: 7d2e9b4c1a58
+Revises: c41d9a7e60f3
+Create Date: 2026-10-19 15:02:17.640931
+
+"""
+from alembic import op
+import sqlalchemy as sa
+import advanced_alchemy
+
+
+# revision identifiers, used by Alembic.
+revision = '7d2e9b4c1a58'
+down_revision = 'c41d9a7e60f3'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('mail_outbox',
+    sa.Column('recipient', sa.String(length=320), nullable=False),
+    sa.Column('subject', sa.String(), nullable=False),
+    sa.Column('body', sa.Text(), nullable=False),
+    sa.Column('subtype', sa.String(), server_default='html', nullable=False),
+    sa.Column('attempts', sa.Integer(), server_default='0', nullable=False),
+    sa.Column(
+        'next_attempt_at', advanced_alchemy.types.datetime.DateTimeUTC(timezone=True),
+        server_default=sa.text('now()'), nullable=False
+    ),
+    sa.Column('sent_at', advanced_alchemy.types.datetime.DateTimeUTC(timezone=True), nullable=True),
+    sa.Column('last_error', sa.Text(), nullable=True),
+    sa.Column('id', sa.BigInteger().with_variant(sa.Integer(), 'sqlite'), nullable=False),
+    sa.Column('created_at', advanced_alchemy.types.datetime.DateTimeUTC(timezone=True), nullable=False),
+    sa.Column('updated_at', advanced_alchemy.types.datetime.DateTimeUTC(timezone=True), nullable=False),
+    sa.PrimaryKeyConstraint('id', name=op.f('pk_mail_outbox'))
+    )
+    op.create_index(
+        'ix_mail_outbox_next_attempt_at', 'mail_outbox', ['next_attempt_at'], unique=False,
+        postgresql_where=sa.text('sent_at IS NULL')
+    )
+
+
+def downgrade():
+    op.drop_index(
+        'ix_mail_outbox_next_attempt_at', table_name='mail_outbox', postgresql_where=sa.text('sent_at IS NULL')
+    )
+    op.drop_table('mail_outbox')
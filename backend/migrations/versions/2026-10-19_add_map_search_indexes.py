@@ -0,0 +1,37 @@
+"""add map search indexes
+
+Revision ID: c41d9a7e60f3
+Revises: 5a6e0d7c2b91
+Create Date: 2026-10-19 13:26:55.118402
+
+"""
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = 'c41d9a7e60f3'
+down_revision = '5a6e0d7c2b91'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+    op.create_index(
+        'ix_maps_name_trgm', 'maps', ['name'], unique=False,
+        postgresql_using='gin', postgresql_ops={'name': 'gin_trgm_ops'}
+    )
+    op.create_index(
+        'ix_users_username_trgm', 'users', ['username'], unique=False,
+        postgresql_using='gin', postgresql_ops={'username': 'gin_trgm_ops'}
+    )
+
+
+def downgrade():
+    op.drop_index(
+        'ix_users_username_trgm', table_name='users',
+        postgresql_using='gin', postgresql_ops={'username': 'gin_trgm_ops'}
+    )
+    op.drop_index(
+        'ix_maps_name_trgm', table_name='maps', postgresql_using='gin', postgresql_ops={'name': 'gin_trgm_ops'}
+    )
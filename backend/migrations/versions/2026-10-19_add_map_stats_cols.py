@@ -0,0 +1,154 @@
+"""add map stats cols
+
+Revision ID: 3b8f1e6a9c27
+Revises: 7d2e9b4c1a58
+Create Date: 2026-10-19 16:40:51.208377
+
+"""
+import itertools
+import math
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '3b8f1e6a9c27'
+down_revision = '7d2e9b4c1a58'
+branch_labels = None
+depends_on = None
+
+STATS_COLUMNS = [
+    ('building_count', sa.Integer()),
+    ('building_height_min', sa.Float()),
+    ('building_height_max', sa.Float()),
+    ('road_length', sa.Float()),
+    ('park_area', sa.Float()),
+    ('bbox_min_x', sa.Float()),
+    ('bbox_min_y', sa.Float()),
+    ('bbox_max_x', sa.Float()),
+    ('bbox_max_y', sa.Float()),
+]
+BACKFILL_BATCH_SIZE = 200
+
+# The map data layers and the stats computed from them as they were at this revision. They're copied rather than
+# imported from app.map_data, so the backfill gives the same results however that module changes later.
+ROAD_LAYERS = ('mainRoads', 'majorRoads', 'minorRoads', 'coastalRoads')
+PARK_LAYERS = ('bigParks', 'smallParks')
+WATER_LAYERS = ('sea', 'river')
+LAYERS = (*ROAD_LAYERS, *PARK_LAYERS, 'buildings', *WATER_LAYERS)
+
+
+class InvalidMapData(Exception):
+    pass
+
+
+def points_of(feature):
+    if not isinstance(feature, list): raise InvalidMapData
+    points = []
+    for point in feature:
+        try:
+            x, y = point['x'], point['y']
+        except (TypeError, KeyError):
+            raise InvalidMapData from None
+        points.append((number(x), number(y)))
+    return points
+
+
+def number(value):
+    if isinstance(value, bool) or not isinstance(value, (int, float)) or not math.isfinite(value): raise InvalidMapData
+    return float(value)
+
+
+def ring_area(points):
+    return abs(sum(x0 * y1 - x1 * y0 for (x0, y0), (x1, y1) in zip(points, points[1:] + points[:1], strict=True))) / 2
+
+
+def distinct_ring_points(points):
+    return len(points) - (len(points) > 0 and points[0] == points[-1])
+
+
+def map_stats(data):
+    """ A map's stats from its data, as app.map_data computed them at this revision; raises InvalidMapData. """
+    if not isinstance(data, dict) or set(data) != set(LAYERS): raise InvalidMapData
+    features = {}
+    for name in (*ROAD_LAYERS, *PARK_LAYERS):
+        if not isinstance(data[name], list): raise InvalidMapData
+        features[name] = [points_of(feature) for feature in data[name]]
+    buildings = data['buildings']
+    if not isinstance(buildings, list) or not all(isinstance(building, dict) for building in buildings):
+        raise InvalidMapData
+    features['buildings'] = [points_of(building.get('data')) for building in buildings]
+    for name in WATER_LAYERS:
+        features[name] = [points_of(data[name])]
+
+    heights = [number(building.get('height')) for building in buildings]
+    for name in ROAD_LAYERS:
+        if any(len(road) < 2 for road in features[name]): raise InvalidMapData
+    for name in (*PARK_LAYERS, 'buildings', *WATER_LAYERS):
+        # A map may have no sea or river, which is sent as an empty polygon.
+        rings = [ring for ring in features[name] if ring or name not in WATER_LAYERS]
+        if any(distinct_ring_points(ring) < 3 for ring in rings): raise InvalidMapData
+    areas = { name: [ring_area(ring) for ring in features[name]] for name in (*PARK_LAYERS, 'buildings') }
+    if any(area == 0 for layer_areas in areas.values() for area in layer_areas): raise InvalidMapData
+
+    points = [point for layer in features.values() for feature in layer for point in feature]
+    xs, ys = [x for x, _ in points], [y for _, y in points]
+    return {
+        'building_count': len(heights),
+        'building_height_min': min(heights) if heights else None,
+        'building_height_max': max(heights) if heights else None,
+        'road_length': sum(
+            math.dist(a, b) for name in ROAD_LAYERS for road in features[name] for a, b in itertools.pairwise(road)
+        ),
+        'park_area': sum(sum(areas[name]) for name in PARK_LAYERS),
+        'bbox_min_x': min(xs) if points else None,
+        'bbox_min_y': min(ys) if points else None,
+        'bbox_max_x': max(xs) if points else None,
+        'bbox_max_y': max(ys) if points else None,
+    }
+
+
+def upgrade():
+    # ### commands auto generated by Alembic - please adjust! ###
+    for name, type_ in STATS_COLUMNS:
+        op.add_column('maps', sa.Column(name, type_, nullable=True))
+    # ### end Alembic commands ###
+
+    # Backfill existing maps. Ones whose data doesn't pass validation keep NULL stats rather than failing the upgrade.
+    maps = sa.table(
+        'maps',
+        sa.column('id', sa.Uuid()),
+        sa.column('data', sa.JSON()),
+        *(sa.column(name) for name, _ in STATS_COLUMNS),
+    )
+    bind = op.get_bind()
+    last_id = None
+    while True:
+        statement = sa.select(maps.c.id, maps.c.data).order_by(maps.c.id).limit(BACKFILL_BATCH_SIZE)
+        if last_id is not None: statement = statement.where(maps.c.id > last_id)
+        rows = bind.execute(statement).all()
+        if not rows: break
+        last_id = rows[-1].id
+
+        updates = []
+        for row in rows:
+            try:
+                stats = map_stats(row.data)
+            except InvalidMapData:
+                continue
+            updates.append({ 'map_id': row.id, **{ f'new_{ name }': value for name, value in stats.items() } })
+        if updates:
+            bind.execute(
+                maps.update()
+                .where(maps.c.id == sa.bindparam('map_id'))
+                .values({ name: sa.bindparam(f'new_{ name }') for name, _ in STATS_COLUMNS }),
+                updates
+            )
+
+
+def downgrade():
+    # ### commands auto generated by Alembic - please adjust! ###
+    for name, _ in reversed(STATS_COLUMNS):
+        op.drop_column('maps', name)
+    # ### end Alembic commands ###
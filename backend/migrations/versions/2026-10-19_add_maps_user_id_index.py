@@ -0,0 +1,23 @@
+"""add maps user id index
+
+Revision ID: fa0f22e246e6
+Revises: b6dd572305c6
+Create Date: 2026-10-19 14:44:46.833367
+
+"""
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = 'fa0f22e246e6'
+down_revision = 'b6dd572305c6'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_index('ix_maps_user_id', 'maps', ['user_id'], unique=False)
+
+
+def downgrade():
+    op.drop_index('ix_maps_user_id', table_name='maps')
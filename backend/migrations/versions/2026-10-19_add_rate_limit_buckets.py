@@ -0,0 +1,34 @@
+"""add rate limit buckets
+
+Revision ID: b6dd572305c6
+Revises: 445796c901e3
+Create Date: 2026-10-19 14:15:19.659959
+
+"""
+from alembic import op
+import sqlalchemy as sa
+import advanced_alchemy
+
+
+# revision identifiers, used by Alembic.
+revision = 'b6dd572305c6'
+down_revision = '445796c901e3'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('rate_limit_buckets',
+    sa.Column('key', sa.String(), nullable=False),
+    sa.Column('tokens', sa.Float(), nullable=False),
+    sa.Column(
+        'updated_at', advanced_alchemy.types.datetime.DateTimeUTC(timezone=True),
+        server_default=sa.text('now()'), nullable=False
+    ),
+    sa.PrimaryKeyConstraint('key', name=op.f('pk_rate_limit_buckets')),
+    prefixes=['UNLOGGED']
+    )
+
+
+def downgrade():
+    op.drop_table('rate_limit_buckets')
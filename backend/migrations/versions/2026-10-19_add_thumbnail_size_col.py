@@ -0,0 +1,32 @@
+"""add thumbnail size col
+
+Revision ID: 3a9e6d2b8c14
+Revises: 5c1d8f3a7b42
+Create Date: 2026-10-19 19:24:51.318027
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '3a9e6d2b8c14'
+down_revision = '5c1d8f3a7b42'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column('thumbnails', sa.Column('size', sa.Integer(), nullable=True))
+    # Thumbnails are now stored one per map, so only the latest of any duplicates is kept
+    op.execute("""
+        DELETE FROM thumbnails a
+        USING thumbnails b
+        WHERE a.map_id = b.map_id AND (a.created_at, a.id) < (b.created_at, b.id)
+    """)
+    op.create_unique_constraint(op.f('uq_thumbnails_map_id'), 'thumbnails', ['map_id'])
+
+
+def downgrade():
+    op.drop_constraint(op.f('uq_thumbnails_map_id'), 'thumbnails', type_='unique')
+    op.drop_column('thumbnails', 'size')
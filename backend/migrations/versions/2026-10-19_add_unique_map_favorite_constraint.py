@@ -0,0 +1,29 @@
+"""add unique map favorite constraint
+
+Revision ID: 8f3b2c1d9e4a
+Revises: 2c2a15b67078
+Create Date: 2026-10-19 10:12:41.204518
+
+"""
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = '8f3b2c1d9e4a'
+down_revision = '2c2a15b67078'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Collapse any duplicate favorites created by concurrent toggles before enforcing uniqueness
+    op.execute("""
+        DELETE FROM map_favorites a
+        USING map_favorites b
+        WHERE a.user_id = b.user_id AND a.map_id = b.map_id AND a.id > b.id
+    """)
+    op.create_unique_constraint(op.f('uq_map_favorites_user_id'), 'map_favorites', ['user_id', 'map_id'])
+
+
+def downgrade():
+    op.drop_constraint(op.f('uq_map_favorites_user_id'), 'map_favorites', type_='unique')
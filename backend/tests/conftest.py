@@ -1,36 +1,97 @@
+import contextlib
 import typing
 
-import modern_di_fastapi
 import pytest
 from httpx import ASGITransport, AsyncClient
-from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy import update
 
-from app import ioc
 from app.application import application
+from app.db import AsyncSessionFactory
+from app.metrics import RequestStats, current_request_stats
+from app.process_pool import process_pool
+from app.models import UserModel
+from app.settings import settings
+from tests import factories
+
+
+@pytest.fixture(autouse=True)
+def offline_avatars(monkeypatch: pytest.MonkeyPatch) -> None:
+    monkeypatch.setattr(settings, "random_avatars_enabled", False)
+
+
+@pytest.fixture(autouse=True)
+def export_cache_dir(monkeypatch: pytest.MonkeyPatch, tmp_path: typing.Any) -> None:
+    monkeypatch.setattr(settings, "export_cache_dir", str(tmp_path / "exports"))
+
+
+@pytest.fixture(autouse=True)
+def small_thumbnails(monkeypatch: pytest.MonkeyPatch) -> None:
+    # Every map created is drawn a thumbnail; small ones keep that cheap.
+    monkeypatch.setattr(settings, "thumbnail_size", 32)
+
+
+@pytest.fixture(autouse=True)
+def no_rate_limits(monkeypatch: pytest.MonkeyPatch) -> None:
+    # Tests register and create far faster than any client should, all from one address.
+    monkeypatch.setattr(settings, "rate_limits_enabled", False)
+
+
+@pytest.fixture(autouse=True)
+def threaded_process_pool(monkeypatch: pytest.MonkeyPatch) -> None:
+    # Spawning worker processes for every test's app would cost far more than the little work tests give them.
+    monkeypatch.setattr(process_pool, "workers", 0)
+
+
+def new_client() -> AsyncClient:
+    # Auth cookies are marked secure outside of dev.
+    return AsyncClient(transport=ASGITransport(app=application), base_url="https://test")
 
 
 @pytest.fixture
 async def client() -> typing.AsyncIterator[AsyncClient]:
-    async with AsyncClient(
-        transport=ASGITransport(app=application),
-        base_url="http://test",
-    ) as client:
+    async with application.router.lifespan_context(application), new_client() as client:
         yield client
 
 
-@pytest.fixture(autouse=True)
-async def db_session() -> typing.AsyncIterator[AsyncSession]:
-    async with modern_di_fastapi.fetch_di_container(application) as di_container:
-        engine = await ioc.Dependencies.database_engine.async_resolve(di_container)
-        connection = await engine.connect()
-        transaction = await connection.begin()
-        await connection.begin_nested()
-        ioc.Dependencies.database_engine.override(connection, di_container)
-
-        try:
-            yield AsyncSession(connection, expire_on_commit=False, autoflush=False)
-        finally:
-            if connection.in_transaction():
-                await transaction.rollback()
-            await connection.close()
-            await engine.dispose()
+async def register(client: AsyncClient) -> dict[str, typing.Any]:
+    """ Register a fresh user; `client` stays logged in as them. """
+    response = await client.post("/api/v1/auth/register", json=factories.UserCreateSchemaFactory.build().model_dump())
+    assert response.status_code == 201
+    return response.json()
+
+
+@pytest.fixture
+async def user(client: AsyncClient) -> dict[str, typing.Any]:
+    return await register(client)
+
+
+@pytest.fixture
+async def other_client(client: AsyncClient) -> typing.AsyncIterator[AsyncClient]:
+    """ A second client, logged in as a different user, against the app `client` started. """
+    async with new_client() as other_client:
+        await register(other_client)
+        yield other_client
+
+
+async def make_superuser(user: dict[str, typing.Any]) -> None:
+    async with AsyncSessionFactory() as session:
+        await session.execute(update(UserModel).where(UserModel.id == user["id"]).values(is_superuser=True))
+        await session.commit()
+
+
+async def create_map(client: AsyncClient, **kwargs: typing.Any) -> dict[str, typing.Any]:
+    body = factories.MapCreateBodySchemaFactory.build(**kwargs).model_dump()
+    response = await client.post("/api/v1/maps/", json=body)
+    assert response.status_code == 200
+    return response.json()
+
+
+@contextlib.contextmanager
+def count_queries() -> typing.Iterator[RequestStats]:
+    """ Count the SQL statements issued by requests made inside the block. """
+    stats = RequestStats()
+    token = current_request_stats.set(stats)
+    try:
+        yield stats
+    finally:
+        current_request_stats.reset(token)
@@ -1,18 +1,21 @@
-from polyfactory.factories.pydantic_factory import ModelFactory
-from polyfactory.factories.sqlalchemy_factory import SQLAlchemyFactory
-
-from app import models, schemas
+import random
+import uuid
 
+from polyfactory import Use
+from polyfactory.factories.pydantic_factory import ModelFactory
 
-class DeckModelFactory(SQLAlchemyFactory[models.Deck]):
-    __model__ = models.Deck
-    id = None
+from app import schemas
+from app.seed import generate_map_data
 
 
-class CardModelFactory(SQLAlchemyFactory[models.Card]):
-    __model__ = models.Card
-    id = None
+class UserCreateSchemaFactory(ModelFactory[schemas.UserCreate]):
+    __model__ = schemas.UserCreate
+    username = Use(lambda: uuid.uuid4().hex[:12])
+    email = Use(lambda: f"{ uuid.uuid4().hex[:12] }@example.com")
+    password = "password"
 
 
-class CardCreateSchemaFactory(ModelFactory[schemas.CardCreate]):
-    __model__ = schemas.CardCreate
+class MapCreateBodySchemaFactory(ModelFactory[schemas.MapCreateBody]):
+    __model__ = schemas.MapCreateBody
+    private = False
+    data = Use(lambda: generate_map_data(random.Random(0), buildings=5))
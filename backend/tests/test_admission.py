@@ -0,0 +1,158 @@
+import asyncio
+import random
+import typing
+import uuid
+
+import pytest
+from fastapi import status
+from httpx import ASGITransport, AsyncClient
+
+from app.application import application
+from app.admission import DatabaseRateLimiter, MemoryRateLimiter, admission
+from app.settings import AdmissionLimits, RateLimitBackend, settings
+from tests import factories
+from tests.conftest import register
+
+
+@pytest.fixture
+def rate_limits(monkeypatch: pytest.MonkeyPatch) -> dict[str, AdmissionLimits]:
+    limits = {
+        "map_create": AdmissionLimits(rate_per_minute=1, burst=2, concurrency=4),
+        "avatar": AdmissionLimits(rate_per_minute=1, burst=2, concurrency=1),
+        "auth": AdmissionLimits(rate_per_minute=1, burst=2, concurrency=4),
+    }
+    monkeypatch.setattr(settings, "rate_limits_enabled", True)
+    monkeypatch.setattr(settings, "admission_limits", limits)
+    monkeypatch.setattr(settings, "admission_queue_timeout_seconds", 0.05)
+    return limits
+
+
+def client_from(address: str) -> AsyncClient:
+    """ A client whose requests come from the given address. """
+    return AsyncClient(transport=ASGITransport(app=application, client=(address, 1234)), base_url="https://test")
+
+
+@pytest.mark.parametrize("limiter", [MemoryRateLimiter, DatabaseRateLimiter])
+async def test_buckets_allow_a_burst_then_refill(client: AsyncClient, limiter: typing.Any) -> None:
+    rate_limiter = limiter()
+    key = f"test:{ uuid.uuid4() }"
+
+    assert await rate_limiter.take(key, 1 / 60, 2) == 0
+    assert await rate_limiter.take(key, 1 / 60, 2) == 0
+    wait = await rate_limiter.take(key, 1 / 60, 2)
+    assert 55 < wait <= 60
+    # Other clients have buckets of their own.
+    assert await rate_limiter.take(f"{ key }:other", 1 / 60, 2) == 0
+    # Refilled almost at once
+    await asyncio.sleep(0.01)
+    assert await rate_limiter.take(key, 1000, 2) == 0
+
+
+@pytest.mark.parametrize("backend", list(RateLimitBackend))
+async def test_addresses_over_their_rate_are_turned_away(
+    client: AsyncClient,
+    rate_limits: dict[str, AdmissionLimits],
+    monkeypatch: pytest.MonkeyPatch,
+    backend: RateLimitBackend,
+) -> None:
+    monkeypatch.setattr(settings, "rate_limit_backend", backend)
+    # An address of its own, as buckets in the database outlive the test
+    address = ".".join(str(random.randrange(1, 255)) for _ in range(4))
+
+    async with client_from(address) as limited:
+        await register(limited)
+        await register(limited)
+        response = await limited.post(
+            "/api/v1/auth/register", json=factories.UserCreateSchemaFactory.build().model_dump()
+        )
+        assert response.status_code == status.HTTP_429_TOO_MANY_REQUESTS
+        assert int(response.headers["Retry-After"]) > 0
+        # Login shares the limit.
+        response = await limited.post("/api/v1/auth/login", data={"username": "nobody@example.com", "password": "x"})
+        assert response.status_code == status.HTTP_429_TOO_MANY_REQUESTS
+
+    # Other addresses aren't held up.
+    await register(client)
+
+
+async def test_clients_behind_trusted_proxies_are_limited_each(
+    client: AsyncClient, rate_limits: dict[str, AdmissionLimits], monkeypatch: pytest.MonkeyPatch
+) -> None:
+    proxy = "10.1.2.3"
+    monkeypatch.setattr(settings, "trusted_proxies", ["10.0.0.0/8"])
+
+    async def login(forwarded_for: str) -> int:
+        response = await proxied.post(
+            "/api/v1/auth/login",
+            data={"username": "nobody@example.com", "password": "x"},
+            headers={"X-Forwarded-For": forwarded_for},
+        )
+        return response.status_code
+
+    async with client_from(proxy) as proxied:
+        # A client's own claims before the address the proxy saw don't get it a fresh bucket.
+        assert await login("192.0.2.1") != status.HTTP_429_TOO_MANY_REQUESTS
+        assert await login("198.51.100.7, 192.0.2.1") != status.HTTP_429_TOO_MANY_REQUESTS
+        assert await login("203.0.113.9, 192.0.2.1, 10.9.9.9") == status.HTTP_429_TOO_MANY_REQUESTS
+        # Another client through the same proxy isn't held up.
+        assert await login("192.0.2.2") != status.HTTP_429_TOO_MANY_REQUESTS
+
+    # From an address that isn't a proxy, X-Forwarded-For is the client's to make up, and ignored.
+    address = "192.0.2.50"
+    async with client_from(address) as proxied:
+        assert await login("192.0.2.101") != status.HTTP_429_TOO_MANY_REQUESTS
+        assert await login("192.0.2.102") != status.HTTP_429_TOO_MANY_REQUESTS
+        assert await login("192.0.2.103") == status.HTTP_429_TOO_MANY_REQUESTS
+
+
+async def test_signed_in_users_are_limited_each(
+    client: AsyncClient, user: dict[str, typing.Any], other_client: AsyncClient, rate_limits: dict[str, AdmissionLimits]
+) -> None:
+    path = f"/api/v1/users/{ user['username'] }/avatar/random"
+    assert (await client.put(path)).status_code == status.HTTP_201_CREATED
+    assert (await client.put(path)).status_code == status.HTTP_201_CREATED
+
+    response = await client.put(path)
+    assert response.status_code == status.HTTP_429_TOO_MANY_REQUESTS
+    assert response.json()["detail"] == "SYSTEM__RATE_LIMITED"
+    assert 55 < int(response.headers["Retry-After"]) <= 60
+
+    other = (await other_client.get("/api/v1/users/self")).json()
+    response = await other_client.put(f"/api/v1/users/{ other['username'] }/avatar/random")
+    assert response.status_code == status.HTTP_201_CREATED
+
+
+async def test_endpoint_classes_at_capacity_shed_load(
+    client: AsyncClient, user: dict[str, typing.Any], rate_limits: dict[str, AdmissionLimits]
+) -> None:
+    async with admission.admit("avatar", "someone else"):
+        response = await client.put(f"/api/v1/users/{ user['username'] }/avatar/random")
+        assert response.status_code == status.HTTP_503_SERVICE_UNAVAILABLE
+        assert response.json()["detail"] == "SYSTEM__OVERLOADED"
+        assert response.headers["Retry-After"] == "1"
+        # Cheap endpoints carry on regardless.
+        assert (await client.get("/api/v1/maps/")).status_code == status.HTTP_200_OK
+
+    response = await client.put(f"/api/v1/users/{ user['username'] }/avatar/random")
+    assert response.status_code == status.HTTP_201_CREATED
+
+
+@pytest.mark.parametrize(
+    ("backend", "limits"),
+    [
+        (RateLimitBackend.MEMORY, AdmissionLimits(rate_per_minute=0.25, burst=1, concurrency=2)),
+        (RateLimitBackend.DATABASE, AdmissionLimits(rate_per_minute=1, burst=5, concurrency=2)),
+    ],
+)
+def test_workers_share_the_limits(
+    monkeypatch: pytest.MonkeyPatch, backend: RateLimitBackend, limits: AdmissionLimits
+) -> None:
+    monkeypatch.setattr(settings, "admission_limits", {
+        "map_create": AdmissionLimits(rate_per_minute=1, burst=5, concurrency=9),
+    })
+    monkeypatch.setattr(settings, "rate_limit_backend", backend)
+    monkeypatch.setattr(settings, "server_workers", 4)
+    # Buckets in the database are every worker's, so only ones in memory are split.
+    assert admission.limits("map_create") == limits
+    monkeypatch.setattr(settings, "server_workers", None)
+    assert admission.limits("map_create") == settings.admission_limits["map_create"]
@@ -0,0 +1,45 @@
+import uuid
+
+from httpx import AsyncClient
+
+from benchmarks.harness import Baseline, ScenarioResult, compare, percentile, run_scenario
+from benchmarks.scenarios import SCENARIOS, World
+
+
+def result(
+    scenario: str = "browse", p95_ms: float = 10.0, p99_ms: float = 12.0, throughput: float = 100.0
+) -> ScenarioResult:
+    return ScenarioResult(
+        scenario=scenario, requests=100, errors=0, seconds=1.0, throughput=throughput,
+        mean_ms=5.0, p50_ms=5.0, p95_ms=p95_ms, p99_ms=p99_ms, max_ms=40.0,
+    )
+
+
+def test_percentile() -> None:
+    values = [float(v) for v in range(1, 101)]
+    assert percentile(values, 50) == 50.0
+    assert percentile(values, 99) == 99.0
+    assert percentile([], 50) == 0.0
+
+
+def test_compare_flags_regressions_past_tolerance() -> None:
+    baseline = Baseline(target="inprocess", config={}, results={"browse": result()})
+
+    assert compare(baseline, [result(p95_ms=12.0, throughput=90.0)], tolerance=0.25) == []
+    # p99 is too noisy to gate on.
+    assert compare(baseline, [result(p99_ms=30.0)], tolerance=0.25) == []
+    # Slower by more than the tolerance, but by less than the noise floor in absolute terms.
+    assert compare(baseline, [result(p95_ms=11.9)], tolerance=0.05, min_latency_delta_ms=2.0) == []
+
+    regressions = compare(baseline, [result(p95_ms=20.0, throughput=50.0)], tolerance=0.25)
+    assert {regression.metric for regression in regressions} == {"p95_ms", "throughput"}
+
+
+async def test_scenarios_run_without_errors(client: AsyncClient) -> None:
+    # The test database isn't emptied between runs like the benchmark's is.
+    world = World(client, seed=1, username_prefix=uuid.uuid4().hex[:8])
+    await world.populate(users=1, maps_per_user=2, buildings_per_map=10)
+
+    for scenario in SCENARIOS.values():
+        outcome = await run_scenario(scenario.name, lambda: scenario.run(world), requests=2, concurrency=2)
+        assert outcome.errors == 0, scenario.name
@@ -0,0 +1,140 @@
+import asyncio
+import io
+import os
+import struct
+import time
+import typing
+import zipfile
+from pathlib import Path
+
+import numpy as np
+import pytest
+from fastapi import status
+from httpx import AsyncClient
+from sqlalchemy import delete
+
+from app import export_cache
+from app.db import AsyncSessionFactory
+from app.export import EXPORT_PARTS, cap_triangles, check_map_data_json, extrude, open_rings, to_stl
+from app.map_data import Layer
+from app.models import MapLayerModel
+from app.settings import settings
+from tests.conftest import create_map
+
+# An L shape, so its caps have to be ear clipped rather than fanned
+L_SHAPE = np.array([(0, 0), (120, 0), (120, 40), (40, 40), (40, 120), (0, 120), (0, 0)], dtype=np.float64)
+
+
+def mesh_volume(positions: np.ndarray, triangles: np.ndarray) -> float:
+    a, b, c = (positions[triangles[:, i]] for i in range(3))
+    return float(np.einsum("ij,ij->i", a, np.cross(b, c)).sum() / 6)
+
+
+@pytest.mark.parametrize("ring", [L_SHAPE, L_SHAPE[::-1]], ids=["counterclockwise", "clockwise"])
+def test_extrude_is_closed(ring: np.ndarray) -> None:
+    mesh = extrude(Layer(ring, np.array([0, len(ring)])), 10)
+    # Every edge of a closed mesh is shared by exactly one other triangle, running the other way.
+    edges = np.concatenate([mesh.triangles[:, [0, 1]], mesh.triangles[:, [1, 2]], mesh.triangles[:, [2, 0]]])
+    assert len({ tuple(edge) for edge in edges }) == len(edges)
+    assert { tuple(edge) for edge in edges } == { tuple(edge) for edge in edges[:, ::-1] }
+    assert mesh_volume(mesh.positions, mesh.triangles) == pytest.approx((120 * 120 - 80 * 80) * 10)
+
+
+def test_extrude_drops_degenerate_rings() -> None:
+    layer = Layer(
+        np.array([(0, 0), (1, 1), (0, 0), (10, 0), (10, 10), (0, 10)], dtype=np.float64), np.array([0, 2, 6])
+    )
+    assert len(open_rings(layer)[0].starts) == 1
+    mesh = extrude(layer, np.array([5.0, 2.0]))
+    assert mesh.positions[:, 2].max() == 2
+    assert len(cap_triangles(open_rings(layer)[0])) == 2
+
+
+def test_to_stl() -> None:
+    mesh = extrude(Layer(L_SHAPE, np.array([0, len(L_SHAPE)])), 10)
+    data = to_stl(mesh, "buildings")
+    (count,) = struct.unpack_from("<I", data, 80)
+    assert count == len(mesh.triangles)
+    assert len(data) == 84 + 50 * count
+
+
+@pytest.mark.parametrize("format, magic", [("stl", b"citygen"), ("glb", b"glTF")])
+async def test_export_map(client: AsyncClient, user: dict[str, typing.Any], format: str, magic: bytes) -> None:
+    map_ = await create_map(client)
+    url = f"/api/v1/maps/{ map_['id'] }/export"
+
+    built = await client.get(url, params={"format": format})
+    assert built.status_code == status.HTTP_200_OK
+    assert built.headers["content-type"] == "application/zip"
+    assert "attachment" in built.headers["content-disposition"]
+    with zipfile.ZipFile(io.BytesIO(built.content)) as archive:
+        names = archive.namelist()
+        assert names[0] == "README.txt"
+        assert set(names[1:]) <= { f"model/{ part }.{ format }" for part in EXPORT_PARTS }
+        assert f"model/buildings.{ format }" in names
+        assert archive.read(f"model/buildings.{ format }").startswith(magic)
+
+    cached = await client.get(url, params={"format": format})
+    assert cached.status_code == status.HTTP_200_OK
+    assert cached.content == built.content
+    assert "content-length" in cached.headers
+
+
+async def test_export_private_map(client: AsyncClient, user: dict[str, typing.Any], other_client: AsyncClient) -> None:
+    private_map = await create_map(client, private=True)
+    response = await other_client.get(f"/api/v1/maps/{ private_map['id'] }/export")
+    assert response.status_code == status.HTTP_401_UNAUTHORIZED
+
+
+async def test_concurrent_exports_share_a_build(
+    client: AsyncClient, user: dict[str, typing.Any], monkeypatch: pytest.MonkeyPatch
+) -> None:
+    map_ = await create_map(client)
+    checks = []
+
+    def slow_check(data_json: str) -> None:
+        # Slow enough that every request arrives while the first build is still going.
+        checks.append(data_json)
+        time.sleep(0.2)
+        check_map_data_json(data_json)
+
+    monkeypatch.setattr(export_cache, "check_map_data_json", slow_check)
+    responses = await asyncio.gather(*(client.get(f"/api/v1/maps/{ map_['id'] }/export") for _ in range(3)))
+    assert [response.status_code for response in responses] == [status.HTTP_200_OK] * 3
+    assert len({ response.content for response in responses }) == 1
+    assert len(checks) == 1
+
+
+async def test_export_invalid_map(client: AsyncClient, user: dict[str, typing.Any]) -> None:
+    map_ = await create_map(client)
+    # Maps stored before their data was checked as it is now
+    async with AsyncSessionFactory() as session:
+        await session.execute(
+            delete(MapLayerModel).where(MapLayerModel.map_id == map_["id"], MapLayerModel.name == "buildings")
+        )
+        await session.commit()
+
+    response = await client.get(f"/api/v1/maps/{ map_['id'] }/export")
+    assert response.status_code == status.HTTP_422_UNPROCESSABLE_ENTITY
+    assert response.json()["detail"] == "MAP__DATA_INVALID"
+    assert not list(Path(settings.export_cache_dir).iterdir())
+
+
+async def test_export_cache_evicts_least_recently_used(
+    client: AsyncClient, user: dict[str, typing.Any], monkeypatch: pytest.MonkeyPatch
+) -> None:
+    maps = [await create_map(client) for _ in range(3)]
+    paths = []
+    for map_ in maps:
+        assert (await client.get(f"/api/v1/maps/{ map_['id'] }/export")).status_code == status.HTTP_200_OK
+        (path,) = Path(settings.export_cache_dir).glob(f"{ map_['id'] }-*.zip")
+        paths.append(path)
+    for age, path in enumerate(paths):
+        os.utime(path, (age, age))
+    # Asking for the oldest export again makes it the most recently used.
+    cached = await client.get(f"/api/v1/maps/{ maps[0]['id'] }/export")
+    assert "content-length" in cached.headers
+
+    monkeypatch.setattr(settings, "export_cache_max_bytes", paths[0].stat().st_size + paths[2].stat().st_size)
+    export_cache.evict_exports(paths[2])
+    assert [path.exists() for path in paths] == [True, False, True]
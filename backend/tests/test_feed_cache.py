@@ -0,0 +1,114 @@
+import asyncio
+import typing
+import uuid
+
+from fastapi import status
+from httpx import AsyncClient
+
+from app.feed_cache import FeedEntry, FeedSnapshotCache
+from tests.conftest import count_queries, create_map, new_client
+
+
+def entry(name: str) -> FeedEntry:
+    return FeedEntry(
+        uuid.uuid4(), 1, f'{{"name":"{ name }"}}'.encode(), f'{{"name":"{ name }","favorited":true}}'.encode()
+    )
+
+
+class CountingBuild:
+    def __init__(self):
+        self.calls = 0
+        self.release = asyncio.Event()
+        self.release.set()
+
+    async def __call__(self, key: str) -> list[FeedEntry]:
+        self.calls += 1
+        await self.release.wait()
+        return [entry(f"{ key } { self.calls }")]
+
+
+async def test_anonymous_feed_is_served_from_a_precompressed_snapshot(
+    client: AsyncClient, user: dict[str, typing.Any]
+) -> None:
+    map_ = await create_map(client)
+
+    async with new_client() as anonymous:
+        response = await anonymous.get("/api/v1/maps/", headers={"Accept-Encoding": "gzip"})
+        assert response.status_code == status.HTTP_200_OK
+        assert response.headers["content-encoding"] == "gzip"
+        assert response.headers["cache-control"].startswith("public")
+        assert map_["id"] in [m["id"] for m in response.json()]
+
+        with count_queries() as stats:
+            cached = await anonymous.get("/api/v1/maps/", headers={"Accept-Encoding": "identity"})
+        assert stats.queries == 0
+        assert "content-encoding" not in cached.headers
+        assert cached.json() == response.json()
+
+        response = await anonymous.get("/api/v1/maps/", headers={"If-None-Match": cached.headers["etag"]})
+        assert response.status_code == status.HTTP_304_NOT_MODIFIED
+
+
+async def test_new_maps_invalidate_the_feed(client: AsyncClient, user: dict[str, typing.Any]) -> None:
+    async with new_client() as anonymous:
+        await anonymous.get("/api/v1/maps/")
+        map_ = await create_map(client)
+        response = await anonymous.get("/api/v1/maps/")
+    assert map_["id"] in [m["id"] for m in response.json()]
+
+
+async def test_signed_in_callers_get_their_favorites_overlaid(
+    client: AsyncClient, user: dict[str, typing.Any], other_client: AsyncClient
+) -> None:
+    own, other = await create_map(client), await create_map(other_client)
+    await client.post(f"/api/v1/maps/{ other['id'] }/favorite", json={"favorited": True})
+
+    response = await client.get("/api/v1/maps/")
+    maps = { m["id"]: m for m in response.json() }
+    assert own["id"] not in maps
+    assert maps[other["id"]]["favorited"] is True
+    assert response.headers["cache-control"].startswith("private")
+
+    response = await client.get("/api/v1/maps/", params={"include_self": True})
+    assert own["id"] in [m["id"] for m in response.json()]
+
+    # The overlay is per caller.
+    response = await other_client.get("/api/v1/maps/", params={"include_self": True})
+    assert next(m for m in response.json() if m["id"] == other["id"])["favorited"] is False
+
+
+async def test_stale_snapshots_are_served_while_a_single_refresh_runs() -> None:
+    build = CountingBuild()
+    cache = FeedSnapshotCache(build, ttl=0, stale_while_revalidate=60)
+
+    first = await cache.get("feed")
+    assert build.calls == 1
+
+    build.release.clear()
+    snapshots = await asyncio.gather(*(cache.get("feed") for _ in range(10)))
+    assert all(snapshot is first for snapshot in snapshots)
+
+    build.release.set()
+    await asyncio.sleep(0)
+    while cache._refreshes: await asyncio.sleep(0.01)
+    assert build.calls == 2
+    assert (await cache.get("feed")) is not first
+    await cache.stop()
+
+
+async def test_invalidated_snapshots_are_not_served() -> None:
+    build = CountingBuild()
+    cache = FeedSnapshotCache(build, ttl=60, stale_while_revalidate=60)
+
+    first = await cache.get("feed")
+    build.release.clear()
+    cache.invalidate("feed")
+    waiters = [asyncio.create_task(cache.get("feed")) for _ in range(10)]
+    await asyncio.sleep(0.01)
+    assert not any(waiter.done() for waiter in waiters)
+
+    build.release.set()
+    snapshots = await asyncio.gather(*waiters)
+    assert build.calls == 2
+    assert all(snapshot is snapshots[0] and snapshot is not first for snapshot in snapshots)
+    await cache.stop()
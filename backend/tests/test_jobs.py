@@ -0,0 +1,236 @@
+import asyncio
+import typing
+import uuid
+from datetime import datetime, timedelta, timezone
+
+import pytest
+from httpx import AsyncClient
+from sqlalchemy import update
+
+from app.db import AsyncSessionFactory
+from app.jobs import JOBS, JobKind, JobRunner, enqueue_job, retry_delay
+from app.models import JobModel
+from app.repositories import JobService
+from app.settings import settings
+from tests import factories
+from tests.conftest import make_superuser, new_client, register
+
+
+@pytest.fixture
+def queue(client: AsyncClient) -> str:
+    """
+    A queue of this test's own, so jobs left over from other tests are never claimed from it, nor its jobs by the app's
+    runner (which is only started for the database).
+    """
+    return f"test-{ uuid.uuid4().hex[:12] }"
+
+
+def runner(queue: str, concurrency: int = 2) -> JobRunner:
+    return JobRunner({ queue: concurrency }, poll_interval=0.05, lease=30, shutdown_timeout=1)
+
+
+def register_kind(monkeypatch: pytest.MonkeyPatch, queue: str, handler: typing.Any) -> str:
+    kind = f"{ queue }.job"
+    monkeypatch.setitem(JOBS, kind, JobKind(queue, handler))
+    return kind
+
+
+async def enqueue(kind: str, payload: dict[str, typing.Any], dedupe_key: str | None = None) -> uuid.UUID:
+    async with AsyncSessionFactory() as session:
+        job_id = await enqueue_job(session, kind, payload, dedupe_key=dedupe_key)
+        await session.commit()
+    return job_id
+
+
+async def get_job(job_id: uuid.UUID) -> JobModel:
+    async with AsyncSessionFactory() as session:
+        return await JobService(session=session).get_job(job_id)
+
+
+def test_retry_delay() -> None:
+    assert retry_delay(1) == timedelta(seconds=settings.jobs_retry_base_seconds)
+    assert retry_delay(2) == timedelta(seconds=settings.jobs_retry_base_seconds * 2)
+    assert retry_delay(100) == timedelta(seconds=settings.jobs_retry_max_seconds)
+
+
+async def test_jobs_are_deduplicated_while_they_may_still_run(monkeypatch: pytest.MonkeyPatch, queue: str) -> None:
+    kind = register_kind(monkeypatch, queue, lambda payload: asyncio.sleep(0, { "n": payload["n"] }))
+    key = f"{ queue }:key"
+
+    first = await enqueue(kind, { "n": 1 }, dedupe_key=key)
+    assert await enqueue(kind, { "n": 2 }, dedupe_key=key) == first
+    assert await enqueue(kind, { "n": 3 }) != first
+
+    assert await runner(queue, concurrency=10).run_pending(queue) == 2
+    assert (await get_job(first)).result == { "n": 1 }
+    # Once done, the same work can be queued again.
+    assert await enqueue(kind, { "n": 4 }, dedupe_key=key) != first
+
+
+async def test_deduplicated_job_finishing_mid_enqueue(monkeypatch: pytest.MonkeyPatch, queue: str) -> None:
+    kind = register_kind(monkeypatch, queue, lambda payload: asyncio.sleep(0, {}))
+    key = f"{ queue }:key"
+    first = await enqueue(kind, {}, dedupe_key=key)
+
+    async with AsyncSessionFactory() as session:
+        scalar = session.scalar
+
+        async def finishing_first_after_insert(
+            statement: typing.Any, *args: typing.Any, **kwargs: typing.Any
+        ) -> typing.Any:
+            result = await scalar(statement, *args, **kwargs)
+            if result is None and statement.is_insert:
+                # The job the insert conflicted with finishes before it's looked up.
+                async with AsyncSessionFactory() as other_session:
+                    await other_session.execute(update(JobModel).where(JobModel.id == first).values(status="succeeded"))
+                    await other_session.commit()
+            return result
+
+        monkeypatch.setattr(session, "scalar", finishing_first_after_insert)
+        job_id = await enqueue_job(session, kind, {}, dedupe_key=key)
+        await session.commit()
+
+    assert job_id is not None and job_id != first
+    assert (await get_job(job_id)).status == "queued"
+
+
+async def test_failed_jobs_are_retried_with_backoff_then_given_up_on(
+    monkeypatch: pytest.MonkeyPatch, queue: str
+) -> None:
+    async def broken(payload: dict[str, typing.Any]) -> None:
+        raise ValueError("broken")
+
+    kind = register_kind(monkeypatch, queue, broken)
+    monkeypatch.setattr(settings, "jobs_max_attempts", 2)
+    job_id = await enqueue(kind, {})
+    jobs = runner(queue)
+
+    assert await jobs.run_pending(queue) == 1
+    failed = await get_job(job_id)
+    assert (failed.status, failed.attempts) == ("queued", 1)
+    assert "broken" in failed.last_error
+    assert failed.run_at > datetime.now(timezone.utc) + timedelta(seconds=settings.jobs_retry_base_seconds / 2)
+
+    # Not due yet, so not retried
+    assert await jobs.run_pending(queue) == 0
+
+    async with AsyncSessionFactory() as session:
+        await session.execute(update(JobModel).where(JobModel.id == job_id).values(run_at=datetime.now(timezone.utc)))
+        await session.commit()
+    assert await jobs.run_pending(queue) == 1
+    given_up = await get_job(job_id)
+    assert (given_up.status, given_up.attempts) == ("failed", 2)
+    assert given_up.finished_at is not None
+
+
+async def test_queues_run_up_to_their_concurrency(monkeypatch: pytest.MonkeyPatch, queue: str) -> None:
+    running = 0
+    most_running = 0
+
+    async def slow(payload: dict[str, typing.Any]) -> None:
+        nonlocal running, most_running
+        running += 1
+        most_running = max(most_running, running)
+        await asyncio.sleep(0.05)
+        running -= 1
+
+    kind = register_kind(monkeypatch, queue, slow)
+    job_ids = [await enqueue(kind, {}) for _ in range(6)]
+    jobs = runner(queue, concurrency=2)
+    jobs.start()
+    try:
+        for _ in range(100):
+            statuses = [(await get_job(job_id)).status for job_id in job_ids]
+            if statuses == ["succeeded"] * len(job_ids): break
+            await asyncio.sleep(0.05)
+    finally:
+        await jobs.stop()
+
+    assert statuses == ["succeeded"] * len(job_ids)
+    assert most_running == 2
+
+
+async def test_jobs_running_at_shutdown_are_handed_back(monkeypatch: pytest.MonkeyPatch, queue: str) -> None:
+    started = asyncio.Event()
+
+    async def endless(payload: dict[str, typing.Any]) -> None:
+        started.set()
+        await asyncio.Event().wait()
+
+    kind = register_kind(monkeypatch, queue, endless)
+    job_id = await enqueue(kind, {})
+    jobs = runner(queue)
+    jobs.start()
+    await asyncio.wait_for(started.wait(), timeout=5)
+    await jobs.stop()
+
+    released = await get_job(job_id)
+    assert (released.status, released.attempts) == ("queued", 0)
+
+
+async def test_taken_over_jobs_are_only_finished_by_their_new_claim(
+    monkeypatch: pytest.MonkeyPatch, queue: str
+) -> None:
+    kind = register_kind(monkeypatch, queue, lambda payload: asyncio.sleep(0))
+    job_id = await enqueue(kind, {})
+
+    async def claim(lease: float) -> int:
+        async with AsyncSessionFactory() as session:
+            (job,) = await JobService(session=session).claim(queue, 1, lease)
+            await session.commit()
+            return job.attempts
+
+    stale = await claim(lease=0)
+    # Its lease has run out, so another worker takes it over.
+    current = await claim(lease=30)
+    assert (stale, current) == (1, 2)
+
+    async with AsyncSessionFactory() as session:
+        job_service = JobService(session=session)
+        await job_service.retry(job_id, stale, datetime.now(timezone.utc), "stale")
+        await job_service.release(job_id, stale)
+        await session.commit()
+    assert (await get_job(job_id)).status == "running"
+
+    async with AsyncSessionFactory() as session:
+        await JobService(session=session).succeed(job_id, current, { "done": True })
+        await session.commit()
+    finished = await get_job(job_id)
+    assert (finished.status, finished.result, finished.attempts) == ("succeeded", { "done": True }, 2)
+
+
+async def test_map_thumbnails_are_drawn_by_a_job(client: AsyncClient, user: dict[str, typing.Any]) -> None:
+    response = await client.post("/api/v1/maps/", json=factories.MapCreateBodySchemaFactory.build().model_dump())
+    assert response.status_code == 200
+    job_id = response.headers["X-Thumbnail-Job-Id"]
+
+    # The app's own runner picks it up.
+    for _ in range(100):
+        job = (await client.get(f"/api/v1/jobs/{ job_id }")).json()
+        if job["status"] == "succeeded": break
+        await asyncio.sleep(0.05)
+    assert job["kind"] == "map.thumbnail"
+    assert job["status"] == "succeeded"
+    assert job["result"]["size"] == settings.thumbnail_size
+
+    thumbnail = await client.get(
+        f"/api/v1/maps/{ response.json()['id'] }/thumbnail", headers={"Accept": "application/json"}
+    )
+    assert thumbnail.json()["id"] == job["result"]["thumbnail_id"]
+
+
+async def test_jobs_are_only_shown_to_whoever_queued_them(
+    client: AsyncClient, user: dict[str, typing.Any], other_client: AsyncClient
+) -> None:
+    response = await client.post("/api/v1/maps/", json=factories.MapCreateBodySchemaFactory.build().model_dump())
+    path = f"/api/v1/jobs/{ response.headers['X-Thumbnail-Job-Id'] }"
+
+    assert (await client.get(path)).status_code == 200
+    assert (await other_client.get(path)).status_code == 404
+    async with new_client() as anonymous:
+        assert (await anonymous.get(path)).status_code == 404
+        superuser = await register(anonymous)
+        await make_superuser(superuser)
+        assert (await anonymous.get(path)).status_code == 200
+    assert (await client.get(f"/api/v1/jobs/{ uuid.uuid4() }")).status_code == 404
+
@@ -0,0 +1,200 @@
+import asyncio
+import email
+import os
+import socket
+import subprocess
+import sys
+import typing
+import uuid
+from datetime import datetime, timedelta, timezone
+from urllib.parse import parse_qs, urlsplit
+
+import pytest
+from aiosmtpd.controller import Controller
+from fastapi import status
+from httpx import AsyncClient
+from sqlalchemy import select, update
+
+from app.db import AsyncSessionFactory
+from app.mail import MailOutbox, mail_outbox, retry_delay
+from app.models import MailOutboxModel
+from app.settings import settings
+from tests.conftest import count_queries, new_client
+
+
+class Inbox:
+    def __init__(self):
+        self.messages: list[tuple[list[str], str]] = []
+
+    async def handle_DATA(self, server, session, envelope) -> str:  # noqa: N802
+        message = email.message_from_bytes(envelope.content)
+        body = "".join(part.get_payload(decode=True).decode() for part in message.walk() if not part.is_multipart())
+        self.messages.append((envelope.rcpt_tos, body))
+        return "250 Message accepted for delivery"
+
+    def to(self, recipient: str) -> list[str]:
+        return [content for recipients, content in self.messages if recipient in recipients]
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+@pytest.fixture
+def smtp_server(monkeypatch: pytest.MonkeyPatch) -> typing.Iterator[Inbox]:
+    inbox = Inbox()
+    controller = Controller(inbox, hostname="127.0.0.1", port=free_port())
+    controller.start()
+    monkeypatch.setattr(settings, "mail_server", "127.0.0.1")
+    monkeypatch.setattr(settings, "mail_port", controller.port)
+    monkeypatch.setattr(settings, "mail_from", "citygen@example.com")
+    monkeypatch.setattr(settings, "mail_starttls", False)
+    yield inbox
+    controller.stop()
+
+
+async def drain_outbox() -> None:
+    while await mail_outbox.send_pending(): pass
+
+
+async def received(inbox: Inbox, recipient: str) -> list[str]:
+    """ Mail to `recipient`, once the app's sender has sent any. """
+    for _ in range(50):
+        if inbox.to(recipient): break
+        await asyncio.sleep(0.1)
+    return inbox.to(recipient)
+
+
+def test_mail_stack_is_imported_lazily() -> None:
+    subprocess.run(
+        [sys.executable, "-c", "import sys, app.application; assert 'fastapi_mail' not in sys.modules"],
+        env={ **os.environ, "MAIL_SERVER": "localhost", "MAIL_FROM": "citygen@example.com" }, check=True
+    )
+
+
+def test_retry_delay() -> None:
+    assert retry_delay(1) == timedelta(seconds=settings.mail_outbox_retry_base_seconds)
+    assert retry_delay(2) == timedelta(seconds=settings.mail_outbox_retry_base_seconds * 2)
+    assert retry_delay(100) == timedelta(seconds=settings.mail_outbox_retry_max_seconds)
+
+
+async def test_forgot_password_is_sent_in_the_background(
+    smtp_server: Inbox, client: AsyncClient, user: dict[str, typing.Any]
+) -> None:
+    # Mail was enabled before the app started, so its sender is running.
+    response = await client.post("/api/v1/auth/forgot-password", json={"email": user["email"]})
+    assert response.status_code == status.HTTP_202_ACCEPTED
+
+    [message] = await received(smtp_server, user["email"])
+    assert f"{ settings.public_url }/reset-password?token=" in message
+    token = parse_qs(urlsplit(message.split()[-1]).query)["token"][0]
+
+    async with new_client() as signed_out:
+        response = await signed_out.post("/api/v1/auth/reset-password", json={"token": token, "password": "changed"})
+        assert response.status_code == status.HTTP_204_NO_CONTENT
+        response = await signed_out.post(
+            "/api/v1/auth/login", data={"username": user["email"], "password": "changed"}
+        )
+        assert response.status_code == status.HTTP_200_OK
+        # The token is tied to the old password, so it's spent.
+        response = await signed_out.post("/api/v1/auth/reset-password", json={"token": token, "password": "again"})
+        assert response.status_code == status.HTTP_400_BAD_REQUEST
+        assert response.json()["detail"] == "USER__RESET_PASSWORD_TOKEN_INVALID"
+
+
+async def test_forgot_password_does_the_same_work_for_any_email(
+    smtp_server: Inbox, client: AsyncClient, user: dict[str, typing.Any]
+) -> None:
+    unknown = f"{ uuid.uuid4().hex }@example.com"
+    queries = []
+    for address in (user["email"], unknown):
+        with count_queries() as stats:
+            response = await client.post("/api/v1/auth/forgot-password", json={"email": address})
+        assert response.status_code == status.HTTP_202_ACCEPTED
+        queries.append(stats.queries)
+    assert queries[0] == queries[1]
+
+    assert len(await received(smtp_server, user["email"])) == 1
+    assert smtp_server.to(unknown) == []
+
+
+async def test_reset_links_ignore_the_request_host(
+    smtp_server: Inbox, client: AsyncClient, user: dict[str, typing.Any], monkeypatch: pytest.MonkeyPatch
+) -> None:
+    monkeypatch.setattr(settings, "public_url", "https://citygen.example")
+    response = await client.post(
+        "/api/v1/auth/forgot-password", json={"email": user["email"]}, headers={"Host": "attacker.example"}
+    )
+    assert response.status_code == status.HTTP_202_ACCEPTED
+    [message] = await received(smtp_server, user["email"])
+    assert "https://citygen.example/reset-password?token=" in message
+    assert "attacker.example" not in message
+
+
+async def test_reset_password_needs_a_token_or_a_user(client: AsyncClient) -> None:
+    response = await client.post("/api/v1/auth/reset-password", json={"password": "changed"})
+    assert response.status_code == status.HTTP_401_UNAUTHORIZED
+    response = await client.post("/api/v1/auth/reset-password", json={"token": "forged", "password": "changed"})
+    assert response.status_code == status.HTTP_400_BAD_REQUEST
+
+
+async def test_stop_cancels_a_sender_that_hangs(monkeypatch: pytest.MonkeyPatch) -> None:
+    outbox = MailOutbox(poll_interval=60, batch_size=1, max_attempts=1, lease=1)
+    started = asyncio.Event()
+
+    async def hang() -> int:
+        started.set()
+        await asyncio.Event().wait()
+        return 0
+
+    monkeypatch.setattr(outbox, "send_pending", hang)
+    monkeypatch.setattr(settings, "mail_timeout_seconds", 0.05)
+    outbox.start()
+    await asyncio.wait_for(started.wait(), timeout=5)
+    task = outbox._task
+    await outbox.stop()
+    assert task.cancelled()
+    # And it can be started again.
+    outbox.start()
+    await outbox.stop()
+
+
+async def test_failed_sends_are_retried_with_backoff(smtp_server: Inbox, monkeypatch: pytest.MonkeyPatch) -> None:
+    recipient = f"{ uuid.uuid4().hex[:12] }@example.com"
+    async with AsyncSessionFactory() as session:
+        await mail_outbox.enqueue(session, recipient=recipient, subject="Hello", body="Hello!")
+
+    async def message() -> MailOutboxModel:
+        async with AsyncSessionFactory() as session:
+            return await session.scalar(select(MailOutboxModel).where(MailOutboxModel.recipient == recipient))
+
+    with monkeypatch.context() as down:
+        down.setattr(settings, "mail_port", free_port())
+        await drain_outbox()
+    failed = await message()
+    assert failed.attempts == 1
+    assert failed.sent_at is None
+    assert failed.last_error is not None
+    half_the_delay = timedelta(seconds=settings.mail_outbox_retry_base_seconds / 2)
+    assert failed.next_attempt_at > datetime.now(timezone.utc) + half_the_delay
+
+    # Not due yet, so not retried
+    await drain_outbox()
+    assert smtp_server.to(recipient) == []
+
+    async with AsyncSessionFactory() as session:
+        await session.execute(
+            update(MailOutboxModel)
+            .where(MailOutboxModel.id == failed.id)
+            .values(next_attempt_at=datetime.now(timezone.utc))
+        )
+        await session.commit()
+    await drain_outbox()
+
+    assert len(smtp_server.to(recipient)) == 1
+    sent = await message()
+    assert sent.attempts == 2
+    assert sent.sent_at is not None
+    assert sent.last_error is None
@@ -1,28 +1,66 @@
+import os
 import runpy
 from unittest import mock
 
-import fastapi
-import modern_di
 import pytest
 
 from app import __main__ as api_main
-from app import ioc
-from app.application import AppBuilder
+from app.application import application
+from app.db import primary_database
+from app.settings import settings, DevPhase
 
 
 def test_main(monkeypatch: pytest.MonkeyPatch) -> None:
-    monkeypatch.setattr("granian.Granian", mock.Mock())
+    granian = mock.Mock()
+    monkeypatch.setattr("granian.Granian", granian)
+    monkeypatch.setattr(settings, "dev_phase", DevPhase.PROD)
+    monkeypatch.setattr(settings, "server_workers", None)
+    monkeypatch.setattr(settings, "metrics_dir", None)
+    # So the variables `__main__` sets are removed again afterwards
+    monkeypatch.setenv("SERVER_WORKERS", "1")
+    monkeypatch.setenv("METRICS_DIR", "")
     runpy.run_module(api_main.__name__, run_name="__main__")
+    granian.return_value.serve.assert_called_once()
+    # A worker per CPU, which the workers themselves are told so they can split the connection budget.
+    assert granian.call_args.kwargs["workers"] == api_main.available_cpus()
+    assert settings.server_workers == api_main.available_cpus()
+
+
+def test_main_shares_metrics_between_workers(monkeypatch: pytest.MonkeyPatch) -> None:
+    granian = mock.Mock()
+    monkeypatch.setattr("granian.Granian", granian)
+    monkeypatch.setattr(settings, "server_workers", 4)
+    monkeypatch.setattr(settings, "metrics_dir", None)
+    monkeypatch.setenv("SERVER_WORKERS", "4")
+    monkeypatch.setenv("METRICS_DIR", "")
+    runpy.run_module(api_main.__name__, run_name="__main__")
+    # The workers are told where to share their metrics, a directory that's gone again once the server is.
+    metrics_dir = settings.metrics_dir
+    assert metrics_dir is not None
+    assert os.environ["METRICS_DIR"] == metrics_dir
+    assert not os.path.exists(metrics_dir)
 
 
 async def test_app_lifespan() -> None:
-    async with AppBuilder().lifespan_manager(fastapi.FastAPI()):
-        pass
+    async with application.router.lifespan_context(application):
+        assert primary_database.engine is not None
+        assert await primary_database.check_health()
+    assert primary_database.engine is None
+
+
+@pytest.mark.parametrize(("workers", "limits"), [(None, (10, 10)), (2, (10, 5)), (4, (7, 0)), (100, (1, 0))])
+async def test_pool_limits_split_the_connection_budget(
+    monkeypatch: pytest.MonkeyPatch, workers: int | None, limits: tuple[int, int]
+) -> None:
+    monkeypatch.setattr(settings, "db_pool_size", 10)
+    monkeypatch.setattr(settings, "db_max_overflow", 10)
+    monkeypatch.setattr(settings, "db_max_connections", 30)
+    monkeypatch.setattr(settings, "server_workers", workers)
+    assert await primary_database.pool_limits() == limits
 
 
-async def test_session() -> None:
-    async with (
-        modern_di.Container(scope=modern_di.Scope.APP) as container,
-        container.build_child_container(scope=modern_di.Scope.REQUEST) as request_container,
-    ):
-        await ioc.Dependencies.session.async_resolve(request_container)
+async def test_connection_budget_defaults_to_a_share_of_max_connections(monkeypatch: pytest.MonkeyPatch) -> None:
+    monkeypatch.setattr(settings, "db_max_connections_share", 0.5)
+    budget = await primary_database.connection_budget()
+    assert budget is not None
+    assert 0 < budget < 1000
@@ -0,0 +1,107 @@
+import random
+import typing
+
+import pytest
+from fastapi import status
+from httpx import AsyncClient
+
+from app.exceptions.map import MapDataInvalidException, MapDataTooLargeException
+from app.map_data import parse_map_data
+from app.seed import generate_map_data
+from app.settings import settings
+from tests.conftest import create_map
+
+
+def points(*coordinates: tuple[float, float]) -> list[dict[str, float]]:
+    return [{ "x": x, "y": y } for x, y in coordinates]
+
+
+def square(x: float, y: float, size: float) -> list[dict[str, float]]:
+    return points((x, y), (x + size, y), (x + size, y + size), (x, y + size), (x, y))
+
+
+def map_data(**layers: typing.Any) -> dict[str, typing.Any]:
+    return {
+        "mainRoads": [points((0, 0), (30, 40)), points((0, 0), (10, 0), (10, 10))],
+        "majorRoads": [],
+        "minorRoads": [],
+        "coastalRoads": [],
+        # Left open, closed implicitly
+        "bigParks": [points((0, 0), (10, 0), (10, 10), (0, 10))],
+        "smallParks": [square(20, 20, 2)],
+        "buildings": [{ "data": square(1, 1, 3), "height": 12.5 }, { "data": square(-5, 2, 1), "height": 3 }],
+        "sea": points((-10, -10), (100, -10), (100, -5)),
+        "river": [],
+        **layers,
+    }
+
+
+def test_stats() -> None:
+    stats = parse_map_data(map_data()).stats
+    assert stats.building_count == 2
+    assert (stats.building_height_min, stats.building_height_max) == (3, 12.5)
+    assert stats.road_length == pytest.approx(50 + 20)
+    assert stats.park_area == pytest.approx(100 + 4)
+    assert (stats.bbox_min_x, stats.bbox_min_y, stats.bbox_max_x, stats.bbox_max_y) == (-10, -10, 100, 40)
+
+
+def test_generated_maps_are_valid() -> None:
+    stats = parse_map_data(generate_map_data(random.Random(0), buildings=500)).stats
+    assert stats.building_count == 500
+    assert stats.road_length > 0
+    assert stats.park_area > 0
+
+
+@pytest.mark.parametrize("data", [
+    [],
+    map_data(trees=[]),
+    { key: value for key, value in map_data().items() if key != "buildings" },
+    map_data(mainRoads=[points((0, 0))]),
+    map_data(mainRoads=[[{ "x": "0", "y": 0 }, { "x": 1, "y": 1 }]]),
+    map_data(mainRoads=[[{ "x": 0 }, { "x": 1, "y": 1 }]]),
+    map_data(mainRoads=[points((0, 0), (float("nan"), 1))]),
+    map_data(mainRoads=[points((0, 0), (settings.map_data_max_coordinate * 2, 0))]),
+    map_data(bigParks=[points((0, 0), (1, 1), (0, 0))]),
+    map_data(smallParks=[points((0, 0), (1, 1), (2, 2))]),
+    map_data(buildings=[{ "data": square(0, 0, 1) }]),
+    map_data(buildings=[{ "data": square(0, 0, 1), "height": -1 }]),
+    map_data(sea=points((0, 0), (1, 0))),
+])
+def test_invalid_map_data(data: typing.Any) -> None:
+    with pytest.raises(MapDataInvalidException):
+        parse_map_data(data)
+
+
+def test_oversized_map_data(monkeypatch: pytest.MonkeyPatch) -> None:
+    monkeypatch.setattr(settings, "map_data_max_buildings", 1)
+    with pytest.raises(MapDataTooLargeException):
+        parse_map_data(map_data())
+
+    monkeypatch.setattr(settings, "map_data_max_buildings", 10)
+    monkeypatch.setattr(settings, "map_data_max_vertices", 10)
+    with pytest.raises(MapDataTooLargeException):
+        parse_map_data(map_data())
+
+
+async def test_map_stats_are_stored_and_listed(client: AsyncClient, user: dict[str, typing.Any]) -> None:
+    map_ = await create_map(client, data=map_data())
+    assert map_["stats"]["building_count"] == 2
+
+    response = await client.get("/api/v1/maps/self")
+    [listed] = [m for m in response.json() if m["id"] == map_["id"]]
+    assert listed["stats"] == map_["stats"]
+    assert listed["stats"]["park_area"] == pytest.approx(104)
+
+
+async def test_invalid_maps_are_rejected(
+    client: AsyncClient, user: dict[str, typing.Any], monkeypatch: pytest.MonkeyPatch
+) -> None:
+    body = { "name": "Broken", "private": False, "data": map_data(sea=points((0, 0))) }
+    response = await client.post("/api/v1/maps/", json=body)
+    assert response.status_code == status.HTTP_422_UNPROCESSABLE_ENTITY
+    assert response.json()["detail"] == "MAP__DATA_INVALID"
+
+    monkeypatch.setattr(settings, "map_data_max_vertices", 10)
+    response = await client.post("/api/v1/maps/", json={ **body, "data": map_data() })
+    assert response.status_code == status.HTTP_413_REQUEST_ENTITY_TOO_LARGE
+    assert response.json()["detail"] == "MAP__DATA_TOO_LARGE"
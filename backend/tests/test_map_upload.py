@@ -0,0 +1,155 @@
+import json
+import random
+import tracemalloc
+import typing
+
+import numpy as np
+import pytest
+from fastapi import status
+from fastapi.exceptions import RequestValidationError
+from httpx import AsyncClient
+from starlette.requests import Request
+
+from app.exceptions.map import MapBodyInvalidException, MapBodyTooLargeException, MapDataInvalidException
+from app.map_data import LAYERS, parse_map_data
+from app.map_upload import read_map_upload
+from app.seed import generate_map_data
+from app.settings import settings
+from tests.test_map_data import map_data, points, square
+
+
+def upload_request(body: bytes, chunk_size: int, content_length: bool = False) -> tuple[Request, list[int]]:
+    """ A request whose body arrives `chunk_size` bytes at a time, and a list counting the chunks read. """
+    chunks = [body[i:i + chunk_size] for i in range(0, len(body), chunk_size)]
+    read = [0]
+
+    async def receive() -> dict[str, typing.Any]:
+        read[0] += 1
+        chunk = chunks[read[0] - 1] if read[0] <= len(chunks) else b""
+        return { "type": "http.request", "body": chunk, "more_body": read[0] < len(chunks) }
+
+    headers = [(b"content-length", str(len(body)).encode())] if content_length else []
+    return Request({ "type": "http", "method": "POST", "headers": headers }, receive), read
+
+
+def map_body(data: typing.Any, **fields: typing.Any) -> bytes:
+    return json.dumps({ "name": "Upload", "private": False, "data": data, **fields }).encode()
+
+
+@pytest.mark.parametrize("chunk_size", [1, 7, 4096, 1 << 20])
+async def test_uploads_are_parsed_as_they_stream_in(chunk_size: int) -> None:
+    data = generate_map_data(random.Random(0), buildings=2500)
+    request, _ = upload_request(map_body(data, name="Streamed ☃"), chunk_size)
+    upload = await read_map_upload(request)
+
+    assert upload.fields.name == "Streamed ☃"
+    assert upload.fields.private is False
+    assert { name: json.loads(layer_json) for name, layer_json in upload.layers_json.items() } == data
+
+    expected = parse_map_data(data)
+    assert upload.data.stats == expected.stats
+    np.testing.assert_array_equal(upload.data.heights, expected.heights)
+    for name in LAYERS:
+        np.testing.assert_array_equal(upload.data.layers[name].vertices, expected.layers[name].vertices)
+        np.testing.assert_array_equal(upload.data.layers[name].offsets, expected.layers[name].offsets)
+
+
+async def test_whitespace_and_field_order_are_free() -> None:
+    body = json.dumps({ "data": map_data(), "private": True, "name": "Spaced" }, indent=4).encode()
+    upload = await read_map_upload(upload_request(body, 13)[0])
+    assert (upload.fields.name, upload.fields.private) == ("Spaced", True)
+    assert upload.data.stats == parse_map_data(map_data()).stats
+
+
+async def test_oversized_uploads_are_turned_away_early(monkeypatch: pytest.MonkeyPatch) -> None:
+    body = map_body(generate_map_data(random.Random(0), buildings=500))
+    monkeypatch.setattr(settings, "map_create_max_body_bytes", len(body) // 4)
+
+    # Before reading anything, when the size is declared
+    request, read = upload_request(body, 1024, content_length=True)
+    with pytest.raises(MapBodyTooLargeException):
+        await read_map_upload(request)
+    assert read[0] == 0
+
+    # Otherwise once the limit is passed, without reading the rest
+    request, read = upload_request(body, 1024)
+    with pytest.raises(MapBodyTooLargeException):
+        await read_map_upload(request)
+    assert read[0] == len(body) // 4 // 1024 + 1
+
+
+@pytest.mark.parametrize(("body", "exception"), [
+    (b"", MapBodyInvalidException),
+    (b"[]", MapBodyInvalidException),
+    (map_body(map_data())[:-20], MapBodyInvalidException),
+    (map_body(map_data()) + b"{}", MapBodyInvalidException),
+    (map_body(map_data()).replace(b'"x": 0', b'"x": 0,,'), MapBodyInvalidException),
+    (map_body(map_data())[:-1] + b', "data": {}}', MapBodyInvalidException),
+    (map_body(map_data(), tags=[]), MapBodyInvalidException),
+    # Stored as sent, where they'd be served back as invalid JSON
+    *(
+        (map_body(map_data(buildings=[{ "data": square(1, 1, 3), "height": 1, "roof": v }])), MapBodyInvalidException)
+        for v in (float("nan"), float("inf"), float("-inf"))
+    ),
+    (json.dumps({ "name": "No data", "private": False }).encode(), MapDataInvalidException),
+    (map_body([]), MapDataInvalidException),
+    (map_body(map_data(trees=[])), MapDataInvalidException),
+    (map_body(map_data(mainRoads={})), MapDataInvalidException),
+    (map_body(map_data(sea=points((0, 0), (1, 0)))), MapDataInvalidException),
+    (map_body(map_data(), name=None), RequestValidationError),
+    (json.dumps({ "name": "No privacy", "data": map_data() }).encode(), RequestValidationError),
+])
+async def test_invalid_uploads(body: bytes, exception: type[Exception]) -> None:
+    with pytest.raises(exception):
+        await read_map_upload(upload_request(body, 64)[0])
+
+
+async def test_uploads_are_kept_as_arrays() -> None:
+    data = generate_map_data(random.Random(0), buildings=20_000)
+    body = map_body(data)
+    del data
+    request, _ = upload_request(body, 64 * 1024)
+
+    tracemalloc.start()
+    try:
+        upload = await read_map_upload(request)
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    assert upload.data.stats.building_count == 20_000
+    # What's kept, the layers' text and their arrays, is about twice the body's size; decoded whole, the body's
+    # objects alone would take nearly ten times it.
+    assert peak < 3 * len(body)
+
+
+async def test_create_map_stores_layers_as_sent(client: AsyncClient, user: dict[str, typing.Any]) -> None:
+    data = map_data()
+    response = await client.post("/api/v1/maps/", json={ "name": "Round trip", "private": False, "data": data })
+    assert response.status_code == status.HTTP_200_OK
+    map_ = response.json()
+
+    response = await client.get(f"/api/v1/maps/{ map_['id'] }", params={"include_data": True})
+    assert response.json()["data"] == data
+
+
+async def test_create_map_rejects_bad_bodies(
+    client: AsyncClient, user: dict[str, typing.Any], monkeypatch: pytest.MonkeyPatch
+) -> None:
+    response = await client.post("/api/v1/maps/", content=b'{"name": "Broken", "private": false, "data": {')
+    assert response.status_code == status.HTTP_422_UNPROCESSABLE_ENTITY
+    assert response.json()["detail"] == "MAP__BODY_INVALID"
+
+    response = await client.post("/api/v1/maps/", content=map_body(map_data(
+        buildings=[{ "data": square(1, 1, 3), "height": 1, "roof": float("nan") }]
+    )))
+    assert response.status_code == status.HTTP_422_UNPROCESSABLE_ENTITY
+    assert response.json()["detail"] == "MAP__BODY_INVALID"
+
+    response = await client.post("/api/v1/maps/", json={ "name": "Private?", "private": "maybe", "data": map_data() })
+    assert response.status_code == status.HTTP_422_UNPROCESSABLE_ENTITY
+    assert response.json()["detail"][0]["loc"] == ["body", "private"]
+
+    monkeypatch.setattr(settings, "map_create_max_body_bytes", 100)
+    response = await client.post("/api/v1/maps/", json={ "name": "Huge", "private": False, "data": map_data() })
+    assert response.status_code == status.HTTP_413_REQUEST_ENTITY_TOO_LARGE
+    assert response.json()["detail"] == "MAP__BODY_TOO_LARGE"
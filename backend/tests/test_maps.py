@@ -0,0 +1,245 @@
+import json
+import typing
+import uuid
+from datetime import datetime
+
+import pytest
+from fastapi import status
+from httpx import AsyncClient
+
+from app.play_events import PlayEventBuffer, play_event_buffer
+from app.settings import settings
+from tests import factories
+from tests.conftest import create_map, new_client
+
+
+async def test_create_and_get_map(client: AsyncClient, user: dict[str, typing.Any]) -> None:
+    map_ = await create_map(client, name="Springfield")
+    assert map_["name"] == "Springfield"
+    assert map_["favorited"] is False
+
+    response = await client.get(f"/api/v1/maps/{ map_['id'] }")
+    assert response.status_code == status.HTTP_200_OK
+    assert response.json()["user"]["username"] == user["username"]
+    assert "data" not in response.json()
+
+    response = await client.get(f"/api/v1/maps/{ map_['id'] }", params={"include_data": True})
+    assert response.status_code == status.HTTP_200_OK
+    assert len(response.json()["data"]["buildings"]) == 5
+
+
+async def test_get_map_layers(client: AsyncClient, user: dict[str, typing.Any]) -> None:
+    map_ = await create_map(client)
+
+    response = await client.get(f"/api/v1/maps/{ map_['id'] }", params={"layers": "buildings,mainRoads"})
+    assert response.status_code == status.HTTP_200_OK
+    assert list(response.json()["data"]) == ["buildings", "mainRoads"]
+    assert len(response.json()["data"]["buildings"]) == 5
+
+    response = await client.get(f"/api/v1/maps/{ map_['id'] }", params={"layers": "buildings,trees"})
+    assert response.status_code == status.HTTP_400_BAD_REQUEST
+    assert response.json()["detail"] == "MAP__LAYER_INVALID"
+
+
+async def test_stream_map_layers(
+    client: AsyncClient, user: dict[str, typing.Any], monkeypatch: pytest.MonkeyPatch
+) -> None:
+    map_ = await create_map(client)
+    full = (await client.get(f"/api/v1/maps/{ map_['id'] }", params={"include_data": True})).json()
+    monkeypatch.setattr(settings, "map_stream_buildings_per_frame", 2)
+
+    response = await client.get(f"/api/v1/maps/{ map_['id'] }/layers")
+    assert response.status_code == status.HTTP_200_OK
+    assert response.headers["content-type"] == "application/x-ndjson"
+    frames = [json.loads(line) for line in response.text.splitlines()]
+
+    assert frames[0]["type"] == "map" and frames[0]["map"]["id"] == map_["id"]
+    assert frames[-1] == {"type": "end"}
+    layers = frames[1:-1]
+    assert [frame["name"] for frame in layers] == [
+        "sea", "river", "coastalRoads", "mainRoads", "majorRoads", "minorRoads", "bigParks", "smallParks",
+        "buildings", "buildings", "buildings",
+    ]
+    assert [frame["chunk"] for frame in layers if frame["name"] == "buildings"] == [0, 1, 2]
+
+    data: dict[str, typing.Any] = {}
+    for frame in layers:
+        if "chunk" in frame: data.setdefault(frame["name"], []).extend(frame["data"])
+        else: data[frame["name"]] = frame["data"]
+    assert data == full["data"]
+
+    response = await client.get(f"/api/v1/maps/{ map_['id'] }/layers", params={"layers": "buildings,sea"})
+    assert [frame.get("name") for frame in map(json.loads, response.text.splitlines())] == [
+        None, "sea", "buildings", "buildings", "buildings", None
+    ]
+
+
+async def test_get_map_not_exist(client: AsyncClient) -> None:
+    response = await client.get("/api/v1/maps/00000000-0000-0000-0000-000000000000")
+    assert response.status_code == status.HTTP_404_NOT_FOUND
+    assert response.json()["detail"] == "MAP__DOES_NOT_EXIST"
+
+
+async def test_private_maps_are_only_visible_to_their_owner(
+    client: AsyncClient,
+    user: dict[str, typing.Any],
+    other_client: AsyncClient,
+) -> None:
+    map_ = await create_map(client, private=True)
+
+    response = await other_client.get(f"/api/v1/maps/{ map_['id'] }")
+    assert response.status_code == status.HTTP_401_UNAUTHORIZED
+    assert response.json()["detail"] == "MAP__NOT_PUBLIC"
+
+    response = await other_client.get("/api/v1/maps/")
+    assert map_["id"] not in [m["id"] for m in response.json()]
+
+    response = await client.get("/api/v1/maps/self")
+    assert map_["id"] in [m["id"] for m in response.json()]
+
+
+async def test_favorite_map(client: AsyncClient, user: dict[str, typing.Any], other_client: AsyncClient) -> None:
+    map_ = await create_map(other_client)
+
+    response = await client.post(f"/api/v1/maps/{ map_['id'] }/favorite", json={"favorited": True})
+    assert response.status_code == status.HTTP_204_NO_CONTENT
+    # Favoriting twice is idempotent.
+    response = await client.post(f"/api/v1/maps/{ map_['id'] }/favorite", json={"favorited": True})
+    assert response.status_code == status.HTTP_204_NO_CONTENT
+
+    response = await client.get("/api/v1/maps/")
+    assert next(m for m in response.json() if m["id"] == map_["id"])["favorited"] is True
+    response = await other_client.get(f"/api/v1/maps/{ map_['id'] }")
+    assert response.json()["favorited"] is False
+
+    response = await client.post(
+        "/api/v1/maps/favorites:batch", json={"favorites": [{"map_id": map_["id"], "favorited": False}]}
+    )
+    assert response.status_code == status.HTTP_204_NO_CONTENT
+    response = await client.get(f"/api/v1/maps/{ map_['id'] }")
+    assert response.json()["favorited"] is False
+
+
+async def test_get_maps_batch_keeps_request_order(client: AsyncClient, user: dict[str, typing.Any]) -> None:
+    maps = [await create_map(client) for _ in range(3)]
+    ids = [m["id"] for m in reversed(maps)]
+
+    response = await client.get("/api/v1/maps/batch", params={"ids": ids})
+    assert response.status_code == status.HTTP_200_OK
+    assert [m["id"] for m in response.json()] == ids
+
+
+async def test_map_thumbnail(client: AsyncClient, user: dict[str, typing.Any]) -> None:
+    map_ = await create_map(client)
+
+    response = await client.get(f"/api/v1/maps/{ map_['id'] }/thumbnail")
+    assert response.status_code == status.HTTP_200_OK
+    assert response.headers["content-type"] == "image/png"
+    assert response.content.startswith(b"\x89PNG\r\n\x1a\n")
+
+    response = await client.get(f"/api/v1/maps/{ map_['id'] }/thumbnail", headers={"Accept": "application/json"})
+    assert response.json()["size"] == settings.thumbnail_size
+
+
+async def test_record_map_play(client: AsyncClient, user: dict[str, typing.Any]) -> None:
+    map_ = await create_map(client)
+
+    for _ in range(2):
+        response = await client.post(f"/api/v1/maps/{ map_['id'] }/play")
+        assert response.status_code == status.HTTP_202_ACCEPTED
+    await play_event_buffer.flush()
+
+    response = await client.get(f"/api/v1/maps/{ map_['id'] }")
+    assert response.json()["play_count"] == 2
+    assert response.json()["last_played_at"] is not None
+
+
+async def test_plays_are_only_recorded_for_visible_maps(
+    client: AsyncClient, user: dict[str, typing.Any], other_client: AsyncClient
+) -> None:
+    map_ = await create_map(client, private=True)
+
+    response = await other_client.post(f"/api/v1/maps/{ map_['id'] }/play")
+    assert response.status_code == status.HTTP_401_UNAUTHORIZED
+    response = await other_client.post(f"/api/v1/maps/{ uuid.uuid4() }/play")
+    assert response.status_code == status.HTTP_404_NOT_FOUND
+    await play_event_buffer.flush()
+
+    response = await client.get(f"/api/v1/maps/{ map_['id'] }")
+    assert response.json()["play_count"] == 0
+
+
+async def test_play_buffer_drops_plays_past_its_cap() -> None:
+    buffer = PlayEventBuffer(flush_interval=60, flush_max_maps=10, max_pending_maps=2)
+    first, second = uuid.uuid4(), uuid.uuid4()
+    buffer.record(first)
+    buffer.record(second)
+    buffer.record(uuid.uuid4())
+    # Maps already pending still count their plays.
+    buffer.record(first)
+    assert buffer._pending[first][0] == 2
+    assert len(buffer._pending) == 2
+    assert buffer.dropped == 1
+
+    # Requeued after a failed flush, behind plays recorded since
+    events, buffer._pending = buffer._pending, { uuid.uuid4(): (1, datetime.now()) }
+    buffer._requeue(events)
+    assert len(buffer._pending) == 2
+    assert buffer.dropped == 2
+
+
+async def search(client: AsyncClient, query: str, limit: int = 20) -> list[dict[str, typing.Any]]:
+    """ Every page of a search, one after the other. """
+    items, cursor = [], None
+    while True:
+        params = { "q": query, "limit": limit, **({ "cursor": cursor } if cursor else {}) }
+        response = await client.get("/api/v1/maps/search", params=params)
+        assert response.status_code == status.HTTP_200_OK
+        page = response.json()
+        items += page["items"]
+        cursor = page["next_cursor"]
+        if cursor is None: return items
+
+
+async def test_search_ranks_names_and_authors(
+    client: AsyncClient, user: dict[str, typing.Any], other_client: AsyncClient
+) -> None:
+    token = f"zq{ uuid.uuid4().hex[:8] }"
+    exact = await create_map(client, name=token)
+    partial = await create_map(client, name=f"Old { token } harbour")
+    response = await other_client.post(
+        "/api/v1/auth/register", json=factories.UserCreateSchemaFactory.build(username=f"{ token }maker").model_dump()
+    )
+    assert response.status_code == status.HTTP_201_CREATED
+    by_author = await create_map(other_client, name="Unrelated")
+
+    ids = [map_["id"] for map_ in await search(client, token)]
+    assert ids[0] == exact["id"]
+    assert partial["id"] in ids
+    assert by_author["id"] in ids
+    assert ids.index(exact["id"]) < ids.index(partial["id"])
+
+
+async def test_search_pages_without_gaps_or_duplicates(client: AsyncClient, user: dict[str, typing.Any]) -> None:
+    token = f"zq{ uuid.uuid4().hex[:8] }"
+    # Equally ranked, so pages are told apart by id alone
+    created = { (await create_map(client, name=f"{ token } { i }"))["id"] for i in range(7) }
+
+    ids = [map_["id"] for map_ in await search(client, token, limit=2)]
+    assert len(ids) == len(set(ids))
+    assert created <= set(ids)
+    assert ids == [map_["id"] for map_ in await search(client, token, limit=50)]
+
+
+async def test_search_hides_other_users_private_maps(
+    client: AsyncClient, user: dict[str, typing.Any], other_client: AsyncClient
+) -> None:
+    token = f"zq{ uuid.uuid4().hex[:8] }"
+    own = await create_map(client, name=token, private=True)
+    others = await create_map(other_client, name=f"{ token } too", private=True)
+
+    ids = [map_["id"] for map_ in await search(client, token)]
+    assert own["id"] in ids
+    assert others["id"] not in ids
+    async with new_client() as signed_out:
+        assert own["id"] not in [map_["id"] for map_ in await search(signed_out, token)]
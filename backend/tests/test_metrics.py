@@ -0,0 +1,133 @@
+import asyncio
+import json
+import os
+import re
+import sys
+import typing
+
+import pytest
+from fastapi import status
+from httpx import AsyncClient
+
+from app.metrics import LATENCY_BUCKETS, Counter, metrics_snapshots, registry
+from app.settings import settings
+from tests.conftest import create_map
+
+SAMPLE = re.compile(r'^(?P<name>[a-zA-Z_:][a-zA-Z0-9_:]*)(?:\{(?P<labels>.*)\})? (?P<value>\S+)$')
+LABEL = re.compile(r'(?P<name>[a-zA-Z_][a-zA-Z0-9_]*)="(?P<value>(?:[^"\\]|\\.)*)"')
+
+
+def parse_samples(text: str) -> list[tuple[str, dict[str, str], float]]:
+    """ The samples of a scrape in the text exposition format, label values unescaped. """
+    samples = []
+    for line in text.splitlines():
+        if line.startswith("#"): continue
+        match = SAMPLE.match(line)
+        assert match is not None, line
+        labels = {
+            label["name"]: re.sub(r"\\(.)", lambda m: "\n" if m[1] == "n" else m[1], label["value"])
+            for label in LABEL.finditer(match["labels"] or "")
+        }
+        samples.append((match["name"], labels, float(match["value"])))
+    return samples
+
+
+@pytest.fixture
+def scraper(client: AsyncClient, monkeypatch: pytest.MonkeyPatch) -> typing.Callable:
+    monkeypatch.setattr(settings, "metrics_token", "scrape-token")
+
+    async def scrape() -> typing.Any:
+        return await client.get("/metrics", headers={ "Authorization": "Bearer scrape-token" })
+    return scrape
+
+
+async def test_metrics_scrape(client: AsyncClient, user: dict[str, typing.Any], scraper: typing.Callable) -> None:
+    maps = [await create_map(client) for _ in range(2)]
+    for map_ in maps:
+        assert (await client.get(f"/api/v1/maps/{ map_['id'] }")).status_code == status.HTTP_200_OK
+
+    # Label values as awkward as any route or error could make them
+    awkward = 'a "quoted" \\ back\nslash'
+    counter = Counter("test_awkward_labels_total", "Labels that need escaping", ("value",))
+    try:
+        counter.inc(awkward)
+        response = await scraper()
+    finally:
+        registry.remove(counter)
+    assert response.status_code == status.HTTP_200_OK
+    assert response.headers["content-type"].startswith("text/plain; version=0.0.4")
+    assert r'test_awkward_labels_total{value="a \"quoted\" \\ back\nslash"} 1' in response.text.splitlines()
+
+    samples = parse_samples(response.text)
+    assert ("test_awkward_labels_total", { "value": awkward }, 1) in samples
+
+    # Routes are labelled by their template, never the path a request was made to.
+    routes = { labels["route"] for _, labels, _ in samples if "route" in labels }
+    assert "/api/v1/maps/{map_id}" in routes
+    assert not any(map_["id"] in route for map_ in maps for route in routes)
+
+    route = { "method": "GET", "route": "/api/v1/maps/{map_id}" }
+    buckets = [
+        (labels["le"], value) for name, labels, value in samples
+        if name == "http_request_duration_seconds_bucket" and labels.items() > route.items()
+    ]
+    assert [le for le, _ in buckets] == [*(str(bound) for bound in LATENCY_BUCKETS), "+Inf"]
+    counts = [value for _, value in buckets]
+    assert counts == sorted(counts)
+    (count,) = [
+        value for name, labels, value in samples if name == "http_request_duration_seconds_count" and labels == route
+    ]
+    (total,) = [
+        value for name, labels, value in samples if name == "http_request_duration_seconds_sum" and labels == route
+    ]
+    assert count == counts[-1] >= len(maps)
+    assert total > 0
+
+
+async def test_metrics_need_the_token(client: AsyncClient, monkeypatch: pytest.MonkeyPatch) -> None:
+    # With no token set, nobody gets them.
+    assert (await client.get("/metrics")).status_code == status.HTTP_401_UNAUTHORIZED
+    monkeypatch.setattr(settings, "metrics_token", "scrape-token")
+    response = await client.get("/metrics", headers={ "Authorization": "Bearer wrong" })
+    assert response.status_code == status.HTTP_401_UNAUTHORIZED
+    assert response.json()["detail"] == "SYSTEM__METRICS_UNAUTHORIZED"
+    assert response.headers["WWW-Authenticate"] == "Bearer"
+
+
+async def test_scrapes_report_every_worker(
+    client: AsyncClient, scraper: typing.Callable, monkeypatch: pytest.MonkeyPatch, tmp_path: typing.Any
+) -> None:
+    monkeypatch.setattr(settings, "metrics_dir", str(tmp_path))
+    counter = Counter("test_worker_requests_total", "Requests by worker", ("route",))
+    try:
+        counter.inc("/a", amount=2)
+        await metrics_snapshots.write()
+        assert json.loads((tmp_path / f"{ os.getpid() }.json").read_text())["test_worker_requests_total"] == [
+            [["/a"], 2]
+        ]
+
+        # Another worker that's still running, and one that has exited
+        live = os.getppid()
+        exited = await asyncio.create_subprocess_exec(sys.executable, "-c", "pass")
+        await exited.wait()
+        for pid, value in [(live, 3), (exited.pid, 5)]:
+            snapshot = {
+                "test_worker_requests_total": [[["/a"], value], [["/b"], 1]],
+                "db_healthy": [[["primary"], 1]],
+            }
+            (tmp_path / f"{ pid }.json").write_text(json.dumps(snapshot))
+
+        counter.inc("/a")
+        response = await scraper()
+    finally:
+        registry.remove(counter)
+    samples = parse_samples(response.text)
+
+    # Counters add up over every worker, exited ones too, with this one's as they are now.
+    assert ("test_worker_requests_total", { "route": "/a" }, 2 + 1 + 3 + 5) in samples
+    assert ("test_worker_requests_total", { "route": "/b" }, 2) in samples
+    # Gauges are each live worker's own.
+    healthy = {
+        labels["worker"] for name, labels, _ in samples if name == "db_healthy" and labels["database"] == "primary"
+    }
+    assert healthy == { str(os.getpid()), str(live) }
@@ -0,0 +1,51 @@
+import json
+import typing
+
+import pytest
+from httpx import ASGITransport, AsyncClient
+
+from app.application import application
+from app.profiling import ProfilingMiddleware
+from app.settings import settings
+from tests.conftest import make_superuser
+
+
+@pytest.fixture
+async def profiling_client(client: AsyncClient, tmp_path, monkeypatch: pytest.MonkeyPatch) -> AsyncClient:
+    """ `client`, with its cookies, against the application with profiling installed as it is when enabled. """
+    monkeypatch.setattr(settings, "profiling_output_dir", str(tmp_path))
+    profiled = ProfilingMiddleware(application)
+
+    async def app(scope, receive, send):
+        # Starlette sets this before running its middleware stack.
+        scope["app"] = application
+        await profiled(scope, receive, send)
+
+    async with AsyncClient(transport=ASGITransport(app=app), base_url="https://test") as profiling_client:
+        # Read the login cookie at request time, since the `user` fixture logs in after this one is set up.
+        async def send_login_cookie(request):
+            request.headers["cookie"] = "; ".join(f"{ name }={ value }" for name, value in client.cookies.items())
+
+        profiling_client.event_hooks["request"].append(send_login_cookie)
+        yield profiling_client
+
+
+async def test_superuser_requests_are_profiled(profiling_client: AsyncClient, user: dict[str, typing.Any]) -> None:
+    await make_superuser(user)
+
+    response = await profiling_client.get("/api/v1/maps/", headers={"X-Profile": "1"})
+    assert response.status_code == 200
+    profile_url = response.links["profile"]["url"]
+    assert profile_url == f"/api/v1/system/profiles/{ response.headers['x-profile-id'] }"
+
+    response = await profiling_client.get(profile_url)
+    assert response.status_code == 200
+    assert json.loads(response.content)["$schema"] == "https://www.speedscope.app/file-format-schema.json"
+
+
+async def test_profile_header_is_ignored_for_other_users(
+    profiling_client: AsyncClient, user: dict[str, typing.Any]
+) -> None:
+    response = await profiling_client.get("/api/v1/maps/", headers={"X-Profile": "1"})
+    assert response.status_code == 200
+    assert "x-profile-id" not in response.headers
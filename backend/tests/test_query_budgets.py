@@ -0,0 +1,97 @@
+import typing
+
+import pytest
+from fastapi.routing import APIRoute
+from httpx import AsyncClient
+
+from app.application import application
+from tests.conftest import count_queries, create_map
+
+
+def route_budget(method: str, path: str) -> int:
+    for route in application.routes:
+        if isinstance(route, APIRoute) and route.path == path and method in route.methods:
+            budget = getattr(route.endpoint, "query_budget", None)
+            assert budget is not None, f"{method} {path} has no declared query budget"
+            return typing.cast(int, budget)
+    raise AssertionError(f"No route for {method} {path}")
+
+
+async def create_maps(client: AsyncClient, count: int) -> list[dict[str, typing.Any]]:
+    return [await create_map(client, name=f"budget map { i }") for i in range(count)]
+
+
+async def assert_within_budget(client: AsyncClient, method: str, path: str, url: str, **kwargs: typing.Any) -> int:
+    with count_queries() as stats:
+        response = await client.request(method, url, **kwargs)
+    assert response.status_code < 400, response.text
+    assert stats.queries <= route_budget(method, path), (
+        f"{method} {path} issued {stats.queries} queries, over its budget of {route_budget(method, path)}"
+    )
+    return stats.queries
+
+
+@pytest.mark.parametrize(
+    ("path", "params"),
+    [
+        ("/api/v1/maps/", {"include_self": True}),
+        ("/api/v1/maps/self", {}),
+        ("/api/v1/maps/search", {"q": "budget map"}),
+    ],
+)
+async def test_map_listings_issue_flat_query_counts(
+    client: AsyncClient,
+    user: dict[str, typing.Any],
+    path: str,
+    params: dict[str, typing.Any],
+) -> None:
+    await create_maps(client, 1)
+    queries_with_one_map = await assert_within_budget(client, "GET", path, path, params=params)
+
+    await create_maps(client, 10)
+    queries_with_many_maps = await assert_within_budget(client, "GET", path, path, params=params)
+
+    assert queries_with_one_map == queries_with_many_maps
+
+
+async def test_map_batch_issues_flat_query_count(client: AsyncClient, user: dict[str, typing.Any]) -> None:
+    maps = await create_maps(client, 10)
+    path = "/api/v1/maps/batch"
+
+    one = await assert_within_budget(client, "GET", path, path, params={"ids": [maps[0]["id"]]})
+    many = await assert_within_budget(client, "GET", path, path, params={"ids": [m["id"] for m in maps]})
+    assert one == many
+
+
+async def test_map_endpoints_within_budget(client: AsyncClient, user: dict[str, typing.Any]) -> None:
+    (map_,) = await create_maps(client, 1)
+    map_id = map_["id"]
+
+    await assert_within_budget(client, "GET", "/api/v1/maps/{map_id}", f"/api/v1/maps/{map_id}")
+    await assert_within_budget(
+        client, "GET", "/api/v1/maps/{map_id}", f"/api/v1/maps/{map_id}", params={"layers": "buildings"}
+    )
+    await assert_within_budget(client, "GET", "/api/v1/maps/{map_id}/scene", f"/api/v1/maps/{map_id}/scene")
+    await assert_within_budget(client, "GET", "/api/v1/maps/{map_id}/data", f"/api/v1/maps/{map_id}/data")
+    await assert_within_budget(client, "GET", "/api/v1/maps/{map_id}/layers", f"/api/v1/maps/{map_id}/layers")
+    await assert_within_budget(client, "GET", "/api/v1/maps/{map_id}/export", f"/api/v1/maps/{map_id}/export")
+    await assert_within_budget(client, "GET", "/api/v1/maps/{map_id}/thumbnail", f"/api/v1/maps/{map_id}/thumbnail")
+    await assert_within_budget(
+        client, "POST", "/api/v1/maps/{map_id}/favorite", f"/api/v1/maps/{map_id}/favorite", json={"favorited": True}
+    )
+    await assert_within_budget(
+        client,
+        "POST",
+        "/api/v1/maps/favorites:batch",
+        "/api/v1/maps/favorites:batch",
+        json={"favorites": [{"map_id": map_id, "favorited": False}]},
+    )
+    await assert_within_budget(client, "POST", "/api/v1/maps/{map_id}/play", f"/api/v1/maps/{map_id}/play")
+
+
+async def test_user_endpoints_within_budget(client: AsyncClient, user: dict[str, typing.Any]) -> None:
+    username = user["username"]
+
+    await assert_within_budget(client, "GET", "/api/v1/users/self", "/api/v1/users/self")
+    await assert_within_budget(client, "GET", "/api/v1/users/{username}", f"/api/v1/users/{username}")
+    await assert_within_budget(client, "GET", "/api/v1/users/{username}/avatar", f"/api/v1/users/{username}/avatar")
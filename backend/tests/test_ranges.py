@@ -0,0 +1,112 @@
+import typing
+
+import pytest
+from fastapi import status
+from httpx import AsyncClient
+
+from app.exceptions.system import RangeNotSatisfiableException
+from app.ranges import ByteRange, parse_range
+from app.settings import settings
+from tests.conftest import create_map
+
+
+@pytest.mark.parametrize(("header", "ranges"), [
+    ("bytes=0-9", [ByteRange(0, 10)]),
+    ("bytes=90-", [ByteRange(90, 100)]),
+    ("bytes=-5", [ByteRange(95, 100)]),
+    ("bytes=-500", [ByteRange(0, 100)]),
+    ("bytes=95-200", [ByteRange(95, 100)]),
+    ("bytes=50-59, 0-9", [ByteRange(0, 10), ByteRange(50, 60)]),
+    # Overlapping and adjacent ranges are merged
+    ("bytes=0-9,5-19,20-29", [ByteRange(0, 30)]),
+    ("bytes=0-9,100-,20-29", [ByteRange(0, 10), ByteRange(20, 30)]),
+    # Ignored, so the whole resource is sent
+    ("items=0-9", None),
+    ("bytes=", None),
+    ("bytes=9-0", None),
+    ("bytes=a-b", None),
+    ("bytes=-", None),
+    ("bytes=٠-٩", None),
+])
+def test_parse_range(header: str, ranges: list[ByteRange] | None) -> None:
+    assert parse_range(header, 100) == ranges
+
+
+def test_parse_range_limits(monkeypatch: pytest.MonkeyPatch) -> None:
+    with pytest.raises(RangeNotSatisfiableException):
+        parse_range("bytes=100-,-0", 100)
+
+    monkeypatch.setattr(settings, "http_range_max_parts", 2)
+    assert parse_range("bytes=0-1,10-11,20-21", 100) is None
+
+
+def multipart_parts(response: typing.Any) -> list[tuple[str, bytes]]:
+    """ The (Content-Range, body) of each part of a multipart/byteranges response. """
+    boundary = response.headers["content-type"].split("boundary=")[1].encode()
+    parts = []
+    for part in response.content.split(b"--" + boundary)[1:-1]:
+        head, _, body = part.removeprefix(b"\r\n").partition(b"\r\n\r\n")
+        headers = dict(line.split(": ", 1) for line in head.decode().split("\r\n"))
+        parts.append((headers["Content-Range"], body.removesuffix(b"\r\n")))
+    return parts
+
+
+async def test_map_data_ranges(client: AsyncClient, user: dict[str, typing.Any]) -> None:
+    map_ = await create_map(client)
+    url = f"/api/v1/maps/{ map_['id'] }/data"
+    full = (await client.get(f"/api/v1/maps/{ map_['id'] }", params={"include_data": True})).json()["data"]
+
+    response = await client.get(url)
+    assert response.status_code == status.HTTP_200_OK
+    assert response.headers["accept-ranges"] == "bytes"
+    assert response.json() == full
+    body, etag = response.content, response.headers["etag"]
+    size = len(body)
+
+    # Ranges within a layer, across layers, and over the JSON between them
+    for start, stop in [(0, 1), (5, 50), (size // 2, size // 2 + 300), (size - 10, size)]:
+        response = await client.get(url, headers={"Range": f"bytes={ start }-{ stop - 1 }"})
+        assert response.status_code == status.HTTP_206_PARTIAL_CONTENT
+        assert response.headers["content-range"] == f"bytes { start }-{ stop - 1 }/{ size }"
+        assert response.content == body[start:stop]
+
+    response = await client.get(url, headers={"Range": "bytes=0-99,-100", "If-Range": etag})
+    assert response.status_code == status.HTTP_206_PARTIAL_CONTENT
+    assert response.headers["content-type"].startswith("multipart/byteranges")
+    assert multipart_parts(response) == [
+        (f"bytes 0-99/{ size }", body[:100]),
+        (f"bytes { size - 100 }-{ size - 1 }/{ size }", body[-100:]),
+    ]
+
+    # A stale If-Range gets the whole, current representation
+    response = await client.get(url, headers={"Range": "bytes=0-99", "If-Range": '"stale"'})
+    assert response.status_code == status.HTTP_200_OK
+    assert response.content == body
+
+    response = await client.get(url, headers={"Range": f"bytes={ size }-"})
+    assert response.status_code == status.HTTP_416_REQUESTED_RANGE_NOT_SATISFIABLE
+    assert response.headers["content-range"] == f"bytes */{ size }"
+    assert response.json()["detail"] == "SYSTEM__RANGE_NOT_SATISFIABLE"
+
+
+async def test_private_map_data_is_not_ranged(
+    client: AsyncClient, user: dict[str, typing.Any], other_client: AsyncClient
+) -> None:
+    map_ = await create_map(client, private=True)
+    response = await other_client.get(f"/api/v1/maps/{ map_['id'] }/data", headers={"Range": "bytes=0-9"})
+    assert response.status_code == status.HTTP_401_UNAUTHORIZED
+
+
+async def test_blob_ranges(client: AsyncClient, user: dict[str, typing.Any]) -> None:
+    map_ = await create_map(client)
+    await client.put(
+        f"/api/v1/users/{ user['username'] }/avatar", files={"file": ("avatar.png", b"\x89PNG avatar", "image/png")}
+    )
+    for url in (f"/api/v1/maps/{ map_['id'] }/thumbnail", f"/api/v1/users/{ user['username'] }/avatar"):
+        response = await client.get(url)
+        assert response.headers["accept-ranges"] == "bytes"
+        body = response.content
+
+        response = await client.get(url, headers={"Range": "bytes=2-5", "If-Range": response.headers["etag"]})
+        assert response.status_code == status.HTTP_206_PARTIAL_CONTENT
+        assert response.content == body[2:6]
@@ -0,0 +1,67 @@
+import typing
+
+import pytest
+from httpx import AsyncClient
+
+from app import db, middleware
+from app.db import PRIMARY_PIN_COOKIE, Database, ReadAsyncSessionFactory
+from app.settings import settings
+from tests.conftest import create_map
+
+
+@pytest.fixture
+async def replica(client: AsyncClient, monkeypatch: pytest.MonkeyPatch) -> typing.AsyncIterator[Database]:
+    """ A replica that's the primary's own database, as in the README's local setup, so it has every write at once. """
+    replica = Database("replica", settings.db_dsn, ReadAsyncSessionFactory)
+    await replica.start()
+    monkeypatch.setattr(db, "replica_database", replica)
+    monkeypatch.setattr(middleware, "replica_database", replica)
+    try:
+        yield replica
+    finally:
+        await replica.stop()
+
+
+def replica_checkouts(replica: Database) -> int:
+    return replica.engine.pool.wait_stats.checkouts
+
+
+async def test_reads_go_to_the_replica(client: AsyncClient, user: dict[str, typing.Any], replica: Database) -> None:
+    map_ = await create_map(client)
+    # As once the write's pin has expired
+    client.cookies.delete(PRIMARY_PIN_COOKIE)
+
+    before = replica_checkouts(replica)
+    response = await client.get(f"/api/v1/maps/{ map_['id'] }")
+    assert response.status_code == 200
+    assert replica_checkouts(replica) > before
+
+
+async def test_writes_pin_reads_to_the_primary(
+    client: AsyncClient, user: dict[str, typing.Any], replica: Database
+) -> None:
+    map_ = await create_map(client)
+    assert float(client.cookies[PRIMARY_PIN_COOKIE]) > 0
+
+    before = replica_checkouts(replica)
+    response = await client.get(f"/api/v1/maps/{ map_['id'] }")
+    assert response.status_code == 200
+    assert replica_checkouts(replica) == before
+
+
+async def test_unhealthy_replica_falls_back_to_the_primary(
+    client: AsyncClient, user: dict[str, typing.Any], replica: Database
+) -> None:
+    map_ = await create_map(client)
+    client.cookies.delete(PRIMARY_PIN_COOKIE)
+
+    # The replica going away: nothing listens on port 1.
+    await replica.engine.dispose()
+    replica.url = replica.url.set(port=1)
+    replica.engine = replica.create_engine(1, 0)
+    assert not await replica.check_health()
+
+    before = replica_checkouts(replica)
+    response = await client.get(f"/api/v1/maps/{ map_['id'] }")
+    assert response.status_code == 200
+    assert replica_checkouts(replica) == before
@@ -0,0 +1,104 @@
+import random
+import typing
+
+import numpy as np
+import pytest
+from fastapi import status
+from httpx import AsyncClient
+
+from app.map_data import Layer, parse_map_data, ring_areas
+from app.scene import (
+    COLLISION, FILLED, HEADER, SCENE_MAGIC, SCENE_VERSION, WORLD_BOUND, WORLD_SCALE,
+    build_scene, build_scene_from_json, building_colors, clip_ring, road_quads, rings, subdivide_ring,
+)
+from app.seed import generate_map_data
+from tests.conftest import create_map
+
+
+def unpack_scene(data: bytes) -> dict[str, np.ndarray]:
+    magic, version, ring_count, vertex_count = HEADER.unpack_from(data)
+    assert (magic, version) == (SCENE_MAGIC, SCENE_VERSION)
+    scene, offset = {}, HEADER.size
+    for name, dtype, count in [
+        ("vertices", "<f4", vertex_count * 2),
+        ("offsets", "<u4", ring_count + 1),
+        ("colors", "u1", ring_count * 4),
+        ("heights", "<f4", ring_count),
+        ("flags", "u1", ring_count),
+    ]:
+        scene[name] = np.frombuffer(data, dtype=dtype, count=count, offset=offset)
+        offset += scene[name].nbytes
+    assert offset == len(data)
+    return scene
+
+
+def test_clip_ring() -> None:
+    square = np.array([(0, 0), (10, 0), (10, 10), (0, 10)], dtype=np.float64)
+    clipped = clip_ring(square, np.array([4.0, 0.0]), np.array([1.0, 0.0]))
+    assert ring_areas(rings(clipped))[0] == pytest.approx(60)
+    assert clipped[:, 0].min() == pytest.approx(4)
+
+
+def test_subdivide_ring_keeps_area() -> None:
+    # An L shape, so some cuts cross it twice
+    ring = np.array([(0, 0), (120, 0), (120, 40), (40, 40), (40, 120), (0, 120)], dtype=np.float64)
+    pieces = subdivide_ring(ring, 500)
+    areas = [ring_areas(rings(piece))[0] for piece in pieces]
+    assert len(pieces) > 1
+    assert max(areas) < 2 * 500
+    assert sum(areas) == pytest.approx(ring_areas(rings(ring))[0])
+
+
+def test_road_quads() -> None:
+    # Two roads, the second with a zero length segment that's skipped
+    layer = Layer(np.array([(0, 0), (10, 0), (10, 10), (5, 5), (5, 5), (8, 5)], dtype=np.float64), np.array([0, 3, 6]))
+    quads = road_quads(layer, 1.5)
+    assert list(quads.offsets) == [0, 4, 8, 12]
+    assert list(ring_areas(quads)) == pytest.approx([30, 30, 9])
+
+
+def test_building_colors_are_seeded() -> None:
+    colors = building_colors(50, 7)
+    assert colors.shape == (50, 4)
+    assert (colors[:, 3] == 255).all()
+    assert (building_colors(50, 7) == colors).all()
+    assert len({ tuple(color) for color in colors }) > 10
+
+
+def test_build_scene() -> None:
+    parsed = parse_map_data(generate_map_data(random.Random(0), buildings=200))
+    scene = unpack_scene(build_scene(parsed.layers, parsed.heights, 1))
+
+    assert scene["flags"][0] == COLLISION | WORLD_BOUND
+    buildings = parsed.layers["buildings"]
+    # Buildings follow the boundary, river pieces, sea and big parks
+    first = 1 + int((scene["flags"][1:] & FILLED).argmin())
+    assert (scene["flags"][first:first + 200] == COLLISION).all()
+    assert scene["heights"][first:first + 200].min() == pytest.approx(1)
+    assert scene["heights"][first:first + 200].max() == pytest.approx(8.5)
+    start = scene["offsets"][first]
+    assert np.allclose(
+        scene["vertices"].reshape(-1, 2)[start:start + len(buildings.vertices)], buildings.vertices * WORLD_SCALE
+    )
+
+    # Maps whose data no longer passes validation are played on bare land, inside the world's boundary.
+    blank = unpack_scene(build_scene_from_json('{"sea": [{"x": 0, "y": 0}]}', 1))
+    assert list(blank["flags"]) == [COLLISION | WORLD_BOUND]
+
+
+async def test_get_map_scene(client: AsyncClient, user: dict[str, typing.Any], other_client: AsyncClient) -> None:
+    map_ = await create_map(client)
+    url = f"/api/v1/maps/{ map_['id'] }/scene"
+
+    built = await client.get(url)
+    assert built.status_code == status.HTTP_200_OK
+    scene = unpack_scene(built.content)
+    assert len(scene["heights"]) >= 1 + 5
+
+    cached = await client.get(url)
+    assert cached.content == built.content
+    assert cached.headers["etag"] == built.headers["etag"]
+
+    private_map = await create_map(client, private=True)
+    response = await other_client.get(f"/api/v1/maps/{ private_map['id'] }/scene")
+    assert response.status_code == status.HTTP_401_UNAUTHORIZED
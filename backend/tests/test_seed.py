@@ -0,0 +1,51 @@
+import random
+import uuid
+
+from fastapi import status
+from httpx import AsyncClient
+from sqlalchemy import select
+
+from app.db import AsyncSessionFactory
+from app.models import MapModel, UserModel
+from app.seed import SeedConfig, generate_map_data, seed
+
+
+def test_generate_map_data_is_deterministic() -> None:
+    data = generate_map_data(random.Random(7), buildings=300)
+    assert data == generate_map_data(random.Random(7), buildings=300)
+    assert data != generate_map_data(random.Random(8), buildings=300)
+    assert len(data["buildings"]) == 300
+    assert all(len(building["data"]) == 5 for building in data["buildings"])
+
+
+async def test_seed(client: AsyncClient) -> None:
+    # The test database isn't emptied between runs, so keep usernames and ids unique.
+    prefix = uuid.uuid4().hex[:8]
+    config = SeedConfig(
+        users=3, maps=4, favorites_per_user=2, private_share=0, buildings_min=10, large_maps=1, large_map_buildings=50,
+        thumbnail_size=16, batch_size=2, seed=random.getrandbits(32), username_prefix=prefix, password="seeded",
+    )
+    async with AsyncSessionFactory() as session:
+        connection = await session.connection()
+        summary = await seed((await connection.get_raw_connection()).driver_connection, config)
+        await session.commit()
+
+        user_ids = select(UserModel.id).where(UserModel.username.startswith(prefix))
+        maps = (await session.scalars(
+            select(MapModel).where(MapModel.user_id.in_(user_ids)).order_by(MapModel.name)
+        )).all()
+    assert summary.users == 3
+    assert summary.maps == len(maps) == 4
+
+    response = await client.post(
+        "/api/v1/auth/login", data={"username": f"{ prefix }0@example.com", "password": "seeded"}
+    )
+    assert response.status_code == status.HTTP_200_OK
+
+    large_map = next(map_ for map_ in maps if map_.name.endswith(" 0"))
+    response = await client.get(f"/api/v1/maps/{ large_map.id }", params={"include_data": True})
+    assert response.status_code == status.HTTP_200_OK
+    assert len(response.json()["data"]["buildings"]) == 50
+
+    response = await client.get(f"/api/v1/maps/{ large_map.id }/thumbnail")
+    assert response.headers["content-type"] == "image/png"
@@ -0,0 +1,58 @@
+import asyncio
+import typing
+
+import pytest
+from httpx import AsyncClient
+
+from app.settings import settings
+from app.slow_queries import fingerprint, parameter_shape, slow_query_log
+from tests.conftest import make_superuser
+
+
+@pytest.fixture
+def log_every_query(monkeypatch: pytest.MonkeyPatch) -> typing.Iterator[None]:
+    monkeypatch.setattr(settings, "slow_query_threshold_ms", 0.0)
+    slow_query_log.clear()
+    yield
+    slow_query_log.clear()
+
+
+def test_fingerprint_groups_variable_length_lists() -> None:
+    assert fingerprint("SELECT * FROM t WHERE id IN ($1, $2, $3)") == fingerprint("SELECT * FROM t WHERE id IN ($1)")
+    assert fingerprint("INSERT INTO t VALUES ($1, $2), ($3, $4)") == fingerprint("INSERT INTO t VALUES ($1, $2)")
+
+
+def test_parameter_shape_omits_values() -> None:
+    assert parameter_shape(("secret", 3, [1, 2])) == ["str", "int", ["int", "int"]]
+
+
+async def test_slow_queries_are_logged_with_route_call_site_and_plan(
+    client: AsyncClient,
+    user: dict[str, typing.Any],
+    log_every_query: None,
+) -> None:
+    await make_superuser(user)
+
+    response = await client.get("/api/v1/maps/search", params={"q": "slow"})
+    assert response.status_code == 200
+
+    search = None
+    for _ in range(50):
+        response = await client.get("/api/v1/system/slow-queries", params={"limit": 100})
+        assert response.status_code == 200
+        search = next((q for q in response.json() if "MapService.search_maps" in q["call_sites"]), None)
+        if search is not None and search["plan"] is not None: break
+        await asyncio.sleep(0.05)
+
+    assert search is not None
+    assert search["routes"] == ["/api/v1/maps/search"]
+    assert search["parameter_shape"]
+    assert search["plan_analyzed"] is True
+    assert "Plan" in search["plan"][0]
+    # Capturing the plan must not itself show up as a slow query.
+    assert not any(q["statement"].lstrip().upper().startswith(("EXPLAIN", "SET")) for q in response.json())
+
+
+async def test_slow_queries_require_superuser(client: AsyncClient, user: dict[str, typing.Any]) -> None:
+    response = await client.get("/api/v1/system/slow-queries")
+    assert response.status_code == 403
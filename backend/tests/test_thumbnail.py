@@ -0,0 +1,94 @@
+import random
+import struct
+import typing
+import uuid
+import zlib
+
+import numpy as np
+from httpx import AsyncClient
+from sqlalchemy import delete
+
+from app.db import AsyncSessionFactory
+from app.map_data import Layer, parse_map_data
+from app.models import ThumbnailModel
+from app.process_pool import ProcessPool
+from app.repositories import ThumbnailService
+from app.seed import generate_map_data
+from app.thumbnail import LAND_COLOR, closed_rings, coverage, render_thumbnail, render_thumbnail_from_json
+from app.thumbnail_backfill import backfill_thumbnails
+from tests.conftest import create_map
+
+
+def decode_png(data: bytes) -> np.ndarray:
+    """ The pixels of a PNG as `encode_png` writes them: one IDAT chunk of unfiltered 8-bit RGB. """
+    width, height = struct.unpack_from(">II", data, 16)
+    idat = data.index(b"IDAT")
+    (length,) = struct.unpack_from(">I", data, idat - 4)
+    raw = np.frombuffer(zlib.decompress(data[idat + 4:idat + 4 + length]), dtype=np.uint8)
+    return raw.reshape(height, 1 + width * 3)[:, 1:].reshape(height, width, 3)
+
+
+def test_coverage() -> None:
+    square = Layer(np.array([(1, 1), (5, 1), (5, 5), (1, 5)], dtype=np.float64), np.array([0, 4]))
+    mask = coverage(square, 8, 1.0)
+    assert mask.sum() == 16
+    assert mask[1:5, 1:5].all()
+
+    # Overlapping rings are each filled, rather than cancelling where they overlap.
+    overlapping = Layer(np.concatenate([square.vertices, square.vertices + 2]), np.array([0, 4, 8]))
+    assert coverage(overlapping, 8, 1.0).sum() == 16 + 16 - 4
+
+    # An L shape, and its own closing vertex repeated
+    ring = np.array([(0, 0), (6, 0), (6, 2), (2, 2), (2, 6), (0, 6), (0, 0)], dtype=np.float64)
+    assert coverage(Layer(ring, np.array([0, 7])), 8, 1.0).sum() == 36 - 16
+    # Scaled, and clipped to the image
+    assert coverage(Layer(ring, np.array([0, 7])), 8, 2.0).sum() == 64 - 16
+
+
+def test_closed_rings() -> None:
+    vertices = np.array([(0, 0), (1, 0), (1, 1), (5, 5), (6, 5), (6, 6)], dtype=np.float64)
+    layer = closed_rings(Layer(vertices, np.array([0, 3, 6])))
+    assert list(layer.offsets) == [0, 4, 8]
+    assert (layer.vertices[3] == (0, 0)).all() and (layer.vertices[7] == (5, 5)).all()
+
+
+def test_render_thumbnail() -> None:
+    data = generate_map_data(random.Random(0), buildings=100)
+    pixels = decode_png(render_thumbnail(parse_map_data(data).layers, 48, extent=400))
+    assert pixels.shape == (48, 48, 3)
+    assert len(np.unique(pixels.reshape(-1, 3), axis=0)) > 5
+
+    # Maps whose data no longer passes validation are drawn as bare land.
+    blank = decode_png(render_thumbnail_from_json('{"sea": [{"x": 0, "y": 0}]}', 16))
+    assert (blank == LAND_COLOR).all()
+
+
+async def test_map_without_thumbnail(client: AsyncClient, user: dict[str, typing.Any]) -> None:
+    map_ = await create_map(client)
+    url = f"/api/v1/maps/{ map_['id'] }/thumbnail"
+    await client.get(url)
+    async with AsyncSessionFactory() as session:
+        await session.execute(delete(ThumbnailModel).where(ThumbnailModel.map_id == uuid.UUID(map_["id"])))
+        await session.commit()
+
+    drawn = await client.get(url)
+    assert drawn.content.startswith(b"\x89PNG")
+    assert (await client.get(url)).content == drawn.content
+
+
+async def test_backfill_thumbnails(client: AsyncClient, user: dict[str, typing.Any]) -> None:
+    map_ = await create_map(client)
+    map_id = uuid.UUID(map_["id"])
+    await client.get(f"/api/v1/maps/{ map_id }/thumbnail")
+    pool = ProcessPool(workers=1)
+    pool.start()
+    try:
+        assert await backfill_thumbnails(AsyncSessionFactory, pool, 24, missing_only=True, map_ids=[map_id]) == 0
+        assert await backfill_thumbnails(AsyncSessionFactory, pool, 24, map_ids=[map_id]) == 1
+        assert await backfill_thumbnails(AsyncSessionFactory, pool, 24, map_ids=[map_id]) == 0
+    finally:
+        await pool.stop()
+    async with AsyncSessionFactory() as session:
+        thumbnail = await ThumbnailService(session=session).get_thumbnail(map_id)
+    assert thumbnail.size == 24
+    assert decode_png(thumbnail.data).shape == (24, 24, 3)
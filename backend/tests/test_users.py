@@ -0,0 +1,50 @@
+import typing
+
+from fastapi import status
+from httpx import AsyncClient
+
+from app.util import get_default_avatar
+
+
+async def test_get_my_user(client: AsyncClient, user: dict[str, typing.Any]) -> None:
+    response = await client.get("/api/v1/users/self")
+    assert response.status_code == status.HTTP_200_OK
+    assert response.json() == user
+
+
+async def test_get_my_user_requires_login(client: AsyncClient) -> None:
+    response = await client.get("/api/v1/users/self")
+    assert response.status_code == status.HTTP_401_UNAUTHORIZED
+
+
+async def test_get_user(client: AsyncClient, user: dict[str, typing.Any]) -> None:
+    response = await client.get(f"/api/v1/users/{ user['username'] }")
+    assert response.status_code == status.HTTP_200_OK
+    assert response.json() == {"username": user["username"]}
+
+    response = await client.get("/api/v1/users/does-not-exist")
+    assert response.status_code == status.HTTP_404_NOT_FOUND
+
+
+async def test_user_avatar(client: AsyncClient, user: dict[str, typing.Any]) -> None:
+    response = await client.get(f"/api/v1/users/{ user['username'] }/avatar")
+    assert response.status_code == status.HTTP_200_OK
+    assert response.content == get_default_avatar()
+
+    response = await client.put(
+        f"/api/v1/users/{ user['username'] }/avatar", files={"file": ("avatar.png", b"\x89PNG avatar", "image/png")}
+    )
+    assert response.status_code == status.HTTP_201_CREATED
+
+    response = await client.get(f"/api/v1/users/{ user['username'] }/avatar")
+    assert response.content == b"\x89PNG avatar"
+    assert response.headers["content-type"] == "image/png"
+
+
+async def test_cannot_change_other_users_avatar(
+    client: AsyncClient,
+    user: dict[str, typing.Any],
+    other_client: AsyncClient,
+) -> None:
+    response = await other_client.put(f"/api/v1/users/{ user['username'] }/avatar/random")
+    assert response.status_code == status.HTTP_401_UNAUTHORIZED
@@ -1,7 +1,7 @@
 import { ConfigProvider, Spin } from 'antd';
 import { red, volcano, gray } from '@ant-design/colors'
 import { Router, LocationProvider, Redirect } from '@gatsbyjs/reach-router'
-import { ErrorPage, MainMenu, MapSelect, MapCreate, LoginPage, AccountPage, GamePage, CreditsPage } from './views'
+import { ErrorPage, MainMenu, MapSelect, MapCreate, LoginPage, ResetPasswordPage, AccountPage, GamePage, CreditsPage } from './views'
 import { ProtectedRoute } from './components/protected-route'
 import { APIProvider } from './contexts'
 import './App.css'
@@ -51,6 +51,7 @@ function App() {
                 <ProtectedRoute component={ CreditsPage } path="/attributions" />
                 <ProtectedRoute component={ LoginPage } onlyRequireLoading path="/login" />
                 <ProtectedRoute component={ LoginPage } register onlyRequireLoading path="/register" />
+                <ProtectedRoute component={ ResetPasswordPage } onlyRequireLoading path="/reset-password" />
                 <ErrorPage code={ 404 } default />
                 <Redirect from="/play" to="/select-map" noThrow />
               </Router>
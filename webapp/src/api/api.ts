@@ -88,17 +88,60 @@ export interface MapData {
     river: Vector[]
 }
 
+export interface MapStats {
+    building_count: number
+    building_height_min: number | null
+    building_height_max: number | null
+    road_length: number
+    park_area: number
+    bbox_min_x: number | null
+    bbox_min_y: number | null
+    bbox_max_x: number | null
+    bbox_max_y: number | null
+}
+
+/** A map's game scene, as laid out in backend/app/scene.py: rings of walls, with each ring's colour, height and flags. */
+export interface MapScene {
+    vertices: Float32Array
+    offsets: Uint32Array
+    colors: Uint8Array
+    heights: Float32Array
+    flags: Uint8Array
+}
+
+/** Formats of a map's 3D model export, a zip of a model per part of the city (see backend/app/export.py). */
+export type MapExportFormat = "stl" | "glb"
+
+export const SCENE_COLLISION = 1
+export const SCENE_FILLED = 2
+export const SCENE_WORLD_BOUND = 4
+
+export type MapLayerFrame =
+    | { type: "map", map: Omit<Map, "data"> }
+    | { [K in keyof MapData]: { type: "layer", name: K, chunk?: undefined, data: MapData[K] } }[keyof MapData]
+    // Buildings come in chunks, each holding the next part of the layer
+    | { type: "layer", name: "buildings", chunk: number, data: BuildingData[] }
+    | { type: "end" }
+
 export interface Map {
     id: string
     name: string
     private: boolean
     data: MapData
     favorited: boolean
+    play_count: number
+    last_played_at: string | null
     created_at: string
     updated_at: string
+    stats: MapStats | null
     user?: User
 }
 
+export interface MapSearchPage {
+    items: Map[]
+    next_cursor: string | null
+}
+
 interface OnUserChange {
     (user: User | null): void
 }
@@ -238,6 +281,20 @@ export class API {
         })
     }
 
+    async resetPassword(token: string, password: string, { headers={}, ...config }: RequestInit={}): Promise<void> {
+        await this.post("auth/reset-password", {
+            ...config,
+            headers: {
+                ...headers,
+                "Content-Type": "application/json"
+            },
+            body: JSON.stringify({
+                token,
+                password
+            })
+        })
+    }
+
     async getUser(config: RequestInit={}): Promise<User> {
         return await this.get("users/self/", config)
     }
@@ -270,13 +327,139 @@ export class API {
         return await this.get("maps/self/", config)
     }
 
+    async searchMaps(query: string, cursor: string | null=null, limit: number=20, config: RequestInit={}): Promise<MapSearchPage> {
+        const params = new URLSearchParams({ q: query, limit: limit.toString() })
+        if (cursor !== null) params.set("cursor", cursor)
+        return await this.get(`maps/search?${ params }`, config)
+    }
+
     async getMap(mapId: string, includeData: boolean=false, config: RequestInit={}): Promise<Map> {
         return await this.get(`maps/${ mapId }?include_data=${ includeData }`, config)
     }
 
+    async getMapLayers<K extends keyof MapData>(mapId: string, layers: K[], config: RequestInit={}): Promise<Omit<Map, "data"> & { data: Pick<MapData, K> }> {
+        return await this.get(`maps/${ mapId }?layers=${ layers.join(",") }`, config)
+    }
+
+    /** Download a map's data, resuming from the bytes already received if the connection drops partway. */
+    async getMapData(mapId: string, retries: number=3, config: RequestInit={}): Promise<MapData> {
+        const chunks: Uint8Array[] = []
+        let received = 0
+        let etag: string | null = null
+        for (let attempt = 0; ; attempt++) {
+            const headers = new Headers(config.headers)
+            if (received > 0 && etag) {
+                headers.set("Range", `bytes=${ received }-`)
+                headers.set("If-Range", etag)
+            }
+            let res
+            try {
+                res = await fetch(`${ this.apiUrl}maps/${ mapId }/data`, {
+                    method: "GET",
+                    credentials: "include",
+                    ...config,
+                    headers
+                })
+            } catch (e: any) {
+                if (attempt < retries) continue
+                throw new APIRequestError(e)
+            }
+            if (!res.ok || !res.body) return await this.handleResponse(res)
+            // Anything but a 206 is the whole map again, e.g. because it changed since the first attempt.
+            if (res.status !== 206) {
+                chunks.length = 0
+                received = 0
+            }
+            etag = res.headers.get("ETag")
+
+            const reader = res.body.getReader()
+            try {
+                while (true) {
+                    const { done, value } = await reader.read()
+                    if (done) break
+                    chunks.push(value)
+                    received += value.length
+                }
+            } catch (e: any) {
+                if (attempt < retries) continue
+                throw new APIRequestError(e)
+            }
+            return JSON.parse(await new Blob(chunks).text())
+        }
+    }
+
+    /** Where to download a map's 3D models; the server builds them, so the browser can follow the link as a download. */
+    getMapExportUrl(mapId: string, format: MapExportFormat="stl"): string {
+        return `${ this.apiUrl }maps/${ mapId }/export?format=${ format }`
+    }
+
+    async getMapScene(mapId: string, config: RequestInit={}): Promise<MapScene> {
+        let res
+        try {
+            res = await fetch(`${ this.apiUrl}maps/${ mapId }/scene`, {
+                method: "GET",
+                credentials: "include",
+                ...config
+            })
+        } catch (e: any) {
+            throw new APIRequestError(e)
+        }
+        if (!res.ok) return await this.handleResponse(res)
+
+        const buffer = await res.arrayBuffer()
+        const view = new DataView(buffer)
+        const rings = view.getUint32(8, true)
+        const vertices = view.getUint32(12, true)
+        // Each array starts where the last ends, aligned for viewing in place.
+        let offset = 16
+        const take = <T>(Type: { new (buffer: ArrayBuffer, offset: number, length: number): T, BYTES_PER_ELEMENT: number }, length: number): T => {
+            const array = new Type(buffer, offset, length)
+            offset += length * Type.BYTES_PER_ELEMENT
+            return array
+        }
+        return {
+            vertices: take(Float32Array, vertices * 2),
+            offsets: take(Uint32Array, rings + 1),
+            colors: take(Uint8Array, rings * 4),
+            heights: take(Float32Array, rings),
+            flags: take(Uint8Array, rings)
+        }
+    }
+
+    /** Stream a map's layers back to front as they arrive, so drawing can start before the whole map is loaded. */
+    async *streamMap(mapId: string, layers?: (keyof MapData)[], config: RequestInit={}): AsyncGenerator<MapLayerFrame> {
+        const query = layers ? `?layers=${ layers.join(",") }` : ""
+        let res
+        try {
+            res = await fetch(`${ this.apiUrl}maps/${ mapId }/layers${ query }`, {
+                method: "GET",
+                credentials: "include",
+                ...config
+            })
+        } catch (e: any) {
+            throw new APIRequestError(e)
+        }
+        if (!res.ok || !res.body) return await this.handleResponse(res)
+
+        const reader = res.body.pipeThrough(new TextDecoderStream()).getReader()
+        let buffered = ""
+        while (true) {
+            const { done, value } = await reader.read()
+            if (done) break
+            buffered += value
+            const lines = buffered.split("\n")
+            buffered = lines.pop()!
+            for (const line of lines) if (line) yield JSON.parse(line)
+        }
+        if (buffered) yield JSON.parse(buffered)
+    }
+
+    async recordMapPlay(mapId: string, config: RequestInit={}): Promise<void> {
+        await this.post(`maps/${ mapId }/play`, config)
+    }
+
     async createMap(
         name: string,
-        thumbnailBase64: string,
         private_: boolean,
         data: MapData,
         { headers={}, ...config }: RequestInit={}
@@ -289,7 +472,6 @@ export class API {
             },
             body: JSON.stringify({
                 name,
-                thumbnail_base64: thumbnailBase64,
                 private: private_,
                 data
             })
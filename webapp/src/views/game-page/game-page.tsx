@@ -5,9 +5,9 @@ import { navigate } from '@gatsbyjs/reach-router'
 import { Player } from './player'
 import { Header } from '../../components/main-menu/header'
 import { useAPI } from '../../contexts'
-import { Map } from '../../api'
+import { Map, MapScene } from '../../api'
 import { MAP_HEIGHT, MAP_WIDTH } from '../map-create/map-create-context'
-import { Game } from './game'
+import { Game, SPAWN_LAYERS, SpawnLayers } from './game'
 import PolygonUtil from '../../MapGenerator/src/ts/impl/polygon_util'
 import { SettingsMenu } from '../../components/settings-menu'
 import './game-page.css'
@@ -60,7 +60,8 @@ export const GamePage = ({ mapId }: GamePageProps) => {
     const [jumpForce, setJumpForce] = useState<number>(0)
     const [moveForce, setMoveForce] = useState<number>(0)
 
-    const [map, setMap] = useState<Map|undefined>()
+    const [map, setMap] = useState<Omit<Map, "data"> & { data: SpawnLayers }|undefined>()
+    const [scene, setScene] = useState<MapScene|undefined>()
     const [error, setError] = useState<string|null>(null)
     const canvasRef = useRef<HTMLCanvasElement>(null)
     const [canvasEl, setCanvas] = useState(
@@ -84,8 +85,16 @@ export const GamePage = ({ mapId }: GamePageProps) => {
         mapAbortController.current?.abort()
         mapAbortController.current = new AbortController()
         try {
-            const map = await api.getMap(mapId, true, { signal: mapAbortController.current.signal })
+            const signal = mapAbortController.current.signal
+            // Only the layers needed to find a spawn point are fetched; the scene is what's drawn.
+            const [map, scene] = await Promise.all([
+                api.getMapLayers(mapId, [...SPAWN_LAYERS], { signal }),
+                api.getMapScene(mapId, { signal })
+            ])
+            setScene(scene)
             setMap(map)
+            // Play tracking is best-effort, a failure shouldn't block the game.
+            api.recordMapPlay(mapId).catch(() => {})
         } catch (e: any) {
             if (!e.isAbort) setError("Failed to load game map!")
         }
@@ -109,9 +118,9 @@ export const GamePage = ({ mapId }: GamePageProps) => {
     }, [loadMap])
 
     useEffect(() => {
-        if (!map || !canvasRef.current) return
+        if (!map || !scene || !canvasRef.current) return
         
-        game.current = new Game(canvasRef.current, map.data);
+        game.current = new Game(canvasRef.current, map.data, scene);
         game.current.startGame();
         game.current.soundEnabled = true
         updatePlayerCoords()
@@ -126,7 +135,7 @@ export const GamePage = ({ mapId }: GamePageProps) => {
         return () => {
             game.current?.endGame()
         }
-    }, [map, canvasEl, updatePlayerCoords])
+    }, [map, scene, canvasEl, updatePlayerCoords])
 
     useEffect(() => {
         if (!game.current) return
@@ -3,7 +3,7 @@ import { Player } from './player'
 import { Raindrop } from './raindrop'
 import { GrayscalePalette, PastelPalette } from './palette'
 import { MAP_HEIGHT, MAP_WIDTH } from '../map-create/map-create-context'
-import { MapData } from '../../api'
+import { MapData, MapScene, SCENE_COLLISION, SCENE_FILLED, SCENE_WORLD_BOUND } from '../../api'
 import PolygonUtil from '../../MapGenerator/src/ts/impl/polygon_util'
 import Vector from '../../MapGenerator/src/ts/vector'
 
@@ -14,17 +14,13 @@ interface GameVector {
     y: number
 }
 
+/** The layers a game needs besides its scene: roads to spawn on, and the water not to spawn in. */
+export const SPAWN_LAYERS = ["mainRoads", "sea", "river"] as const
+export type SpawnLayers = Pick<MapData, typeof SPAWN_LAYERS[number]>
+
 export class Game {
     WORLD_WIDTH = 20000
     WORLD_HEIGHT = 20000
-    
-    WATER_COLOR = new Raycaster.Color(0, 0, 255, 1)
-    COASTLINE_COLOR = new Raycaster.Color(252, 246, 217, 1)
-    MAIN_ROAD_COLOR = new Raycaster.Color(164, 164, 164, 1)
-    MAJOR_ROAD_COLOR = new Raycaster.Color(164, 164, 164, 1)
-    MINOR_ROAD_COLOR = new Raycaster.Color(164, 164, 164, 1)
-    PARK_COLOR = new Raycaster.Color(0, 180, 0, 1)
-    WORLD_BOUNDARY_COLOR = new Raycaster.Color(255, 165, 0, 1)
 
     
     private _raycaster
@@ -33,7 +29,7 @@ export class Game {
     private raining = false
     private rain: Raindrop[] = []
 
-    constructor(private canvas, private mapData: MapData) {
+    constructor(private canvas, private mapData: SpawnLayers, private scene: MapScene) {
     }
 
     get worldScaleX() {
@@ -96,124 +92,42 @@ export class Game {
             const nextVector = i === polygon.length - 1 ? polygon[0] : polygon[i + 1]
             return new Raycaster.Wall(
                 this._raycaster,
-                vector.x * this.worldScaleX,
-                vector.y * this.worldScaleY,
-                nextVector.x * this.worldScaleX,
-                nextVector.y * this.worldScaleY,
+                vector.x,
+                vector.y,
+                nextVector.x,
+                nextVector.y,
                 options
             )
         })
         if (options.filled) {
             walls.forEach((w) => {
                 w.associated = walls
-                w.polygon = PolygonUtil.polygonToPolygonArray(
-                    polygon.map((v) => new Vector(v.x * this.worldScaleX, v.y * this.worldScaleY))
-                )
+                w.polygon = PolygonUtil.polygonToPolygonArray(polygon.map((v) => new Vector(v.x, v.y)))
             })
         }
         return walls
     }
 
+    /** The walls of the map's scene, which the server has already built in world coordinates (see getMapScene). */
     createMap() {
         const objects: any[] = []
-        const palette = new PastelPalette({
-            minLightness: 0.2,
-            minBrightness: 0.2,
-            maxBrightness: 0.6,
-            maxLightness: 0.8,
-            minSaturation: 0.2,
-            mode: null
-        })
-        const heights = this.mapData.buildings.map((i) => i.height)
-        const minHeight = Math.min(...heights)
-        const maxHeight = Math.max(...heights)
-
-        objects.push(this.createWallPolygon([
-            {x: 0, y: 0}, {x: MAP_WIDTH, y: 0}, {x: MAP_WIDTH, y: MAP_HEIGHT}, {x: 0, y: MAP_HEIGHT}
-        ], {
-            color: this.WORLD_BOUNDARY_COLOR,
-            varHeight: 25,
-            worldBound: true
-        }))
-
-        PolygonUtil.subdividePolygon(this.mapData.river.map((v) => new Vector(v.x, v.y)), 500, true).forEach((riverChunk) => {
-            objects.push(...this.createWallPolygon(riverChunk, {
-                color: this.WATER_COLOR,
-                collision: true,
-                varHeight: 0.01,
-                filled: true
-            }))
-        })
-
-        objects.push(...this.createWallPolygon(this.mapData.sea, {
-            color: this.WATER_COLOR,
-            // collision: true,
-            // varHeight: 0.5,
-            collision: true,
-            varHeight: 0.01,
-            filled: true
-        }))
-
-        this.mapData.bigParks.forEach((park) => {
-            objects.push(...this.createWallPolygon(park, {
-                color: this.PARK_COLOR,
-                collision: false,
-                varHeight: 0.01,
-                filled: true
-            }))
-        })
-
-
-        this.mapData.buildings.forEach((building) => {
-            // if (building.data.find((v) => v.x <= 0 || v.y <= 0 || v.x >= MAP_WIDTH || v.y >= MAP_HEIGHT)) return
-            const color = palette.getNextColor()
-            objects.push(...this.createWallPolygon(building.data, {
-                color: new Raycaster.Color(...color.rgb(), 1),
-                varHeight: 1 + 7.5 * (building.height - minHeight) / (maxHeight - minHeight)
-            }))     
-        })
-        
-        // this.mapData.mainRoads.concat(this.mapData.coastalRoads).forEach((road) => {
-        this.mapData.mainRoads.forEach((road) => {
-        // this.mapData.mainRoads.forEach((road) => {
-            road.forEach((startVec, i) => {
-                if (i === road.length - 1) return
-                const endVec = road[i + 1]
-                objects.push(...this.createWallPolygon(PolygonUtil.resizeGeometry([startVec, endVec], 3, false), {
-                    color: this.MAIN_ROAD_COLOR,
-                    varHeight: 0.01,
-                    collision: false,
-                    filled: true
-                }))
-            })
-        })
-
-        this.mapData.majorRoads.forEach((road) => {
-            road.forEach((startVec, i) => {
-                if (i === road.length - 1) return
-                const endVec = road[i + 1]
-                objects.push(...this.createWallPolygon(PolygonUtil.resizeGeometry([startVec, endVec], 1.5, false), {
-                    color: this.MAJOR_ROAD_COLOR,
-                    varHeight: 0.01,
-                    collision: false,
-                    filled: true
-                }))
-            })
-        })
-
-        this.mapData.minorRoads.forEach((road) => {
-            road.forEach((startVec, i) => {
-                if (i === road.length - 1) return
-                const endVec = road[i + 1]
-                objects.push(...this.createWallPolygon(PolygonUtil.resizeGeometry([startVec, endVec], 1.5, false), {
-                    color: this.MINOR_ROAD_COLOR,
-                    varHeight: 0.01,
-                    collision: false,
-                    filled: true
-                }))
+        const { vertices, offsets, colors, heights, flags } = this.scene
+        for (let ring = 0; ring < heights.length; ring++) {
+            const polygon: GameVector[] = []
+            for (let i = offsets[ring]; i < offsets[ring + 1]; i++) {
+                polygon.push({ x: vertices[2 * i], y: vertices[2 * i + 1] })
+            }
+            const walls = this.createWallPolygon(polygon, {
+                color: new Raycaster.Color(colors[4 * ring], colors[4 * ring + 1], colors[4 * ring + 2], colors[4 * ring + 3] / 255),
+                varHeight: heights[ring],
+                collision: (flags[ring] & SCENE_COLLISION) !== 0,
+                filled: (flags[ring] & SCENE_FILLED) !== 0,
+                worldBound: (flags[ring] & SCENE_WORLD_BOUND) !== 0
             })
-        })
-        
+            // The world boundary has always been added as one object
+            if (flags[ring] & SCENE_WORLD_BOUND) objects.push(walls)
+            else objects.push(...walls)
+        }
         return objects
     }
 
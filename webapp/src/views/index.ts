@@ -5,4 +5,5 @@ export * from './game-page'
 export * from './account-page'
 export * from './credits-page'
 export * from './login-page'
+export * from './reset-password-page'
 export * from './error-page'
\ No newline at end of file
@@ -55,7 +55,7 @@ const GenerateMenu = ({ activeStep, setActiveStep }: MapGenerateMenuProps) => {
 
 export const MapCreateInternal = () => {
     const { api } = useAPI()
-    const { canvasEl, canvasRef, buildings, generateBuildings, drawBuildings, collectMapData } = useMapCreate()
+    const { canvasEl, buildings, generateBuildings, drawBuildings, collectMapData } = useMapCreate()
 
     const [activeStep, setActiveStep] = useState<number>(0)
     const [creatingMap, setCreatingMap] = useState<boolean>(false)
@@ -64,18 +64,10 @@ export const MapCreateInternal = () => {
 
     const mapCreateAbortController = useRef<AbortController>()
 
-    const createThumbnail = useCallback(() => {
-        if (!canvasEl) return
-        const dataURL = canvasRef.current!.toDataURL("image/jpeg")
-        const b64String = dataURL.split("base64,")[1]
-        return b64String
-    }, [canvasEl])
-
     const confirmMapCreation = useCallback(async (mapSettings: IMapSettings) => {
         if (!canvasEl) return
         
         setCreatingMap(true)
-        const thumbnail = createThumbnail()!
         let map
         try {
             mapCreateAbortController.current?.abort()
@@ -84,7 +76,6 @@ export const MapCreateInternal = () => {
             const mapData = collectMapData()!
             map = await api.createMap(
                 mapSettings.name,
-                thumbnail,
                 mapSettings.private,
                 mapData
             )
@@ -99,7 +90,7 @@ export const MapCreateInternal = () => {
         }
         // Don't bother setting loading to false if successful, since it will redirect anyways
         // (since it causes a flash of the view before the redirect goes through)
-    }, [api, buildings, generateBuildings, drawBuildings, collectMapData, createThumbnail])
+    }, [api, buildings, generateBuildings, drawBuildings, collectMapData])
 
     if (creatingMap) return <Spin />
     return (
@@ -263,7 +263,12 @@ export const MapSelect = () => {
                 open={ !!showMapImageModal }
                 onOk={ () => setShowMapImageModal(undefined) }
                 onCancel={ () => setShowMapImageModal(undefined) }
-                footer={ null }
+                footer={ showMapImageModal && (
+                    <Space>
+                        <Button href={ api.getMapExportUrl(showMapImageModal.id, "stl") }>Download STL</Button>
+                        <Button href={ api.getMapExportUrl(showMapImageModal.id, "glb") }>Download glTF</Button>
+                    </Space>
+                ) }
             >
                 { showMapImageModal && (
                     <img
@@ -0,0 +1,89 @@
+import { useCallback, useMemo, useRef, useState } from 'react'
+import { Button, Form, Input, Result } from 'antd'
+import { LockOutlined } from '@ant-design/icons'
+import { navigate, useLocation } from '@gatsbyjs/reach-router'
+import { useAPI } from '../contexts'
+import { Header } from '../components/main-menu'
+import { APIResponseError } from '../api'
+import './login-page.css'
+
+export const ResetPasswordPage = () => {
+    const { api } = useAPI()
+    const location = useLocation()
+    const token = useMemo(() => new URLSearchParams(location.search).get("token"), [location.search])
+    const [done, setDone] = useState<boolean>(false)
+    const [generalError, setGeneralError] = useState<string|null>(null)
+
+    const [form] = Form.useForm()
+    const abortController = useRef<AbortController>()
+
+    const onFinish = useCallback(async ({ password }) => {
+        if (!token) return
+        setGeneralError(null)
+
+        abortController.current?.abort()
+        abortController.current = new AbortController()
+        try {
+            await api.resetPassword(token, password, { signal: abortController.current.signal })
+            setDone(true)
+        } catch (e: any) {
+            if (e.isAbort) return
+            if (e instanceof APIResponseError) {
+                if (e.detail === "USER__PASSWORD_TOO_SHORT") form.setFields([{
+                    name: "password",
+                    errors: [e.message]
+                }])
+                else setGeneralError(e.message)
+            } else setGeneralError("Something went wrong...")
+        }
+    }, [api, form, token])
+
+    if (!token || done) return (
+        <Result
+            status={ done ? "success" : "warning" }
+            title={ done ? "Your password has been reset" : "This password reset link is invalid" }
+            extra={[
+                <Button key={ 0 } type="text" onClick={ () => navigate("/login") }>Log in</Button>
+            ]}
+        />
+    )
+    return (
+        <div style={{ display: "flex", flexDirection: "column", alignItems: "stretch" }}>
+            <Header size="small" subTitle="Reset password" />
+            <div className="login-form-wrapper">
+                <Form
+                    className="login-form"
+                    form={ form }
+                    onFinish={ onFinish }
+                    validateTrigger="onBlur"
+                    layout="vertical"
+                >
+                    <Form.Item
+                        name="password"
+                        rules={[
+                            { required: true, message: "Please enter a new password!" },
+                            { min: 4, message: "Your password must be at least 4 characters!" },
+                            { max: 100, message: "Your password cannot be more than 100 characters!" }
+                        ]}
+                    >
+                        <Input.Password
+                            prefix={ <LockOutlined style={{ marginRight: 4 }} /> }
+                            type="password"
+                            placeholder="New password"
+                        />
+                    </Form.Item>
+                    <Form.Item style={{ marginBottom: 0 }}>
+                        <Button block type="primary" htmlType="submit">
+                            Reset password
+                        </Button>
+                        { generalError && (
+                            <div className="login-form-general-error" style={{ marginTop: 8 }}>
+                                { generalError }
+                            </div>
+                        ) }
+                    </Form.Item>
+                </Form>
+            </div>
+        </div>
+    )
+}